@@ -0,0 +1,605 @@
+"""
+Property address normalization and the in-process Opportunity address index
+"""
+import logging
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# USPS Publication 28 street suffixes: every accepted spelling -> standard abbreviation
+USPS_SUFFIXES = {
+    'aly': ('alley', 'allee', 'ally'),
+    'anx': ('annex', 'anex', 'annx'),
+    'arc': ('arcade',),
+    'ave': ('avenue', 'av', 'aven', 'avenu', 'avn', 'avnue'),
+    'byu': ('bayou', 'bayoo'),
+    'bch': ('beach',),
+    'bnd': ('bend',),
+    'blf': ('bluff', 'bluf'),
+    'blvd': ('boulevard', 'boul', 'boulv'),
+    'br': ('branch', 'brnch'),
+    'brg': ('bridge', 'brdge'),
+    'brk': ('brook',),
+    'byp': ('bypass', 'bypa', 'bypas', 'byps'),
+    'cp': ('camp', 'cmp'),
+    'cyn': ('canyon', 'canyn', 'cnyn'),
+    'cswy': ('causeway', 'causwa'),
+    'ctr': ('center', 'cen', 'cent', 'centr', 'centre', 'cnter', 'cntr'),
+    'cir': ('circle', 'circ', 'circl', 'crcl', 'crcle'),
+    'clf': ('cliff',),
+    'cmn': ('common',),
+    'cor': ('corner',),
+    'crse': ('course',),
+    'ct': ('court',),
+    'cv': ('cove',),
+    'crk': ('creek',),
+    'cres': ('crescent', 'crsent', 'crsnt'),
+    'xing': ('crossing', 'crssng'),
+    'dr': ('drive', 'driv', 'drv'),
+    'est': ('estate',),
+    'expy': ('expressway', 'exp', 'expr', 'express', 'expw'),
+    'ext': ('extension', 'extn', 'extnsn'),
+    'fls': ('falls',),
+    'fry': ('ferry', 'frry'),
+    'fld': ('field',),
+    'flds': ('fields',),
+    'frst': ('forest', 'forests'),
+    'frk': ('fork',),
+    'ft': ('fort', 'frt'),
+    'fwy': ('freeway', 'freewy', 'frway', 'frwy'),
+    'gdn': ('garden', 'gardn', 'grden', 'grdn'),
+    'gdns': ('gardens', 'grdns'),
+    'gtwy': ('gateway', 'gatewy', 'gatway', 'gtway'),
+    'gln': ('glen',),
+    'grn': ('green',),
+    'grv': ('grove', 'grov'),
+    'hbr': ('harbor', 'harb', 'harbr', 'hrbor'),
+    'hvn': ('haven',),
+    'hts': ('heights', 'ht'),
+    'hwy': ('highway', 'highwy', 'hiway', 'hiwy', 'hway'),
+    'holw': ('hollow', 'hllw', 'hollows', 'holws'),
+    'jct': ('junction', 'jction', 'jctn', 'junctn', 'juncton'),
+    'knl': ('knoll', 'knol'),
+    'lndg': ('landing', 'lndng'),
+    'ln': ('lane',),
+    'mnr': ('manor',),
+    'mdws': ('meadows', 'mdw', 'medows'),
+    'msn': ('mission', 'missn', 'mssn'),
+    'mtwy': ('motorway',),
+    'mt': ('mount', 'mnt'),
+    'mtn': ('mountain', 'mntain', 'mntn', 'mountin', 'mtin'),
+    'pkwy': ('parkway', 'parkwy', 'pkway', 'pky', 'parkways', 'pkwys'),
+    'pl': ('place',),
+    'plz': ('plaza', 'plza'),
+    'pt': ('point',),
+    'prt': ('port',),
+    'pr': ('prairie', 'prr'),
+    'rnch': ('ranch', 'ranches', 'rnchs'),
+    'rdg': ('ridge', 'rdge'),
+    'riv': ('river', 'rvr', 'rivr'),
+    'rd': ('road',),
+    'rte': ('route',),
+    'shr': ('shore',),
+    'spg': ('spring', 'spng', 'sprng'),
+    'sq': ('square', 'sqr', 'sqre', 'squ'),
+    'sta': ('station', 'statn', 'stn'),
+    'st': ('street', 'strt', 'str'),
+    'smt': ('summit', 'sumit', 'sumitt'),
+    'ter': ('terrace', 'terr'),
+    'trce': ('trace', 'traces'),
+    'trak': ('track', 'tracks', 'trk', 'trks'),
+    'trl': ('trail', 'trails', 'trls'),
+    'tunl': ('tunnel', 'tunel', 'tunls', 'tunnels', 'tunnl'),
+    'tpke': ('turnpike', 'trnpk', 'turnpk'),
+    'vly': ('valley', 'vally', 'vlly'),
+    'via': ('viaduct', 'vdct', 'viadct'),
+    'vw': ('view',),
+    'vlg': ('village', 'vill', 'villag', 'villg', 'villiage'),
+    'vis': ('vista', 'vist', 'vst', 'vsta'),
+    'way': ('wy',),
+}
+DIRECTION_NAMES = {
+    'n': ('north',), 's': ('south',), 'e': ('east',), 'w': ('west',),
+    'ne': ('northeast',), 'nw': ('northwest',), 'se': ('southeast',), 'sw': ('southwest',),
+}
+# USPS secondary unit designators
+UNIT_DESIGNATORS = {
+    'apt': ('apartment',), 'bldg': ('building',), 'fl': ('floor',), 'ste': ('suite',),
+    'unit': (), 'rm': ('room',), 'spc': ('space',), 'lot': (), '#': (),
+}
+
+# Trailing locality on a spoken or pasted address ("..., Tampa FL 33602") - codes and one-word names
+STATE_CODES = frozenset('''
+    al ak az ar ca co ct de dc fl ga hi id il in ia ks ky la me md ma mi mn ms mo mt ne nv nh nj nm ny nc nd
+    oh ok or pa pr ri sc sd tn tx ut vt va wa wv wi wy
+'''.split())
+STATE_NAMES = frozenset('''
+    alabama alaska arizona arkansas california colorado connecticut delaware florida georgia hawaii idaho
+    illinois indiana iowa kansas kentucky louisiana maine maryland massachusetts michigan minnesota mississippi
+    missouri montana nebraska nevada ohio oklahoma oregon pennsylvania tennessee texas utah vermont virginia
+    washington wisconsin wyoming
+'''.split())
+
+def _build_token_table() -> dict:
+    table = {}
+    for group in (USPS_SUFFIXES, DIRECTION_NAMES, UNIT_DESIGNATORS):
+        for standard, spellings in group.items():
+            table[standard] = standard
+            for spelling in spellings:
+                table[spelling] = standard
+    return table
+
+TOKEN_TABLE = _build_token_table()
+STREET_SUFFIXES = frozenset(USPS_SUFFIXES)
+DIRECTIONS = frozenset(DIRECTION_NAMES)
+UNIT_MARKERS = frozenset(UNIT_DESIGNATORS)
+
+NORMALIZE_CACHE_SIZE = 100_000
+
+_ORDINAL_RE = re.compile(r'^(\d+)(st|nd|rd|th)$')
+_ZIP_RE = re.compile(r'^\d{5}$')
+# State codes as normalized_tokens leaves them ("WY" reads as the suffix "way")
+STATE_TOKENS = frozenset(TOKEN_TABLE.get(code, code) for code in STATE_CODES) | STATE_NAMES
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def normalized_tokens(address: str) -> tuple:
+    """Lowercase tokens with USPS suffixes, directions and unit designators abbreviated
+
+    Single pass over whole tokens, so 'eastwood' and 'street' inside other words are left alone.
+    """
+    lookup = TOKEN_TABLE.get
+    # Commas and hyphens separate tokens, periods are dropped ("St." -> "st"), '#' stands alone
+    text = address.lower().replace(',', ' ').replace('-', ' ').replace('.', '').replace('#', ' # ')
+    return tuple([lookup(token, token) for token in text.split()])
+
+def normalize_address(address: str) -> str:
+    """Normalize address for better matching"""
+    return ' '.join(normalized_tokens(address))
+
+def address_tokens(address: str) -> list:
+    """Normalized address split into tokens"""
+    return list(normalized_tokens(address))
+
+def soql_datetime(value: str) -> str:
+    """Convert a Salesforce datetime ('2025-01-06T15:04:05.000+0000') to a SOQL literal"""
+    parsed = datetime.strptime(value, '%Y-%m-%dT%H:%M:%S.%f%z')
+    return parsed.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+# Confidence needed to act on a match without asking the AE, and how far ahead
+# of the runner-up the best candidate must be
+MATCH_THRESHOLD = 0.85
+AMBIGUITY_MARGIN = 0.05
+
+# Component weights for the confidence score
+WEIGHTS = {'number': 0.4, 'name': 0.4, 'direction': 0.1, 'suffix': 0.05, 'unit': 0.05}
+
+
+class ParsedAddress:
+    """Street address split into number / direction / name / suffix / unit"""
+
+    __slots__ = ('number', 'direction', 'name', 'suffix', 'unit')
+
+    def __init__(self, number=None, direction=None, name=(), suffix=None, unit=None):
+        self.number = number
+        self.direction = direction
+        self.name = tuple(name)
+        self.suffix = suffix
+        self.unit = unit
+
+    def __repr__(self):
+        return (f"ParsedAddress(number={self.number!r}, direction={self.direction!r}, name={self.name!r}, "
+                f"suffix={self.suffix!r}, unit={self.unit!r})")
+
+
+def parse_address(address: str) -> ParsedAddress:
+    """Parse the street part of an address or Opportunity name ("4116 W Iowa Ave - Chicago")"""
+    # Opportunity names carry the city after " - "; only the street part is matched
+    street = address.split(' - ')[0]
+    tokens = [_ORDINAL_RE.sub(r'\1', t) for t in normalized_tokens(street)]
+    parsed = ParsedAddress()
+    if tokens and tokens[0].isdigit():
+        parsed.number = tokens.pop(0)
+    tokens = strip_locality(tokens)
+
+    for i, token in enumerate(tokens):
+        # A designator before any street name is the name itself ("9 Lot Rd")
+        if token in UNIT_MARKERS and any(t not in DIRECTIONS for t in tokens[:i]):
+            # "Apt #4" and "Unit 4" are the same unit
+            parsed.unit = ''.join(t for t in tokens[i + 1:] if t not in UNIT_MARKERS) or None
+            tokens = tokens[:i]
+            break
+
+    if tokens and tokens[0] in DIRECTIONS and len(tokens) > 1:
+        parsed.direction = tokens.pop(0)
+    # Trailing direction ("Main St NW") counts as the direction when none came first;
+    # either way it comes off before the suffix
+    if len(tokens) > 1 and tokens[-1] in DIRECTIONS:
+        trailing = tokens.pop()
+        parsed.direction = parsed.direction or trailing
+    if len(tokens) > 1 and tokens[-1] in STREET_SUFFIXES:
+        parsed.suffix = tokens.pop()
+    parsed.name = tuple(tokens)
+    return parsed
+
+
+def strip_locality(tokens: list) -> list:
+    """Street tokens without a trailing city, state and ZIP ("12 st tampa fl 33602" -> "12 st")
+
+    A state that is also a street token ("ct", "ne") is only taken as one before a
+    ZIP, on a street that already has its suffix; a unit marker with nothing after
+    it ("fl") can't be a unit, so it's the state. The city is the run of words
+    between the state and the street suffix, number or unit ("apt 4b") before it -
+    with none of those, there's no telling where the street ends.
+    """
+    end = len(tokens)
+    zip_code = False
+    if end > 2 and _ZIP_RE.match(tokens[end - 2]) and len(tokens[end - 1]) == 4 and tokens[end - 1].isdigit():
+        end -= 2  # ZIP+4, split at its hyphen
+        zip_code = True
+    elif end > 1 and _ZIP_RE.match(tokens[end - 1]):
+        end -= 1
+        zip_code = True
+    state = end > 1 and tokens[end - 1] in STATE_TOKENS
+    if state and tokens[end - 1] in TOKEN_TABLE and tokens[end - 1] not in UNIT_MARKERS:
+        state = zip_code and any(token in STREET_SUFFIXES for token in tokens[:end - 1])
+    if not state:
+        return tokens[:end]
+    end -= 1
+    city = end
+    while (city > 0 and tokens[city - 1].isalpha() and tokens[city - 1] not in TOKEN_TABLE
+           and not (city > 1 and tokens[city - 2] in UNIT_MARKERS)):
+        city -= 1
+    if city > 0 and city < end and (tokens[city - 1] in STREET_SUFFIXES or tokens[city - 1].isdigit()
+                                    or (city > 1 and tokens[city - 2] in UNIT_MARKERS)):
+        end = city
+    return tokens[:end]
+
+
+def edit_distance(a: str, b: str) -> int:
+    """Levenshtein distance between two short strings"""
+    if a == b:
+        return 0
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+@lru_cache(maxsize=65536)
+def token_similarity(a: str, b: str) -> float:
+    if a == b:
+        return 1.0
+    longest = max(len(a), len(b))
+    # Length difference alone already rules out any useful similarity
+    if abs(len(a) - len(b)) >= longest:
+        return 0.0
+    return max(0.0, 1.0 - edit_distance(a, b) / longest)
+
+
+def name_similarity(query: tuple, candidate: tuple) -> float:
+    """Token-level similarity of two street names, symmetric so extra words cost something"""
+    if not query or not candidate:
+        return 0.0
+    if query == candidate:
+        return 1.0
+    matrix = [[token_similarity(q, c) for c in candidate] for q in query]
+    forward = sum(max(row) for row in matrix) / len(query)
+    backward = sum(max(column) for column in zip(*matrix)) / len(candidate)
+    return (forward + backward) / 2
+
+
+def _component_score(query, candidate, weight: float) -> float:
+    """Full weight if equal, partial if either side omits it, a penalty if they conflict
+
+    W Iowa and E Iowa are different streets, so a conflict costs more than a gap.
+    """
+    if query is None and candidate is None:
+        return weight
+    if query is None or candidate is None:
+        return weight * 0.75
+    return weight if query == candidate else -weight
+
+
+def score_address(query: ParsedAddress, candidate: ParsedAddress) -> float:
+    """Confidence in [0, 1] that candidate is the address the AE meant"""
+    score = 0.0
+    if query.number and candidate.number:
+        score += WEIGHTS['number'] * token_similarity(query.number, candidate.number)
+    score += WEIGHTS['name'] * name_similarity(query.name, candidate.name)
+    score += _component_score(query.direction, candidate.direction, WEIGHTS['direction'])
+    score += _component_score(query.suffix, candidate.suffix, WEIGHTS['suffix'])
+    score += _component_score(query.unit, candidate.unit, WEIGHTS['unit'])
+    return round(max(score, 0.0), 4)
+
+
+def trigrams(name: tuple) -> set:
+    text = f" {' '.join(name)} "
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def pick_match(candidates: list) -> dict:
+    """Best candidate if it is confident and clearly ahead of the runner-up, else None"""
+    if not candidates or candidates[0]['confidence'] < MATCH_THRESHOLD:
+        return None
+    if len(candidates) > 1 and candidates[0]['confidence'] - candidates[1]['confidence'] < AMBIGUITY_MARGIN:
+        return None
+    return candidates[0]['record']
+
+
+def rank_records(address: str, records: list, limit: int = 5) -> list:
+    """Score a small list of Opportunity records (e.g. SOQL results) against an address"""
+    query = parse_address(address)
+    seen = {}
+    for record in records:
+        seen[record['Id']] = {'record': record, 'confidence': score_address(query, parse_address(record['Name'] or ''))}
+    ranked = sorted(seen.values(), key=lambda c: (-c['confidence'], c['record']['Id']))
+    return ranked[:limit]
+
+
+class AddressMatcher:
+    """Ranks Opportunities against a spoken address
+
+    Candidates come from the street-number block first. If nothing there is a
+    confident match, a trigram block over distinct street names adds the
+    addresses on the closest-sounding streets, so a misheard house number can
+    still surface the right street for disambiguation.
+    """
+
+    STREET_CANDIDATES = 5
+    MAX_CANDIDATES = 200
+
+    def __init__(self):
+        self.records = {}
+        self.parsed = {}
+        self.by_number = {}
+        self.by_street = {}
+        self.street_trigrams = {}
+
+    def __len__(self):
+        return len(self.records)
+
+    def add(self, record: dict):
+        opp_id = record['Id']
+        self.remove(opp_id)
+        parsed = parse_address(record.get('Name') or '')
+        self.records[opp_id] = record
+        self.parsed[opp_id] = parsed
+        if parsed.number:
+            self.by_number.setdefault(parsed.number, set()).add(opp_id)
+        if parsed.name:
+            street = self.by_street.setdefault(parsed.name, set())
+            if not street:
+                for gram in trigrams(parsed.name):
+                    self.street_trigrams.setdefault(gram, set()).add(parsed.name)
+            street.add(opp_id)
+
+    def remove(self, opp_id: str):
+        parsed = self.parsed.pop(opp_id, None)
+        self.records.pop(opp_id, None)
+        if not parsed:
+            return
+        if parsed.number:
+            self.by_number.get(parsed.number, set()).discard(opp_id)
+        street = self.by_street.get(parsed.name)
+        if street is not None:
+            street.discard(opp_id)
+            if not street:
+                del self.by_street[parsed.name]
+                for gram in trigrams(parsed.name):
+                    self.street_trigrams.get(gram, set()).discard(parsed.name)
+
+    def _score(self, query: ParsedAddress, ids) -> list:
+        return [{'record': self.records[opp_id], 'confidence': score_address(query, self.parsed[opp_id])}
+                for opp_id in ids]
+
+    def similar_streets(self, name: tuple) -> list:
+        """Distinct street names sharing the most trigrams with name"""
+        counts = {}
+        for gram in trigrams(name):
+            for street in self.street_trigrams.get(gram, ()):
+                counts[street] = counts.get(street, 0) + 1
+        return sorted(counts, key=lambda street: (-counts[street], street))[:self.STREET_CANDIDATES]
+
+    def rank(self, address: str, limit: int = 5) -> list:
+        """Top candidates as [{'record': ..., 'confidence': ...}], best first"""
+        query = parse_address(address)
+        block = set(self.by_number.get(query.number, ())) if query.number else set()
+        scored = self._score(query, block)
+
+        if not pick_match(sorted(scored, key=lambda c: -c['confidence'])[:2]) and query.name:
+            extra = set()
+            for street in self.similar_streets(query.name):
+                extra.update(self.by_street[street])
+                if len(extra) >= self.MAX_CANDIDATES:
+                    break
+            scored.extend(self._score(query, extra - block))
+
+        scored.sort(key=lambda c: (-c['confidence'], c['record']['Id']))
+        return scored[:limit]
+
+
+class AddressIndex:
+    """In-memory AddressMatcher over every Opportunity in the org
+
+    Warmed from a full export of Opportunity names, then kept fresh by polling
+    LastModifiedDate. Lookups never touch the API; callers fall back to SOQL on a miss.
+    Given shared (a SharedState) and leader (a LeaderElection), only the leader
+    syncs with Salesforce; it publishes the index after each change and the other
+    workers load the published copy.
+    """
+
+    FIELDS = 'Id, Name, StageName, LastModifiedDate'
+    SHARED_KEY = 'address_index'
+    # How soon a worker looks again while the leader is still building the first index
+    FOLLOWER_RETRY = 5
+
+    def __init__(self, poll_interval: float = 60, full_refresh_interval: float = 6 * 3600,
+                 shared=None, leader=None):
+        self.poll_interval = poll_interval
+        # Polling LastModifiedDate doesn't see deletes, so rebuild from scratch now and then
+        self.full_refresh_interval = full_refresh_interval
+        self.shared = shared
+        self.leader = leader
+        self.version = None  # of the published copy this worker has loaded
+        self.loads = {'salesforce': 0, 'shared': 0}
+        self.matcher = AddressMatcher()
+        self.modified = {}
+        self.watermark = None
+        self.ready = False
+        self.hits = 0
+        self.misses = 0
+        self.last_sync_at = None
+        self.last_full_sync_at = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def __len__(self):
+        return len(self.matcher)
+
+    @staticmethod
+    def _entry(record: dict) -> dict:
+        return {'Id': record['Id'], 'Name': record.get('Name'), 'StageName': record.get('StageName')}
+
+    def _advance_watermark(self, record: dict):
+        modified = record.get('LastModifiedDate')
+        if modified and (self.watermark is None or modified > self.watermark):
+            self.watermark = modified
+
+    def load(self, sf):
+        """Rebuild the index from every Opportunity in the org"""
+        matcher, modified = AddressMatcher(), {}
+        self.watermark = None
+        for record in sf.query_all_iter(f"SELECT {self.FIELDS} FROM Opportunity"):
+            matcher.add(self._entry(record))
+            modified[record['Id']] = record.get('LastModifiedDate')
+            self._advance_watermark(record)
+        with self._lock:
+            self.matcher, self.modified = matcher, modified
+            self.ready = True
+            self.last_sync_at = self.last_full_sync_at = time.time()
+        self.loads['salesforce'] += 1
+        logger.info(f"Address index loaded {len(matcher)} opportunities")
+
+    def publish(self):
+        """Share the index with the other workers: the records, then a version they poll for"""
+        if self.shared is None:
+            return
+        with self._lock:
+            records = [[r['Id'], r['Name'], r['StageName'], self.modified.get(r['Id'])]
+                       for r in self.matcher.records.values()]
+        version = f'{self.last_sync_at}:{len(records)}'
+        self.shared.put(self.SHARED_KEY, {'records': records, 'watermark': self.watermark, 'version': version,
+                                          'synced_at': self.last_sync_at, 'full_sync_at': self.last_full_sync_at})
+        self.shared.put(f'{self.SHARED_KEY}:version', version)
+        self.version = version
+
+    def follow(self) -> bool:
+        """Load the published index if it changed since this worker last did. Returns whether it had"""
+        found, version = self.shared.get(f'{self.SHARED_KEY}:version')
+        if not found or version == self.version:
+            return False
+        found, published = self.shared.get(self.SHARED_KEY)
+        if not found:
+            return False
+        matcher, modified = AddressMatcher(), {}
+        for opp_id, name, stage, modified_at in published['records']:
+            matcher.add({'Id': opp_id, 'Name': name, 'StageName': stage})
+            modified[opp_id] = modified_at
+        with self._lock:
+            self.matcher, self.modified = matcher, modified
+            self.ready = True
+            self.last_sync_at, self.last_full_sync_at = published['synced_at'], published['full_sync_at']
+        # Kept so this worker can carry on polling from here if it becomes the leader
+        self.watermark = published['watermark']
+        self.version = published['version']
+        self.loads['shared'] += 1
+        logger.info(f"Address index loaded {len(matcher)} opportunities from the leader's copy")
+        return True
+
+    def refresh(self, sf) -> int:
+        """Apply Opportunities modified since the last sync. Returns the number applied"""
+        if self.watermark is None:
+            self.load(sf)
+            return len(self.matcher)
+        query = (f"SELECT {self.FIELDS} FROM Opportunity "
+                 f"WHERE LastModifiedDate >= {soql_datetime(self.watermark)} ORDER BY LastModifiedDate")
+        count = 0
+        for record in sf.query_all_iter(query):
+            # >= re-reads records sitting exactly on the watermark; skip ones we already have
+            if self.modified.get(record['Id']) == record.get('LastModifiedDate'):
+                continue
+            with self._lock:
+                self.matcher.add(self._entry(record))
+            self.modified[record['Id']] = record.get('LastModifiedDate')
+            self._advance_watermark(record)
+            count += 1
+        self.last_sync_at = time.time()
+        return count
+
+    def rank(self, address: str, limit: int = 5) -> list:
+        """Ranked candidates for an address, or [] if the index isn't loaded yet"""
+        if not self.ready:
+            return []
+        with self._lock:
+            ranked = self.matcher.rank(address, limit)
+        ranked = [{'record': dict(c['record']), 'confidence': c['confidence']} for c in ranked]
+        if pick_match(ranked):
+            self.hits += 1
+        else:
+            self.misses += 1
+        return ranked
+
+    def lookup(self, address: str) -> dict:
+        """Find the Opportunity for an address, or None if the index can't answer confidently"""
+        return pick_match(self.rank(address, limit=2))
+
+    def start(self, sf_factory):
+        """Warm the index and keep polling for changes in a background thread"""
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._run, args=(sf_factory,), name='address-index', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self.leader is not None:
+            self.leader.resign()
+
+    def _run(self, sf_factory):
+        while not self._stopping.is_set():
+            try:
+                if self.leader is not None and not self.leader.is_leader():
+                    self.follow()
+                elif not self.ready or time.time() - self.last_full_sync_at > self.full_refresh_interval:
+                    self.load(sf_factory())
+                    self.publish()
+                else:
+                    changed = self.refresh(sf_factory())
+                    if changed:
+                        logger.info(f"Address index applied {changed} changed opportunities")
+                        self.publish()
+            except Exception as e:
+                logger.error(f"Address index sync failed: {str(e)}")
+            self._stopping.wait(self.poll_interval if self.ready else min(self.poll_interval, self.FOLLOWER_RETRY))
+
+    def metrics(self) -> dict:
+        return {
+            'size': len(self.matcher),
+            'ready': self.ready,
+            'hits': self.hits,
+            'misses': self.misses,
+            'last_sync_age_seconds': round(time.time() - self.last_sync_at, 1) if self.last_sync_at else None,
+            'loads': dict(self.loads),
+            'leader': self.leader.leading if self.leader is not None else None,
+        }
@@ -2,14 +2,42 @@
 Poppy - AE Voice Assistant Backend
 Handles Retell webhooks and updates Salesforce
 """
-import os
+import base64
+import io
 import json
-import re
+import os
 import logging
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from datetime import datetime, timedelta
-from flask import Flask, request, jsonify
-from simple_salesforce import Salesforce
+import requests
+from flask import Flask, Response, request, jsonify
+from simple_salesforce.exceptions import SalesforceExpiredSession, SalesforceGeneralError, SalesforceRefusedRequest
 import anthropic
+from addresses import AddressIndex, normalize_address, pick_match, rank_records
+from cache import PhoneUserCache, TTLCache, normalize_phone
+from extraction import (EXTRACTION_WINDOW_TOKENS, analysis_debrief, extract_call_data, extract_increment,
+                        is_long_transcript, skipped_request_tokens, stream_debrief, usage_metrics, validate_debrief,
+                        with_known)
+from idempotency import COMPLETED, store_from_env
+from job_queue import JobQueue, JobWorkerPool
+from latency import LatencyTracker
+from live_debrief import LiveDebrief
+from metrics import (CALL_ANALYZED_EVENTS, FUNCTION_SECONDS, JOBS_PARKED, LLM_REQUESTS_SAVED, LLM_TOKENS_SAVED,
+                     OPPORTUNITY_FIELDS, OPPORTUNITY_SEARCH_SECONDS, OPPORTUNITY_WRITES_SKIPPED, REGISTRY,
+                     WEBHOOK_SALESFORCE_REQUESTS, WEBHOOK_SECONDS, count_llm_usage, count_salesforce_requests)
+from opportunity_fields import (DETAIL_FIELDS, FieldCapabilities, build_opportunity_update, diff_update, fetch_snapshots,
+                                merge_diffs)
+from pipeline import StageGraph
+from reference_store import ReferenceStore
+from sf_composite import MAX_SUBREQUESTS, CompositeRequest
+from sf_guard import OPEN, CircuitBreaker, SalesforceGuard, SalesforceUnavailable
+from sf_session import SalesforceSessionManager
+from shared_state import LeaderElection, SharedCache, state_from_env
+from transcripts import chunks, estimate_tokens, transcript_lines
 
 app = Flask(__name__)
 
@@ -17,21 +45,150 @@ app = Flask(__name__)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Simple in-memory cache to prevent duplicate webhook processing
-# Stores call_id -> timestamp of processing
-processed_calls = {}
+# Append every Retell webhook payload to this JSONL file - a corpus for benchmarks/bench_replay.py
+WEBHOOK_RECORD_PATH = os.environ.get('WEBHOOK_RECORD_PATH')
+webhook_record_lock = threading.Lock()
+
+# Retell sometimes sends the same webhook more than once. The idempotency store is
+# shared by every worker and keeps each call's final result so duplicates get it back
+IDEMPOTENCY_TTL = float(os.environ.get('IDEMPOTENCY_TTL_SECONDS', 24 * 3600))
+idempotency_store = store_from_env()
+
+# call_ended webhooks are queued and processed in the background so Retell gets
+# an immediate 202 instead of waiting on Salesforce and Claude
+ASYNC_CALL_PROCESSING = os.environ.get('ASYNC_CALL_PROCESSING', 'true').lower() != 'false'
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 5))
+job_queue = JobQueue(os.environ.get('JOB_QUEUE_PATH', 'jobs.sqlite3'))
+worker_pool = None
+worker_pool_lock = threading.Lock()
+
+# Retell sends call_analyzed, with its post-call analysis, shortly after call_ended. A queued
+# call can wait up to CALL_ANALYSIS_WAIT_SECONDS for it so both are handled as one job, and the
+# analysis's custom fields and summary are used instead of extracting them again. Off by default:
+# the wait holds every debrief, including calls no call_analyzed ever comes for; a late one is
+# still used if it arrives before the job starts
+CALL_ANALYSIS_WAIT_SECONDS = float(os.environ.get('CALL_ANALYSIS_WAIT_SECONDS', 0))
+CALL_ANALYSIS_REUSE = os.environ.get('CALL_ANALYSIS_REUSE', 'true').lower() != 'false'
+
+# State shared by the processes serving the app - SHARED_STATE_BACKEND is local (this
+# process only), sqlite (every worker on the host; gunicorn.conf.py's default) or redis
+# (every dyno). With it shared, one elected worker loads the address index and the AE
+# directory from Salesforce and the others copy them from here
+shared_state = state_from_env()
+SHARED_STATE = shared_state.backend != 'local'
+
+def leader_election(name: str, ttl: float):
+    return LeaderElection(shared_state, name, ttl) if SHARED_STATE else None
+
+# In-process address -> Opportunity index, so live lookups skip the LIKE '%...%' queries
+ADDRESS_INDEX_ENABLED = os.environ.get('ADDRESS_INDEX_ENABLED', 'true').lower() != 'false'
+ADDRESS_INDEX_POLL_SECONDS = float(os.environ.get('ADDRESS_INDEX_POLL_SECONDS', 60))
+address_index = AddressIndex(poll_interval=ADDRESS_INDEX_POLL_SECONDS,
+                             shared=shared_state if SHARED_STATE else None,
+                             leader=leader_election('address_index', ttl=3 * ADDRESS_INDEX_POLL_SECONDS))
+address_index_lock = threading.Lock()
+
+# AE phone -> User directory, preloaded from all active users and refreshed hourly
+USER_CACHE_ENABLED = os.environ.get('USER_CACHE_ENABLED', 'true').lower() != 'false'
+user_cache = PhoneUserCache(
+    ttl=float(os.environ.get('USER_CACHE_TTL_SECONDS', 3600)),
+    negative_ttl=float(os.environ.get('USER_CACHE_NEGATIVE_TTL_SECONDS', 300)),
+    shared=shared_state if SHARED_STATE else None,
+    leader=leader_election('user_directory', ttl=300),
+)
+
+# Bundle the end-of-call Salesforce writes into one Composite API request
+SF_COMPOSITE_WRITES = os.environ.get('SF_COMPOSITE_WRITES', 'true').lower() != 'false'
+
+# Stream the extraction and send the Opportunity update while tasks/events are still
+# being generated. The update then goes out ahead of (not inside) the Composite request
+STREAMING_EXTRACTION = os.environ.get('STREAMING_EXTRACTION', 'false').lower() == 'true'
+
+# Where the rest of a transcript too long for the call Task's description goes: 'file' - a
+# text file (ContentVersion) on the Opportunity, 'tasks' - continuation Tasks, 'truncate' - dropped
+TRANSCRIPT_STORAGE = os.environ.get('TRANSCRIPT_STORAGE', 'file').lower()
+TASK_DESCRIPTION_LIMIT = 32000
+
+# Threads per call for the debrief pipeline stages; 1 runs them one after another
+PIPELINE_WORKERS = int(os.environ.get('PIPELINE_WORKERS', 4))
+
+# Mid-call function calls (the AE is waiting on the line): lookups get a hard latency
+# budget, resolved addresses are cached per call, and writes are queued for the workers
+FAST_FUNCTION_PATH = os.environ.get('FAST_FUNCTION_PATH', 'true').lower() != 'false'
+FUNCTION_LATENCY_BUDGET = float(os.environ.get('FUNCTION_LATENCY_BUDGET_MS', 800)) / 1000
+function_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('FUNCTION_WORKERS', 8)),
+                                       thread_name_prefix='function')
+# Queued writes go ahead of call_ended jobs and have workers of their own, so an acknowledged
+# write never waits behind a debrief that takes 20-30 s
+FUNCTION_WRITE_PRIORITY = 1
+function_write_pool = None
+# A call's function calls can land on different workers, so with shared state they share its lookups
+if SHARED_STATE:
+    live_calls = SharedCache(shared_state, 'live_calls', ttl=2 * 3600)
+else:
+    live_calls = TTLCache(ttl=2 * 3600, max_size=5000)
+function_latency = LatencyTracker(budget=FUNCTION_LATENCY_BUDGET)
+
+# Extract the debrief during the call from Retell's transcript_updated webhooks, a stretch
+# of at least LIVE_EXTRACTION_MIN_TOKENS at a time, so call_ended only has to reconcile
+# the last few utterances and the Opportunity has already been found. The running debrief
+# lives in this process, so it needs every webhook for the call - a single web worker
+LIVE_EXTRACTION = os.environ.get('LIVE_EXTRACTION', 'false').lower() == 'true'
+WEB_WORKERS = int(os.environ.get('WEB_CONCURRENCY') or 1)
+if LIVE_EXTRACTION and WEB_WORKERS > 1:
+    logger.warning(f"LIVE_EXTRACTION is off: {WEB_WORKERS} workers would each see only some of a call's "
+                   f"transcript updates. Run one worker (WEB_CONCURRENCY=1) to use it")
+    LIVE_EXTRACTION = False
+LIVE_EXTRACTION_MIN_TOKENS = int(os.environ.get('LIVE_EXTRACTION_MIN_TOKENS', 200))
+live_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('LIVE_EXTRACTION_WORKERS', 4)),
+                                   thread_name_prefix='live')
+live_debriefs = TTLCache(ttl=2 * 3600, max_size=1000)
+live_debriefs_lock = threading.Lock()
+
+# Read an Opportunity's current values before updating it and send only the fields that
+# changed. The diff always reads Salesforce - a value someone changed since a cached read
+# must not be taken as already set. The read is cached briefly and carries the Account and
+# property details the call's events are built from
+OPPORTUNITY_DIFF_ENABLED = os.environ.get('OPPORTUNITY_DIFF', 'true').lower() != 'false'
+opportunity_snapshots = TTLCache(ttl=float(os.environ.get('OPPORTUNITY_SNAPSHOT_TTL_SECONDS', 60)), max_size=2000)
+field_capabilities = FieldCapabilities()
+
+# Local SQLite copy of Opportunities, Accounts and active Users (REFERENCE_STORE=true): a
+# nightly Bulk API export plus SystemModstamp deltas. While it was synced within
+# REFERENCE_STORE_MAX_STALENESS_SECONDS, address searches, Opportunity reads and AE phone
+# lookups are answered from it - but not the read a write is diffed against; one worker
+# per host keeps the file in sync
+REFERENCE_STORE_ENABLED = os.environ.get('REFERENCE_STORE', 'false').lower() == 'true'
+REFERENCE_SYNC_DELTA_SECONDS = float(os.environ.get('REFERENCE_SYNC_DELTA_SECONDS', 300))
+reference_store = ReferenceStore(
+    path=os.environ.get('REFERENCE_STORE_PATH', 'reference_store.sqlite3'),
+    max_staleness=float(os.environ.get('REFERENCE_STORE_MAX_STALENESS_SECONDS', 900)),
+    delta_interval=REFERENCE_SYNC_DELTA_SECONDS,
+    sync_hour=int(os.environ.get('REFERENCE_SYNC_HOUR_UTC', 9)),
+    capabilities=field_capabilities,
+    leader=leader_election(f'reference_store:{socket.gethostname()}', ttl=3 * REFERENCE_SYNC_DELTA_SECONDS),
+)
+reference_store_lock = threading.Lock()
+
+# Outbound Salesforce traffic from this process shares one rate limit (SF_MAX_RPS, scaled
+# down once the org has used SF_API_SOFT_LIMIT of its daily API requests) and a circuit
+# breaker. While the circuit is open, calls are parked in the job queue rather than failed
+SF_GUARD_ENABLED = os.environ.get('SF_GUARD', 'true').lower() != 'false'
+sf_guard = SalesforceGuard(
+    rate=float(os.environ.get('SF_MAX_RPS', 20)),
+    soft_limit=float(os.environ.get('SF_API_SOFT_LIMIT', 0.8)),
+    breaker=CircuitBreaker(
+        failure_threshold=int(os.environ.get('SF_BREAKER_FAILURES', 5)),
+        reset_timeout=float(os.environ.get('SF_BREAKER_RESET_SECONDS', 30)),
+        limit_timeout=float(os.environ.get('SF_LIMIT_BACKOFF_SECONDS', 300)),
+    ),
+) if SF_GUARD_ENABLED else None
+
+# Salesforce connection - one login per process, shared across request threads
+sf_sessions = SalesforceSessionManager(guard=sf_guard)
 
-# Salesforce connection
 def get_sf_connection():
-    return Salesforce(
-        username=os.environ.get('SF_USERNAME'),
-        password=os.environ.get('SF_PASSWORD'),
-        security_token=os.environ.get('SF_SECURITY_TOKEN'),
-        domain=os.environ.get('SF_DOMAIN', 'login')
-    )
-
-# Anthropic client for extraction
-claude_client = anthropic.Anthropic(api_key=os.environ.get('ANTHROPIC_API_KEY'))
+    return sf_sessions.connection()
 
 def get_next_business_day():
     """Get the next business day (skip weekends)"""
@@ -44,117 +201,39 @@ def get_next_business_day():
         next_day = today + timedelta(days=days_ahead)
     return next_day.strftime('%Y-%m-%d')
 
-def extract_data_from_transcript(transcript: str, property_address: str) -> dict:
-    """Use GPT to extract structured data from conversation transcript"""
-
-    extraction_prompt = f"""
-Extract structured data from this sales call transcript. The AE is debriefing about an appointment at {property_address}.
-
-TRANSCRIPT:
-{transcript}
-
-Extract the following fields (return null if not mentioned):
-- stage: One of [Appointment Set, Warm, Hot, Nurture, Contract Signed, Closed Won, Closed Lost]
-  * Appointment Set = appointment scheduled but not yet attended
-  * Warm = interested, needs follow-up
-  * Hot = very interested, likely to close soon
-  * Nurture = long-term follow-up needed
-  * Contract Signed = got the contract signed
-  * DO NOT use "Appointment Attended" - this is NOT a valid stage
-- nurture_reason: Only if stage is Nurture - one of [3-6 Months, 6-9 Months, 9-24 Months, Uncontacted, Cold, Property Currently List, Skiptrace Needed, SOLD, Check Back, Below Mortgage]
-- appt_status: One of [Scheduled, Attended, No-Show, Cancelled, Rescheduled] - status of the appointment
-- appointment_attended: true/false - did the AE attend the appointment? (usually true for debrief calls)
-- ae_in_attendance: Name of the AE who attended (if mentioned)
-- arv: After Repair Value as integer (no $ or commas)
-- rehab_cost: Estimated repair costs as integer
-- last_offer: Last offer made to seller as integer
-- lowest_accept: Lowest price seller will accept as integer
-- options_presented: true/false - were purchase options presented to the seller?
-- option_notes: Notes about option presentation - what options were discussed
-- obstacle: What's preventing contract signing right now
-- property_walk_thru: Notes from the property walkthrough - condition, observations, etc.
-- seller_declined_offer: One of [Yes, No, Counter Offered, Considering, No Response] - did the seller decline the offer price?
-- next_step: What happens next - ALWAYS use actual dates (e.g., "Meet on 12/6/2025 with seller for options presentation"). NEVER use relative terms like "tomorrow", "today", "next week", "Wednesday" - convert to actual MM/DD/YYYY format
-- post_appt_notes: General notes from the appointment
-- marketing_notes: Marketing-related observations
-- repair_notes: Details about property repairs needed
-- not_closeable_reason: Why did the AE leave without a signed contract? (e.g., price gap, seller needs time, competing offers, title issues, etc.) - ALWAYS populate this if no contract was signed
-- tasks: Array of tasks to create, each with "subject" and optional "due_date" (YYYY-MM-DD)
-- events: Array of calendar events to create (e.g., follow-up appointments, meetings with seller). Each event needs:
-  * "datetime": ISO format datetime (e.g., "2024-12-06T14:00:00") - MUST include specific time
-  * "location": Optional - only if AE specifies a different location than the property
-
-IMPORTANT:
-- Convert dollar amounts to integers (e.g., "320k" = 320000, "$195,000" = 195000)
-- For stage: ONLY extract if the AE explicitly states the stage (e.g., "this is a hot lead", "put them in nurture", "mark it warm"). Do NOT guess or infer the stage - return null if not explicitly mentioned.
-- Extract emotional/motivation details into appropriate notes fields
-- If no contract was signed at the appointment, ALWAYS extract not_closeable_reason - what prevented the close?
-- next_step is REQUIRED - always extract what happens next
-- Convert ALL relative dates to actual dates. Today is {datetime.now().strftime('%m/%d/%Y')}. "Tomorrow" = {(datetime.now() + timedelta(days=1)).strftime('%m/%d/%Y')}, etc.
-
-Return valid JSON only, no markdown formatting.
-"""
-
-    response = claude_client.messages.create(
-        model="claude-sonnet-4-20250514",
-        max_tokens=1024,
-        system="You extract structured data from sales call transcripts. Return only valid JSON, no markdown formatting or code blocks.",
-        messages=[
-            {"role": "user", "content": extraction_prompt}
-        ]
-    )
-
-    try:
-        content = response.content[0].text
-        # Strip any markdown code blocks if present
-        content = re.sub(r'^```json\s*', '', content)
-        content = re.sub(r'^```\s*', '', content)
-        content = re.sub(r'\s*```$', '', content)
-        return json.loads(content)
-    except json.JSONDecodeError:
-        # Try to extract JSON from response
-        match = re.search(r'\{.*\}', content, re.DOTALL)
-        if match:
-            return json.loads(match.group())
-        return {}
-
-def normalize_address(address: str) -> str:
-    """Normalize address for better matching"""
-    addr = address.lower().strip()
-    # Standardize common abbreviations
-    replacements = {
-        ' street': ' st', ' st.': ' st',
-        ' avenue': ' ave', ' ave.': ' ave',
-        ' drive': ' dr', ' dr.': ' dr',
-        ' road': ' rd', ' rd.': ' rd',
-        ' boulevard': ' blvd', ' blvd.': ' blvd',
-        ' lane': ' ln', ' ln.': ' ln',
-        ' court': ' ct', ' ct.': ' ct',
-        ' place': ' pl', ' pl.': ' pl',
-        ' circle': ' cir', ' cir.': ' cir',
-        ' west': ' w', ' w.': ' w',
-        ' east': ' e', ' e.': ' e',
-        ' north': ' n', ' n.': ' n',
-        ' south': ' s', ' s.': ' s',
-        ',': '', ' - ': ' ', '-': ' ',
-    }
-    for old, new in replacements.items():
-        addr = addr.replace(old, new)
-    return addr
-
 def find_opportunity_by_address(sf, address: str) -> dict:
-    """Find an Opportunity by address (Name field)"""
+    """Find an Opportunity by address (Name field) - only when the match is confident and unambiguous"""
+    return pick_match(find_opportunity_candidates(sf, address))
+
+def find_opportunity_candidates(sf, address: str, limit: int = 5) -> list:
+    """Ranked Opportunities for an address, as [{'record': ..., 'confidence': ...}] best first"""
+    # The local index answers most lookups without an API call
+    if ADDRESS_INDEX_ENABLED:
+        with OPPORTUNITY_SEARCH_SECONDS.time(step='index'):
+            ensure_address_index()
+            candidates = address_index.rank(address, limit)
+        if pick_match(candidates):
+            return candidates
+
+    # A fresh local copy answers the rest, matched or not
+    if REFERENCE_STORE_ENABLED:
+        with OPPORTUNITY_SEARCH_SECONDS.time(step='reference_store'):
+            ensure_reference_store()
+            candidates = reference_store.search_opportunities(address, limit)
+        if candidates is not None:
+            return candidates
+
     # Clean up address for search
     clean_address = address.strip().replace("'", "\\'")
+    records = []
 
     # Try exact match first
     query = f"SELECT Id, Name, StageName FROM Opportunity WHERE Name LIKE '%{clean_address}%' LIMIT 5"
-    results = sf.query(query)
-
-    if results['totalSize'] == 1:
-        return results['records'][0]
-    elif results['totalSize'] > 1:
-        return results['records'][0]
+    with OPPORTUNITY_SEARCH_SECONDS.time(step='exact'):
+        records.extend(sf.query(query)['records'])
+    candidates = rank_records(address, records, limit)
+    if pick_match(candidates):
+        return candidates
 
     # Try with just street number and street name (first 2-3 words)
     parts = clean_address.split()
@@ -162,85 +241,145 @@ def find_opportunity_by_address(sf, address: str) -> dict:
         # Try "4116 W Iowa" style (number + direction + street)
         partial = f"{parts[0]} {parts[1]}"
         query = f"SELECT Id, Name, StageName FROM Opportunity WHERE Name LIKE '%{partial}%' LIMIT 5"
-        results = sf.query(query)
-        if results['totalSize'] >= 1:
-            return results['records'][0]
+        with OPPORTUNITY_SEARCH_SECONDS.time(step='street'):
+            records.extend(sf.query(query)['records'])
+        candidates = rank_records(address, records, limit)
+        if pick_match(candidates):
+            return candidates
 
-    # Try normalized matching - normalize both input and search by street number
+    # Search by street number and let the scorer sort out spelling differences
     if len(parts) >= 1 and parts[0].isdigit():
-        street_num = parts[0]
-        # Search by street number and check normalized versions
-        query = f"SELECT Id, Name, StageName FROM Opportunity WHERE Name LIKE '{street_num}%' LIMIT 20"
-        results = sf.query(query)
-
-        if results['totalSize'] >= 1:
-            normalized_input = normalize_address(address)
-            for record in results['records']:
-                normalized_name = normalize_address(record['Name'])
-                # Check if key parts match
-                if normalized_input.split()[0] in normalized_name:
-                    # Same street number, check street name
-                    input_words = set(normalized_input.split())
-                    name_words = set(normalized_name.split())
-                    # If they share the street number and at least one other word
-                    if len(input_words & name_words) >= 2:
-                        return record
+        query = f"SELECT Id, Name, StageName FROM Opportunity WHERE Name LIKE '{parts[0]}%' LIMIT 20"
+        with OPPORTUNITY_SEARCH_SECONDS.time(step='street_number'):
+            records.extend(sf.query(query)['records'])
+        candidates = rank_records(address, records, limit)
+
+    return candidates
+
+def serialize_candidates(candidates: list, min_confidence: float = 0.5) -> list:
+    """Candidate list for JSON responses"""
+    return [
+        {
+            'opportunity_id': c['record']['Id'],
+            'name': c['record']['Name'],
+            'current_stage': c['record'].get('StageName'),
+            'confidence': c['confidence'],
+        }
+        for c in candidates if c['confidence'] >= min_confidence
+    ]
 
-    return None
+def ensure_address_index():
+    """Start warming the address index on first use - after gunicorn has forked"""
+    with address_index_lock:
+        address_index.start(lambda: get_sf_connection())
+
+def ensure_reference_store():
+    """Start syncing the reference store on first use - after gunicorn has forked"""
+    with reference_store_lock:
+        reference_store.start(lambda: get_sf_connection())
 
 def find_user_by_phone(sf, phone: str) -> dict:
     """Find a Salesforce User by phone number"""
-    clean_phone = re.sub(r'\D', '', phone)[-10:]  # Last 10 digits
-
-    query = f"SELECT Id, Name FROM User WHERE Phone LIKE '%{clean_phone}%' OR MobilePhone LIKE '%{clean_phone}%' LIMIT 1"
-    results = sf.query(query)
+    clean_phone = normalize_phone(phone)  # Last 10 digits
+    if not clean_phone:
+        return None
 
-    if results['totalSize'] >= 1:
-        return results['records'][0]
-    return None
+    if USER_CACHE_ENABLED:
+        user_cache.refresh_in_background(get_sf_connection)
+        found, user = user_cache.get(clean_phone)
+        if found:
+            return user
 
-def update_opportunity(sf, opp_id: str, data: dict) -> bool:
-    """Update Opportunity with extracted data"""
-    update_fields = {}
-
-    # Map extracted data keys to SF field API names
-    field_mapping = {
-        'stage': 'StageName',
-        'nurture_reason': 'Nurture_Reason__c',
-        'appt_status': 'Appt_Status__c',
-        'appointment_attended': 'Appointment_Attended__c',
-        'ae_in_attendance': 'AE_in_Attendance__c',
-        'arv': 'ARV__c',
-        'rehab_cost': 'Rehab_Cost__c',
-        'last_offer': 'Last_Offer_Made__c',
-        'lowest_accept': 'Lowest_price_seller_will_accept__c',
-        'options_presented': 'Options_Presented__c',
-        'option_notes': 'Option_Presentation_Notes__c',
-        'obstacle': 'Obstacle_to_Contract__c',
-        'property_walk_thru': 'Property_Walk_Thru__c',
-        'seller_declined_offer': 'Did_Seller_Decline_Offer_Price__c',
-        'next_step': 'NextStep',  # Standard SF field, not custom Next_Step__c
-        'post_appt_notes': 'Post_Appointment_Notes__c',
-        'marketing_notes': 'AE_Marketing_Notes__c',
-        'repair_notes': 'AE_Repair_Notes__c',
-        'not_closeable_reason': 'Why_was_this_not_closable__c',
-    }
+    if REFERENCE_STORE_ENABLED:
+        ensure_reference_store()
+        found, user = reference_store.user_by_phone(clean_phone)
+        if found:
+            if USER_CACHE_ENABLED:
+                user_cache.put(clean_phone, user)
+            return user
 
-    for key, sf_field in field_mapping.items():
-        if key in data and data[key] is not None:
-            update_fields[sf_field] = data[key]
+    query = f"SELECT Id, Name FROM User WHERE Phone LIKE '%{clean_phone}%' OR MobilePhone LIKE '%{clean_phone}%' LIMIT 1"
+    results = sf.query(query)
 
-    if update_fields:
-        sf.Opportunity.update(opp_id, update_fields)
-        return True
-    return False
+    user = results['records'][0] if results['totalSize'] >= 1 else None
+    if USER_CACHE_ENABLED:
+        # Unknown numbers are cached too, so a caller we can't match doesn't cost a query every call
+        user_cache.put(clean_phone, user)
+    return user
+
+def load_opportunity(sf, opp_id: str, fresh: bool = False) -> dict:
+    """The Opportunity's debrief fields and event details, from the cache, the reference store or one query;
+    None if it doesn't exist. fresh skips the cache and the reference store, which may be minutes behind"""
+    if not fresh:
+        found, snapshot = opportunity_snapshots.get(opp_id)
+        if found:
+            return snapshot
+    if REFERENCE_STORE_ENABLED and not fresh:
+        ensure_reference_store()
+        found, snapshot = reference_store.opportunity(opp_id)
+        if found:
+            opportunity_snapshots.put(opp_id, snapshot)
+            return snapshot
+    detail_fields = field_capabilities.available(sf, 'Opportunity', DETAIL_FIELDS)
+    snapshot = fetch_snapshots(sf, [opp_id], extra_fields=detail_fields).get(opp_id)
+    if snapshot is not None:
+        opportunity_snapshots.put(opp_id, snapshot)
+    return snapshot
+
+def opportunity_snapshot(sf, opp_id: str) -> dict:
+    """Current values of the Opportunity fields a debrief writes, read now, or None if they can't be read"""
+    try:
+        return load_opportunity(sf, opp_id, fresh=True)
+    except Exception as e:
+        logger.warning(f"Could not read opportunity {opp_id} for the field diff, sending every field: {e}")
+        return None
 
-def create_task(sf, opp_id: str, owner_id: str, subject: str, due_date: str = None) -> str:
-    """Create a Task linked to an Opportunity"""
+def diff_opportunity(sf, opp_id: str, data: dict) -> tuple:
+    """(fields to send, diff report) for writing extracted data to an Opportunity"""
+    proposed = build_opportunity_update(data)
+    if not proposed:
+        return {}, merge_diffs()
+    changes, diff = diff_update(opportunity_snapshot(sf, opp_id) if OPPORTUNITY_DIFF_ENABLED else None, proposed)
+    for outcome in ('changed', 'unchanged', 'rejected'):
+        if diff[outcome]:
+            OPPORTUNITY_FIELDS.inc(len(diff[outcome]), outcome=outcome)
+    if not changes:
+        OPPORTUNITY_WRITES_SKIPPED.inc()
+    return changes, diff
+
+def remember_opportunity_write(opp_id: str, changes: dict):
+    """Fold fields just written into the cached snapshot and the reference store, so a repeat write diffs against them"""
+    found, snapshot = opportunity_snapshots.get(opp_id)
+    if found and snapshot is not None:
+        opportunity_snapshots.put(opp_id, {**snapshot, **changes})
+    if REFERENCE_STORE_ENABLED:
+        try:
+            reference_store.apply_write(opp_id, changes)
+        except Exception as e:
+            logger.warning(f"Could not update the reference store copy of {opp_id}: {e}")
+
+def update_opportunity(sf, opp_id: str, data: dict) -> dict:
+    """Update Opportunity with the extracted fields that differ from its current values
+
+    Returns the diff report; nothing is sent when it has no changed fields.
+    """
+    changes, diff = diff_opportunity(sf, opp_id, data)
+    if changes:
+        try:
+            sf.Opportunity.update(opp_id, changes)
+        except Exception:
+            # The write may or may not have landed - read the record again next time
+            opportunity_snapshots.invalidate(opp_id)
+            raise
+        remember_opportunity_write(opp_id, changes)
+    return diff
+
+def build_task_data(opp_id: str, owner_id: str, subject: str, due_date: str = None) -> dict:
+    """Field values for a follow-up Task linked to an Opportunity"""
     if not due_date:
         due_date = get_next_business_day()
 
-    task_data = {
+    return {
         'Subject': subject,
         'WhatId': opp_id,
         'OwnerId': owner_id,
@@ -249,42 +388,26 @@ def create_task(sf, opp_id: str, owner_id: str, subject: str, due_date: str = No
         'Priority': 'Normal'
     }
 
-    result = sf.Task.create(task_data)
+def create_task(sf, opp_id: str, owner_id: str, subject: str, due_date: str = None) -> str:
+    """Create a Task linked to an Opportunity"""
+    result = sf.Task.create(build_task_data(opp_id, owner_id, subject, due_date))
     return result['id']
 
 def get_opportunity_details(sf, opp_id: str) -> dict:
-    """Get Opportunity details for event creation"""
-    query = f"""SELECT Id, Name, Account.Name, Account.Phone, Account.PersonMobilePhone,
-                Property_Address__c, Property_City__c, Property_State__c, Property_Zip__c
-                FROM Opportunity WHERE Id = '{opp_id}'"""
-    try:
-        results = sf.query(query)
-        if results['totalSize'] >= 1:
-            return results['records'][0]
-    except:
-        # Fallback query without Account fields if they don't exist
-        query = f"SELECT Id, Name FROM Opportunity WHERE Id = '{opp_id}'"
-        results = sf.query(query)
-        if results['totalSize'] >= 1:
-            return results['records'][0]
-    return None
+    """Get Opportunity details for event creation - usually already cached by the read before the update"""
+    return load_opportunity(sf, opp_id)
 
-def create_event(sf, opp_id: str, owner_id: str, event_datetime: str, location: str = None, sf_instance_url: str = None) -> str:
-    """Create an Event (calendar item) linked to an Opportunity
+def build_event_data(opp: dict, owner_id: str, event_datetime: str, location: str = None, sf_instance_url: str = None) -> dict:
+    """Field values for an Event on an Opportunity, using its details for subject/location/description
 
     Args:
-        sf: Salesforce connection
-        opp_id: Opportunity ID
+        opp: Opportunity record from get_opportunity_details
         owner_id: User ID for event owner
         event_datetime: ISO format datetime string (e.g., '2024-12-06T14:00:00')
         location: Optional location override (defaults to property address)
         sf_instance_url: SF instance URL for building record links
     """
-    # Get opportunity details for event info
-    opp = get_opportunity_details(sf, opp_id)
-    if not opp:
-        logger.error(f"Could not find opportunity {opp_id} for event creation")
-        return None
+    opp_id = opp['Id']
 
     # Extract seller name from Opportunity Name or Account
     # Opportunity Name format is usually "Address - City" so use Account if available
@@ -334,7 +457,7 @@ def create_event(sf, opp_id: str, owner_id: str, event_datetime: str, location:
     start_dt = datetime.fromisoformat(event_datetime.replace('Z', ''))
     end_dt = start_dt + timedelta(minutes=60)
 
-    event_data = {
+    return {
         'Subject': subject,
         'WhatId': opp_id,
         'OwnerId': owner_id,
@@ -344,12 +467,33 @@ def create_event(sf, opp_id: str, owner_id: str, event_datetime: str, location:
         'Description': description
     }
 
+def create_event(sf, opp_id: str, owner_id: str, event_datetime: str, location: str = None, sf_instance_url: str = None) -> str:
+    """Create an Event (calendar item) linked to an Opportunity
+
+    Args:
+        sf: Salesforce connection
+        opp_id: Opportunity ID
+        owner_id: User ID for event owner
+        event_datetime: ISO format datetime string (e.g., '2024-12-06T14:00:00')
+        location: Optional location override (defaults to property address)
+        sf_instance_url: SF instance URL for building record links
+    """
+    # Get opportunity details for event info
+    opp = get_opportunity_details(sf, opp_id)
+    if not opp:
+        logger.error(f"Could not find opportunity {opp_id} for event creation")
+        return None
+
+    event_data = build_event_data(opp, owner_id, event_datetime, location, sf_instance_url)
     result = sf.Event.create(event_data)
-    logger.info(f"Created event {result['id']} for {subject}")
+    logger.info(f"Created event {result['id']} for {event_data['Subject']}")
     return result['id']
 
-def log_call_activity(sf, opp_id: str, owner_id: str, call_data: dict, transcript: str) -> str:
-    """Log the Poppy debrief call as a completed Task activity"""
+def build_call_activity_data(opp_id: str, owner_id: str, call_data: dict, transcript: str, continued: str = None) -> dict:
+    """Field values for the completed Task that logs a Poppy debrief call
+
+    transcript is the part of it that fits; continued says where the rest is.
+    """
     call_id = call_data.get('call_id', 'unknown')
     recording_url = call_data.get('recording_url', '')
     call_duration = call_data.get('call_length', 0)  # in seconds
@@ -369,12 +513,11 @@ def log_call_activity(sf, opp_id: str, owner_id: str, call_data: dict, transcrip
     if recording_url:
         description_parts.append(f"\nRecording: {recording_url}")
 
-    # Add transcript (truncate if too long - SF has 32k limit)
+    # Add transcript - as much as fits in the 32k description, cut between utterances
     if transcript:
-        max_transcript_len = 30000  # Leave room for other content
-        if len(transcript) > max_transcript_len:
-            transcript = transcript[:max_transcript_len] + "\n\n[Transcript truncated]"
         description_parts.append(f"\n\n--- TRANSCRIPT ---\n{transcript}")
+    if continued:
+        description_parts.append(f"\n\n[{continued}]")
 
     description = "\n".join(description_parts)
 
@@ -390,14 +533,228 @@ def log_call_activity(sf, opp_id: str, owner_id: str, call_data: dict, transcrip
     }
 
     # Remove None values
-    task_data = {k: v for k, v in task_data.items() if v is not None}
+    return {k: v for k, v in task_data.items() if v is not None}
 
-    result = sf.Task.create(task_data)
-    return result['id']
+def build_call_records(opp_id: str, owner_id: str, call_data: dict, transcript: str) -> list:
+    """(sobject, field values) for logging the call: the completed Task, then - if the transcript
+    doesn't fit in its description - a file or continuation Tasks holding the full transcript
+
+    The transcript is read an utterance at a time (from transcript_object when Retell
+    sent it), so a long call is never copied whole into more than the one file body.
+    """
+    call_data = dict(call_data, transcript=transcript)
+    room = TASK_DESCRIPTION_LIMIT - len(build_call_activity_data(opp_id, owner_id, call_data, '')['Description']) - 300
+    parts = chunks(transcript_lines(call_data), room)
+    first = next(parts, '')
+    second = next(parts, None)
+    if second is None:
+        return [('Task', build_call_activity_data(opp_id, owner_id, call_data, first))]
+    call_id = call_data.get('call_id', 'unknown')
+
+    if TRANSCRIPT_STORAGE == 'truncate':
+        return [('Task', build_call_activity_data(opp_id, owner_id, call_data, first, 'Transcript truncated'))]
+
+    if TRANSCRIPT_STORAGE == 'tasks':
+        rest = [second, *parts]
+        total = len(rest) + 1
+        records = [('Task', build_call_activity_data(
+            opp_id, owner_id, call_data, first, f'Transcript continues in {total - 1} more "Poppy Debrief Call" tasks'))]
+        for i, chunk in enumerate(rest, start=2):
+            records.append(('Task', {
+                'Subject': f'Poppy Debrief Call - transcript {i} of {total}',
+                'WhatId': opp_id,
+                'OwnerId': owner_id,
+                'ActivityDate': datetime.now().strftime('%Y-%m-%d'),
+                'Status': 'Completed',
+                'Priority': 'Normal',
+                'Description': f'Call ID: {call_id}\n\n{chunk}',
+            }))
+        return records
+
+    title = f'Poppy transcript {call_id}'
+    body = io.BytesIO()
+    for line in transcript_lines(call_data):
+        body.write(line.encode('utf-8'))
+        body.write(b'\n')
+    return [
+        ('Task', build_call_activity_data(opp_id, owner_id, call_data, first,
+                                          f'Transcript continues - full transcript in the file "{title}" on this Opportunity')),
+        ('ContentVersion', {
+            'Title': title,
+            'PathOnClient': f'poppy-transcript-{call_id}.txt',
+            'VersionData': base64.b64encode(body.getbuffer()).decode('ascii'),
+            'FirstPublishLocationId': opp_id,
+        }),
+    ]
+
+class PartialDebriefWrite(Exception):
+    """A record-by-record debrief write failed after creating some of its records
+
+    Running the debrief again would create those records a second time, so this is
+    never retried or parked; result is what was written, kept for re-sent webhooks.
+    """
+
+    def __init__(self, opp_id: str, written: dict, cause: Exception):
+        self.result = {'status': 'partially_written', 'opportunity_id': opp_id,
+                       'error': f"{type(cause).__name__}: {cause}", **written}
+        super().__init__(f"Debrief for opportunity {opp_id} was partly written before {type(cause).__name__}: {cause}")
+
+def write_debrief_records(sf, opp_id: str, owner_id: str, call_data: dict, transcript: str, extracted: dict,
+                          tasks: list, events: list, sf_instance_url: str) -> dict:
+    """write_debrief_results one record at a time
+
+    A failure before anything is created re-raises as is, so the job can be retried.
+    Once a record exists it raises PartialDebriefWrite instead: a retry would create it again.
+    """
+    written = {'opportunity_updated': False, 'opportunity_diff': merge_diffs(), 'call_activity_id': None,
+               'transcript_records': [], 'tasks_created': [], 'events_created': []}
+    try:
+        if extracted:
+            written['opportunity_diff'] = update_opportunity(sf, opp_id, extracted)
+            written['opportunity_updated'] = bool(written['opportunity_diff']['changed'])
+        if owner_id:
+            for i, (sobject, data) in enumerate(build_call_records(opp_id, owner_id, call_data, transcript)):
+                record_id = getattr(sf, sobject).create(data)['id']
+                if i == 0:
+                    written['call_activity_id'] = record_id
+                else:
+                    written['transcript_records'].append(record_id)
+        for task in tasks:
+            written['tasks_created'].append(
+                create_task(sf, opp_id, owner_id, task.get('subject', 'Follow up'), task.get('due_date')))
+        for event in events:
+            event_id = create_event(sf, opp_id, owner_id, event['datetime'], event.get('location'), sf_instance_url)
+            if event_id:
+                written['events_created'].append(event_id)
+    except Exception as e:
+        created = [written['call_activity_id'], *written['transcript_records'], *written['tasks_created'],
+                   *written['events_created']]
+        if not any(created):
+            raise
+        error = PartialDebriefWrite(opp_id, written, e)
+        logger.error(f"{error}: {created}")
+        raise error from e
+    return written
+
+def write_debrief_results(sf, opp_id: str, owner_id: str, call_data: dict, transcript: str, extracted: dict) -> dict:
+    """Apply the extracted debrief to Salesforce: Opportunity update, call log, tasks and events
+
+    With SF_COMPOSITE_WRITES on (the default) everything goes out in a single
+    all-or-none Composite request; otherwise each record is written separately.
+    """
+    sf_instance_url = os.environ.get('SF_INSTANCE_URL', 'https://orgfarm-848e4d60cd-dev-ed.develop.lightning.force.com')
+    events = [e for e in (extracted.get('events') or []) if e.get('datetime')] if owner_id else []
+    tasks = (extracted.get('tasks') or []) if owner_id else []
+
+    if not SF_COMPOSITE_WRITES:
+        return write_debrief_records(sf, opp_id, owner_id, call_data, transcript, extracted, tasks, events,
+                                     sf_instance_url)
+
+    composite = CompositeRequest(all_or_none=True)
+    update_fields, diff = diff_opportunity(sf, opp_id, extracted) if extracted else ({}, merge_diffs())
+    if update_fields:
+        composite.update('Opportunity', opp_id, update_fields, 'opportunity')
+    call_records = build_call_records(opp_id, owner_id, call_data, transcript) if owner_id else []
+    for i, (sobject, data) in enumerate(call_records):
+        composite.create(sobject, data, 'call_activity' if i == 0 else f'transcript_{i}')
+    for i, task in enumerate(tasks):
+        composite.create('Task', build_task_data(opp_id, owner_id, task.get('subject', 'Follow up'), task.get('due_date')), f'task_{i}')
+    if events:
+        # One details lookup covers every event on this Opportunity
+        opp = get_opportunity_details(sf, opp_id)
+        if not opp:
+            logger.error(f"Could not find opportunity {opp_id} for event creation")
+            events = []
+        for i, event in enumerate(events):
+            event_data = build_event_data(opp, owner_id, event['datetime'], event.get('location'), sf_instance_url)
+            composite.create('Event', event_data, f'event_{i}')
+
+    if len(composite) > MAX_SUBREQUESTS:
+        # Batches would commit independently - write the records one by one and say so if that stops partway
+        logger.warning(f"Debrief for opportunity {opp_id} has {len(composite)} records, over the Composite limit "
+                       f"of {MAX_SUBREQUESTS}; writing them one at a time")
+        return write_debrief_records(sf, opp_id, owner_id, call_data, transcript, extracted, tasks, events,
+                                     sf_instance_url)
+
+    try:
+        results = composite.send(sf)
+    except Exception:
+        opportunity_snapshots.invalidate(opp_id)
+        raise
+    if update_fields:
+        remember_opportunity_write(opp_id, update_fields)
+    logger.info(f"Composite write of {len(composite)} records for opportunity {opp_id}")
+    return {
+        'opportunity_updated': 'opportunity' in results,
+        'opportunity_diff': diff,
+        'call_activity_id': results.get('call_activity', {}).get('id'),
+        'transcript_records': [results[f'transcript_{i}']['id'] for i in range(1, len(call_records))],
+        'tasks_created': [results[f'task_{i}']['id'] for i in range(len(tasks))],
+        'events_created': [results[f'event_{i}']['id'] for i in range(len(events))],
+        'write_results': results,
+    }
 
 @app.route('/health', methods=['GET'])
 def health():
-    return jsonify({'status': 'healthy', 'agent': 'Poppy'})
+    return jsonify({
+        'status': 'healthy',
+        'agent': 'Poppy',
+        'salesforce': sf_sessions.metrics(),
+        'address_index': address_index.metrics(),
+        'user_cache': user_cache.metrics(),
+        'extraction': usage_metrics(),
+        'functions': function_latency.summary(),
+        'shared_state': dict(shared_state.metrics(), pid=os.getpid()),
+        'reference_store': reference_store.metrics() if REFERENCE_STORE_ENABLED else None,
+    })
+
+def resign_leadership():
+    """Hand the background jobs this worker leads to another one now, rather than when its lease runs out"""
+    for election in (address_index.leader, user_cache.leader, reference_store.leader):
+        if election is not None:
+            election.resign()
+
+# Cache, queue and session state read at scrape time
+REGISTRY.collector('poppy_cache_hits_total', 'In-process cache hits', 'counter', lambda: [
+    ({'cache': 'address_index'}, address_index.hits),
+    ({'cache': 'user'}, user_cache.cache.hits),
+    ({'cache': 'live_calls'}, live_calls.hits),
+    ({'cache': 'opportunity_snapshots'}, opportunity_snapshots.hits),
+])
+REGISTRY.collector('poppy_cache_misses_total', 'In-process cache misses', 'counter', lambda: [
+    ({'cache': 'address_index'}, address_index.misses),
+    ({'cache': 'user'}, user_cache.cache.misses),
+    ({'cache': 'live_calls'}, live_calls.misses),
+    ({'cache': 'opportunity_snapshots'}, opportunity_snapshots.misses),
+])
+REGISTRY.collector('poppy_cache_entries', 'Entries held by in-process caches', 'gauge', lambda: [
+    ({'cache': 'address_index'}, len(address_index)),
+    ({'cache': 'user'}, len(user_cache.cache)),
+    ({'cache': 'live_calls'}, len(live_calls) if not SHARED_STATE else None),
+    ({'cache': 'opportunity_snapshots'}, len(opportunity_snapshots)),
+    ({'cache': 'live_debriefs'}, len(live_debriefs)),
+])
+REGISTRY.collector('poppy_reference_store_lookups_total', 'Reference store lookups by result (hit, miss, stale)', 'counter',
+                   lambda: [({'result': result}, count) for result, count in reference_store.lookups.items()]
+                   if REFERENCE_STORE_ENABLED else [])
+REGISTRY.collector('poppy_reference_store_age_seconds', 'Seconds since each sObject in the reference store was synced',
+                   'gauge', lambda: [({'sobject': sobject}, age) for sobject, age in
+                                     reference_store.metrics()['age_seconds'].items()] if REFERENCE_STORE_ENABLED else [])
+REGISTRY.collector('poppy_jobs', 'Jobs in the queue by status', 'gauge',
+                   lambda: [({'status': status}, count) for status, count in job_queue.counts().items()])
+REGISTRY.collector('poppy_salesforce_logins_total', 'Salesforce logins, including session refreshes', 'counter',
+                   lambda: [({}, sf_sessions.login_count)])
+REGISTRY.collector('poppy_salesforce_circuit_open', 'Whether the Salesforce circuit breaker is refusing requests',
+                   'gauge', lambda: [({}, int(sf_guard.breaker.state == OPEN))] if sf_guard else [])
+REGISTRY.collector('poppy_salesforce_rate_limit', 'Requests per second allowed to Salesforce from this process',
+                   'gauge', lambda: [({}, sf_guard.bucket.rate)] if sf_guard else [])
+REGISTRY.collector('poppy_salesforce_api_usage', "The org's daily API requests used and allowed, from Sforce-Limit-Info",
+                   'gauge', lambda: [({'kind': 'used'}, sf_guard.api_usage[0]), ({'kind': 'limit'}, sf_guard.api_usage[1])]
+                   if sf_guard and sf_guard.api_usage else [])
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/webhook/retell', methods=['POST'])
 def retell_webhook():
@@ -405,29 +762,192 @@ def retell_webhook():
     data = request.json
     event_type = data.get('event')
     logger.info(f"Webhook received: event_type={event_type}, keys={list(data.keys())}")
+    if WEBHOOK_RECORD_PATH:
+        record_webhook(data)
 
-    if event_type == 'call_ended':
+    if event_type == 'call_started':
+        return handle_call_started(data)
+    elif event_type == 'call_ended':
         return handle_call_ended(data)
     elif event_type == 'call_analyzed':
         return handle_call_analyzed(data)
+    elif event_type == 'transcript_updated':
+        return handle_transcript_updated(data)
+
+    return jsonify({'status': 'ok'})
 
+def record_webhook(data: dict):
+    try:
+        with webhook_record_lock, open(WEBHOOK_RECORD_PATH, 'a') as f:
+            f.write(json.dumps(data) + '\n')
+    except OSError as e:
+        logger.error(f"Could not record webhook: {str(e)}")
+
+def handle_call_started(data: dict):
+    """Warm the Salesforce session and address index before the first mid-call function call"""
+    if FAST_FUNCTION_PATH:
+        function_executor.submit(warm_up_function_path)
+    return jsonify({'status': 'ok'})
+
+def warm_up_function_path():
+    try:
+        get_sf_connection()
+        if ADDRESS_INDEX_ENABLED:
+            ensure_address_index()
+    except Exception as e:
+        logger.error(f"Function path warm-up failed: {str(e)}")
+
+def handle_transcript_updated(data: dict):
+    """Fold the new utterances of a call in progress into its running debrief, in the background"""
+    call_data = data.get('call', data)
+    call_id = call_data.get('call_id', '')
+    if LIVE_EXTRACTION and call_id:
+        live = live_debrief(call_id)
+        live.observe(list(transcript_lines(call_data)))
+        if live.ready():
+            live_executor.submit(advance_live_debrief, live)
     return jsonify({'status': 'ok'})
 
-def extract_address_from_transcript(transcript: str) -> str:
-    """Use Claude to extract the property address from transcript"""
-    response = claude_client.messages.create(
-        model="claude-sonnet-4-20250514",
-        max_tokens=100,
-        system="Extract the property address from this call transcript. Return ONLY the address (like '2922 N 12th St' or '123 Main Street'), nothing else. If no address found, return 'NONE'.",
-        messages=[
-            {"role": "user", "content": transcript}
-        ]
-    )
-    address = response.content[0].text.strip()
-    return None if address == 'NONE' else address
+def live_debrief(call_id: str) -> LiveDebrief:
+    with live_debriefs_lock:
+        found, live = live_debriefs.get(call_id)
+        if not found:
+            live = LiveDebrief(call_id, min_new_tokens=LIVE_EXTRACTION_MIN_TOKENS)
+            live_debriefs.put(call_id, live)
+    return live
+
+def advance_live_debrief(live: LiveDebrief):
+    try:
+        if live.advance(extract_increment):
+            resolve_live_address(live)
+    except Exception as e:
+        logger.error(f"Live extraction for call {live.call_id} failed: {str(e)}")
+
+def resolve_live_address(live: LiveDebrief):
+    """Find the Opportunity once the call mentions an address - it also becomes the call's
+    current Opportunity for mid-call writes that don't name one"""
+    if live.resolve(lambda address: find_opportunity_candidates(get_sf_connection(), address)):
+        opp = pick_match(live.candidates)
+        if opp and not live_calls.get((live.call_id, 'opportunity'))[0]:
+            live_calls.put((live.call_id, 'opportunity'), {'Id': opp['Id'], 'Name': opp['Name'],
+                                                           'StageName': opp.get('StageName'),
+                                                           'confidence': live.candidates[0]['confidence']})
 
 def handle_call_ended(data: dict):
-    """Process a completed call"""
+    """Queue a completed call for background processing"""
+    call_data = data.get('call', data)
+    call_id = call_data.get('call_id', '')
+
+    if not call_id or not ASYNC_CALL_PROCESSING:
+        return process_call_ended_sync(data)
+
+    claimed, record = idempotency_store.claim(call_id, IDEMPOTENCY_TTL)
+    if not claimed:
+        return duplicate_response(call_id, record)
+
+    # Hold the job briefly for call_analyzed, unless the payload already has the analysis
+    # or the debrief was already extracted during the call
+    delay = CALL_ANALYSIS_WAIT_SECONDS if CALL_ANALYSIS_REUSE and not call_data.get('call_analysis') else 0
+    if LIVE_EXTRACTION and live_debriefs.get(call_id)[0]:
+        delay = 0
+    job, created = job_queue.enqueue(call_id, data, max_attempts=JOB_MAX_ATTEMPTS, delay=delay)
+    if not created:
+        # Retell retries the webhook if we were slow - the original job already covers it
+        logger.info(f"Skipping duplicate webhook for call_id: {call_id} (job {job['status']})")
+        return jsonify({'status': 'duplicate', 'call_id': call_id, 'job_status': job['status']}), 202
+
+    get_worker_pool().notify()
+    logger.info(f"Queued call_ended for call_id: {call_id}")
+    return jsonify({'status': 'queued', 'call_id': call_id, 'job_status': job['status']}), 202
+
+def process_call_ended_sync(data: dict):
+    """Process a completed call inline (used when async processing is disabled)"""
+    call_data = data.get('call', data)
+    call_id = call_data.get('call_id', '')
+
+    # Check for duplicate webhook - Retell sometimes sends multiple times
+    if call_id:
+        claimed, record = idempotency_store.claim(call_id, IDEMPOTENCY_TTL)
+        if not claimed:
+            return duplicate_response(call_id, record)
+
+    try:
+        result = process_call_ended(data)
+    except PartialDebriefWrite as e:
+        logger.error(f"Error processing call: {str(e)}")
+        if call_id:
+            # Keep the claim - processing a re-sent webhook would write the same records again
+            idempotency_store.complete(call_id, e.result, IDEMPOTENCY_TTL)
+        return jsonify(e.result), 500
+    except Exception as e:
+        logger.error(f"Error processing call: {str(e)}")
+        if call_id:
+            parked = park_call(call_id, data, e)
+            if parked:
+                return parked
+            # Let Retell's retry of this webhook have another go
+            idempotency_store.release(call_id)
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+    if call_id:
+        idempotency_store.complete(call_id, result, IDEMPOTENCY_TTL)
+    return jsonify(result)
+
+def park_call(call_id: str, data: dict, exc: Exception):
+    """Queue a call that failed inline on a transient error for the job workers to finish, keeping
+    its idempotency claim. Returns the 202 response, or None if it can't be parked"""
+    delay = salesforce_retry_after(exc)
+    if delay is None:
+        if not is_transient_error(exc):
+            return None
+        delay = get_worker_pool().backoff(1)
+    job, created = job_queue.enqueue(call_id, data, max_attempts=JOB_MAX_ATTEMPTS, delay=delay)
+    if not created:
+        return None
+    JOBS_PARKED.inc()
+    get_worker_pool().notify()
+    logger.warning(f"Parked call_ended for call_id: {call_id} for {delay:.1f}s")
+    return jsonify({'status': 'parked', 'call_id': call_id, 'job_status': job['status'],
+                    'retry_in_seconds': round(delay, 1)}), 202
+
+def duplicate_response(call_id: str, record: dict):
+    """Answer a re-sent webhook - with the original result if the first delivery has finished"""
+    logger.info(f"Skipping duplicate webhook for call_id: {call_id} ({record['status']})")
+    if record['status'] == COMPLETED:
+        return jsonify(record['result'])
+    job = job_queue.get(call_id)
+    return jsonify({'status': 'duplicate', 'call_id': call_id,
+                    'job_status': job['status'] if job else record['status']}), 202
+
+def process_call_job(data: dict) -> dict:
+    """Job worker handler - process the call and record its result for duplicate webhooks"""
+    if 'function_name' in data:
+        return run_function_write(data)
+    result = process_call_ended(data)
+    call_id = data.get('call', data).get('call_id', '')
+    if call_id:
+        idempotency_store.complete(call_id, result, IDEMPOTENCY_TTL)
+    return result
+
+def release_call_job(data: dict, exc: Exception):
+    """A job failed for good - release its call_id so a re-sent webhook is processed again
+
+    Unless the debrief was partly written: then re-sent webhooks get what was written instead.
+    """
+    if 'function_name' in data:
+        logger.error(f"Mid-call {data['function_name']} for opportunity {data['opportunity_id']} was not written: {exc}")
+        return
+    call_id = data.get('call', data).get('call_id', '')
+    if call_id and isinstance(exc, PartialDebriefWrite):
+        idempotency_store.complete(call_id, exc.result, IDEMPOTENCY_TTL)
+    elif call_id:
+        idempotency_store.release(call_id)
+
+def process_call_ended(data: dict) -> dict:
+    """Run the debrief pipeline for a completed call and return the result
+
+    Raises on Salesforce/Anthropic errors so the job worker can decide whether to retry.
+    """
     # Retell can send call data nested under 'call' or at top level
     call_data = data.get('call', data)
     call_id = call_data.get('call_id', '')
@@ -443,192 +963,509 @@ def handle_call_ended(data: dict):
     logger.info(f"Processing call_ended. Call ID: {call_id}, Transcript length: {len(transcript)}, from: {from_number}, to: {to_number}, ae_phone: {ae_phone}")
     logger.info(f"Call data keys: {list(call_data.keys())}")
 
-    # Check for duplicate webhook - Retell sometimes sends multiple times
-    if call_id and call_id in processed_calls:
-        logger.info(f"Skipping duplicate webhook for call_id: {call_id}")
-        return jsonify({'status': 'duplicate', 'call_id': call_id})
-
-    # Mark this call as being processed
-    if call_id:
-        processed_calls[call_id] = datetime.now()
-        # Clean up old entries (older than 1 hour) to prevent memory growth
-        cutoff = datetime.now() - timedelta(hours=1)
-        expired = [k for k, v in processed_calls.items() if v < cutoff]
-        for k in expired:
-            del processed_calls[k]
-
     if not transcript:
         logger.warning("No transcript in call data")
-        return jsonify({'status': 'no_transcript'})
+        return {'status': 'no_transcript'}
+
+    analysis, complete = None, False
+    if CALL_ANALYSIS_REUSE and call_data.get('call_analysis'):
+        analysis, complete = analysis_debrief(call_data['call_analysis'])
+        logger.info(f"Retell call analysis: {sorted(analysis.data)} ({'complete' if complete else 'partial'})")
+
+    started = time.perf_counter()
+    status = 'error'
+    with count_salesforce_requests() as sf_requests, count_llm_usage() as llm_usage:
+        try:
+            # Salesforce login, the AE lookup and the Claude extraction don't depend on each
+            # other, so they run side by side; each later stage starts once its inputs are ready
+            with ThreadPoolExecutor(max_workers=PIPELINE_WORKERS) as executor:
+                graph = StageGraph(executor)
+                graph.add('salesforce', get_sf_connection)
+                graph.add('owner', lambda sf: find_owner_id(sf, ae_phone), deps=('salesforce',))
+                live = None if complete else finishing_live_debrief(call_id, transcript)
+                if analysis is None and live is None and STREAMING_EXTRACTION and not is_long_transcript(transcript):
+                    result = process_streamed_debrief(graph, call_data, transcript)
+                else:
+                    result = process_extracted_debrief(graph, call_data, transcript, live, analysis, complete)
+            status = result['status']
+            if live is not None:
+                result['live_extractions'] = live.extractions
+                live_debriefs.invalidate(call_id)
+        finally:
+            WEBHOOK_SECONDS.observe(time.perf_counter() - started, status=status)
+            WEBHOOK_SALESFORCE_REQUESTS.observe(sf_requests['requests'])
+    result['stage_timings'] = graph.timings
+    result['salesforce_requests'] = sf_requests['requests']
+    result['llm_usage'] = dict(llm_usage, saved=llm_savings(transcript, analysis, complete))
+    return result
+
+def llm_savings(transcript: str, analysis, complete: bool) -> dict:
+    """Claude requests and (estimated) tokens Retell's call analysis saved this call, also counted in the metrics"""
+    if analysis is None or not analysis.data:
+        return {'requests': 0, 'input_tokens': 0, 'output_tokens': 0}
+    if complete:
+        tokens = skipped_request_tokens(transcript, analysis.data)
+    else:
+        # Claude still read the transcript, but only had to write the fields the analysis lacked
+        tokens = {'input': 0, 'output': skipped_request_tokens('', analysis.data)['output']}
+    requests_saved = 1 if complete else 0
+    LLM_REQUESTS_SAVED.inc(requests_saved)
+    for kind, count in tokens.items():
+        LLM_TOKENS_SAVED.inc(count, type=kind)
+    return {'requests': requests_saved, 'input_tokens': tokens['input'], 'output_tokens': tokens['output']}
+
+def find_owner_id(sf, ae_phone: str) -> str:
+    """User Id of the AE on the call, or the default owner if the phone lookup fails"""
+    user = find_user_by_phone(sf, ae_phone)
+    if not user:
+        logger.info(f"User lookup for {ae_phone}: Not found, using default owner")
+        return os.environ.get('DEFAULT_OWNER_ID', '005gK000007u2SvQAI')  # Tisa Daniels
+    logger.info(f"User lookup for {ae_phone}: {user['Name']}")
+    return user['Id']
+
+def finishing_live_debrief(call_id: str, transcript: str) -> LiveDebrief:
+    """The call's running debrief, if live extraction covered enough of it to finish from there"""
+    if not LIVE_EXTRACTION or not call_id:
+        return None
+    found, live = live_debriefs.get(call_id)
+    if not found:
+        return None
+    # If most of the call is still unextracted (transcript updates were missed), one full pass is better
+    remaining = estimate_tokens(transcript) - live.covered_tokens()
+    if remaining > estimate_tokens(transcript) / 2 or remaining > EXTRACTION_WINDOW_TOKENS:
+        return None
+    return live
 
-    try:
-        sf = get_sf_connection()
-        logger.info("SF connection established")
-
-        # Find the user (AE) by phone
-        user = find_user_by_phone(sf, ae_phone)
-        owner_id = user['Id'] if user else None
-        # Fallback to default owner if phone lookup fails
-        if not owner_id:
-            owner_id = os.environ.get('DEFAULT_OWNER_ID', '005gK000007u2SvQAI')  # Tisa Daniels
-            logger.info(f"User lookup for {ae_phone}: Not found, using default owner")
-        else:
-            logger.info(f"User lookup for {ae_phone}: {user['Name']}")
+def finish_live_debrief(live: LiveDebrief, call_data: dict) -> tuple:
+    """extract_call_data for a call extracted as it went: reconcile the utterances since the last update"""
+    live.observe(list(transcript_lines(call_data)), final=True)
+    live.advance(extract_increment, final=True)
+    return live.result()
 
-        # Extract property address using Claude (much smarter than regex)
-        property_address = extract_address_from_transcript(transcript)
-        logger.info(f"Extracted address: {property_address}")
+def same_address(a: str, b: str) -> bool:
+    return bool(a and b) and normalize_address(a) == normalize_address(b)
 
-        if not property_address:
-            logger.warning("Could not extract address from transcript")
-            return jsonify({'status': 'no_address_found', 'message': 'Could not identify property address'})
+def search_opportunity(sf, address: str, live: LiveDebrief = None) -> list:
+    if not address:
+        return []
+    candidates = live.candidates_for(address) if live is not None else None
+    return candidates if candidates is not None else find_opportunity_candidates(sf, address)
 
-        # Find the Opportunity
-        opp = find_opportunity_by_address(sf, property_address)
-        if not opp:
-            logger.warning(f"Opportunity not found for address: {property_address}")
-            return jsonify({'status': 'opportunity_not_found', 'address': property_address})
+def process_extracted_debrief(graph: StageGraph, call_data: dict, transcript: str, live: LiveDebrief = None,
+                              analysis=None, complete: bool = False) -> dict:
+    """Debrief pipeline on a single (non-streamed) extraction, the reconciled live one, or Retell's call analysis
 
-        logger.info(f"Found opportunity: {opp['Name']} ({opp['Id']})")
+    A complete analysis is used as is; a partial one fills the fields Claude leaves out.
+    """
+    known = analysis.data if analysis is not None else {}
+    # Extract the property address and debrief fields in a single Claude pass, then
+    # search for the Opportunity as soon as both the address and the login are ready
+    if complete:
+        graph.add('extraction', lambda: with_known((None, {}, list(analysis.errors)), known))
+    elif live is not None:
+        graph.add('extraction', lambda: with_known(finish_live_debrief(live, call_data), known))
+    else:
+        graph.add('extraction', lambda: extract_call_data(transcript, call_data, known))
+    analysis_address = known.get('property_address')
+    if analysis_address and not complete:
+        # The analysis has the address, so the search needn't wait for Claude
+        graph.add('analysis_search', lambda sf: search_opportunity(sf, analysis_address, live), deps=('salesforce',))
+        graph.add('opportunity_search',
+                  lambda sf, extraction, found: found if same_address(extraction[0], analysis_address)
+                  else search_opportunity(sf, extraction[0], live),
+                  deps=('salesforce', 'extraction', 'analysis_search'))
+    else:
+        graph.add('opportunity_search', lambda sf, extraction: search_opportunity(sf, extraction[0], live),
+                  deps=('salesforce', 'extraction'))
+
+    property_address, extracted, errors = graph.result('extraction')
+    logger.info(f"Extracted address: {property_address}")
+
+    if not property_address:
+        logger.warning("Could not extract address from transcript")
+        return {'status': 'no_address_found', 'message': 'Could not identify property address'}
+
+    # Find the Opportunity
+    candidates = graph.result('opportunity_search')
+    opp = pick_match(candidates)
+    if not opp:
+        logger.warning(f"Opportunity not found for address: {property_address}")
+        return {'status': 'opportunity_not_found', 'address': property_address,
+                'candidates': serialize_candidates(candidates)}
+
+    logger.info(f"Found opportunity: {opp['Name']} ({opp['Id']})")
+    logger.info(f"Extracted data keys: {list(extracted.keys()) if extracted else 'None'}")
+
+    # Write the Opportunity update, call log, tasks and events
+    graph.add('write', lambda sf, owner_id: write_debrief_results(sf, opp['Id'], owner_id, call_data, transcript, extracted),
+              deps=('salesforce', 'owner'))
+    return debrief_result(opp, extracted, graph.result('write'), errors)
+
+def debrief_result(opp: dict, extracted: dict, written: dict, errors: list) -> dict:
+    logger.info(f"Updated opportunity {opp['Id']}: call activity {written['call_activity_id']}, "
+                f"{len(written['tasks_created'])} tasks, {len(written['events_created'])} events")
+
+    return {
+        'status': 'success',
+        'opportunity_id': opp['Id'],
+        'opportunity_name': opp['Name'],
+        'fields_updated': list(extracted.keys()) if extracted else [],
+        'opportunity_diff': written.get('opportunity_diff'),
+        'extraction_errors': [e.as_dict() for e in errors],
+        'call_activity_id': written['call_activity_id'],
+        'transcript_records': written.get('transcript_records', []),
+        'tasks_created': written['tasks_created'],
+        'events_created': written['events_created'],
+        'write_results': written.get('write_results', {})
+    }
 
-        # Extract structured data from transcript
-        extracted = extract_data_from_transcript(transcript, property_address)
-        logger.info(f"Extracted data keys: {list(extracted.keys()) if extracted else 'None'}")
+def process_streamed_debrief(graph: StageGraph, call_data: dict, transcript: str) -> dict:
+    """Debrief pipeline on a streamed extraction
 
-        # Update the Opportunity
-        if extracted:
-            update_opportunity(sf, opp['Id'], extracted)
-            logger.info(f"Updated opportunity {opp['Id']}")
+    The Opportunity search starts as soon as the address has streamed in, and the
+    Opportunity update as soon as its fields are complete - both while Claude is
+    still generating tasks and events. The rest is written once the stream ends.
+    """
+    early_fields = {}
+
+    def on_address(address):
+        if address:
+            graph.add('opportunity_search', lambda sf: find_opportunity_candidates(sf, address), deps=('salesforce',))
+
+    def update_when_found(sf, candidates) -> tuple:
+        opp = pick_match(candidates)
+        diff = update_opportunity(sf, opp['Id'], early_fields) if opp and early_fields else None
+        return opp, diff
+
+    def on_opportunity_fields(fields: dict):
+        if graph.has('opportunity_search'):
+            early_fields.update(fields)
+            graph.add('opportunity_update', update_when_found, deps=('salesforce', 'opportunity_search'))
+
+    graph.add('extraction', lambda: stream_debrief(transcript, on_address=on_address,
+                                                   on_opportunity_fields=on_opportunity_fields))
+    extracted, timings = graph.result('extraction')
+    if extracted is None:
+        logger.warning("Streamed extraction returned no tool call, falling back to the non-streaming flow")
+        property_address, extracted, errors = extract_call_data(transcript)
+    else:
+        debrief = validate_debrief(extracted)
+        extracted, errors = debrief.data, debrief.errors
+        property_address = extracted.pop('property_address', None)
+    logger.info(f"Extracted address: {property_address} (stream timings: {timings})")
+
+    if not property_address:
+        logger.warning("Could not extract address from transcript")
+        return {'status': 'no_address_found', 'message': 'Could not identify property address'}
+
+    if not graph.has('opportunity_search'):
+        on_address(property_address)
+    candidates = graph.result('opportunity_search')
+    if graph.has('opportunity_update'):
+        opp, early_diff = graph.result('opportunity_update')
+    else:
+        opp, early_diff = pick_match(candidates), None
+    if not opp:
+        logger.warning(f"Opportunity not found for address: {property_address}")
+        return {'status': 'opportunity_not_found', 'address': property_address,
+                'candidates': serialize_candidates(candidates)}
+
+    logger.info(f"Found opportunity: {opp['Name']} ({opp['Id']})")
+
+    # Fields the early update already covered don't need writing again
+    remaining = {k: v for k, v in extracted.items() if k not in early_fields}
+    graph.add('write', lambda sf, owner_id: write_debrief_results(sf, opp['Id'], owner_id, call_data, transcript, remaining),
+              deps=('salesforce', 'owner'))
+    written = graph.result('write')
+    written['opportunity_updated'] = written['opportunity_updated'] or bool(early_diff and early_diff['changed'])
+    written['opportunity_diff'] = merge_diffs(early_diff, written['opportunity_diff'])
+    result = debrief_result(opp, extracted, written, errors)
+    result['extraction_timings'] = timings
+    return result
+
+def is_transient_error(exc: Exception) -> bool:
+    """Whether a failed job is worth retrying (network blips, rate limits, 5xx)"""
+    if isinstance(exc, (requests.ConnectionError, requests.Timeout)):
+        return True
+    if isinstance(exc, (SalesforceGeneralError, SalesforceExpiredSession)):
+        return True
+    if isinstance(exc, SalesforceRefusedRequest):
+        return 'REQUEST_LIMIT_EXCEEDED' in str(exc.content)
+    if isinstance(exc, (anthropic.APIConnectionError, anthropic.RateLimitError, anthropic.InternalServerError)):
+        return True
+    return False
 
-        # Log the call as an activity
-        call_activity_id = None
-        if owner_id:
-            call_activity_id = log_call_activity(sf, opp['Id'], owner_id, call_data, transcript)
-            logger.info(f"Logged call activity: {call_activity_id}")
-
-        # Create any follow-up tasks from extracted data
-        tasks_created = []
-        if extracted.get('tasks') and owner_id:
-            for task in extracted['tasks']:
-                task_id = create_task(
-                    sf,
-                    opp['Id'],
-                    owner_id,
-                    task.get('subject', 'Follow up'),
-                    task.get('due_date')
-                )
-                tasks_created.append(task_id)
-            logger.info(f"Created {len(tasks_created)} follow-up tasks")
-
-        # Create any calendar events from extracted data
-        events_created = []
-        if extracted.get('events') and owner_id:
-            sf_instance_url = os.environ.get('SF_INSTANCE_URL', 'https://orgfarm-848e4d60cd-dev-ed.develop.lightning.force.com')
-            for event in extracted['events']:
-                if event.get('datetime'):
-                    event_id = create_event(
-                        sf,
-                        opp['Id'],
-                        owner_id,
-                        event['datetime'],
-                        event.get('location'),
-                        sf_instance_url
-                    )
-                    if event_id:
-                        events_created.append(event_id)
-            logger.info(f"Created {len(events_created)} calendar events")
-
-        return jsonify({
-            'status': 'success',
-            'opportunity_id': opp['Id'],
-            'opportunity_name': opp['Name'],
-            'fields_updated': list(extracted.keys()) if extracted else [],
-            'call_activity_id': call_activity_id,
-            'tasks_created': tasks_created,
-            'events_created': events_created
-        })
+def salesforce_retry_after(exc: Exception) -> float:
+    """Seconds to park a job that failed because Salesforce isn't taking requests, or None"""
+    if isinstance(exc, SalesforceUnavailable):
+        return exc.retry_after
+    salesforce_errors = (requests.ConnectionError, requests.Timeout, SalesforceGeneralError, SalesforceRefusedRequest)
+    if sf_guard is not None and sf_guard.breaker.state == OPEN and isinstance(exc, salesforce_errors):
+        # The failure that opened the circuit, or one in flight when it did
+        return sf_guard.breaker.retry_after()
+    return None
 
-    except Exception as e:
-        logger.error(f"Error processing call: {str(e)}")
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+def parked_job(exc: Exception) -> float:
+    delay = salesforce_retry_after(exc)
+    if delay is not None:
+        JOBS_PARKED.inc()
+    return delay
+
+def get_worker_pool() -> JobWorkerPool:
+    """Start the job workers on first use - after gunicorn has forked"""
+    global worker_pool
+    with worker_pool_lock:
+        if worker_pool is None:
+            worker_pool = JobWorkerPool(
+                job_queue,
+                process_call_job,
+                size=int(os.environ.get('JOB_WORKERS', 2)),
+                is_transient=is_transient_error,
+                on_failure=release_call_job,
+                retry_after=parked_job,
+            )
+            worker_pool.start()
+    return worker_pool
+
+def get_function_write_pool() -> JobWorkerPool:
+    """Start the mid-call write workers on first use - they only take function write jobs"""
+    global function_write_pool
+    with worker_pool_lock:
+        if function_write_pool is None:
+            function_write_pool = JobWorkerPool(
+                job_queue,
+                process_call_job,
+                size=int(os.environ.get('FUNCTION_WRITE_WORKERS', 1)),
+                is_transient=is_transient_error,
+                on_failure=release_call_job,
+                retry_after=parked_job,
+                min_priority=FUNCTION_WRITE_PRIORITY,
+                name='function-write-worker',
+            )
+            function_write_pool.start()
+    return function_write_pool
+
+@app.route('/jobs/<call_id>', methods=['GET'])
+def job_status(call_id):
+    """Look up the processing status of a queued call"""
+    job = job_queue.get(call_id)
+    if not job:
+        return jsonify({'error': 'Job not found', 'call_id': call_id}), 404
+    return jsonify(job)
 
 def handle_call_analyzed(data: dict):
-    """Handle post-call analysis from Retell"""
-    # This can be used for additional processing after Retell's analysis
-    return jsonify({'status': 'ok'})
+    """Fold Retell's post-call analysis into the call's queued job, or queue the call from it"""
+    call_data = data.get('call', data)
+    call_id = call_data.get('call_id', '')
+    if not call_id or not ASYNC_CALL_PROCESSING or not CALL_ANALYSIS_REUSE:
+        return jsonify({'status': 'ok'})
+
+    claimed, record = idempotency_store.claim(call_id, IDEMPOTENCY_TTL)
+    if claimed:
+        # call_analyzed got here first - it carries the whole call, so it can be processed on its own
+        job, created = job_queue.enqueue(call_id, data, max_attempts=JOB_MAX_ATTEMPTS)
+        if created:
+            CALL_ANALYZED_EVENTS.inc(outcome='queued')
+            get_worker_pool().notify()
+            logger.info(f"Queued call_analyzed for call_id: {call_id}")
+        return jsonify({'status': 'queued' if created else 'duplicate', 'call_id': call_id,
+                        'job_status': job['status']}), 202
+
+    job = job_queue.get(call_id, include_payload=True)
+    if job and job_queue.amend(call_id, dict(job['payload'], call=dict(job['payload'].get('call', {}), **call_data))):
+        CALL_ANALYZED_EVENTS.inc(outcome='coalesced')
+        get_worker_pool().notify()
+        logger.info(f"Added call analysis to the queued job for call_id: {call_id}")
+        return jsonify({'status': 'coalesced', 'call_id': call_id, 'job_status': 'queued'}), 202
+
+    # The call is already being (or has been) processed without the analysis
+    CALL_ANALYZED_EVENTS.inc(outcome='late')
+    return jsonify({'status': 'ok', 'call_id': call_id, 'job_status': job['status'] if job else record['status']})
 
 @app.route('/webhook/retell/function', methods=['POST'])
 def retell_function_call():
     """Handle real-time function calls from Retell during the call"""
+    started = time.perf_counter()
     data = request.json
     function_name = data.get('function_name')
     args = data.get('arguments', {})
+    call_id = (data.get('call') or {}).get('call_id') or data.get('call_id')
+
+    try:
+        if function_name == 'lookup_property':
+            return lookup_property(args.get('address'), call_id)
+        elif function_name == 'update_opportunity':
+            return update_opp_from_call(args, call_id)
+        elif function_name == 'create_task':
+            return create_task_from_call(args, call_id)
+
+        return jsonify({'error': 'Unknown function'})
+    finally:
+        elapsed = time.perf_counter() - started
+        function_latency.record(function_name or 'unknown', elapsed)
+        FUNCTION_SECONDS.observe(elapsed, function=function_name or 'unknown')
+
+def resolve_call_address(call_id: str, address: str) -> dict:
+    """Opportunity candidates for an address, cached for the rest of the call
+
+    Returns {'match': record or None, 'candidates': serialized candidates}. The
+    match also becomes the call's current Opportunity for later writes.
+    """
+    key = (call_id, normalize_address(address))
+    if call_id:
+        found, resolved = live_calls.get(key)
+        if found:
+            return resolved
+
+    candidates = find_opportunity_candidates(get_sf_connection(), address)
+    opp = pick_match(candidates)
+    resolved = {
+        'match': {'Id': opp['Id'], 'Name': opp['Name'], 'StageName': opp.get('StageName'),
+                  'confidence': candidates[0]['confidence']} if opp else None,
+        'candidates': serialize_candidates(candidates),
+    }
+    if call_id:
+        live_calls.put(key, resolved)
+        if opp:
+            live_calls.put((call_id, 'opportunity'), resolved['match'])
+    return resolved
 
-    if function_name == 'lookup_property':
-        return lookup_property(args.get('address'))
-    elif function_name == 'update_opportunity':
-        return update_opp_from_call(args)
-    elif function_name == 'create_task':
-        return create_task_from_call(args)
+def resolve_within_budget(call_id: str, address: str, started: float) -> dict:
+    """resolve_call_address, giving up once the function's latency budget is spent
 
-    return jsonify({'error': 'Unknown function'})
+    Returns None on timeout; the lookup keeps running and caches its result, so
+    asking again a moment later is answered from the cache.
+    """
+    future = function_executor.submit(resolve_call_address, call_id, address)
+    remaining = FUNCTION_LATENCY_BUDGET - (time.perf_counter() - started)
+    try:
+        return future.result(timeout=max(remaining, 0))
+    except FutureTimeoutError:
+        logger.warning(f"Address lookup for '{address}' exceeded the {FUNCTION_LATENCY_BUDGET * 1000:.0f} ms budget")
+        return None
 
-def lookup_property(address: str):
+def resolve_opportunity_id(args: dict, call_id: str, started: float) -> tuple:
+    """(Opportunity id or None, still resolving) for a mid-call write: explicit id, else the address, else
+    the one found earlier in the call
+
+    An address that doesn't match is not found - the write never falls back to another property.
+    """
+    if args.get('opportunity_id'):
+        return args['opportunity_id'], False
+    if args.get('address'):
+        if not FAST_FUNCTION_PATH:
+            opp = find_opportunity_by_address(get_sf_connection(), args['address'])
+            return (opp['Id'] if opp else None), False
+        resolved = resolve_within_budget(call_id, args['address'], started)
+        if resolved is None:
+            return None, True
+        return (resolved['match']['Id'] if resolved['match'] else None), False
+    if call_id:
+        found, opp = live_calls.get((call_id, 'opportunity'))
+        if found and opp:
+            return opp['Id'], False
+    return None, False
+
+def opportunity_not_resolved(args: dict, pending: bool):
+    """Function-call reply when the write's Opportunity couldn't be resolved"""
+    if pending:
+        return jsonify({'success': False, 'pending': True,
+                        'message': f"Still looking up '{args['address']}'. Keep the AE talking and try again in a moment."})
+    return jsonify({'success': False, 'message': 'Opportunity not found'})
+
+def lookup_property(address: str, call_id: str = None):
     """Look up a property during the call"""
+    started = time.perf_counter()
     try:
-        sf = get_sf_connection()
-        opp = find_opportunity_by_address(sf, address)
+        if FAST_FUNCTION_PATH:
+            resolved = resolve_within_budget(call_id, address, started)
+            if resolved is None:
+                return jsonify({'found': False, 'pending': True,
+                                'message': f"Still looking up '{address}'. Keep the AE talking and try again in a moment."})
+        else:
+            resolved = resolve_call_address(None, address)
 
+        opp = resolved['match']
         if opp:
             return jsonify({
                 'found': True,
                 'opportunity_id': opp['Id'],
                 'name': opp['Name'],
-                'current_stage': opp.get('StageName')
+                'current_stage': opp.get('StageName'),
+                'confidence': opp['confidence']
             })
-        else:
-            return jsonify({'found': False, 'message': f"No property found matching '{address}'"})
+        matches = resolved['candidates']
+        if matches:
+            names = ', '.join(m['name'] for m in matches)
+            return jsonify({
+                'found': False,
+                'ambiguous': True,
+                'candidates': matches,
+                'message': f"'{address}' could be one of: {names}. Ask the AE which property they mean."
+            })
+        return jsonify({'found': False, 'message': f"No property found matching '{address}'"})
     except Exception as e:
         return jsonify({'found': False, 'error': str(e)})
 
-def update_opp_from_call(args: dict):
+def queue_function_write(call_id: str, function_name: str, opp_id: str, args: dict) -> str:
+    """Queue a mid-call Salesforce write for the job workers and return its job id
+
+    The write is retried like any other job, so a transient Salesforce error
+    doesn't lose it; GET /jobs/<write_id> shows how it ended up.
+    """
+    write_id = f"{call_id or 'call'}:{function_name}:{uuid.uuid4().hex[:12]}"
+    payload = {'function_name': function_name, 'call_id': call_id, 'opportunity_id': opp_id, 'arguments': args}
+    job_queue.enqueue(write_id, payload, max_attempts=JOB_MAX_ATTEMPTS, priority=FUNCTION_WRITE_PRIORITY)
+    get_function_write_pool().notify()
+    return write_id
+
+def run_function_write(payload: dict) -> dict:
+    """Job worker handler for a queued mid-call write"""
+    sf = get_sf_connection()
+    args = payload['arguments']
+    opp_id = payload['opportunity_id']
+    if payload['function_name'] == 'update_opportunity':
+        diff = update_opportunity(sf, opp_id, args)
+        return {'opportunity_id': opp_id, 'updated': bool(diff['changed']), 'diff': diff}
+    task_id = create_task(sf, opp_id, args.get('owner_id'), args.get('subject', 'Follow up'), args.get('due_date'))
+    return {'opportunity_id': opp_id, 'task_id': task_id}
+
+def update_opp_from_call(args: dict, call_id: str = None):
     """Update opportunity during the call"""
+    started = time.perf_counter()
     try:
-        sf = get_sf_connection()
-        opp_id = args.get('opportunity_id')
-
-        if not opp_id and args.get('address'):
-            opp = find_opportunity_by_address(sf, args['address'])
-            if opp:
-                opp_id = opp['Id']
+        opp_id, pending = resolve_opportunity_id(args, call_id, started)
 
         if not opp_id:
-            return jsonify({'success': False, 'message': 'Opportunity not found'})
+            return opportunity_not_resolved(args, pending)
+
+        if FAST_FUNCTION_PATH:
+            write_id = queue_function_write(call_id, 'update_opportunity', opp_id, args)
+            return jsonify({'success': True, 'opportunity_id': opp_id, 'queued': True, 'write_id': write_id})
 
-        update_opportunity(sf, opp_id, args)
-        return jsonify({'success': True, 'opportunity_id': opp_id})
+        diff = update_opportunity(get_sf_connection(), opp_id, args)
+        return jsonify({'success': True, 'opportunity_id': opp_id, 'diff': diff})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
-def create_task_from_call(args: dict):
+def create_task_from_call(args: dict, call_id: str = None):
     """Create a task during the call"""
+    started = time.perf_counter()
     try:
-        sf = get_sf_connection()
-        opp_id = args.get('opportunity_id')
-
-        if not opp_id and args.get('address'):
-            opp = find_opportunity_by_address(sf, args['address'])
-            if opp:
-                opp_id = opp['Id']
+        opp_id, pending = resolve_opportunity_id(args, call_id, started)
 
         if not opp_id:
-            return jsonify({'success': False, 'message': 'Opportunity not found'})
+            return opportunity_not_resolved(args, pending)
+
+        if FAST_FUNCTION_PATH:
+            write_id = queue_function_write(call_id, 'create_task', opp_id, args)
+            return jsonify({'success': True, 'opportunity_id': opp_id, 'queued': True, 'write_id': write_id})
 
         # Default owner - would need to be passed or looked up
         owner_id = args.get('owner_id')
 
         task_id = create_task(
-            sf,
+            get_sf_connection(),
             opp_id,
             owner_id,
             args.get('subject', 'Follow up'),
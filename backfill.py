@@ -0,0 +1,387 @@
+"""
+Backfill - re-run past debriefs through the current extraction and field mapping
+
+    python backfill.py calls.jsonl --checkpoint backfill.sqlite3
+
+Reads exported call_ended payloads (JSONL, e.g. recorded with WEBHOOK_RECORD_PATH),
+extracts each transcript with the record_debrief tool through the Message Batches
+API, matches the Opportunity by address, and writes the Opportunity fields that
+differ from their current values with Bulk API 2.0. Every step is checkpointed in SQLite, so an interrupted run picks
+up where it stopped - including batches that were submitted but not collected.
+Salesforce requests share a token bucket; with --no-batch the Claude calls do too.
+
+Only Opportunity fields are rewritten: the call activity, tasks and events were
+created when the call was first processed and aren't duplicated.
+"""
+import argparse
+import contextvars
+import csv
+import hashlib
+import io
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import app
+import extraction
+from addresses import pick_match
+from extraction import (debrief_request, debrief_tool_input, extract_debrief_single_pass, record_usage, usage_metrics,
+                        validate_debrief)
+from metrics import count_salesforce_requests
+from opportunity_fields import diff_update, fetch_snapshots
+from rate_limit import TokenBucket, rate_limit_session
+
+logger = logging.getLogger(__name__)
+
+# Checkpoint stages, in order
+PENDING = 'pending'        # not extracted yet
+SUBMITTED = 'submitted'    # in a message batch that hasn't been collected
+EXTRACTED = 'extracted'    # tool input stored, Opportunity not matched yet
+MATCHED = 'matched'        # Opportunity found, update not written yet
+WRITTEN = 'written'
+SKIPPED = 'skipped'        # nothing to write (no transcript, address or Opportunity)
+FAILED = 'failed'
+
+# Message Batches accept up to 100,000 requests; custom_id is 1-64 of [a-zA-Z0-9_-]
+MAX_BATCH_REQUESTS = 100000
+CUSTOM_ID_RE = re.compile(r'^[a-zA-Z0-9_-]{1,64}$')
+
+
+def custom_id(call_id: str) -> str:
+    """Batch custom_id for a call - the call_id itself when it's a valid one"""
+    if CUSTOM_ID_RE.match(call_id):
+        return call_id
+    return 'h' + hashlib.sha1(call_id.encode()).hexdigest()
+
+
+def call_day(call_data: dict) -> datetime:
+    """When the call happened (Retell's start_timestamp, in ms), to anchor relative dates"""
+    timestamp = call_data.get('start_timestamp')
+    return datetime.fromtimestamp(timestamp / 1000) if timestamp else None
+
+
+class BackfillCheckpoint:
+    """Per-call progress of a backfill run in SQLite"""
+
+    def __init__(self, path: str = 'backfill.sqlite3'):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        if path != ':memory:':
+            self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS calls (
+                call_id TEXT PRIMARY KEY,
+                seq INTEGER NOT NULL,
+                stage TEXT NOT NULL,
+                batch_id TEXT,
+                extracted TEXT,
+                opportunity_id TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute('CREATE INDEX IF NOT EXISTS calls_stage ON calls (stage, seq)')
+
+    def add(self, call_id: str, seq: int, stage: str = PENDING, error: str = None):
+        """Track a call - a no-op if an earlier run already did"""
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR IGNORE INTO calls (call_id, seq, stage, error, updated_at) VALUES (?, ?, ?, ?, ?)',
+                (call_id, seq, stage, error, time.time())
+            )
+
+    def update(self, call_ids: list, stage: str, **fields):
+        if 'extracted' in fields and fields['extracted'] is not None:
+            fields['extracted'] = json.dumps(fields['extracted'])
+        columns = ''.join(f', {name} = ?' for name in fields)
+        with self._lock:
+            self._conn.execute('BEGIN')
+            self._conn.executemany(
+                f'UPDATE calls SET stage = ?, updated_at = ?{columns} WHERE call_id = ?',
+                [(stage, time.time(), *fields.values(), call_id) for call_id in call_ids]
+            )
+            self._conn.execute('COMMIT')
+
+    def fail_attempt(self, call_id: str, error: str, max_attempts: int):
+        """Record a failed extraction - back to pending, or failed after max_attempts"""
+        with self._lock:
+            self._conn.execute(
+                """UPDATE calls SET attempts = attempts + 1, error = ?, batch_id = NULL, updated_at = ?,
+                   stage = CASE WHEN attempts + 1 >= ? THEN ? ELSE ? END WHERE call_id = ?""",
+                (error, time.time(), max_attempts, FAILED, PENDING, call_id)
+            )
+
+    def calls(self, stage: str) -> list:
+        with self._lock:
+            rows = self._conn.execute('SELECT * FROM calls WHERE stage = ? ORDER BY seq', (stage,)).fetchall()
+        calls = [dict(row) for row in rows]
+        for call in calls:
+            call['extracted'] = json.loads(call['extracted']) if call['extracted'] else None
+        return calls
+
+    def counts(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute('SELECT stage, COUNT(*) AS n FROM calls GROUP BY stage').fetchall()
+        return {row['stage']: row['n'] for row in rows}
+
+
+def load_payloads(path: str) -> dict:
+    """call_id -> call_ended payload, in file order (a later copy of a call replaces an earlier one)"""
+    payloads = {}
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            data = json.loads(line)
+            if data.get('event', 'call_ended') != 'call_ended':
+                continue
+            call_id = data.get('call', data).get('call_id')
+            if call_id:
+                payloads.pop(call_id, None)
+                payloads[call_id] = data
+    return payloads
+
+
+def run_parallel(workers: int, fn, items: list):
+    """fn over items on a bounded pool, each call in a copy of this context (so metrics follow it)"""
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(contextvars.copy_context().run, fn, item) for item in items]
+        for future in futures:
+            future.result()
+
+
+class Backfill:
+    def __init__(self, checkpoint: BackfillCheckpoint, payloads: dict, sf, args):
+        self.checkpoint = checkpoint
+        self.payloads = payloads
+        self.sf = sf
+        self.args = args
+        self.llm_bucket = TokenBucket(args.llm_rpm / 60, capacity=args.workers)
+
+    def transcript(self, call_id: str) -> tuple:
+        call_data = self.payloads[call_id].get('call', self.payloads[call_id])
+        return call_data.get('transcript', ''), call_day(call_data)
+
+    def track(self):
+        for seq, (call_id, data) in enumerate(self.payloads.items()):
+            if data.get('call', data).get('transcript'):
+                self.checkpoint.add(call_id, seq)
+            else:
+                self.checkpoint.add(call_id, seq, SKIPPED, 'no_transcript')
+
+    # Extraction
+    def extract(self):
+        for _ in range(self.args.max_attempts):
+            # Collect batches an earlier (interrupted) run submitted before sending new ones
+            submitted = {}
+            for call in self.checkpoint.calls(SUBMITTED):
+                submitted.setdefault(call['batch_id'], []).append(call['call_id'])
+            for batch_id, call_ids in submitted.items():
+                self.collect_batch(batch_id, call_ids)
+
+            pending = [c['call_id'] for c in self.checkpoint.calls(PENDING) if c['call_id'] in self.payloads]
+            if not pending:
+                return
+            if self.args.no_batch:
+                run_parallel(self.args.workers, self.extract_one, pending)
+                continue
+            batch_size = min(self.args.batch_size, MAX_BATCH_REQUESTS)
+            batches = [self.submit_batch(pending[i:i + batch_size]) for i in range(0, len(pending), batch_size)]
+            for batch_id, call_ids in batches:
+                self.collect_batch(batch_id, call_ids)
+
+    def submit_batch(self, call_ids: list) -> tuple:
+        requests = []
+        for call_id in call_ids:
+            transcript, day = self.transcript(call_id)
+            requests.append({'custom_id': custom_id(call_id), 'params': debrief_request(transcript, day)})
+        batch = extraction.claude_client.beta.messages.batches.create(requests=requests)
+        self.checkpoint.update(call_ids, SUBMITTED, batch_id=batch.id)
+        logger.info(f"Submitted message batch {batch.id} with {len(call_ids)} calls")
+        return batch.id, call_ids
+
+    def collect_batch(self, batch_id: str, call_ids: list):
+        batches = extraction.claude_client.beta.messages.batches
+        while batches.retrieve(batch_id).processing_status != 'ended':
+            time.sleep(self.args.poll_seconds)
+
+        by_custom_id = {custom_id(call_id): call_id for call_id in call_ids}
+        collected = set()
+        for entry in batches.results(batch_id):
+            call_id = by_custom_id.get(entry.custom_id)
+            if call_id is None:
+                continue
+            collected.add(call_id)
+            result = entry.result
+            if result.type == 'succeeded':
+                record_usage('batch', result.message.usage)
+                self.store_extraction(call_id, debrief_tool_input(result.message))
+            else:
+                error = getattr(getattr(result, 'error', None), 'error', None)
+                self.checkpoint.fail_attempt(call_id, f"{result.type}: {getattr(error, 'message', '')}".strip(': '),
+                                             self.args.max_attempts)
+        for call_id in set(call_ids) - collected:
+            self.checkpoint.fail_attempt(call_id, 'missing from batch results', self.args.max_attempts)
+        logger.info(f"Collected message batch {batch_id}: {len(collected)} results")
+
+    def extract_one(self, call_id: str):
+        transcript, day = self.transcript(call_id)
+        self.llm_bucket.acquire()
+        try:
+            self.store_extraction(call_id, extract_debrief_single_pass(transcript, day))
+        except Exception as e:
+            logger.error(f"Extraction failed for {call_id}: {str(e)}")
+            self.checkpoint.fail_attempt(call_id, str(e), self.args.max_attempts)
+
+    def store_extraction(self, call_id: str, tool_input: dict):
+        if tool_input is None:
+            self.checkpoint.update([call_id], SKIPPED, error='no_tool_call')
+        else:
+            self.checkpoint.update([call_id], EXTRACTED, extracted=validate_debrief(tool_input).data)
+
+    # Opportunity matching
+    def match(self):
+        calls = self.checkpoint.calls(EXTRACTED)
+        if calls and app.ADDRESS_INDEX_ENABLED and not app.address_index.ready:
+            # One paged export instead of a few SOQL searches per call
+            app.address_index.load(self.sf)
+        run_parallel(self.args.workers, self.match_one, calls)
+
+    def match_one(self, call: dict):
+        address = call['extracted'].get('property_address')
+        if not address:
+            self.checkpoint.update([call['call_id']], SKIPPED, error='no_address_found')
+            return
+        try:
+            opp = pick_match(app.find_opportunity_candidates(self.sf, address))
+        except Exception as e:
+            logger.error(f"Opportunity search failed for {call['call_id']}: {str(e)}")
+            self.checkpoint.update([call['call_id']], FAILED, error=str(e))
+            return
+        if opp:
+            self.checkpoint.update([call['call_id']], MATCHED, opportunity_id=opp['Id'])
+        else:
+            self.checkpoint.update([call['call_id']], SKIPPED, error=f'opportunity_not_found: {address}')
+
+    # Opportunity updates
+    def pending_updates(self) -> tuple:
+        """(Opportunity Id -> merged field values, Opportunity Id -> call_ids) for matched calls
+
+        Calls are applied in file order, so the latest call about an Opportunity wins each field.
+        """
+        updates, calls_by_opp = {}, {}
+        for call in self.checkpoint.calls(MATCHED):
+            opp_id = call['opportunity_id']
+            updates.setdefault(opp_id, {}).update(app.build_opportunity_update(call['extracted']))
+            calls_by_opp.setdefault(opp_id, []).append(call['call_id'])
+        return updates, calls_by_opp
+
+    def write(self):
+        updates, calls_by_opp = self.pending_updates()
+        empty = [opp_id for opp_id, fields in updates.items() if not fields]
+        for opp_id in empty:
+            self.checkpoint.update(calls_by_opp.pop(opp_id), SKIPPED, error='no_fields')
+            del updates[opp_id]
+        if not updates:
+            return
+        if not self.args.no_diff:
+            # Only fields that differ from the current values go into the job
+            snapshots = fetch_snapshots(self.sf, list(updates))
+            for opp_id in list(updates):
+                updates[opp_id], _ = diff_update(snapshots.get(opp_id), updates[opp_id])
+                if not updates[opp_id]:
+                    self.checkpoint.update(calls_by_opp.pop(opp_id), SKIPPED, error='unchanged')
+                    del updates[opp_id]
+            if not updates:
+                return
+        if self.args.dry_run:
+            logger.info(f"Dry run: would update {len(updates)} opportunities")
+            return
+        if self.args.no_bulk:
+            failed = self.write_records(updates)
+        else:
+            failed = self.write_bulk(updates)
+        for opp_id, call_ids in calls_by_opp.items():
+            if opp_id in failed:
+                self.checkpoint.update(call_ids, FAILED, error=failed[opp_id])
+            else:
+                self.checkpoint.update(call_ids, WRITTEN)
+
+    def write_bulk(self, updates: dict) -> dict:
+        """Bulk API 2.0 update jobs. Returns Opportunity Id -> error for rows that failed"""
+        records = [dict(fields, Id=opp_id) for opp_id, fields in updates.items()]
+        bulk = self.sf.bulk2.Opportunity
+        failed = {}
+        for job in bulk.update(records=records, batch_size=self.args.bulk_batch_size, wait=self.args.bulk_wait):
+            logger.info(f"Bulk job {job['job_id']}: {job['numberRecordsProcessed']} processed, "
+                        f"{job['numberRecordsFailed']} failed")
+            if job['numberRecordsFailed']:
+                for row in csv.DictReader(io.StringIO(bulk.get_failed_records(job['job_id']))):
+                    failed[row.get('sf__Id') or row.get('Id')] = row.get('sf__Error')
+        return failed
+
+    def write_records(self, updates: dict) -> dict:
+        """One PATCH per Opportunity. Returns Opportunity Id -> error for updates that failed"""
+        failed = {}
+
+        def update(item):
+            opp_id, fields = item
+            try:
+                self.sf.Opportunity.update(opp_id, fields)
+            except Exception as e:
+                failed[opp_id] = str(e)
+
+        run_parallel(self.args.workers, update, list(updates.items()))
+        return failed
+
+    def run(self):
+        self.track()
+        self.extract()
+        self.match()
+        self.write()
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description='Re-run past debriefs and rewrite the Opportunity fields')
+    parser.add_argument('calls', help='JSONL file of call_ended payloads')
+    parser.add_argument('--checkpoint', default='backfill.sqlite3', help='progress file; re-run with it to resume')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--sf-rps', type=float, default=5, help='Salesforce requests per second')
+    parser.add_argument('--llm-rpm', type=float, default=50, help='Claude requests per minute with --no-batch')
+    parser.add_argument('--no-batch', action='store_true', help='call Claude per transcript instead of in batches')
+    parser.add_argument('--batch-size', type=int, default=10000)
+    parser.add_argument('--poll-seconds', type=float, default=30, help='how often to check on a message batch')
+    parser.add_argument('--max-attempts', type=int, default=3, help='extraction attempts per call')
+    parser.add_argument('--no-bulk', action='store_true', help='PATCH each Opportunity instead of Bulk API 2.0')
+    parser.add_argument('--bulk-batch-size', type=int, default=10000)
+    parser.add_argument('--bulk-wait', type=float, default=5, help='seconds between bulk job status checks')
+    parser.add_argument('--no-diff', action='store_true',
+                        help="write every extracted field, not just those that differ from Salesforce")
+    parser.add_argument('--dry-run', action='store_true', help='extract and match, but leave Salesforce alone')
+    args = parser.parse_args(argv)
+
+    payloads = load_payloads(args.calls)
+    checkpoint = BackfillCheckpoint(args.checkpoint)
+    sf = app.get_sf_connection()
+    sf_bucket = TokenBucket(args.sf_rps, capacity=args.workers)
+    rate_limit_session(sf.session, sf_bucket)
+
+    started = time.perf_counter()
+    with count_salesforce_requests() as sf_requests:
+        Backfill(checkpoint, payloads, sf, args).run()
+    logger.info(f"Backfill finished in {time.perf_counter() - started:.1f}s: {checkpoint.counts()}, "
+                f"{sf_requests['requests']} Salesforce requests (waited {sf_bucket.waited:.1f}s for the rate limit), "
+                f"Claude usage {usage_metrics()}")
+    return checkpoint.counts()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""
+Ranked address matching on a synthetic corpus
+
+Builds an AddressMatcher over a generated set of Opportunity names, then looks
+up perturbed versions of known addresses: spelled-out suffixes and directions,
+dropped directions, misheard street names, swapped house-number digits,
+missing units and a trailing city, state and ZIP. Reports lookup throughput,
+precision of confident matches and how often the matcher asked for
+disambiguation instead of guessing.
+
+"wrong" under swapped_digits is mostly the matcher correctly finding a different
+address that really exists at the number that was spoken.
+
+    python -m benchmarks.bench_address_matching --corpus 100000 --queries 5000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from addresses import AddressMatcher, parse_address, pick_match  # noqa: E402
+
+SYLLABLES = ['ma', 'ple', 'oak', 'wood', 'ri', 'ver', 'lin', 'coln', 'wash', 'ing', 'ton', 'elm', 'ced', 'ar',
+             'pine', 'hill', 'crest', 'view', 'lake', 'shore', 'mont', 'gom', 'ery', 'har', 'bor', 'fair']
+SUFFIXES = [('St', 'Street'), ('Ave', 'Avenue'), ('Dr', 'Drive'), ('Rd', 'Road'), ('Ln', 'Lane'), ('Ct', 'Court')]
+DIRECTIONS = [('N', 'North'), ('S', 'South'), ('E', 'East'), ('W', 'West')]
+CITIES = ['Chicago', 'Phoenix', 'Tampa', 'Dallas', 'Memphis', 'Boca Raton', 'San Antonio']
+
+
+def generate_corpus(size: int, rng: random.Random) -> list:
+    streets = set()
+    while len(streets) < max(size // 40, 50):
+        streets.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))).capitalize())
+    streets = sorted(streets)
+
+    seen = set()
+    corpus = []
+    while len(corpus) < size:
+        number = str(rng.randint(1, 9999))
+        direction = rng.choice(DIRECTIONS) if rng.random() < 0.6 else None
+        street = rng.choice(streets)
+        suffix = rng.choice(SUFFIXES)
+        unit = f"{rng.randint(1, 12)}{rng.choice(['', '', 'A', 'B'])}" if rng.random() < 0.05 else None
+        key = (number, direction, street, suffix, unit)
+        if key in seen:
+            continue
+        seen.add(key)
+        parts = [number] + ([direction[0]] if direction else []) + [street, suffix[0]] + ([f'Unit {unit}'] if unit else [])
+        corpus.append({'Id': f'006SYN{len(corpus):09d}', 'Name': f"{' '.join(parts)} - {rng.choice(CITIES)}",
+                       'StageName': 'Appointment Set', 'parts': key})
+    return corpus
+
+
+def misspell(word: str, rng: random.Random) -> str:
+    i = rng.randrange(len(word))
+    return word[:i] + rng.choice('aeioustr') + word[i + 1:]
+
+
+def perturb(record: dict, rng: random.Random) -> tuple:
+    """A spoken version of the address, and the kind of noise applied"""
+    number, direction, street, suffix, unit = record['parts']
+    kind = rng.choice(['exact', 'spelled_out', 'no_direction', 'misheard_street', 'swapped_digits', 'no_unit',
+                       'with_locality'])
+    dir_text = direction[0] if direction else None
+    suffix_text = suffix[0]
+    if kind == 'spelled_out':
+        dir_text = direction[1] if direction else None
+        suffix_text = suffix[1]
+    elif kind == 'no_direction':
+        dir_text = None
+    elif kind == 'misheard_street':
+        street = misspell(street, rng)
+    elif kind == 'swapped_digits' and len(number) > 1:
+        number = number[::-1]
+    if kind == 'no_unit':
+        unit = None
+    parts = [number] + ([dir_text] if dir_text else []) + [street, suffix_text] + ([f'Apt {unit}'] if unit else [])
+    if kind == 'with_locality':
+        # "..., Apt 4B, Boca Raton, FL 33432-1234": a unit with letters mustn't run into the city
+        zip_code = str(rng.randint(10000, 99999)) + (f'-{rng.randint(1000, 9999)}' if rng.random() < 0.5 else '')
+        parts[-1] += ','
+        parts += [f'{rng.choice(CITIES)},', rng.choice(['FL', 'TX', 'IL', 'AZ', 'TN']), zip_code]
+    return ' '.join(parts), kind
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--corpus', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    t0 = time.perf_counter()
+    corpus = generate_corpus(args.corpus, rng)
+    matcher = AddressMatcher()
+    for record in corpus:
+        matcher.add({k: v for k, v in record.items() if k != 'parts'})
+    build_s = time.perf_counter() - t0
+
+    queries = [(record['Id'],) + perturb(record, rng) for record in rng.sample(corpus, args.queries)]
+    by_kind = {}
+    t0 = time.perf_counter()
+    for expected_id, address, kind in queries:
+        match = pick_match(matcher.rank(address, limit=2))
+        stats = by_kind.setdefault(kind, {'n': 0, 'correct': 0, 'wrong': 0, 'unsure': 0})
+        stats['n'] += 1
+        if match is None:
+            stats['unsure'] += 1
+        elif match['Id'] == expected_id:
+            stats['correct'] += 1
+        else:
+            stats['wrong'] += 1
+    elapsed = time.perf_counter() - t0
+
+    print(f"corpus: {len(corpus)} addresses indexed in {build_s:.1f} s")
+    print(f"throughput: {len(queries) / elapsed:,.0f} lookups/s ({elapsed / len(queries) * 1e6:.0f} us/lookup)")
+    print(f"{'noise':18}{'n':>6}{'correct':>9}{'wrong':>7}{'unsure':>8}{'precision':>11}")
+    totals = {'n': 0, 'correct': 0, 'wrong': 0, 'unsure': 0}
+    for kind, stats in sorted(by_kind.items()):
+        for key in totals:
+            totals[key] += stats[key]
+        decided = stats['correct'] + stats['wrong']
+        precision = stats['correct'] / decided if decided else 0.0
+        print(f"{kind:18}{stats['n']:>6}{stats['correct']:>9}{stats['wrong']:>7}{stats['unsure']:>8}{precision:>11.3f}")
+    decided = totals['correct'] + totals['wrong']
+    print(f"{'all':18}{totals['n']:>6}{totals['correct']:>9}{totals['wrong']:>7}{totals['unsure']:>8}"
+          f"{totals['correct'] / decided if decided else 0.0:>11.3f}")
+
+    # A wrong unit only costs a little confidence, so check the parsed units themselves
+    names = {record['Id']: record['Name'] for record in corpus}
+    with_unit = [(address, names[expected_id]) for expected_id, address, kind in queries
+                 if kind == 'with_locality' and parse_address(names[expected_id]).unit]
+    kept = sum(1 for address, name in with_unit if parse_address(address).unit == parse_address(name).unit)
+    print(f"with_locality units parsed as stored: {kept} of {len(with_unit)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+Backfill: per-call Claude requests and PATCHes vs message batches and Bulk API 2.0
+
+Runs backfill.py over a synthetic export against the mock Salesforce REST API and
+FakeAnthropic, once with --no-batch --no-bulk and once with the defaults, and
+prints wall time, Salesforce requests, Claude requests and token cost for each
+(batched tokens are billed at half price). A third run is interrupted after the
+batch is submitted and then resumed from the checkpoint.
+
+    python -m benchmarks.bench_backfill --calls 200 --sf-rps 50
+"""
+import argparse
+import collections
+import json
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('JOB_QUEUE_PATH', ':memory:')
+os.environ.setdefault('IDEMPOTENCY_PATH', ':memory:')
+os.environ.setdefault('USER_CACHE_ENABLED', 'false')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as poppy  # noqa: E402
+import backfill  # noqa: E402
+import extraction  # noqa: E402
+from addresses import AddressIndex  # noqa: E402
+from benchmarks.fakes import FakeAnthropic, corpus_responder, llm_latency_model, sample_corpus, sample_org  # noqa: E402
+from benchmarks.mock_sf_rest import mock_salesforce  # noqa: E402
+
+
+def token_cost(usage: dict, discount: float) -> int:
+    """Input-token-equivalents billed: cache reads at 10%, cache writes at 125%, output at 5x"""
+    cost = (usage['input_tokens'] + usage['cache_read_input_tokens'] * 0.1
+            + usage['cache_creation_input_tokens'] * 1.25 + usage['output_tokens'] * 5)
+    return round(cost * discount)
+
+
+def crash(*args):
+    raise KeyboardInterrupt
+
+
+def run(label: str, corpus_path: str, args, flags: list, interrupt: bool = False) -> dict:
+    sf, adapter = mock_salesforce(sample_org(args.opportunities), latency=args.sf_latency)
+    poppy.get_sf_connection = lambda: sf
+    poppy.address_index = AddressIndex()
+    claude = FakeAnthropic(corpus_responder, latency=llm_latency_model(args.llm_scale), batch_latency=args.batch_latency)
+    extraction.claude_client = claude
+    for key in extraction.usage_totals:
+        extraction.usage_totals[key] = 0
+
+    checkpoint = os.path.join(tempfile.mkdtemp(), 'backfill.sqlite3')
+    argv = [corpus_path, '--checkpoint', checkpoint, '--sf-rps', str(args.sf_rps), '--llm-rpm', str(args.llm_rpm),
+            '--poll-seconds', '0.1', '--bulk-wait', '0.05', *flags]
+    started = time.perf_counter()
+    if interrupt:
+        # Crash once the batch is submitted, then resume from the checkpoint
+        collect = backfill.Backfill.collect_batch
+        backfill.Backfill.collect_batch = crash
+        try:
+            backfill.main(argv)
+        except KeyboardInterrupt:
+            pass
+        backfill.Backfill.collect_batch = collect
+    counts = backfill.main(argv)
+    elapsed = time.perf_counter() - started
+
+    usage = extraction.usage_metrics()
+    batched = '--no-batch' not in flags
+    return {
+        'label': label,
+        'seconds': elapsed,
+        'counts': counts,
+        'sf_requests': len(adapter.requests),
+        'sf_by_request': dict(collections.Counter(adapter.requests)),
+        'claude_requests': len(claude.calls) + len(claude.beta.messages.batches.batches),
+        'batches': len(claude.beta.messages.batches.batches),
+        'token_cost': token_cost(usage, 0.5 if batched else 1.0),
+        'opportunities': {opp_id: {k: v for k, v in record.items() if k not in ('LastModifiedDate', 'SystemModstamp')}
+                          for opp_id, record in adapter.store.records['Opportunity'].items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--opportunities', type=int, default=50)
+    parser.add_argument('--sf-latency', type=float, default=0.02)
+    parser.add_argument('--sf-rps', type=float, default=50)
+    parser.add_argument('--llm-rpm', type=float, default=600)
+    parser.add_argument('--llm-scale', type=float, default=0.2, help='multiplier on the modelled Claude latency')
+    parser.add_argument('--batch-latency', type=float, default=2.0, help='seconds a message batch takes')
+    args = parser.parse_args()
+
+    corpus_path = os.path.join(tempfile.mkdtemp(), 'calls.jsonl')
+    with open(corpus_path, 'w') as f:
+        f.writelines(json.dumps(payload) + '\n' for payload in sample_corpus(args.calls, args.opportunities))
+
+    results = [
+        run('per-call', corpus_path, args, ['--no-batch', '--no-bulk']),
+        run('batch + bulk', corpus_path, args, []),
+        run('interrupted + resumed', corpus_path, args, [], interrupt=True),
+    ]
+    print(f"{'':24}{'seconds':>9}{'SF requests':>13}{'Claude requests':>17}{'token cost':>12}  outcome")
+    for r in results:
+        print(f"{r['label']:24}{r['seconds']:>9.1f}{r['sf_requests']:>13}{r['claude_requests']:>17}"
+              f"{r['token_cost']:>12}  {r['counts']}")
+    for r in results:
+        print(f"{r['label']}: {r['sf_by_request']} ({r['batches']} message batches)")
+    same = all(r['opportunities'] == results[0]['opportunities'] for r in results[1:])
+    print(f"same Opportunity field values in every run: {same}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""
+Claude requests and tokens saved by reusing Retell's call analysis
+
+Processes the same calls with no call_analysis, a partial one (the call summary
+and the address) and a complete one (custom analysis fields for every debrief
+field in CALL_ANALYSIS_REQUIRED_FIELDS), against the mock Salesforce REST API
+and a FakeAnthropic whose latency grows with prompt and output tokens. Reports
+the Claude requests and tokens (cached prompt included) used and saved per
+call, processing time, the Opportunity and how the fields written differ.
+
+Then sends call_ended and, --gap seconds later, call_analyzed for each call
+through the webhook with async processing on, and reports how many were
+coalesced into one job.
+
+    python -m benchmarks.bench_call_analysis --calls 5 --gap 0.2
+"""
+import argparse
+import collections
+import json
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+
+os.environ.setdefault('JOB_QUEUE_PATH', ':memory:')
+os.environ.setdefault('IDEMPOTENCY_PATH', ':memory:')
+os.environ.setdefault('USER_CACHE_ENABLED', 'false')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as poppy  # noqa: E402
+import extraction  # noqa: E402
+from benchmarks.fakes import (SAMPLE_EXTRACTION, FakeAnthropic, debrief_responder, llm_latency_model,  # noqa: E402
+                              sample_call_payload, sample_org)
+from benchmarks.mock_sf_rest import mock_salesforce  # noqa: E402
+from job_queue import JobQueue, JobWorkerPool  # noqa: E402
+from metrics import CALL_ANALYZED_EVENTS  # noqa: E402
+
+SUMMARY = ('The AE met the seller at 4116 W Iowa Ave. The seller is warm but needs to talk to her brother; '
+           'next step is a meeting on 12/6/2025 at 2pm.')
+
+
+def call_analysis(kind: str) -> dict:
+    if kind == 'none':
+        return None
+    if kind == 'partial':
+        return {'call_summary': SUMMARY, 'custom_analysis_data': {'property_address': '4116 W Iowa Ave'}}
+    custom = dict(SAMPLE_EXTRACTION, property_address='4116 W Iowa Ave', post_appt_notes=SUMMARY,
+                  tasks=json.dumps(SAMPLE_EXTRACTION['tasks']), events=json.dumps(SAMPLE_EXTRACTION['events']))
+    return {'call_summary': SUMMARY, 'custom_analysis_data': custom, 'user_sentiment': 'Positive'}
+
+
+def analyzed_payload(call_id: str, kind: str) -> dict:
+    payload = sample_call_payload(call_id)
+    payload['call']['call_analysis'] = call_analysis(kind)
+    return dict(payload, event='call_analyzed')
+
+
+def setup(args) -> FakeAnthropic:
+    claude = FakeAnthropic(debrief_responder, latency=llm_latency_model(scale=args.llm_scale))
+    extraction.claude_client = claude
+    sf, adapter = mock_salesforce(sample_org(), latency=args.sf_latency)
+    poppy.get_sf_connection = lambda: sf
+    poppy.ADDRESS_INDEX_ENABLED = False
+    poppy.opportunity_snapshots.clear()
+    return claude
+
+
+def run_extraction(kind: str, args) -> dict:
+    claude = setup(args)
+    results, seconds = [], []
+    for i in range(args.calls):
+        payload = analyzed_payload(f'{kind}_{i}', kind)
+        started = time.perf_counter()
+        results.append(poppy.process_call_ended(payload))
+        seconds.append(time.perf_counter() - started)
+    usage = [r['llm_usage'] for r in results]
+    return {
+        'results': results,
+        'claude_calls': len(claude.calls) / args.calls,
+        'tokens': statistics.mean(u['input_tokens'] + u['output_tokens'] + u['cache_creation_input_tokens']
+                                  + u['cache_read_input_tokens'] for u in usage),
+        'saved_requests': statistics.mean(u['saved']['requests'] for u in usage),
+        'saved_tokens': statistics.mean(u['saved']['input_tokens'] + u['saved']['output_tokens'] for u in usage),
+        'seconds': statistics.median(seconds),
+    }
+
+
+def run_coalescing(args) -> dict:
+    """call_ended, then call_analyzed args.gap seconds later, for each call through the async webhook"""
+    claude = setup(args)
+    poppy.ASYNC_CALL_PROCESSING = True
+    poppy.CALL_ANALYSIS_WAIT_SECONDS = args.wait
+    poppy.job_queue = JobQueue(':memory:')
+    handled = collections.Counter()
+    lock = threading.Lock()
+
+    def handler(data):
+        with lock:
+            handled[data.get('event')] += 1
+        return poppy.process_call_job(data)
+
+    pool = JobWorkerPool(poppy.job_queue, handler, size=args.workers, is_transient=poppy.is_transient_error,
+                         on_failure=poppy.release_call_job, poll_interval=0.02)
+    poppy.worker_pool = pool
+    pool.start()
+    client = poppy.app.test_client()
+    before = {outcome: CALL_ANALYZED_EVENTS.value(outcome=outcome) for outcome in ('coalesced', 'queued', 'late')}
+    call_ids = [f'coalesce_{i}' for i in range(args.calls)]
+    started = time.perf_counter()
+    responses = []
+    for call_id in call_ids:
+        client.post('/webhook/retell', json=sample_call_payload(call_id))
+        time.sleep(args.gap)
+        responses.append(client.post('/webhook/retell', json=analyzed_payload(call_id, 'complete')).get_json()['status'])
+    while any(poppy.job_queue.get(call_id)['status'] not in ('succeeded', 'failed') for call_id in call_ids):
+        time.sleep(0.02)
+    elapsed = time.perf_counter() - started
+    pool.stop()
+    return {
+        'responses': collections.Counter(responses),
+        'outcomes': {k: CALL_ANALYZED_EVENTS.value(outcome=k) - v for k, v in before.items()},
+        'jobs': sum(handled.values()),
+        'claude_calls': len(claude.calls),
+        'seconds': elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--gap', type=float, default=0.2, help='seconds between call_ended and call_analyzed')
+    parser.add_argument('--wait', type=float, default=1.0, help='how long a queued call waits for call_analyzed')
+    parser.add_argument('--llm-scale', type=float, default=0.05, help='FakeAnthropic latency scale')
+    parser.add_argument('--sf-latency', type=float, default=0.01)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    poppy.ASYNC_CALL_PROCESSING = False
+    rows = {kind: run_extraction(kind, args) for kind in ('none', 'partial', 'complete')}
+    print(f"{'call_analysis':15}{'claude calls':>14}{'tokens used':>13}{'reqs saved':>12}{'tokens saved':>14}"
+          f"{'p50':>8}  opportunity")
+    for kind, r in rows.items():
+        opportunities = {res.get('opportunity_id') for res in r['results']}
+        print(f"{kind:15}{r['claude_calls']:>14.1f}{r['tokens']:>13,.0f}{r['saved_requests']:>12.1f}"
+              f"{r['saved_tokens']:>14,.0f}{r['seconds']:>7.2f}s  {sorted(opportunities, key=str)}")
+    fields = {kind: set(r['results'][0].get('fields_updated') or []) for kind, r in rows.items()}
+    for kind in ('partial', 'complete'):
+        print(f"fields written with a {kind} analysis vs none: "
+              f"+{sorted(fields[kind] - fields['none'])} -{sorted(fields['none'] - fields[kind])}")
+
+    r = run_coalescing(args)
+    print(f"call_ended + call_analyzed {args.gap}s apart, {args.calls} calls: {r['jobs']} jobs run, "
+          f"{r['claude_calls']} Claude calls, responses {dict(r['responses'])}, "
+          f"outcomes {r['outcomes']}, {r['seconds']:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Salesforce round-trips per webhook: per-record writes vs one Composite request
+
+Runs process_call_ended against a real simple_salesforce client pointed at the
+local mock REST API and counts the HTTP requests it makes, with and without
+SF_COMPOSITE_WRITES. Also checks that a rejected field rolls back the whole batch,
+that a debrief with more records than one Composite call takes is written
+record by record rather than in batches that commit separately, and that a
+record-by-record write cut short by an outage isn't retried into duplicates.
+
+    python -m benchmarks.bench_composite_writes --tasks 3 --events 2
+"""
+import argparse
+import collections
+import os
+import sys
+import time
+
+os.environ.setdefault('JOB_QUEUE_PATH', ':memory:')
+os.environ.setdefault('IDEMPOTENCY_PATH', ':memory:')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as poppy  # noqa: E402
+import extraction  # noqa: E402
+from benchmarks.fakes import SAMPLE_EXTRACTION, FakeAnthropic, sample_call_payload, sample_org  # noqa: E402
+from benchmarks.mock_sf_rest import mock_salesforce  # noqa: E402
+from sf_composite import MAX_SUBREQUESTS, CompositeRequestError  # noqa: E402
+
+
+def run(composite: bool, tasks: int, events: int, latency: float) -> tuple:
+    extraction_reply = dict(
+        SAMPLE_EXTRACTION,
+        property_address='4116 W Iowa Ave',
+        tasks=[{'subject': f'Follow up {i}', 'due_date': None} for i in range(tasks)],
+        events=[{'datetime': f'2025-12-0{i + 1}T14:00:00'} for i in range(events)],
+    )
+    extraction.claude_client = FakeAnthropic(lambda kwargs: extraction_reply)
+    sf, adapter = mock_salesforce(sample_org(), latency=latency)
+    poppy.get_sf_connection = lambda: sf
+    poppy.SF_COMPOSITE_WRITES = composite
+    poppy.ADDRESS_INDEX_ENABLED = False
+    poppy.opportunity_snapshots.clear()
+
+    t0 = time.perf_counter()
+    result = poppy.process_call_ended(sample_call_payload(f'composite_{composite}'))
+    elapsed = time.perf_counter() - t0
+    assert result['status'] == 'success', result
+    return adapter, result, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tasks', type=int, default=3)
+    parser.add_argument('--events', type=int, default=2)
+    parser.add_argument('--latency', type=float, default=0.08, help='simulated Salesforce round-trip seconds')
+    args = parser.parse_args()
+
+    for composite in (False, True):
+        adapter, result, elapsed = run(composite, args.tasks, args.events, args.latency)
+        label = 'composite' if composite else 'per-record'
+        breakdown = ', '.join(f'{k} x{v}' for k, v in collections.Counter(adapter.requests).items())
+        print(f"{label:11} {len(adapter.requests):3} HTTP requests  {elapsed * 1000:7.1f} ms  ({breakdown})")
+    print(f"write_results: {sorted(result['write_results'])}")
+
+    # A bad field value must leave nothing half-written
+    extraction.claude_client = FakeAnthropic(lambda kwargs: dict(SAMPLE_EXTRACTION, property_address='4116 W Iowa Ave'))
+    sf, adapter = mock_salesforce(sample_org())
+    adapter.store.reject_fields = {'ARV__c'}
+    poppy.get_sf_connection = lambda: sf
+    poppy.opportunity_snapshots.clear()
+    try:
+        poppy.process_call_ended(sample_call_payload('composite_rollback'))
+        print("rollback: FAILED - request succeeded")
+    except CompositeRequestError as e:
+        print(f"rollback: {e} - tasks left in org: {len(adapter.store.records.get('Task', {}))}")
+
+    adapter, result, _ = run(True, MAX_SUBREQUESTS, 0, 0)
+    print(f"{MAX_SUBREQUESTS} tasks: {len(result['tasks_created'])} created with {dict(collections.Counter(adapter.requests))}")
+
+    # Salesforce goes down right after the call log is created
+    sf, adapter = mock_salesforce(sample_org())
+    poppy.get_sf_connection = lambda: sf
+    poppy.SF_COMPOSITE_WRITES = False
+    poppy.opportunity_snapshots.clear()
+    send = adapter.send
+
+    def outage_after_first_task(request, **kwargs):
+        response = send(request, **kwargs)
+        if request.method == 'POST' and '/sobjects/Task' in request.url:
+            adapter.outage = True
+        return response
+
+    adapter.send = outage_after_first_task
+    try:
+        poppy.process_call_ended(sample_call_payload('composite_partial'))
+        print("partial write: FAILED - request succeeded")
+    except poppy.PartialDebriefWrite as e:
+        retried = poppy.is_transient_error(e) or poppy.salesforce_retry_after(e) is not None
+        print(f"partial write: {e.result['status']}, call activity {e.result['call_activity_id']}, "
+              f"retried: {retried}, tasks in org: {len(adapter.store.records.get('Task', {}))}")
+
+
+if __name__ == '__main__':
+    main()
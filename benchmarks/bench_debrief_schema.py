@@ -0,0 +1,108 @@
+"""
+Parsing and validating extraction output
+
+Times the previous fence-stripping regexes + json.loads + greedy regex fallback
+against parse_json_object on replies of growing size, with and without prose
+around the JSON, and shows what each returns when the prose contains braces. Then
+times validate_debrief over generated tool inputs, some with bad values, and
+counts the calls that would previously have aborted on an event datetime.
+
+    python -m benchmarks.bench_debrief_schema --replies 2000
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import re
+import sys
+import time
+from datetime import datetime
+
+os.environ.setdefault('ANTHROPIC_API_KEY', 'unused')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import SAMPLE_EXTRACTION  # noqa: E402
+from debrief_schema import parse_json_object  # noqa: E402
+from extraction import validate_debrief  # noqa: E402
+
+
+def regex_parse(content: str) -> dict:
+    """The previous implementation, kept here for comparison"""
+    try:
+        content = re.sub(r'^```json\s*', '', content)
+        content = re.sub(r'^```\s*', '', content)
+        content = re.sub(r'\s*```$', '', content)
+        return json.loads(content)
+    except json.JSONDecodeError:
+        match = re.search(r'\{.*\}', content, re.DOTALL)
+        if match:
+            try:
+                return json.loads(match.group())
+            except json.JSONDecodeError:
+                return None
+        return {}
+
+
+def reply(notes: int, prose: bool) -> str:
+    data = dict(SAMPLE_EXTRACTION, post_appt_notes=' '.join(['Seller wants to think it over.'] * notes))
+    body = json.dumps(data)
+    if prose:
+        return f"Here is the extracted data:\n{body}\nNote: the {{stage}} field was set from the AE's words."
+    return f"```json\n{body}\n```"
+
+
+def time_per_call(fn, items: list) -> float:
+    t0 = time.perf_counter()
+    for item in items:
+        fn(item)
+    return (time.perf_counter() - t0) / len(items) * 1e6
+
+
+def noisy_input(rng: random.Random) -> dict:
+    data = dict(SAMPLE_EXTRACTION, property_address='4116 W Iowa Ave')
+    data['arv'] = rng.choice([320000, '320k', '$320,000', 'about 320'])
+    data['stage'] = rng.choice(['Warm', 'warm', 'Hot Lead'])
+    data['events'] = [{'datetime': rng.choice(['2025-12-06T14:00:00', '12/06/2025 2:00 PM', 'Friday afternoon'])}]
+    return data
+
+
+def old_event_ok(data: dict) -> bool:
+    try:
+        for event in data['events']:
+            datetime.fromisoformat(event['datetime'].replace('Z', ''))
+        return True
+    except ValueError:
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--replies', type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'reply':28}{'bytes':>8}{'regex us':>10}{'parser us':>11}")
+    for notes in (1, 100, 2000):
+        for prose in (False, True):
+            text = reply(notes, prose)
+            items = [text] * max(10, args.replies // notes)
+            label = f"{'prose' if prose else 'fenced'}, {notes} note sentences"
+            print(f"{label:28}{len(text):>8}{time_per_call(regex_parse, items):>10.1f}"
+                  f"{time_per_call(parse_json_object, items):>11.1f}")
+    text = reply(1, True)
+    print(f"prose with braces after the JSON: regex -> {regex_parse(text)}, "
+          f"parser -> {len(parse_json_object(text))} fields")
+
+    logging.getLogger('extraction').setLevel(logging.ERROR)
+    rng = random.Random(0)
+    inputs = [noisy_input(rng) for _ in range(args.replies)]
+    per_call = time_per_call(validate_debrief, inputs)
+    results = [validate_debrief(data) for data in inputs]
+    with_errors = sum(1 for r in results if r.errors)
+    print(f"validate_debrief: {per_call:.1f} us per tool input; {with_errors}/{len(inputs)} had values dropped, "
+          f"{sum(len(r.data['events']) for r in results)} events kept")
+    print(f"previously aborted on an event datetime: {sum(1 for d in inputs if not old_event_ok(d))}/{len(inputs)} calls")
+
+
+if __name__ == '__main__':
+    main()
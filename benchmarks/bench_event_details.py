@@ -0,0 +1,84 @@
+"""
+Salesforce requests for a debrief with several events
+
+Processes a debrief with --events events against the mock Salesforce REST API,
+with per-record and Composite writes and the field diff on and off, and counts
+the HTTP requests per call. The Opportunity read before the update carries the
+Account and property fields, so events don't query it again; the org's fields
+are described once per process (the first call shows that cost). Later calls
+repeat the debrief, so with the diff on their unchanged update is skipped. Then
+runs the same call against an org without person accounts or Property_Zip__c
+and shows the event still gets the seller's name and the property address.
+
+    python -m benchmarks.bench_event_details --events 3 --calls 3
+"""
+import argparse
+import collections
+import logging
+import os
+import sys
+
+os.environ.setdefault('JOB_QUEUE_PATH', ':memory:')
+os.environ.setdefault('IDEMPOTENCY_PATH', ':memory:')
+os.environ.setdefault('USER_CACHE_ENABLED', 'false')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as poppy  # noqa: E402
+import extraction  # noqa: E402
+from benchmarks.fakes import SAMPLE_EXTRACTION, FakeAnthropic, sample_call_payload, sample_org  # noqa: E402
+from benchmarks.mock_sf_rest import mock_salesforce  # noqa: E402
+
+
+def setup(events: int, missing_fields: set = frozenset()):
+    reply = dict(SAMPLE_EXTRACTION, property_address='4116 W Iowa Ave',
+                 events=[{'datetime': f'2025-12-{6 + i:02d}T14:00:00'} for i in range(events)])
+    extraction.claude_client = FakeAnthropic(lambda kwargs: reply)
+    sf, adapter = mock_salesforce(sample_org())
+    adapter.store.missing_fields = set(missing_fields)
+    poppy.get_sf_connection = lambda: sf
+    poppy.ADDRESS_INDEX_ENABLED = False
+    poppy.opportunity_snapshots.clear()
+    poppy.field_capabilities.clear()
+    return sf, adapter
+
+
+def run(composite: bool, diff: bool, args) -> list:
+    poppy.SF_COMPOSITE_WRITES = composite
+    poppy.OPPORTUNITY_DIFF_ENABLED = diff
+    sf, adapter = setup(args.events)
+    rows = []
+    for i in range(args.calls):
+        # Each call is a different visit, so nothing about the Opportunity is cached yet
+        poppy.opportunity_snapshots.clear()
+        before = len(adapter.requests)
+        result = poppy.process_call_ended(sample_call_payload(f'events_{composite}_{diff}_{i}'))
+        assert result['status'] == 'success' and len(result['events_created']) == args.events, result
+        rows.append(collections.Counter(adapter.requests[before:]))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--events', type=int, default=3, help='events in the debrief')
+    parser.add_argument('--calls', type=int, default=3)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    print(f"{'':26}{'first call':>12}{'later calls':>13}  later call requests")
+    for composite in (False, True):
+        for diff in (False, True):
+            rows = run(composite, diff, args)
+            label = f"{'composite' if composite else 'per-record'}, diff {'on' if diff else 'off'}"
+            later = rows[1:] or rows
+            print(f"{label:26}{sum(rows[0].values()):>12}{sum(sum(r.values()) for r in later) / len(later):>13.1f}"
+                  f"  {dict(later[-1])}")
+
+    sf, adapter = setup(1, {'Account.PersonMobilePhone', 'Opportunity.Property_Zip__c'})
+    result = poppy.process_call_ended(sample_call_payload('no_person_accounts'))
+    event = adapter.store.records['Event'][result['events_created'][0]]
+    print(f"org without PersonMobilePhone / Property_Zip__c: {result['status']}, "
+          f"event {event['Subject']!r} at {event['Location']!r}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Two-call vs single-pass Claude extraction
+
+Runs process_call_ended end to end against fake Salesforce and a recorded-response
+Claude stub whose latency grows with input and output tokens, once with the old
+address-then-fields flow and once with the single record_debrief tool call.
+
+    python -m benchmarks.bench_extraction --calls 10 --scale 0.2
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+os.environ.setdefault('JOB_QUEUE_PATH', ':memory:')
+os.environ.setdefault('IDEMPOTENCY_PATH', ':memory:')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as poppy  # noqa: E402
+import extraction  # noqa: E402
+from benchmarks.fakes import (SAMPLE_TRANSCRIPT, FakeAnthropic, FakeSalesforce, debrief_responder, llm_latency_model,  # noqa: E402
+                              prompt_tokens, sample_call_payload, sample_org)
+
+
+def run(single_pass: bool, calls: int, scale: float, sf_latency: float, transcript: str) -> dict:
+    extraction.SINGLE_PASS_EXTRACTION = single_pass
+    llm = FakeAnthropic(debrief_responder, latency=llm_latency_model(scale))
+    extraction.claude_client = llm
+    sf = FakeSalesforce(sample_org(), latency=sf_latency)
+    poppy.get_sf_connection = lambda: sf
+
+    timings = []
+    for i in range(calls):
+        t0 = time.perf_counter()
+        result = poppy.process_call_ended(sample_call_payload(f'extract_{single_pass}_{i}', transcript))
+        timings.append(time.perf_counter() - t0)
+        assert result['status'] == 'success', result
+
+    return {
+        'p50_ms': statistics.median(timings) * 1000,
+        'mean_ms': statistics.mean(timings) * 1000,
+        'llm_calls_per_webhook': len(llm.calls) / calls,
+        'input_tokens_per_webhook': sum(prompt_tokens(call) for call in llm.calls) / calls,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=10)
+    parser.add_argument('--scale', type=float, default=0.2, help='multiplier on the modelled Claude latency')
+    parser.add_argument('--sf-latency', type=float, default=0.01)
+    parser.add_argument('--transcript-repeat', type=int, default=12,
+                        help='repeat the sample transcript to approximate a full 8 minute debrief')
+    args = parser.parse_args()
+
+    transcript = '\n'.join([SAMPLE_TRANSCRIPT] * args.transcript_repeat)
+    two_call = run(False, args.calls, args.scale, args.sf_latency, transcript)
+    single = run(True, args.calls, args.scale, args.sf_latency, transcript)
+
+    print(f"{'':28}{'two-call':>12}{'single-pass':>14}")
+    for key in ('p50_ms', 'mean_ms', 'llm_calls_per_webhook', 'input_tokens_per_webhook'):
+        print(f"{key:28}{two_call[key]:>12.1f}{single[key]:>14.1f}")
+    print(f"{'speedup (p50)':28}{two_call['p50_ms'] / single['p50_ms']:>26.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+Mid-call function latency: synchronous handlers vs the fast path
+
+Replays the function calls of a live debrief (lookup_property, then
+update_opportunity and create_task calls for the same property, and a repeat
+lookup) through Flask's
+test client against a slow fake Salesforce, with FAST_FUNCTION_PATH off and on,
+and prints p50/p99 per function name. With the fast path on it then waits for the
+queued writes to drain and checks they all landed, that a write naming an address that doesn't
+match isn't redirected to the property looked up earlier in the call, and how
+long a write waits while every job worker is busy with a slow debrief.
+
+    python -m benchmarks.bench_function_calls --calls 20 --sf-latency 0.15
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('JOB_QUEUE_PATH', os.path.join(tempfile.mkdtemp(), 'jobs.sqlite3'))
+os.environ.setdefault('IDEMPOTENCY_PATH', ':memory:')
+# The recorded calls have no call_analyzed to wait for
+os.environ.setdefault('CALL_ANALYSIS_WAIT_SECONDS', '0')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as poppy  # noqa: E402
+from benchmarks.fakes import FakeSalesforce, sample_org  # noqa: E402
+from latency import LatencyTracker  # noqa: E402
+
+
+def function_call(call_id: str, name: str, **arguments) -> dict:
+    return {'call': {'call_id': call_id}, 'function_name': name, 'arguments': arguments}
+
+
+def run(fast: bool, calls: int, sf: FakeSalesforce, addresses: list, rng: random.Random) -> list:
+    poppy.FAST_FUNCTION_PATH = fast
+    poppy.function_latency = LatencyTracker(budget=poppy.FUNCTION_LATENCY_BUDGET)
+    client = poppy.app.test_client()
+    write_ids = []
+    for i in range(calls):
+        call_id = f"live_{'fast' if fast else 'sync'}_{i}"
+        address = rng.choice(addresses)
+        client.post('/webhook/retell', json={'event': 'call_started', 'call': {'call_id': call_id}})
+        requests = [function_call(call_id, 'lookup_property', address=address)]
+        requests += [function_call(call_id, 'update_opportunity', address=address, arv=300000 + i)]
+        requests += [function_call(call_id, 'create_task', address=address, subject=f'Follow up {n}') for n in range(2)]
+        # The AE double-checks the property before the last update
+        requests += [function_call(call_id, 'lookup_property', address=address)]
+        requests += [function_call(call_id, 'update_opportunity', address=address, next_step='Call seller Friday')]
+        for payload in requests:
+            response = client.post('/webhook/retell/function', json=payload).get_json()
+            if response.get('write_id'):
+                write_ids.append(response['write_id'])
+    return write_ids
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=20)
+    parser.add_argument('--opportunities', type=int, default=200)
+    parser.add_argument('--sf-latency', type=float, default=0.15)
+    parser.add_argument('--index', action='store_true', help='resolve addresses from the in-process index')
+    args = parser.parse_args()
+    rng = random.Random(11)
+
+    sf = FakeSalesforce(sample_org(args.opportunities), latency=args.sf_latency)
+    poppy.get_sf_connection = lambda: sf
+    poppy.ADDRESS_INDEX_ENABLED = args.index
+    addresses = [r['Name'].split(' - ')[0] for r in sf.records['Opportunity'].values()]
+
+    for fast in (False, True):
+        write_ids = run(fast, args.calls, sf, addresses, rng)
+        print(f"{'fast path' if fast else 'synchronous'} (budget {poppy.FUNCTION_LATENCY_BUDGET * 1000:.0f} ms)")
+        for name, stats in sorted(poppy.function_latency.summary().items()):
+            print(f"  {name:20} n={stats['count']:<4} p50 {stats['p50_ms']:>7.1f} ms  p99 {stats['p99_ms']:>7.1f} ms"
+                  f"  over budget {stats['over_budget']}")
+
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        statuses = [poppy.job_queue.get(write_id)['status'] for write_id in write_ids]
+        if all(status in ('succeeded', 'failed') for status in statuses):
+            break
+        time.sleep(0.1)
+    print(f"queued writes: {len(write_ids)}, succeeded {statuses.count('succeeded')}, failed {statuses.count('failed')}")
+
+    client = poppy.app.test_client()
+    client.post('/webhook/retell', json={'event': 'call_started', 'call': {'call_id': 'live_unmatched'}})
+    client.post('/webhook/retell/function', json=function_call('live_unmatched', 'lookup_property', address=addresses[0]))
+    response = client.post('/webhook/retell/function', json=function_call(
+        'live_unmatched', 'update_opportunity', address='999 Nonexistent Blvd', arv=1)).get_json()
+    print(f"update for an unknown address after a lookup: {response}")
+
+    # Every job worker is on a debrief when the AE's next write comes in
+    process_call_ended = poppy.process_call_ended
+    poppy.process_call_ended = lambda data: time.sleep(3) or {'status': 'success'}
+    pool = poppy.get_worker_pool()
+    for i in range(pool.size):
+        poppy.job_queue.enqueue(f'slow_debrief_{i}', {'call': {'call_id': f'slow_debrief_{i}'}})
+    pool.notify()
+    time.sleep(0.2)
+    started = time.time()
+    write_id = client.post('/webhook/retell/function', json=function_call(
+        'live_busy', 'update_opportunity', address=addresses[0], arv=1)).get_json()['write_id']
+    while poppy.job_queue.get(write_id)['status'] not in ('succeeded', 'failed'):
+        time.sleep(0.02)
+    print(f"write with {pool.size} workers on slow debriefs: {poppy.job_queue.get(write_id)['status']} "
+          f"in {time.time() - started:.2f}s")
+    poppy.process_call_ended = process_call_ended
+    pool.stop()
+    poppy.get_function_write_pool().stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Idempotency store under concurrent duplicate deliveries
+
+Simulates several gunicorn workers, each with its own store handle (separate
+SQLite connections on one file, or clients of one Redis), receiving the same
+webhooks at once. Every call_id must be claimed exactly once, and duplicates
+arriving after completion must get the stored result. Also times the old
+per-call dict sweep at the same number of tracked calls.
+
+    python -m benchmarks.bench_idempotency --calls 2000 --workers 4 --deliveries 3
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import FakeRedis  # noqa: E402
+from idempotency import COMPLETED, RedisIdempotencyStore, SQLiteIdempotencyStore  # noqa: E402
+
+
+def run(stores: list, call_ids: list, deliveries: int) -> dict:
+    claims = {}
+    lock = threading.Lock()
+    barrier = threading.Barrier(len(stores))
+
+    def worker(store):
+        barrier.wait()
+        for _ in range(deliveries):
+            for call_id in call_ids:
+                claimed, record = store.claim(call_id, ttl=60)
+                if claimed:
+                    with lock:
+                        claims[call_id] = claims.get(call_id, 0) + 1
+                    store.complete(call_id, {'status': 'success', 'call_id': call_id}, ttl=60)
+
+    threads = [threading.Thread(target=worker, args=(store,)) for store in stores]
+    t0 = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - t0
+
+    replayed = [stores[-1].get(call_id) for call_id in call_ids]
+    return {
+        'claims_per_s': len(stores) * deliveries * len(call_ids) / elapsed,
+        'double_claims': sum(1 for n in claims.values() if n > 1),
+        'unclaimed': len(call_ids) - len(claims),
+        'replayed_ok': sum(1 for r in replayed if r and r['status'] == COMPLETED and r['result']['call_id']),
+    }
+
+
+def dict_sweep_us(size: int) -> float:
+    """Cost per webhook of the old processed_calls cleanup at a given size"""
+    processed_calls = {f'call_{i}': datetime.now() for i in range(size)}
+    t0 = time.perf_counter()
+    for _ in range(50):
+        cutoff = datetime.now() - timedelta(hours=1)
+        expired = [k for k, v in processed_calls.items() if v < cutoff]
+        for k in expired:
+            del processed_calls[k]
+    return (time.perf_counter() - t0) / 50 * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--deliveries', type=int, default=3, help='times each worker receives every webhook')
+    args = parser.parse_args()
+    call_ids = [f'call_{i}' for i in range(args.calls)]
+
+    path = os.path.join(tempfile.mkdtemp(), 'idempotency.sqlite3')
+    sqlite_stores = [SQLiteIdempotencyStore(path) for _ in range(args.workers)]
+    redis = FakeRedis()
+    redis_stores = [RedisIdempotencyStore(redis) for _ in range(args.workers)]
+
+    print(f"{args.workers} workers x {args.deliveries} deliveries of {args.calls} call_ids")
+    print(f"{'':8}{'claims/s':>10}{'double claims':>15}{'unclaimed':>11}{'replayed':>10}")
+    for label, stores in (('sqlite', sqlite_stores), ('redis', redis_stores)):
+        stats = run(stores, call_ids, args.deliveries)
+        print(f"{label:8}{stats['claims_per_s']:>10,.0f}{stats['double_claims']:>15}"
+              f"{stats['unclaimed']:>11}{stats['replayed_ok']:>10}")
+    print(f"old dict sweep per webhook at {args.calls} tracked calls: {dict_sweep_us(args.calls):.0f} us")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""
+Time from hangup to a written debrief, with and without live extraction
+
+Replays utterance streams - Retell transcript_updated webhooks followed by
+call_ended - through Flask's test client against the mock Salesforce REST API
+and a FakeAnthropic whose latency grows with prompt and output tokens. Each
+update follows the previous one by the time its utterance takes to say (150
+words a minute); call_ended is processed inline, and its response time is the
+wait after hangup. The clock runs --speedup times fast (speech, Claude and
+Salesforce alike) and times are reported in real seconds. Reports that wait,
+the Claude requests and prompt tokens, and whether both modes wrote the same
+debrief.
+
+Recorded streams come from a JSONL file of webhooks (WEBHOOK_RECORD_PATH records
+every event, transcript_updated included); without --corpus debriefs of
+--minutes are generated.
+
+    python -m benchmarks.bench_live_extraction --calls 3 --minutes 8 --speedup 20
+    python -m benchmarks.bench_live_extraction --corpus webhooks.jsonl
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+
+os.environ.setdefault('JOB_QUEUE_PATH', ':memory:')
+os.environ.setdefault('IDEMPOTENCY_PATH', ':memory:')
+os.environ.setdefault('USER_CACHE_ENABLED', 'false')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as poppy  # noqa: E402
+import extraction  # noqa: E402
+from benchmarks.bench_long_transcripts import long_call  # noqa: E402
+from benchmarks.fakes import SAMPLE_EXTRACTION, FakeAnthropic, llm_latency_model, prompt_tokens, sample_org  # noqa: E402
+from benchmarks.mock_sf_rest import mock_salesforce  # noqa: E402
+
+WORDS_PER_SECOND = 2.5
+
+
+def load_streams(path: str) -> list:
+    """[[transcript_updated..., call_ended], ...] per call from a JSONL file of recorded webhooks"""
+    calls = {}
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            payload = json.loads(line)
+            call_id = payload.get('call', payload).get('call_id')
+            if payload.get('event') in ('transcript_updated', 'call_ended') and call_id:
+                calls.setdefault(call_id, []).append(payload)
+    return [events for events in calls.values() if events[-1].get('event') == 'call_ended']
+
+
+def generated_stream(call_id: str, minutes: int, seed: int) -> list:
+    """A transcript_updated after each utterance of a generated debrief, then call_ended"""
+    ended = long_call(minutes, seed)
+    call = dict(ended['call'], call_id=call_id)
+    turns = call['transcript_object']
+    updates = [{'event': 'transcript_updated', 'call': {'call_id': call_id, 'transcript_object': turns[:i]}}
+               for i in range(1, len(turns) + 1)]
+    return updates + [{'event': 'call_ended', 'call': call}]
+
+
+def speaking_seconds(payload: dict) -> float:
+    """How long the newest utterance of a transcript_updated took to say"""
+    turns = payload['call'].get('transcript_object') or [{'content': ''}]
+    return len((turns[-1].get('content') or '').split()) / WORDS_PER_SECOND
+
+
+def with_call_id(payload: dict, suffix: str) -> dict:
+    return dict(payload, call=dict(payload['call'], call_id=f"{payload['call']['call_id']}_{suffix}"))
+
+
+def responder(kwargs: dict) -> dict:
+    """The sample debrief - for an incremental request only what isn't in the debrief so far,
+    with null for the rest, as Claude answers when the new stretch doesn't change a field"""
+    debrief = dict(SAMPLE_EXTRACTION, property_address='4116 W Iowa Ave')
+    prompt = kwargs['messages'][0]['content']
+    if 'DEBRIEF SO FAR:' not in prompt:
+        return debrief
+    state = json.loads(prompt.split('DEBRIEF SO FAR:\n', 1)[1].split('\n', 1)[0])
+    return {key: ([] if isinstance(value, list) else None) if state.get(key) == value else value
+            for key, value in debrief.items()}
+
+
+def run(streams: list, live: bool, speedup: float) -> dict:
+    poppy.LIVE_EXTRACTION = live
+    poppy.ASYNC_CALL_PROCESSING = False
+    claude = FakeAnthropic(responder, latency=llm_latency_model(scale=1 / speedup))
+    extraction.claude_client = claude
+    sf, adapter = mock_salesforce(sample_org(), latency=0.05 / speedup)
+    poppy.get_sf_connection = lambda: sf
+    poppy.ADDRESS_INDEX_ENABLED = False
+    client = poppy.app.test_client()
+
+    waits, results = [], []
+    for stream in streams:
+        for payload in stream[:-1] if live else ():
+            time.sleep(speaking_seconds(payload) / speedup)
+            client.post('/webhook/retell', json=with_call_id(payload, live))
+        started = time.perf_counter()
+        result = client.post('/webhook/retell', json=with_call_id(stream[-1], live)).get_json()
+        waits.append((time.perf_counter() - started) * speedup)
+        results.append(result)
+    return {
+        'waits': waits,
+        'results': results,
+        'claude_calls': len(claude.calls),
+        'prompt_tokens': sum(prompt_tokens(c) for c in claude.calls),
+        'live_extractions': [r.get('live_extractions') for r in results],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--corpus', help='JSONL of recorded Retell webhooks')
+    parser.add_argument('--calls', type=int, default=3)
+    parser.add_argument('--minutes', type=int, default=8, help='length of generated debriefs')
+    parser.add_argument('--speedup', type=float, default=20, help='how many times faster than real time to replay')
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    if args.corpus:
+        streams = load_streams(args.corpus)
+    else:
+        streams = [generated_stream(f'live_{i}', args.minutes, seed=i) for i in range(args.calls)]
+    print(f"{len(streams)} calls, {statistics.mean(len(s) - 1 for s in streams):.0f} transcript updates each")
+
+    rows = {live: run(streams, live, args.speedup) for live in (False, True)}
+    print(f"{'':18}{'wait p50':>10}{'wait max':>10}{'claude calls':>14}{'prompt tokens':>15}  extractions per call")
+    for live, r in rows.items():
+        print(f"{'live extraction' if live else 'after hangup':18}{statistics.median(r['waits']):>9.2f}s"
+              f"{max(r['waits']):>9.2f}s{r['claude_calls']:>14}{r['prompt_tokens']:>15,}  {r['live_extractions']}")
+    same = all(a.get('opportunity_id') == b.get('opportunity_id') and a.get('fields_updated') == b.get('fields_updated')
+               for a, b in zip(rows[False]['results'], rows[True]['results']))
+    print(f"same Opportunity and fields written: {same}; statuses {[r['status'] for r in rows[True]['results']]}")
+
+
+if __name__ == '__main__':
+    main()
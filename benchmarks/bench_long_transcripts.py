@@ -0,0 +1,120 @@
+"""
+Long calls: windowed extraction and full-transcript storage
+
+Runs process_call_ended on a generated multi-hour debrief (sent as Retell's
+transcript_object and transcript) against the mock Salesforce REST API and
+FakeAnthropic, once per TRANSCRIPT_STORAGE mode, and reports the Claude requests
+and largest prompt, the records written, how much of the transcript can be read
+back from Salesforce, and the peak memory traced while processing the webhook.
+
+    python -m benchmarks.bench_long_transcripts --minutes 180
+"""
+import argparse
+import base64
+import collections
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+os.environ.setdefault('JOB_QUEUE_PATH', ':memory:')
+os.environ.setdefault('IDEMPOTENCY_PATH', ':memory:')
+os.environ.setdefault('USER_CACHE_ENABLED', 'false')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as poppy  # noqa: E402
+import extraction  # noqa: E402
+from benchmarks.fakes import SAMPLE_EXTRACTION, FakeAnthropic, sample_call_payload, sample_org  # noqa: E402
+from benchmarks.mock_sf_rest import mock_salesforce  # noqa: E402
+
+WORDS = ('the seller said roof kitchen offer price brother contract foundation windows water heater basement '
+         'comps market listing agent tenant lease repairs closing title cash timeline motivated').split()
+
+
+def long_call(minutes: int, seed: int = 0) -> dict:
+    """call_ended payload for a debrief of about minutes long (~150 spoken words a minute)"""
+    rng = random.Random(seed)
+    turns = [{'role': 'user', 'content': 'It was 4116 W Iowa Ave, met the seller this afternoon.'}]
+    words = 0
+    while words < minutes * 150:
+        count = rng.randint(8, 60)
+        turns.append({'role': rng.choice(('agent', 'user')), 'content': ' '.join(rng.choices(WORDS, k=count)) + '.'})
+        words += count
+    turns.append({'role': 'user', 'content': 'Mark it warm and set a follow up for Friday at 2.'})
+    payload = sample_call_payload(f'long_{minutes}')
+    payload['call']['transcript_object'] = turns
+    payload['call']['transcript'] = ''.join(f"{'Agent' if t['role'] == 'agent' else 'User'}: {t['content']}\n"
+                                            for t in turns)
+    return payload
+
+
+def stored_transcript(store) -> str:
+    """What a user can read back: the call Task's transcript, its continuation Tasks, or the file"""
+    files = list(store.records.get('ContentVersion', {}).values())
+    if files:
+        return base64.b64decode(files[0]['VersionData']).decode('utf-8')
+    parts = []
+    for task in store.records.get('Task', {}).values():
+        description = task.get('Description') or ''
+        if task['Subject'] == 'Poppy Debrief Call':
+            transcript = description.partition('--- TRANSCRIPT ---\n')[2]
+            parts.insert(0, transcript.rpartition('\n\n[')[0].rstrip('\n') if '\n\n[' in transcript else transcript)
+        elif task['Subject'].startswith('Poppy Debrief Call - transcript'):
+            parts.append(description.partition('\n\n')[2])
+    return '\n'.join(parts)
+
+
+def run(payload: dict, storage: str, window_tokens: int) -> dict:
+    poppy.TRANSCRIPT_STORAGE = storage
+    extraction.EXTRACTION_WINDOW_TOKENS = window_tokens
+    claude = FakeAnthropic(lambda kwargs: dict(SAMPLE_EXTRACTION, property_address='4116 W Iowa Ave'))
+    extraction.claude_client = claude
+    sf, adapter = mock_salesforce(sample_org())
+    poppy.get_sf_connection = lambda: sf
+    poppy.ADDRESS_INDEX_ENABLED = False
+    poppy.opportunity_snapshots.clear()
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = poppy.process_call_ended(payload)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert result['status'] == 'success', result
+
+    stored = stored_transcript(adapter.store).strip()
+    original = payload['call']['transcript'].strip()
+    return {
+        'seconds': elapsed,
+        'peak_kb': peak / 1024,
+        'claude_calls': len(claude.calls),
+        'max_prompt_chars': max(len(str(c['messages'])) for c in claude.calls),
+        'records': dict(collections.Counter(f"{r.split()[0]} {r.split()[1].split('/')[0]}" for r in adapter.requests)),
+        'stored_pct': 100 * len(stored) / len(original),
+        'complete': stored == original,
+        'tasks': len(adapter.store.records.get('Task', {})),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--minutes', type=int, default=180)
+    parser.add_argument('--window-tokens', type=int, default=30000)
+    args = parser.parse_args()
+
+    payload = long_call(args.minutes)
+    print(f"{args.minutes} minute call: {len(payload['call']['transcript_object'])} utterances, "
+          f"{len(payload['call']['transcript']):,} characters")
+    print(f"{'':30}{'claude calls':>13}{'max prompt':>12}{'stored':>9}{'complete':>10}{'tasks':>7}{'peak KB':>9}  requests")
+    for label, storage, window in (('one prompt, truncate', 'truncate', 10 ** 9),
+                                   ('windowed, truncate', 'truncate', args.window_tokens),
+                                   ('windowed, file', 'file', args.window_tokens),
+                                   ('windowed, tasks', 'tasks', args.window_tokens)):
+        r = run(payload, storage, window)
+        print(f"{label:30}{r['claude_calls']:>13}{r['max_prompt_chars']:>12,}{r['stored_pct']:>8.0f}%"
+              f"{str(r['complete']):>10}{r['tasks']:>7}{r['peak_kb']:>9,.0f}  {r['records']}")
+
+
+if __name__ == '__main__':
+    main()
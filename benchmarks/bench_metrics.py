@@ -0,0 +1,79 @@
+"""
+Per-stage latency breakdown from the /metrics endpoint
+
+Runs process_call_ended against the mock Salesforce REST API (so requests go
+through an instrumented requests.Session) and a fake Claude client, then scrapes
+GET /metrics and prints where the time went: per stage, per Salesforce operation,
+per Claude request kind, and how many Salesforce requests each call made.
+
+    python -m benchmarks.bench_metrics --calls 10 --sf-latency 0.05
+"""
+import argparse
+import os
+import re
+import sys
+
+os.environ.setdefault('JOB_QUEUE_PATH', ':memory:')
+os.environ.setdefault('IDEMPOTENCY_PATH', ':memory:')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as poppy  # noqa: E402
+import extraction  # noqa: E402
+from benchmarks.fakes import FakeAnthropic, debrief_responder, llm_latency_model, sample_call_payload, sample_org  # noqa: E402
+from benchmarks.mock_sf_rest import mock_salesforce  # noqa: E402
+
+SAMPLE = re.compile(r'^(\w+)_(sum|count)\{?([^}]*)\}? (\S+)$')
+
+
+def histogram_means(text: str, name: str) -> dict:
+    """{labels: (count, mean seconds)} for one histogram in the exposition text"""
+    sums, counts = {}, {}
+    for line in text.splitlines():
+        match = SAMPLE.match(line)
+        if not match or match.group(1) != name:
+            continue
+        target = sums if match.group(2) == 'sum' else counts
+        target[match.group(3)] = float(match.group(4))
+    return {labels: (int(counts[labels]), sums[labels] / counts[labels]) for labels in counts if counts[labels]}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=10)
+    parser.add_argument('--sf-latency', type=float, default=0.05)
+    parser.add_argument('--scale', type=float, default=0.2, help='multiplier on the modelled Claude latency')
+    args = parser.parse_args()
+
+    poppy.ADDRESS_INDEX_ENABLED = False
+    poppy.USER_CACHE_ENABLED = False
+    extraction.claude_client = FakeAnthropic(debrief_responder, latency=llm_latency_model(args.scale))
+    sf, _ = mock_salesforce(sample_org(), latency=args.sf_latency)
+    poppy.get_sf_connection = lambda: sf
+
+    requests_per_call = []
+    for i in range(args.calls):
+        result = poppy.process_call_ended(sample_call_payload(f'metrics_{i}'))
+        assert result['status'] == 'success', result
+        requests_per_call.append(result['salesforce_requests'])
+
+    response = poppy.app.test_client().get('/metrics')
+    assert response.status_code == 200
+    text = response.get_data(as_text=True)
+    print(f"/metrics: {len(text.splitlines())} lines, {response.content_type}")
+    print(f"Salesforce requests per call: {requests_per_call}")
+
+    sections = [
+        ('poppy_call_processing_seconds', 'end to end'),
+        ('poppy_stage_seconds', 'pipeline stages'),
+        ('poppy_salesforce_request_seconds', 'Salesforce requests'),
+        ('poppy_opportunity_search_seconds', 'opportunity search'),
+        ('poppy_llm_request_seconds', 'Claude requests'),
+    ]
+    for name, title in sections:
+        print(f"{title}:")
+        for labels, (count, mean) in sorted(histogram_means(text, name).items(), key=lambda item: -item[1][1]):
+            print(f"  {labels or '-':45}{count:>5}x  mean {mean * 1000:>7.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
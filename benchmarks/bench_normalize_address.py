@@ -0,0 +1,91 @@
+"""
+normalize_address cost per address
+
+Times the previous str.replace loop against the table-driven tokenizer on a
+generated list of addresses, both cold (every address new) and warm (the same
+few hundred addresses repeated, as during a day of calls against one org).
+
+    python -m benchmarks.bench_normalize_address --addresses 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from addresses import normalize_address, normalized_tokens  # noqa: E402
+
+STREETS = ['Iowa', 'Main', 'Oak', 'Eastwood', 'Westfield', 'Northgate', 'Southport', 'Lincoln', 'Maple', '12th']
+SUFFIXES = ['Street', 'St.', 'Avenue', 'Ave', 'Drive', 'Road', 'Boulevard', 'Lane', 'Court', 'Place', 'Circle']
+DIRECTIONS = ['', 'N ', 'South ', 'E. ', 'West ']
+
+
+def replace_loop_normalize(address: str) -> str:
+    """The previous implementation, kept here for comparison"""
+    addr = address.lower().strip()
+    replacements = {
+        ' street': ' st', ' st.': ' st',
+        ' avenue': ' ave', ' ave.': ' ave',
+        ' drive': ' dr', ' dr.': ' dr',
+        ' road': ' rd', ' rd.': ' rd',
+        ' boulevard': ' blvd', ' blvd.': ' blvd',
+        ' lane': ' ln', ' ln.': ' ln',
+        ' court': ' ct', ' ct.': ' ct',
+        ' place': ' pl', ' pl.': ' pl',
+        ' circle': ' cir', ' cir.': ' cir',
+        ' west': ' w', ' w.': ' w',
+        ' east': ' e', ' e.': ' e',
+        ' north': ' n', ' n.': ' n',
+        ' south': ' s', ' s.': ' s',
+        ',': '', ' - ': ' ', '-': ' ',
+    }
+    for old, new in replacements.items():
+        addr = addr.replace(old, new)
+    return addr
+
+
+def generate(count: int, rng: random.Random) -> list:
+    return [f"{rng.randint(1, 99999)} {rng.choice(DIRECTIONS)}{rng.choice(STREETS)} {rng.choice(SUFFIXES)}, Chicago"
+            for _ in range(count)]
+
+
+def time_per_address(fn, addresses: list) -> float:
+    t0 = time.perf_counter()
+    for address in addresses:
+        fn(address)
+    return (time.perf_counter() - t0) / len(addresses) * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--addresses', type=int, default=1_000_000)
+    parser.add_argument('--distinct-warm', type=int, default=500)
+    args = parser.parse_args()
+    rng = random.Random(1)
+
+    cold = generate(args.addresses, rng)
+    pool = generate(args.distinct_warm, rng)
+    warm = [rng.choice(pool) for _ in range(args.addresses)]
+
+    old_cold = time_per_address(replace_loop_normalize, cold)
+    normalized_tokens.cache_clear()
+    new_cold = time_per_address(normalize_address, cold)
+    old_warm = time_per_address(replace_loop_normalize, warm)
+    normalized_tokens.cache_clear()
+    new_warm = time_per_address(normalize_address, warm)
+
+    print(f"{args.addresses:,} addresses")
+    print(f"{'':10}{'replace loop':>14}{'tokenizer':>12}")
+    print(f"{'cold':10}{old_cold:>11.0f} ns{new_cold:>9.0f} ns")
+    print(f"{'warm':10}{old_warm:>11.0f} ns{new_warm:>9.0f} ns")
+    print(f"cache: {normalized_tokens.cache_info()}")
+
+    # Where the two disagree, the old loop was rewriting parts of words
+    for address in ['100 Eastwood Street', '7 Westbrook Ave.', '42 Northern Lights Dr']:
+        print(f"  {address!r}: {replace_loop_normalize(address)!r} -> {normalize_address(address)!r}")
+
+
+if __name__ == '__main__':
+    main()
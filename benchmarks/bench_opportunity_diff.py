@@ -0,0 +1,98 @@
+"""
+Opportunity writes with and without the field-level diff
+
+Processes the same debrief twice (a re-sent or re-run call) against the mock
+Salesforce REST API, with OPPORTUNITY_DIFF on and off and with per-record and
+Composite writes, and counts the HTTP requests and Opportunity fields sent. Also
+shows a mid-call '320k' ARV matching a stored 320000.0, a value changed in
+Salesforce since the last read still being written back, and an invalid stage
+being dropped instead of rolling back the whole Composite request.
+
+    python -m benchmarks.bench_opportunity_diff --runs 2
+"""
+import argparse
+import collections
+import os
+import sys
+
+os.environ.setdefault('JOB_QUEUE_PATH', ':memory:')
+os.environ.setdefault('IDEMPOTENCY_PATH', ':memory:')
+os.environ.setdefault('USER_CACHE_ENABLED', 'false')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as poppy  # noqa: E402
+import extraction  # noqa: E402
+from benchmarks.fakes import SAMPLE_EXTRACTION, FakeAnthropic, sample_call_payload, sample_org  # noqa: E402
+from benchmarks.mock_sf_rest import mock_salesforce  # noqa: E402
+
+OPP_ID = '006FAKE00000000'
+
+
+def setup(reply: dict, latency: float):
+    extraction.claude_client = FakeAnthropic(lambda kwargs: dict(reply, property_address='4116 W Iowa Ave'))
+    sf, adapter = mock_salesforce(sample_org(), latency=latency)
+    poppy.get_sf_connection = lambda: sf
+    poppy.ADDRESS_INDEX_ENABLED = False
+    poppy.opportunity_snapshots.clear()
+    return sf, adapter
+
+
+def run(diff: bool, composite: bool, runs: int, latency: float) -> list:
+    poppy.OPPORTUNITY_DIFF_ENABLED = diff
+    poppy.SF_COMPOSITE_WRITES = composite
+    sf, adapter = setup(SAMPLE_EXTRACTION, latency)
+    rows = []
+    for i in range(runs):
+        # Re-processing usually happens well after the first write, so start with a cold snapshot
+        poppy.opportunity_snapshots.clear()
+        before = len(adapter.requests)
+        result = poppy.process_call_ended(sample_call_payload(f'diff_{diff}_{composite}_{i}'))
+        assert result['status'] == 'success', result
+        requests = adapter.requests[before:]
+        sent = len(result['opportunity_diff']['changed']) if diff else len(poppy.build_opportunity_update(SAMPLE_EXTRACTION))
+        rows.append((len(requests), sent, dict(collections.Counter(requests))))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=2, help='times the same debrief is processed')
+    parser.add_argument('--latency', type=float, default=0.02, help='simulated Salesforce round-trip seconds')
+    args = parser.parse_args()
+
+    print(f"{'':28}{'run':>4}{'HTTP requests':>15}{'fields sent':>13}  requests")
+    for composite in (False, True):
+        for diff in (False, True):
+            label = f"{'composite' if composite else 'per-record'}, diff {'on' if diff else 'off'}"
+            for i, (requests, sent, breakdown) in enumerate(run(diff, composite, args.runs, args.latency)):
+                print(f"{label:28}{i + 1:>4}{requests:>15}{sent:>13}  {breakdown}")
+
+    # Mid-call update with spoken amounts against what Salesforce stores for a currency field
+    poppy.OPPORTUNITY_DIFF_ENABLED = True
+    sf, adapter = setup(SAMPLE_EXTRACTION, 0)
+    adapter.store.records['Opportunity'][OPP_ID].update({'ARV__c': 320000.0, 'Rehab_Cost__c': 45000.0})
+    before = len(adapter.requests)
+    diff = poppy.update_opportunity(sf, OPP_ID, {'arv': '320k', 'rehab_cost': '$45,000'})
+    print(f"mid-call '320k' / '$45,000' vs stored 320000.0 / 45000.0: {diff}, "
+          f"requests {adapter.requests[before:]}")
+
+    # Someone changes the ARV in Salesforce after our last read; the same update must still be sent
+    adapter.store.records['Opportunity'][OPP_ID]['ARV__c'] = 250000.0
+    diff = poppy.update_opportunity(sf, OPP_ID, {'arv': '320k'})
+    print(f"ARV changed to 250000.0 in Salesforce since the last read, update to '320k': "
+          f"changed {[c['field'] for c in diff['changed']]}, "
+          f"stored {adapter.store.records['Opportunity'][OPP_ID]['ARV__c']}")
+
+    # An invalid picklist value is dropped and the rest of the call is still written,
+    # where sending it would have rolled back every write in the Composite request
+    poppy.SF_COMPOSITE_WRITES = True
+    sf, adapter = setup(dict(SAMPLE_EXTRACTION, stage='Hot Lead'), 0)
+    result = poppy.process_call_ended(sample_call_payload('picklist'))
+    dropped = result['extraction_errors'] + result['opportunity_diff']['rejected']
+    print(f"stage 'Hot Lead': {result['status']}, dropped {[e['field'] for e in dropped]}, "
+          f"{len(result['opportunity_diff']['changed'])} fields and "
+          f"{len(adapter.store.records.get('Task', {}))} tasks written")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Debrief pipeline: stages one after another vs the concurrent stage graph
+
+Runs process_call_ended with latency-injecting fakes (a slow Salesforce login,
+per-call Salesforce latency, token-based Claude latency) with PIPELINE_WORKERS=1
+(stages run serially) and the default pool, and prints end-to-end latency plus
+the per-stage timeline of the last call.
+
+    python -m benchmarks.bench_pipeline --calls 5 --login-latency 0.4 --sf-latency 0.1
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+os.environ.setdefault('JOB_QUEUE_PATH', ':memory:')
+os.environ.setdefault('IDEMPOTENCY_PATH', ':memory:')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as poppy  # noqa: E402
+import extraction  # noqa: E402
+from benchmarks.fakes import (FakeAnthropic, FakeSalesforce, debrief_responder, llm_latency_model,  # noqa: E402
+                              sample_call_payload, sample_org)
+
+
+def run(workers: int, calls: int, args) -> tuple:
+    poppy.PIPELINE_WORKERS = workers
+    poppy.ADDRESS_INDEX_ENABLED = False
+    poppy.USER_CACHE_ENABLED = False
+    poppy.STREAMING_EXTRACTION = args.streaming
+    extraction.claude_client = FakeAnthropic(debrief_responder, latency=llm_latency_model(args.scale))
+
+    timings = []
+    result = None
+    for i in range(calls):
+        sf = FakeSalesforce(sample_org(), latency=args.sf_latency)
+
+        def login():
+            # A cold worker: every call pays for the OAuth login
+            time.sleep(args.login_latency)
+            return sf
+
+        poppy.get_sf_connection = login
+        t0 = time.perf_counter()
+        result = poppy.process_call_ended(sample_call_payload(f'pipeline_{workers}_{i}'))
+        timings.append(time.perf_counter() - t0)
+        assert result['status'] == 'success', result
+    return statistics.median(timings) * 1000, result['stage_timings']
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--login-latency', type=float, default=0.4)
+    parser.add_argument('--sf-latency', type=float, default=0.1)
+    parser.add_argument('--scale', type=float, default=0.5, help='multiplier on the modelled Claude latency')
+    parser.add_argument('--streaming', action='store_true', help='use the streamed extraction')
+    args = parser.parse_args()
+
+    for workers in (1, args.workers):
+        p50_ms, stages = run(workers, args.calls, args)
+        label = 'serial' if workers == 1 else f'{workers} workers'
+        print(f"{label}: p50 {p50_ms:.0f} ms")
+        for name, timing in sorted(stages.items(), key=lambda item: item[1]['start_ms']):
+            start, duration = timing['start_ms'], timing['duration_ms']
+            bar = ' ' * int(start / 25) + '#' * max(1, int(duration / 25))
+            print(f"  {name:20}{start:>7.0f} +{duration:>6.0f} ms  {bar}")
+
+
+if __name__ == '__main__':
+    main()
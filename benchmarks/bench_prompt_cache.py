@@ -0,0 +1,76 @@
+"""
+Extraction prompt caching: input tokens and latency per call
+
+Runs the single-pass and two-call extraction flows repeatedly against the fake
+Claude client, which simulates Anthropic prompt caching (first request with a
+cache_control prefix writes it, later ones read it), with PROMPT_CACHING off
+and on. Reports the token split from the logged usage and the input cost in
+uncached-token equivalents (cache writes at 1.25x, reads at 0.1x). The two-call
+flow sets no breakpoint - its system prompt alone is under the 1024-token
+minimum - so its cached and uncached rows are the same.
+
+    python -m benchmarks.bench_prompt_cache --calls 20 --scale 0.2
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+os.environ.setdefault('JOB_QUEUE_PATH', ':memory:')
+os.environ.setdefault('IDEMPOTENCY_PATH', ':memory:')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import extraction  # noqa: E402
+from benchmarks.fakes import SAMPLE_TRANSCRIPT, FakeAnthropic, debrief_responder, llm_latency_model  # noqa: E402
+
+CACHE_WRITE_COST = 1.25
+CACHE_READ_COST = 0.1
+
+
+def run(caching: bool, single_pass: bool, calls: int, scale: float, transcript: str) -> dict:
+    extraction.PROMPT_CACHING = caching
+    extraction.SINGLE_PASS_EXTRACTION = single_pass
+    extraction.claude_client = FakeAnthropic(debrief_responder, latency=llm_latency_model(scale))
+    for key in extraction.usage_totals:
+        extraction.usage_totals[key] = 0
+
+    timings = []
+    for _ in range(calls):
+        t0 = time.perf_counter()
+        address, data, _ = extraction.extract_call_data(transcript)
+        timings.append(time.perf_counter() - t0)
+        assert address and data
+
+    totals = extraction.usage_metrics()
+    cost = (totals['input_tokens'] + totals['cache_creation_input_tokens'] * CACHE_WRITE_COST
+            + totals['cache_read_input_tokens'] * CACHE_READ_COST)
+    return {
+        'uncached_in': totals['input_tokens'] / calls,
+        'cache_write': totals['cache_creation_input_tokens'] / calls,
+        'cache_read': totals['cache_read_input_tokens'] / calls,
+        'input_cost': cost / calls,
+        'p50_ms': statistics.median(timings) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=20)
+    parser.add_argument('--scale', type=float, default=0.2, help='multiplier on the modelled Claude latency')
+    parser.add_argument('--transcript-repeat', type=int, default=4)
+    args = parser.parse_args()
+    transcript = '\n'.join([SAMPLE_TRANSCRIPT] * args.transcript_repeat)
+
+    print(f"per call, {args.calls} calls{'':8}{'uncached in':>12}{'cache write':>12}{'cache read':>11}"
+          f"{'input cost':>11}{'p50 ms':>8}")
+    for single_pass in (True, False):
+        for caching in (False, True):
+            stats = run(caching, single_pass, args.calls, args.scale, transcript)
+            label = f"{'single-pass' if single_pass else 'two-call'} {'cached' if caching else 'uncached'}"
+            print(f"{label:31}{stats['uncached_in']:>12.0f}{stats['cache_write']:>12.0f}{stats['cache_read']:>11.0f}"
+                  f"{stats['input_cost']:>11.0f}{stats['p50_ms']:>8.0f}")
+
+
+if __name__ == '__main__':
+    main()
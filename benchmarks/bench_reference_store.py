@@ -0,0 +1,160 @@
+"""
+Reference lookups: SOQL against Salesforce vs the local reference store
+
+Generates a production-sized org (--opportunities, each with its seller's
+Account, plus AE Users) behind the mock Salesforce REST API, loads it into a
+ReferenceStore with Bulk API 2.0 query jobs and reports the sync's time and
+requests. Then resolves spoken addresses (abbreviations spelled out, plus some
+properties that aren't in the org), Opportunity reads and AE phone numbers
+through the app with the store off and on, reporting per-lookup latency, API
+requests and results. Finally changes a few records and applies them with a
+delta sync, checks that a write is diffed against Salesforce rather than the
+store's copy, and shows that a store older than max_staleness sends lookups
+back to SOQL.
+
+    python -m benchmarks.bench_reference_store --opportunities 250000 --lookups 50
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('JOB_QUEUE_PATH', ':memory:')
+os.environ.setdefault('IDEMPOTENCY_PATH', ':memory:')
+os.environ.setdefault('USER_CACHE_ENABLED', 'false')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as poppy  # noqa: E402
+from benchmarks.fakes import large_org  # noqa: E402
+from benchmarks.mock_sf_rest import mock_salesforce  # noqa: E402
+from reference_store import ReferenceStore  # noqa: E402
+
+SPOKEN = {'N': 'North', 'S': 'South', 'E': 'East', 'W': 'West', 'Ave': 'Avenue', 'St': 'Street', 'Rd': 'Road',
+          'Dr': 'Drive', 'Ln': 'Lane', 'Blvd': 'Boulevard', 'Ct': 'Court', 'Pl': 'Place', 'Ter': 'Terrace',
+          'Pkwy': 'Parkway', 'Cir': 'Circle'}
+
+
+def spoken(address: str) -> str:
+    """How an AE says an address: directions and suffixes spelled out"""
+    return ' '.join(SPOKEN.get(word, word) for word in address.split())
+
+
+def time_lookups(adapter, lookup, keys: list) -> tuple:
+    """(us per lookup, API requests per lookup, lookups with a result)"""
+    before = len(adapter.requests)
+    found = 0
+    t0 = time.perf_counter()
+    for key in keys:
+        if lookup(key):
+            found += 1
+    elapsed = time.perf_counter() - t0
+    return elapsed / len(keys) * 1e6, (len(adapter.requests) - before) / len(keys), found
+
+
+def compare(sf, adapter, addresses: list, opp_ids: list, phones: list) -> dict:
+    lookups = {
+        'address': (lambda address: poppy.find_opportunity_by_address(sf, address), addresses),
+        'opportunity': (lambda opp_id: poppy.load_opportunity(sf, opp_id), opp_ids),
+        'user phone': (lambda phone: poppy.find_user_by_phone(sf, phone), phones),
+    }
+    rows = {}
+    for enabled in (False, True):
+        poppy.REFERENCE_STORE_ENABLED = enabled
+        # Describes are a one-off per process; don't bill them to whichever path runs first
+        poppy.load_opportunity(sf, opp_ids[0])
+        for name, (lookup, keys) in lookups.items():
+            poppy.opportunity_snapshots.clear()
+            rows[name, enabled] = time_lookups(adapter, lookup, keys)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--opportunities', type=int, default=250000)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--lookups', type=int, default=50)
+    parser.add_argument('--unmatched', type=float, default=0.1, help='share of addresses not in the org')
+    parser.add_argument('--changes', type=int, default=100, help='records changed before the delta sync')
+    parser.add_argument('--sf-latency', type=float, default=0.0, help='seconds added to every Salesforce request')
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    t0 = time.perf_counter()
+    org = large_org(args.opportunities, args.users)
+    print(f"generated {len(org['Opportunity'])} opportunities, {len(org['Account'])} accounts, "
+          f"{len(org['User'])} users in {time.perf_counter() - t0:.1f}s")
+    sf, adapter = mock_salesforce(org, latency=args.sf_latency)
+    poppy.get_sf_connection = lambda: sf
+    poppy.ADDRESS_INDEX_ENABLED = False
+    poppy.USER_CACHE_ENABLED = False
+    poppy.ensure_reference_store = lambda: None
+    poppy.field_capabilities.clear()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ReferenceStore(os.path.join(tmp, 'reference_store.sqlite3'), capabilities=poppy.field_capabilities,
+                               bulk_wait=0.1)
+        poppy.reference_store = store
+        before = len(adapter.requests)
+        t0 = time.perf_counter()
+        loaded = store.sync(sf, full=True)
+        sync_s = time.perf_counter() - t0
+        size_mb = os.path.getsize(store.path) / 1e6
+        print(f"full sync: {loaded} in {sync_s:.1f}s, {len(adapter.requests) - before} requests, {size_mb:.0f} MB")
+
+        rng = random.Random(7)
+        opps = list(org['Opportunity'].values())
+        sample = rng.sample(opps, args.lookups)
+        addresses = [f'{rng.randint(20000, 29999)} North Nowhere Road' if rng.random() < args.unmatched
+                     else spoken(opp['Property_Address__c']) for opp in sample]
+        opp_ids = [opp['Id'] for opp in sample]
+        users = list(org['User'].values())
+        phones = [rng.choice((user['Phone'], user['MobilePhone'])) for user in rng.choices(users, k=args.lookups)]
+
+        rows = compare(sf, adapter, addresses, opp_ids, phones)
+        print(f"{'':14}{'path':>7}{'us/lookup':>12}{'API calls/lookup':>18}{'found':>8}")
+        for name in ('address', 'opportunity', 'user phone'):
+            for enabled in (False, True):
+                us, calls, found = rows[name, enabled]
+                print(f"{name:14}{'store' if enabled else 'soql':>7}{us:>12.1f}{calls:>18.2f}{found:>8}")
+        active = sum(1 for user in org['User'].values() if user['IsActive'])
+        print(f"active users: {active} of {len(users)} (the store only holds active ones)")
+
+        # Records change in Salesforce between syncs
+        changed = rng.sample(opps, args.changes)
+        for i, opp in enumerate(changed):
+            sf.Opportunity.update(opp['Id'], {'Name': f'{i + 1} Delta Ct - Chicago',
+                                              'Property_Address__c': f'{i + 1} Delta Ct'})
+        deactivated = next(user for user in users if user['IsActive'])
+        sf.User.update(deactivated['Id'], {'IsActive': False})
+        before = len(adapter.requests)
+        t0 = time.perf_counter()
+        applied = store.sync(sf)
+        delta_ms = (time.perf_counter() - t0) * 1000
+        poppy.REFERENCE_STORE_ENABLED = True
+        renamed = poppy.find_opportunity_by_address(sf, '1 Delta Court')
+        print(f"delta sync: {applied} in {delta_ms:.0f} ms, {len(adapter.requests) - before} requests; "
+              f"renamed opportunity found: {bool(renamed and renamed['Id'] == changed[0]['Id'])}, "
+              f"deactivated user dropped: {store.user_by_phone(deactivated['Phone']) == (True, None)}")
+
+        # A value changed in Salesforce since the last sync must not make the debrief's look already set
+        opp_id = next(opp['Id'] for opp in sample if opp['ARV__c'])
+        store_arv = store.opportunity(opp_id)[1]['ARV__c']
+        adapter.store.records['Opportunity'][opp_id]['ARV__c'] = store_arv + 1000
+        diff = poppy.update_opportunity(sf, opp_id, {'arv': store_arv})
+        print(f"ARV changed in Salesforce after the sync, debrief says the store's {store_arv:.0f}: "
+              f"changed {[c['field'] for c in diff['changed']]}, "
+              f"now {adapter.store.records['Opportunity'][opp_id]['ARV__c']:.0f}")
+
+        store.max_staleness = 0
+        poppy.opportunity_snapshots.clear()
+        before = len(adapter.requests)
+        match = poppy.find_opportunity_by_address(sf, addresses[0])
+        print(f"stale store: address lookup made {len(adapter.requests) - before} SOQL requests, "
+              f"found: {bool(match)}; lookups {store.lookups}")
+
+
+if __name__ == '__main__':
+    main()
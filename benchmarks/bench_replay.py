@@ -0,0 +1,268 @@
+"""
+Offline replay / load test of the Retell webhook pipeline
+
+Replays a corpus of call_ended payloads against the app - in-process through
+Flask's test client, against a gunicorn it starts, or against a server already
+running benchmarks.replay_server - with fake Salesforce and Anthropic clients
+injecting latency. Reports throughput, p50/p95/p99 latency, and Salesforce and
+Claude calls per webhook, and exits non-zero when a --max-*/--min-* gate fails.
+
+The corpus is a JSONL file or a directory of .json payloads (set WEBHOOK_RECORD_PATH
+on a deployment to record one); without --corpus a synthetic one is generated.
+
+    python -m benchmarks.bench_replay --calls 200 --concurrency 8
+    python -m benchmarks.bench_replay --corpus webhooks.jsonl --gunicorn --max-p95-ms 3000
+    python -m benchmarks.bench_replay --mode async --calls 100
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests  # noqa: E402
+
+from benchmarks.fakes import sample_corpus  # noqa: E402
+from latency import percentile  # noqa: E402
+
+
+def load_corpus(path: str) -> list:
+    """call_ended payloads from a JSONL file or a directory of .json files"""
+    if os.path.isdir(path):
+        payloads = []
+        for name in sorted(os.listdir(path)):
+            if name.endswith('.json'):
+                with open(os.path.join(path, name)) as f:
+                    payloads.append(json.load(f))
+    else:
+        with open(path) as f:
+            payloads = [json.loads(line) for line in f if line.strip()]
+    return [p for p in payloads if p.get('event') == 'call_ended']
+
+
+class TestClientTarget:
+    """The app in this process, through Flask's test client"""
+
+    def __init__(self, server):
+        self.server = server
+        self._local = threading.local()
+
+    def post(self, payload: dict) -> tuple:
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.server.app.test_client()
+        response = client.post('/webhook/retell', json=payload)
+        return response.status_code, response.get_json()
+
+    def stats(self) -> dict:
+        return self.server.stats(self.server.adapter, self.server.claude)
+
+    def close(self):
+        pass
+
+
+class HttpTarget:
+    """A running benchmarks.replay_server (gunicorn or otherwise) at url"""
+
+    def __init__(self, url: str, process=None):
+        self.url = url.rstrip('/')
+        self.process = process
+        self._local = threading.local()
+
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def post(self, payload: dict) -> tuple:
+        response = self._session().post(f'{self.url}/webhook/retell', json=payload, timeout=120)
+        return response.status_code, response.json()
+
+    def stats(self) -> dict:
+        return self._session().get(f'{self.url}/replay/stats', timeout=10).json()
+
+    def close(self):
+        if self.process:
+            self.process.terminate()
+            self.process.wait(timeout=30)
+
+
+def start_gunicorn(args) -> HttpTarget:
+    """Run benchmarks.replay_server under gunicorn on a free port"""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--workers', '1', '--threads', str(args.concurrency),
+         '--bind', f'127.0.0.1:{port}', '--log-level', 'warning', 'benchmarks.replay_server:app'],
+        cwd=root, env=os.environ.copy(),
+    )
+    target = HttpTarget(f'http://127.0.0.1:{port}', process)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f'{target.url}/health', timeout=1).ok:
+                return target
+        # The socket is open before the worker has imported the app
+        except (requests.ConnectionError, requests.Timeout):
+            time.sleep(0.2)
+    target.close()
+    raise RuntimeError('gunicorn did not come up within 30s')
+
+
+def replay(target, corpus: list, concurrency: int) -> tuple:
+    """Post every payload with concurrency in flight. Returns (samples, wall seconds)"""
+    def send(payload):
+        start = time.perf_counter()
+        try:
+            status_code, body = target.post(payload)
+        except Exception as e:
+            status_code, body = None, {'status': 'error', 'message': str(e)}
+        return {'seconds': time.perf_counter() - start, 'http_status': status_code, 'body': body or {}}
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        samples = list(executor.map(send, corpus))
+    return samples, time.perf_counter() - start
+
+
+def wait_for_drain(target, timeout: float = 600) -> float:
+    """Wait until the job queue has nothing queued or running. Returns the seconds waited"""
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        jobs = target.stats()['jobs']
+        if not jobs.get('queued') and not jobs.get('running'):
+            break
+        time.sleep(0.05)
+    return time.perf_counter() - start
+
+
+def summarize(samples: list, wall: float, stats: dict) -> dict:
+    latencies = [s['seconds'] for s in samples]
+    outcomes = {}
+    for s in samples:
+        outcome = f"{s['http_status']} {s['body'].get('status', '?')}"
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    in_call = [s['body']['salesforce_requests'] for s in samples if 'salesforce_requests' in s['body']]
+    return {
+        'webhooks': len(samples),
+        'wall_s': round(wall, 3),
+        'throughput_per_s': round(len(samples) / wall, 2) if wall else None,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+        'max_ms': round(max(latencies) * 1000, 1),
+        'outcomes': outcomes,
+        # Requests made while processing a call, as reported in its result
+        'salesforce_requests_per_call': round(sum(in_call) / len(in_call), 2) if in_call else None,
+        'salesforce_requests_per_call_max': max(in_call) if in_call else None,
+        # Everything the fakes saw, background loads included, spread over the webhooks
+        'salesforce_requests_per_webhook': round(stats['salesforce_requests'] / len(samples), 2),
+        'claude_calls_per_webhook': round(stats['claude_calls'] / len(samples), 2),
+        'claude_tokens_per_webhook': {
+            kind: round(count / len(samples)) for kind, count in stats['claude_usage'].items()
+            if kind.endswith('_tokens')
+        },
+        'salesforce_by_request': stats['salesforce_by_request'],
+    }
+
+
+def check_gates(report: dict, args) -> list:
+    failures = []
+    for key, limit in (('p95_ms', args.max_p95_ms), ('p99_ms', args.max_p99_ms),
+                       ('salesforce_requests_per_webhook', args.max_sf_requests),
+                       ('claude_calls_per_webhook', args.max_claude_calls)):
+        if limit is not None and report[key] is not None and report[key] > limit:
+            failures.append(f'{key} {report[key]} > {limit}')
+    if args.min_throughput is not None and report['throughput_per_s'] < args.min_throughput:
+        failures.append(f"throughput_per_s {report['throughput_per_s']} < {args.min_throughput}")
+    errors = sum(n for outcome, n in report['outcomes'].items() if not outcome.startswith('2'))
+    if errors > args.max_errors:
+        failures.append(f'{errors} non-2xx responses > {args.max_errors}')
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--corpus', help='JSONL file or directory of call_ended payloads')
+    parser.add_argument('--calls', type=int, default=100, help='size of the synthetic corpus')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save-corpus', help='write the corpus used to this JSONL file')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--mode', choices=('sync', 'async'), default='sync',
+                        help='sync: each webhook processes the call; async: 202 + background workers')
+    parser.add_argument('--job-workers', type=int, default=2, help='background workers in async mode')
+    parser.add_argument('--url', help='replay against a running benchmarks.replay_server')
+    parser.add_argument('--gunicorn', action='store_true', help='start benchmarks.replay_server under gunicorn')
+    parser.add_argument('--sf-latency', type=float, default=0.05)
+    parser.add_argument('--llm-scale', type=float, default=0.3, help='multiplier on the modelled Claude latency')
+    parser.add_argument('--opportunities', type=int, default=50)
+    parser.add_argument('--json', help='write the report to this file')
+    parser.add_argument('--max-p95-ms', type=float)
+    parser.add_argument('--max-p99-ms', type=float)
+    parser.add_argument('--max-sf-requests', type=float, help='Salesforce requests per webhook')
+    parser.add_argument('--max-claude-calls', type=float, help='Claude calls per webhook')
+    parser.add_argument('--min-throughput', type=float, help='webhooks per second')
+    parser.add_argument('--max-errors', type=int, default=0, help='non-2xx responses allowed')
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else sample_corpus(args.calls, args.opportunities, seed=args.seed)
+    if args.save_corpus:
+        with open(args.save_corpus, 'w') as f:
+            f.writelines(json.dumps(payload) + '\n' for payload in corpus)
+
+    # The server reads these when it's imported (here) or started (gunicorn)
+    os.environ.update({
+        'REPLAY_SF_LATENCY': str(args.sf_latency),
+        'REPLAY_LLM_SCALE': str(args.llm_scale),
+        'REPLAY_OPPORTUNITIES': str(args.opportunities),
+        'ASYNC_CALL_PROCESSING': str(args.mode == 'async').lower(),
+        'JOB_WORKERS': str(args.job_workers),
+    })
+    if args.url:
+        target = HttpTarget(args.url)
+    elif args.gunicorn:
+        target = start_gunicorn(args)
+    else:
+        from benchmarks import replay_server
+        target = TestClientTarget(replay_server)
+
+    try:
+        samples, wall = replay(target, corpus, args.concurrency)
+        if args.mode == 'async':
+            # Acknowledgements are fast; throughput is how long the workers take to catch up
+            wall += wait_for_drain(target)
+        report = summarize(samples, wall, target.stats())
+        report['mode'] = args.mode
+    finally:
+        target.close()
+
+    print(f"{report['webhooks']} webhooks ({args.mode}, concurrency {args.concurrency}) in {report['wall_s']:.2f} s "
+          f"- {report['throughput_per_s']} webhooks/s")
+    print(f"latency p50 {report['p50_ms']} ms  p95 {report['p95_ms']} ms  p99 {report['p99_ms']} ms  "
+          f"max {report['max_ms']} ms")
+    print(f"outcomes: {report['outcomes']}")
+    print(f"salesforce requests per webhook: {report['salesforce_requests_per_webhook']} "
+          f"(in-call mean {report['salesforce_requests_per_call']}, max {report['salesforce_requests_per_call_max']})")
+    print(f"  {report['salesforce_by_request']}")
+    print(f"claude calls per webhook: {report['claude_calls_per_webhook']}  tokens: {report['claude_tokens_per_webhook']}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    failures = check_gates(report, args)
+    for failure in failures:
+        print(f"FAIL {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""
+Throughput as gunicorn workers are added
+
+Starts benchmarks.replay_server under gunicorn.conf.py with 1, 2, 4... workers
+(--threads request threads each, SHARED_STATE_BACKEND=sqlite in a temp dir, so
+the workers share the idempotency store, job queue and shared state as on a
+dyno), replays --calls-per-worker webhooks per worker with every thread busy,
+and reports throughput, how it scales against one worker, and latency. Then
+reads each worker's /health and /replay/stats to show that every call was
+processed once (Claude calls per distinct call stay flat) and that only the
+elected leader loaded the address index and the AE directory from Salesforce -
+the others copied its published copy.
+
+The fakes run inside the workers, so scaling is near-linear only while the
+host has a CPU to spare; on a small machine keep --llm-scale high enough that
+requests mostly wait, as they do on Salesforce and Claude in production.
+
+    python -m benchmarks.bench_scale_out --workers 1 2 4 --threads 4 --calls-per-worker 24
+    python -m benchmarks.bench_scale_out --worker-class sync --threads 1
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests  # noqa: E402
+
+from benchmarks.bench_replay import HttpTarget, replay  # noqa: E402
+from benchmarks.fakes import sample_corpus  # noqa: E402
+from latency import percentile  # noqa: E402
+
+
+def start_server(workers: int, args, state_dir: str) -> HttpTarget:
+    """Run benchmarks.replay_server with the production gunicorn.conf.py on a free port"""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(
+        os.environ,
+        PORT=str(port),
+        WEB_CONCURRENCY=str(workers),
+        GUNICORN_THREADS=str(args.threads),
+        GUNICORN_WORKER_CLASS=args.worker_class,
+        SHARED_STATE_BACKEND='sqlite',
+        SHARED_STATE_PATH=os.path.join(state_dir, 'shared_state.sqlite3'),
+        IDEMPOTENCY_PATH=os.path.join(state_dir, 'idempotency.sqlite3'),
+        JOB_QUEUE_PATH=os.path.join(state_dir, 'jobs.sqlite3'),
+        ASYNC_CALL_PROCESSING='false',
+        ADDRESS_INDEX_POLL_SECONDS='2',
+        REPLAY_SF_LATENCY=str(args.sf_latency),
+        REPLAY_LLM_SCALE=str(args.llm_scale),
+        REPLAY_OPPORTUNITIES=str(args.opportunities),
+    )
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}',
+         '--log-level', 'warning', 'benchmarks.replay_server:app'],
+        cwd=root, env=env,
+    )
+    target = HttpTarget(f'http://127.0.0.1:{port}', process)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f'{target.url}/health', timeout=1).ok:
+                return target
+        # The socket is open before the workers have imported the app
+        except (requests.ConnectionError, requests.Timeout):
+            time.sleep(0.2)
+    target.close()
+    raise RuntimeError('gunicorn did not come up within 60s')
+
+
+def per_worker(target: HttpTarget, path: str, pid, workers: int, attempts: int = 300) -> dict:
+    """GET path on new connections until every worker has answered. Returns {pid: body}"""
+    bodies = {}
+    for _ in range(attempts):
+        body = requests.get(f'{target.url}{path}', headers={'Connection': 'close'}, timeout=10).json()
+        bodies[pid(body)] = body
+        if len(bodies) == workers:
+            break
+    return bodies
+
+
+def run(workers: int, args) -> dict:
+    corpus = sample_corpus(args.calls_per_worker * workers, args.opportunities, seed=workers)
+    distinct = len({payload['call']['call_id'] for payload in corpus})
+    with tempfile.TemporaryDirectory() as state_dir:
+        target = start_server(workers, args, state_dir)
+        try:
+            # Don't start the clock while workers are still importing the app
+            per_worker(target, '/health', lambda body: body['shared_state']['pid'], workers)
+            samples, wall = replay(target, corpus, workers * args.threads)
+            # Give followers a few polls to pick up the index the leader published before counting loads
+            deadline = time.monotonic() + 15
+            while True:
+                health = per_worker(target, '/health', lambda body: body['shared_state']['pid'], workers)
+                if all(h['address_index']['ready'] for h in health.values()) or time.monotonic() > deadline:
+                    break
+                time.sleep(1)
+            stats = per_worker(target, '/replay/stats', lambda body: body['pid'], workers)
+        finally:
+            target.close()
+    latencies = [s['seconds'] for s in samples]
+    loads = {}
+    for name in ('address_index', 'user_cache'):
+        loads[name] = {kind: sum(h[name]['loads'][kind] for h in health.values()) for kind in ('salesforce', 'shared')}
+        loads[name]['leaders'] = sum(1 for h in health.values() if h[name].get('leader'))
+    return {
+        'workers': workers,
+        'webhooks': len(samples),
+        'errors': sum(1 for s in samples if not str(s['http_status']).startswith('2')),
+        'throughput': len(samples) / wall,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'workers_seen': len(health),
+        'claude_per_call': sum(s['claude_calls'] for s in stats.values()) / distinct,
+        'loads': loads,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--threads', type=int, default=4, help='request threads per worker')
+    parser.add_argument('--worker-class', default='gthread', help='gthread, sync or gevent')
+    parser.add_argument('--calls-per-worker', type=int, default=24)
+    parser.add_argument('--sf-latency', type=float, default=0.05)
+    parser.add_argument('--llm-scale', type=float, default=1.0, help='multiplier on the modelled Claude latency')
+    parser.add_argument('--opportunities', type=int, default=50)
+    parser.add_argument('--min-efficiency', type=float, help='fail if throughput per worker drops below this share '
+                                                             "of one worker's")
+    args = parser.parse_args()
+
+    rows = [run(workers, args) for workers in args.workers]
+    base = rows[0]['throughput'] / rows[0]['workers']
+    print(f"{args.worker_class}, {args.threads} threads per worker")
+    print(f"{'workers':>8}{'webhooks':>10}{'errors':>8}{'per s':>8}{'speedup':>9}{'efficiency':>12}"
+          f"{'p50 ms':>9}{'p95 ms':>9}{'claude/call':>13}  index loads (sf/shared)  directory loads (sf/shared)")
+    failures = []
+    for r in rows:
+        efficiency = r['throughput'] / (base * r['workers'])
+        index, directory = r['loads']['address_index'], r['loads']['user_cache']
+        print(f"{r['workers']:>8}{r['webhooks']:>10}{r['errors']:>8}{r['throughput']:>8.1f}"
+              f"{r['throughput'] / rows[0]['throughput']:>8.2f}x{efficiency:>11.0%}{r['p50_ms']:>9.0f}{r['p95_ms']:>9.0f}"
+              f"{r['claude_per_call']:>13.2f}  {index['salesforce']}/{index['shared']} "
+              f"({index['leaders']} leader){'':7}{directory['salesforce']}/{directory['shared']} "
+              f"({directory['leaders']} leader)")
+        if r['workers_seen'] < r['workers']:
+            print(f"  only {r['workers_seen']} of {r['workers']} workers answered /health")
+        if args.min_efficiency is not None and efficiency < args.min_efficiency:
+            failures.append(f"{r['workers']} workers: efficiency {efficiency:.0%} < {args.min_efficiency:.0%}")
+        if r['errors']:
+            failures.append(f"{r['workers']} workers: {r['errors']} non-2xx responses")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+"""
+A burst of debriefs against a Salesforce org that is down or out of API requests
+
+Queues a burst of call_ended jobs against the mock Salesforce REST API while it
+answers 503 (an outage) or 403 REQUEST_LIMIT_EXCEEDED (the daily API limit), with
+the rate limiter and circuit breaker on and off. Reports how many calls were
+lost, how many requests were sent while Salesforce was refusing them, and the
+guard's counters. Also shows the allowed request rate as the org's API usage
+climbs, and the inline (sync) path answering 202 'parked' instead of 500.
+
+    python -m benchmarks.bench_sf_guard --calls 30 --outage 2
+"""
+import argparse
+import collections
+import logging
+import os
+import sys
+import threading
+import time
+
+os.environ.setdefault('JOB_QUEUE_PATH', ':memory:')
+os.environ.setdefault('IDEMPOTENCY_PATH', ':memory:')
+os.environ.setdefault('USER_CACHE_ENABLED', 'false')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as poppy  # noqa: E402
+import extraction  # noqa: E402
+from benchmarks.fakes import FakeAnthropic, debrief_responder, sample_call_payload, sample_org  # noqa: E402
+from benchmarks.mock_sf_rest import mock_salesforce  # noqa: E402
+from job_queue import JobQueue, JobWorkerPool  # noqa: E402
+from metrics import JOBS_PARKED, SALESFORCE_FAILURES, SALESFORCE_REJECTED, SALESFORCE_THROTTLED  # noqa: E402
+from sf_guard import CircuitBreaker, SalesforceGuard, guard_session  # noqa: E402
+
+
+def counters() -> dict:
+    return {
+        'throttled': SALESFORCE_THROTTLED.value(),
+        'rejected': SALESFORCE_REJECTED.value(reason='circuit_open') + SALESFORCE_REJECTED.value(reason='rate_limited'),
+        'failures': sum(SALESFORCE_FAILURES.value(kind=k) for k in ('limit_exceeded', 'server_error', 'connection')),
+        'parked': JOBS_PARKED.value(),
+    }
+
+
+def setup(guarded: bool, api_limit: int, args) -> tuple:
+    sf, adapter = mock_salesforce(sample_org(), latency=args.sf_latency, api_limit=api_limit)
+    guard = None
+    if guarded:
+        guard = SalesforceGuard(rate=args.rps, breaker=CircuitBreaker(failure_threshold=5, reset_timeout=0.5,
+                                                                      limit_timeout=1.0))
+        guard_session(sf.session, guard)
+    poppy.sf_guard = guard
+    poppy.get_sf_connection = lambda: sf
+    poppy.ADDRESS_INDEX_ENABLED = False
+    poppy.opportunity_snapshots.clear()
+    poppy.job_queue = JobQueue(':memory:')
+    return sf, adapter, guard
+
+
+def run_burst(scenario: str, guarded: bool, args) -> dict:
+    """Queue args.calls jobs while Salesforce refuses requests, let it recover after args.outage seconds"""
+    api_limit = 10 ** 9
+    if scenario == 'limit':
+        # Enough API requests left for a couple of calls, then REQUEST_LIMIT_EXCEEDED until the window rolls over
+        api_limit = 20
+    sf, adapter, guard = setup(guarded, api_limit, args)
+    adapter.outage = scenario == 'outage'
+    pool = JobWorkerPool(poppy.job_queue, poppy.process_call_job, size=args.workers,
+                         is_transient=poppy.is_transient_error, on_failure=poppy.release_call_job,
+                         retry_after=poppy.parked_job if guarded else None,
+                         backoff_base=0.05, backoff_max=0.5, poll_interval=0.05)
+    poppy.worker_pool = pool
+    before = counters()
+    call_ids = [f'{scenario}_{guarded}_{i}' for i in range(args.calls)]
+    started = time.perf_counter()
+    for call_id in call_ids:
+        poppy.job_queue.enqueue(call_id, sample_call_payload(call_id), max_attempts=3)
+    pool.start()
+
+    time.sleep(args.outage)
+    refused_requests = len(adapter.requests)
+    adapter.outage = False
+    adapter.api_limit = 10 ** 9
+
+    while True:
+        statuses = [poppy.job_queue.get(call_id)['status'] for call_id in call_ids]
+        if all(s in ('succeeded', 'failed') for s in statuses):
+            break
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - started
+    pool.stop()
+    after = counters()
+    return {
+        'succeeded': statuses.count('succeeded'),
+        'lost': statuses.count('failed'),
+        'refused_requests': refused_requests,
+        'seconds': elapsed,
+        **{k: after[k] - before[k] for k in after},
+    }
+
+
+def rate_by_usage(args):
+    guard = SalesforceGuard(rate=args.rps, soft_limit=0.8, min_rate=0.5)
+    row = []
+    for pct in (50, 80, 85, 90, 95, 99, 100):
+        guard.observe_usage(pct * 150, 15000)
+        row.append(f'{pct}% -> {guard.bucket.rate:.1f}/s')
+    print(f"allowed rate by daily API usage: {', '.join(row)}")
+
+
+def burst_throttling(args):
+    """A burst of requests through the bucket: how many had to wait, and the rate actually sent"""
+    sf, adapter, guard = setup(True, 10 ** 9, args)
+    before = counters()
+    started = time.perf_counter()
+    threads = [threading.Thread(target=lambda: [sf.query("SELECT Id FROM User LIMIT 1") for _ in range(10)])
+               for _ in range(args.workers * 2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    print(f"burst of {len(adapter.requests)} queries from {len(threads)} threads: "
+          f"{len(adapter.requests) / elapsed:.1f}/s sent (limit {args.rps}/s, burst {guard.bucket.capacity:.0f}), "
+          f"{counters()['throttled'] - before['throttled']:.0f} throttled")
+
+
+def sync_parking(args):
+    """With async processing off, a webhook that hits an open circuit is queued instead of answered 500"""
+    sf, adapter, guard = setup(True, 10 ** 9, args)
+    poppy.ASYNC_CALL_PROCESSING = False
+    poppy.worker_pool = JobWorkerPool(poppy.job_queue, poppy.process_call_job, size=1,
+                                      is_transient=poppy.is_transient_error, retry_after=poppy.parked_job,
+                                      poll_interval=0.05)
+    adapter.outage = True
+    client = poppy.app.test_client()
+    responses = [client.post('/webhook/retell', json=sample_call_payload(f'sync_{i}')) for i in range(3)]
+    adapter.outage = False
+    poppy.worker_pool.start()
+    time.sleep(1.0 + max(r.get_json().get('retry_in_seconds', 0) for r in responses))
+    while any(poppy.job_queue.get(f'sync_{i}')['status'] != 'succeeded' for i in range(3)):
+        time.sleep(0.05)
+    poppy.worker_pool.stop()
+    print(f"sync webhooks during an outage: {[(r.status_code, r.get_json()['status']) for r in responses]}, "
+          f"then {collections.Counter(poppy.job_queue.get(f'sync_{i}')['status'] for i in range(3))}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=30)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--outage', type=float, default=2.0, help='seconds Salesforce refuses requests')
+    parser.add_argument('--rps', type=float, default=50, help='Salesforce requests per second allowed')
+    parser.add_argument('--sf-latency', type=float, default=0.01)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    extraction.claude_client = FakeAnthropic(debrief_responder)
+
+    rate_by_usage(args)
+    burst_throttling(args)
+    print(f"{'':24}{'succeeded':>10}{'lost':>6}{'refused reqs':>14}{'rejected':>10}{'failures':>10}"
+          f"{'parked':>8}{'seconds':>9}")
+    for scenario in ('outage', 'limit'):
+        for guarded in (False, True):
+            r = run_burst(scenario, guarded, args)
+            label = f"{scenario}, guard {'on' if guarded else 'off'}"
+            print(f"{label:24}{r['succeeded']:>10}{r['lost']:>6}{r['refused_requests']:>14}{r['rejected']:>10.0f}"
+                  f"{r['failures']:>10.0f}{r['parked']:>8.0f}{r['seconds']:>9.2f}")
+    sync_parking(args)
+
+
+if __name__ == '__main__':
+    main()
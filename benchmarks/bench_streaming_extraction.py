@@ -0,0 +1,106 @@
+"""
+Streamed vs blocking Claude extraction
+
+Runs process_call_ended end to end with the fake Claude client replaying the
+recorded record_debrief reply as a stream of input_json_delta chunks, and
+reports time to first field, when the Opportunity fields reached Salesforce and
+the end-to-end latency, with and without STREAMING_EXTRACTION. Also feeds the
+recorded reply to the incremental parser in random chunk sizes to check that it
+always rebuilds the same object.
+
+    python -m benchmarks.bench_streaming_extraction --calls 5 --scale 0.2
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+os.environ.setdefault('JOB_QUEUE_PATH', ':memory:')
+os.environ.setdefault('IDEMPOTENCY_PATH', ':memory:')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as poppy  # noqa: E402
+import extraction  # noqa: E402
+from benchmarks.fakes import (SAMPLE_TRANSCRIPT, FakeAnthropic, FakeSalesforce, debrief_responder,  # noqa: E402
+                              llm_latency_model, sample_call_payload, sample_org)
+from json_stream import IncrementalObjectParser  # noqa: E402
+
+
+class TimedSalesforce(FakeSalesforce):
+    """FakeSalesforce that records when each API call completed"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.completed = []
+
+    def _api_call(self, name: str):
+        super()._api_call(name)
+        self.completed.append((name, time.perf_counter()))
+
+
+def run(streaming: bool, calls: int, scale: float, sf_latency: float, transcript: str) -> dict:
+    poppy.STREAMING_EXTRACTION = streaming
+    poppy.ADDRESS_INDEX_ENABLED = False
+    poppy.USER_CACHE_ENABLED = False
+    extraction.claude_client = FakeAnthropic(debrief_responder, latency=llm_latency_model(scale), chunk_chars=12)
+
+    total, opp_written, first_field = [], [], []
+    for i in range(calls):
+        sf = TimedSalesforce(sample_org(), latency=sf_latency)
+        poppy.get_sf_connection = lambda: sf
+        t0 = time.perf_counter()
+        result = poppy.process_call_ended(sample_call_payload(f'stream_{streaming}_{i}', transcript))
+        total.append(time.perf_counter() - t0)
+        assert result['status'] == 'success', result
+        # The Opportunity fields land with the first write: its own update when
+        # streaming, the Composite request otherwise
+        written_at = next(t for name, t in sf.completed if name in ('Opportunity.update', 'composite'))
+        opp_written.append(written_at - t0)
+        if streaming:
+            first_field.append(result['extraction_timings']['first_field_s'])
+    return {
+        'first_field_ms': statistics.median(first_field) * 1000 if first_field else None,
+        'opportunity_written_ms': statistics.median(opp_written) * 1000,
+        'total_ms': statistics.median(total) * 1000,
+    }
+
+
+def check_parser(rounds: int) -> int:
+    expected = debrief_responder({'tools': True})
+    text = json.dumps(expected)
+    rng = random.Random(5)
+    for _ in range(rounds):
+        parser = IncrementalObjectParser()
+        i = 0
+        while i < len(text):
+            size = rng.randint(1, 24)
+            parser.feed(text[i:i + size])
+            i += size
+        assert parser.result() == expected
+    return rounds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=5)
+    parser.add_argument('--scale', type=float, default=0.2, help='multiplier on the modelled Claude latency')
+    parser.add_argument('--sf-latency', type=float, default=0.05)
+    parser.add_argument('--transcript-repeat', type=int, default=12)
+    args = parser.parse_args()
+
+    transcript = '\n'.join([SAMPLE_TRANSCRIPT] * args.transcript_repeat)
+    blocking = run(False, args.calls, args.scale, args.sf_latency, transcript)
+    streamed = run(True, args.calls, args.scale, args.sf_latency, transcript)
+
+    print(f"{'p50':26}{'blocking':>12}{'streaming':>12}")
+    for key in ('first_field_ms', 'opportunity_written_ms', 'total_ms'):
+        before = '-' if blocking[key] is None else f'{blocking[key]:.0f}'
+        print(f"{key:26}{before:>12}{streamed[key]:>12.0f}")
+    print(f"parser: {check_parser(500)} random chunkings rebuilt the same object")
+
+
+if __name__ == '__main__':
+    main()
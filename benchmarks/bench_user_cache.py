@@ -0,0 +1,79 @@
+"""
+AE lookup by phone: per-call SOQL vs the preloaded phone -> User cache
+
+Looks up a mix of known AE numbers (in assorted formats) and unknown callers
+through find_user_by_phone with the cache disabled and enabled, reporting
+per-lookup latency and API calls.
+
+    python -m benchmarks.bench_user_cache --users 500 --lookups 2000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault('JOB_QUEUE_PATH', ':memory:')
+os.environ.setdefault('IDEMPOTENCY_PATH', ':memory:')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as poppy  # noqa: E402
+from benchmarks.fakes import FakeSalesforce, sample_org  # noqa: E402
+from cache import PhoneUserCache  # noqa: E402
+
+FORMATS = ['{}', '+1{}', '({}) {}-{}', '{}-{}-{}']
+
+
+def format_phone(digits: str, rng: random.Random) -> str:
+    fmt = rng.choice(FORMATS)
+    if fmt.count('{}') == 3:
+        return fmt.format(digits[:3], digits[3:6], digits[6:])
+    return fmt.format(digits)
+
+
+def time_lookups(sf, phones: list) -> tuple:
+    calls_before = len(sf.api_calls)
+    found = 0
+    t0 = time.perf_counter()
+    for phone in phones:
+        if poppy.find_user_by_phone(sf, phone):
+            found += 1
+    elapsed = time.perf_counter() - t0
+    return elapsed / len(phones) * 1e6, (len(sf.api_calls) - calls_before) / len(phones), found
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--lookups', type=int, default=2000)
+    parser.add_argument('--unknown', type=float, default=0.1, help='share of calls from numbers with no User')
+    parser.add_argument('--latency', type=float, default=0.0, help='simulated Salesforce round-trip seconds')
+    args = parser.parse_args()
+    rng = random.Random(3)
+
+    org = sample_org(10)
+    for i in range(args.users):
+        org['User'][f'005FAKE{i + 2:08d}'] = {'Id': f'005FAKE{i + 2:08d}', 'Name': f'AE {i}', 'IsActive': True,
+                                              'Phone': f'312{i:07d}', 'MobilePhone': f'773{i:07d}'}
+    sf = FakeSalesforce(org, latency=args.latency)
+    known = [u[f] for u in org['User'].values() for f in ('Phone', 'MobilePhone') if u.get(f)]
+    unknown = [f'555{rng.randint(0, 9_999_999):07d}' for _ in range(20)]
+    phones = [format_phone(rng.choice(unknown if rng.random() < args.unknown else known), rng)
+              for _ in range(args.lookups)]
+
+    poppy.USER_CACHE_ENABLED = False
+    soql_us, soql_calls, soql_found = time_lookups(sf, phones)
+
+    poppy.user_cache = PhoneUserCache()
+    poppy.user_cache.preload(sf)
+    poppy.USER_CACHE_ENABLED = True
+    cache_us, cache_calls, cache_found = time_lookups(sf, phones)
+
+    print(f"{'':8}{'us/lookup':>12}{'API calls/lookup':>18}{'found':>8}")
+    print(f"{'soql':8}{soql_us:>12.0f}{soql_calls:>18.3f}{soql_found:>8}")
+    print(f"{'cache':8}{cache_us:>12.1f}{cache_calls:>18.3f}{cache_found:>8}")
+    print(f"cache: {poppy.user_cache.metrics()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+Webhook latency with the background job queue
+
+Posts call_ended webhooks through Flask's test client against fake Salesforce
+and Anthropic clients with realistic latency, then waits for the workers to
+drain the queue. One transient Salesforce failure is injected to exercise retry.
+Then fails one call for good and re-sends its webhook, which must be processed
+again rather than answered as a duplicate, and runs a call for longer than the
+queue's visibility timeout, which no other worker may pick up meanwhile.
+
+    python -m benchmarks.bench_webhook_queue --calls 20
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('JOB_QUEUE_PATH', os.path.join(tempfile.mkdtemp(), 'jobs.sqlite3'))
+os.environ.setdefault('IDEMPOTENCY_PATH', ':memory:')
+# The recorded calls have no call_analyzed to wait for
+os.environ.setdefault('CALL_ANALYSIS_WAIT_SECONDS', '0')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests  # noqa: E402
+
+import app as poppy  # noqa: E402
+import extraction  # noqa: E402
+from benchmarks.fakes import FakeAnthropic, FakeSalesforce, debrief_responder, sample_call_payload, sample_org  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=20)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--sf-latency', type=float, default=0.05)
+    parser.add_argument('--llm-latency', type=float, default=0.5)
+    args = parser.parse_args()
+
+    sf = FakeSalesforce(sample_org(), latency=args.sf_latency)
+    sf.fail_next(1, requests.ConnectionError('connection reset'))
+    poppy.get_sf_connection = lambda: sf
+    # Keep the injected failure on the job path rather than the AE directory preload
+    poppy.USER_CACHE_ENABLED = False
+    extraction.claude_client = FakeAnthropic(debrief_responder, latency=args.llm_latency)
+    os.environ['JOB_WORKERS'] = str(args.workers)
+    pool = poppy.get_worker_pool()
+    pool.backoff_base = 0.1
+
+    client = poppy.app.test_client()
+    run_id = int(time.time())
+    call_ids = [f'bench_{run_id}_{i}' for i in range(args.calls)]
+
+    webhook_ms = []
+    started = time.perf_counter()
+    for call_id in call_ids:
+        t0 = time.perf_counter()
+        resp = client.post('/webhook/retell', json=sample_call_payload(call_id))
+        webhook_ms.append((time.perf_counter() - t0) * 1000)
+        assert resp.status_code == 202, resp.get_json()
+
+    # Duplicate delivery should be absorbed by the queue
+    dup = client.post('/webhook/retell', json=sample_call_payload(call_ids[0])).get_json()
+
+    while True:
+        statuses = [client.get(f'/jobs/{call_id}').get_json()['status'] for call_id in call_ids]
+        if all(s in ('succeeded', 'failed') for s in statuses):
+            break
+        time.sleep(0.05)
+    drained_s = time.perf_counter() - started
+    pool.stop()
+
+    # Once processed, a re-sent webhook gets the original result back
+    replay = client.post('/webhook/retell', json=sample_call_payload(call_ids[0])).get_json()
+
+    # A call that failed for good is released, so its re-sent webhook is processed again
+    failing_id = f'bench_{run_id}_failed'
+    sf.fail_next(1, ValueError('malformed request'))
+    client.post('/webhook/retell', json=sample_call_payload(failing_id))
+    while pool.run_once():
+        pass
+    failed = client.get(f'/jobs/{failing_id}').get_json()['status']
+    redelivered = client.post('/webhook/retell', json=sample_call_payload(failing_id)).get_json()
+    while pool.run_once():
+        pass
+    reprocessed = client.get(f'/jobs/{failing_id}').get_json()
+
+    # A job still being worked on past the visibility timeout keeps its lock
+    slow_id = f'bench_{run_id}_slow'
+    process_call_ended = poppy.process_call_ended
+    slow_runs = []
+
+    def slow_process(data):
+        slow_runs.append(time.perf_counter())
+        time.sleep(1.0)
+        return process_call_ended(data)
+
+    poppy.process_call_ended = slow_process
+    poppy.job_queue.visibility_timeout = 0.3
+    pool.start()
+    client.post('/webhook/retell', json=sample_call_payload(slow_id))
+    while client.get(f'/jobs/{slow_id}').get_json()['status'] not in ('succeeded', 'failed'):
+        time.sleep(0.05)
+    pool.stop()
+    slow = client.get(f'/jobs/{slow_id}').get_json()
+    poppy.process_call_ended = process_call_ended
+
+    attempts = [client.get(f'/jobs/{call_id}').get_json()['attempts'] for call_id in call_ids]
+    print(f"calls:               {args.calls}")
+    print(f"webhook p50 / max:   {statistics.median(webhook_ms):.1f} ms / {max(webhook_ms):.1f} ms")
+    print(f"queue drained in:    {drained_s:.2f} s with {args.workers} workers")
+    print(f"succeeded / failed:  {statuses.count('succeeded')} / {statuses.count('failed')}")
+    print(f"retried jobs:        {sum(1 for a in attempts if a > 1)}")
+    print(f"duplicate response:  {dup['status']} ({dup['job_status']})")
+    print(f"replayed response:   {replay['status']} (opportunity {replay.get('opportunity_id')})")
+    print(f"failed, re-sent:     {failed} -> {redelivered['status']} -> {reprocessed['status']} "
+          f"(attempts {reprocessed['attempts']})")
+    print(f"slow job (1.0 s, visibility timeout 0.3 s): {slow['status']}, run {len(slow_runs)}x, "
+          f"attempts {slow['attempts']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,974 @@
+"""
+In-process fakes for Salesforce and Anthropic
+Used by the benchmark scripts so the pipeline can run without live credentials
+"""
+import copy
+import csv
+import heapq
+import io
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+
+def sf_now() -> str:
+    """Current time in Salesforce's datetime format"""
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000+0000')
+
+
+class FakeSalesforceError(Exception):
+    def __init__(self, status: int, errors: list):
+        super().__init__(errors[0]['message'])
+        self.status = status
+        self.errors = errors
+
+
+class FakeSObject:
+    """Stands in for simple_salesforce's SFType (sf.Opportunity, sf.Task, ...)"""
+
+    def __init__(self, sf, name: str, counted: bool = True):
+        self.sf = sf
+        self.name = name
+        self.counted = counted
+
+    def _api_call(self, operation: str):
+        if self.counted:
+            self.sf._api_call(f'{self.name}.{operation}')
+
+    def create(self, data: dict) -> dict:
+        self._api_call('create')
+        self.sf.validate(self.name, data)
+        record_id = self.sf.new_id(self.name)
+        with self.sf.data_lock:
+            now = sf_now()
+            self.sf.records.setdefault(self.name, {})[record_id] = dict(data, Id=record_id, LastModifiedDate=now,
+                                                                        SystemModstamp=now)
+        return {'id': record_id, 'success': True, 'errors': []}
+
+    def update(self, record_id: str, data: dict) -> int:
+        self._api_call('update')
+        self.sf.validate(self.name, data)
+        with self.sf.data_lock:
+            record = self.sf.records.setdefault(self.name, {}).setdefault(record_id, {'Id': record_id})
+            now = sf_now()
+            record.update(data, LastModifiedDate=now, SystemModstamp=now)
+        return 204
+
+    def get(self, record_id: str) -> dict:
+        self._api_call('get')
+        with self.sf.data_lock:
+            return dict(self.sf.records.get(self.name, {})[record_id])
+
+    def delete(self, record_id: str) -> int:
+        self._api_call('delete')
+        with self.sf.data_lock:
+            self.sf.records.get(self.name, {}).pop(record_id, None)
+        return 204
+
+    def describe(self) -> dict:
+        """Fields seen on this sObject's records, and on records nested under its name elsewhere
+        (Account under Opportunity); a nested record also makes a lookup field. Fields holding
+        booleans or numbers are typed boolean or double, the rest string"""
+        self._api_call('describe')
+        names, lookups, types = {'Id'}, set(), {}
+        with self.sf.data_lock:
+            for sobject, records in self.sf.records.items():
+                for record in records.values():
+                    if sobject == self.name:
+                        names.update(k for k, v in record.items() if not isinstance(v, dict))
+                        lookups.update(k for k, v in record.items() if isinstance(v, dict))
+                        for k, v in record.items():
+                            if k not in types and isinstance(v, (bool, int, float)):
+                                types[k] = 'boolean' if isinstance(v, bool) else 'double'
+                    elif isinstance(record.get(self.name), dict):
+                        names.update(record[self.name])
+        names -= {f.split('.', 1)[1] for f in self.sf.missing_fields if f.startswith(f'{self.name}.')}
+        fields = [{'name': name, 'type': types.get(name, 'string'), 'relationshipName': None, 'referenceTo': []}
+                  for name in sorted(names)]
+        fields += [{'name': f'{name}Id', 'type': 'reference', 'relationshipName': name, 'referenceTo': [name]}
+                   for name in sorted(lookups)]
+        return {'name': self.name, 'fields': fields}
+
+
+class SoqlQuery:
+    """Parsed form of the SOQL subset FakeSalesforce answers
+
+        SELECT f1, Rel.f2, ... | COUNT() FROM Obj
+        [WHERE cond {AND|OR} [NOT] (cond ...)] [ORDER BY f [ASC|DESC], ...] [LIMIT n] [OFFSET n]
+
+    Conditions are f {=|!=|<>|<|<=|>|>=|LIKE} literal and f [NOT] IN (literals), where a
+    literal is a quoted string, number, true/false, null or a date/datetime.
+    """
+
+    _token_re = re.compile(r"'(?:[^'\\]|\\.)*'|!=|<>|<=|>=|[=<>(),]|[\w.:+-]+")
+    _clause_re = re.compile(r'\s*SELECT\s+(?P<fields>.+?)\s+FROM\s+(?P<sobject>\w+)'
+                            r'(?:\s+WHERE\s+(?P<where>.+?))?'
+                            r'(?:\s+ORDER\s+BY\s+(?P<order>.+?))?'
+                            r'(?:\s+LIMIT\s+(?P<limit>\d+))?'
+                            r'(?:\s+OFFSET\s+(?P<offset>\d+))?\s*$', re.IGNORECASE | re.DOTALL)
+
+    def __init__(self, soql: str):
+        match = self._clause_re.match(soql)
+        if not match:
+            raise ValueError(f'Unsupported SOQL: {soql}')
+        fields = [f.strip() for f in match.group('fields').split(',')]
+        self.count = [f.upper() for f in fields] == ['COUNT()']
+        self.fields = [] if self.count else fields
+        self.sobject = match.group('sobject')
+        self.order = []
+        for part in (match.group('order') or '').split(','):
+            words = part.split()
+            if words:
+                self.order.append((words[0], len(words) > 1 and words[1].upper() == 'DESC'))
+        self.limit = int(match.group('limit')) if match.group('limit') else None
+        self.offset = int(match.group('offset') or 0)
+        self.where = None
+        if match.group('where'):
+            self._tokens = self._token_re.findall(match.group('where'))
+            self._pos = 0
+            self.where = self._or()
+            if self._pos != len(self._tokens):
+                raise ValueError(f'Unsupported SOQL: {soql}')
+
+    # Recursive descent over the WHERE tokens: OR binds loosest, then AND, then NOT
+    def _peek(self):
+        return self._tokens[self._pos] if self._pos < len(self._tokens) else None
+
+    def _next(self):
+        token = self._peek()
+        self._pos += 1
+        return token
+
+    def _keyword(self, word: str) -> bool:
+        token = self._peek()
+        if token is not None and token.upper() == word:
+            self._pos += 1
+            return True
+        return False
+
+    def _or(self):
+        node = self._and()
+        while self._keyword('OR'):
+            node = ('or', node, self._and())
+        return node
+
+    def _and(self):
+        node = self._not()
+        while self._keyword('AND'):
+            node = ('and', node, self._not())
+        return node
+
+    def _not(self):
+        if self._keyword('NOT'):
+            return ('not', self._not())
+        if self._peek() == '(':
+            self._next()
+            node = self._or()
+            if self._next() != ')':
+                raise ValueError('Unbalanced parentheses in SOQL')
+            return node
+        field = self._next()
+        negate = self._keyword('NOT')
+        if self._keyword('IN'):
+            if self._next() != '(':
+                raise ValueError('Expected ( after IN')
+            values = [self._literal(self._next())]
+            while self._peek() == ',':
+                self._next()
+                values.append(self._literal(self._next()))
+            self._next()
+            node = ('in', field, values)
+            return ('not', node) if negate else node
+        op = self._next().upper()
+        return ('cmp', field, op, self._literal(self._next()))
+
+    @staticmethod
+    def _literal(token: str):
+        if token.startswith("'"):
+            return token[1:-1].replace("\\'", "'")
+        lowered = token.lower()
+        if lowered in ('true', 'false'):
+            return lowered == 'true'
+        if lowered == 'null':
+            return None
+        try:
+            return int(token) if token.lstrip('-').isdigit() else float(token)
+        except ValueError:
+            # Date and datetime literals compare as strings
+            return token
+
+    @staticmethod
+    def value(record: dict, path: str):
+        """Field value by dotted path (Account.Name)"""
+        value = record
+        for part in path.split('.'):
+            if not isinstance(value, dict):
+                return None
+            value = value.get(part)
+        return value
+
+    def matches(self, record: dict) -> bool:
+        return self.where is None or self._eval(self.where, record)
+
+    def _eval(self, node, record: dict) -> bool:
+        kind = node[0]
+        if kind == 'or':
+            return self._eval(node[1], record) or self._eval(node[2], record)
+        if kind == 'and':
+            return self._eval(node[1], record) and self._eval(node[2], record)
+        if kind == 'not':
+            return not self._eval(node[1], record)
+        if kind == 'in':
+            actual = self.value(record, node[1])
+            return any(self._compare(actual, '=', value) for value in node[2])
+        return self._compare(self.value(record, node[1]), node[2], node[3])
+
+    @staticmethod
+    def _compare(actual, op: str, value) -> bool:
+        if op == '<>':
+            op = '!='
+        if value is None or actual is None:
+            if op == '=':
+                return actual is None and value is None
+            if op == '!=':
+                return (actual is None) != (value is None)
+            return False
+        if op == '!=':
+            return not SoqlQuery._compare(actual, '=', value)
+        if isinstance(value, bool) or isinstance(actual, bool):
+            return op == '=' and str(actual).lower() == str(value).lower()
+        if op == 'LIKE':
+            pattern = '^' + re.escape(str(value)).replace('%', '.*').replace('_', '.') + '$'
+            return re.match(pattern, str(actual), re.IGNORECASE) is not None
+        if not (isinstance(value, (int, float)) and isinstance(actual, (int, float))):
+            # Datetime literals: compare on the normalized 'YYYY-MM-DDTHH:MM:SS' prefix
+            actual, value = str(actual), str(value)
+            if op != '=':
+                actual, value = actual[:19], value[:19]
+        return {'=': actual == value, '>': actual > value, '>=': actual >= value,
+                '<': actual < value, '<=': actual <= value}[op]
+
+    def sort(self, records: list) -> list:
+        # Stable sorts from the last key to the first; nulls sort first, as in SOQL ASC
+        for field, descending in reversed(self.order):
+            records.sort(key=lambda r: (self.value(r, field) is not None, str(self.value(r, field) or '')),
+                         reverse=descending)
+        return records
+
+    def project(self, record: dict) -> dict:
+        """Only the selected fields, with relationship fields nested as Salesforce returns them"""
+        result = {'attributes': {'type': self.sobject}}
+        for field in self.fields:
+            parts = field.split('.')
+            target, source = result, record
+            for part in parts[:-1]:
+                source = source.get(part) if isinstance(source, dict) else None
+                if source is None:
+                    target[part] = None
+                    break
+                target = target.setdefault(part, {})
+            else:
+                target[parts[-1]] = source.get(parts[-1]) if isinstance(source, dict) else None
+        return result
+
+
+class FakeSalesforce:
+    """Minimal Salesforce double: sObject CRUD plus a SOQL subset (see SoqlQuery)
+
+    Query results come back in pages of batch_size with a nextRecordsUrl, like the
+    real API. Every call - each page included - is counted in api_calls and can be
+    slowed down with latency.
+    """
+
+    def __init__(self, records: dict = None, latency: float = 0.0, batch_size: int = 2000):
+        self.records = records or {}
+        self.latency = latency
+        self.batch_size = batch_size
+        self.api_calls = []
+        self.sf_instance = 'fake.my.salesforce.com'
+        self.sf_version = '59.0'
+        self.session_id = 'FAKE_SESSION'
+        # Writes touching one of these fields fail with FIELD_INTEGRITY_EXCEPTION
+        self.reject_fields = set()
+        # Fields the org doesn't have ('Account.PersonMobilePhone'): left out of describe,
+        # and a query selecting one fails with INVALID_FIELD
+        self.missing_fields = set()
+        self._failures = []
+        self._cursors = {}
+        self._jobs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        # Held while records are read or written; a composite request holds it throughout
+        self.data_lock = threading.RLock()
+
+    def new_id(self, sobject: str) -> str:
+        with self._lock:
+            return f'{sobject[:3].upper()}FAKE{next(self._ids):08d}'
+
+    def fail_next(self, count: int, exc: Exception):
+        """Make the next count API calls raise exc"""
+        self._failures.extend([exc] * count)
+
+    def _api_call(self, name: str):
+        with self._lock:
+            self.api_calls.append(name)
+            failure = self._failures.pop(0) if self._failures else None
+        if self.latency:
+            time.sleep(self.latency)
+        if failure:
+            raise failure
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return FakeSObject(self, name)
+
+    def query(self, soql: str) -> dict:
+        self._api_call('query')
+        parsed = SoqlQuery(soql)
+        missing = [f for f in parsed.fields if (f if '.' in f else f'{parsed.sobject}.{f}') in self.missing_fields]
+        if missing:
+            raise FakeSalesforceError(400, [{'errorCode': 'INVALID_FIELD',
+                                             'message': f"No such column '{missing[0]}' on entity '{parsed.sobject}'"}])
+        with self.data_lock:
+            records = [r for r in self.records.get(parsed.sobject, {}).values() if parsed.matches(r)]
+        parsed.sort(records)
+        records = records[parsed.offset:]
+        if parsed.limit is not None:
+            records = records[:parsed.limit]
+        if parsed.count:
+            return {'totalSize': len(records), 'done': True, 'records': []}
+        return self._page([parsed.project(r) for r in records], 0)
+
+    def _page(self, records: list, offset: int) -> dict:
+        page = records[offset:offset + self.batch_size]
+        result = {'totalSize': len(records), 'done': offset + len(page) >= len(records), 'records': page}
+        if not result['done']:
+            locator = f'01gFAKE{id(records):x}-{offset + len(page)}'
+            with self._lock:
+                self._cursors[locator] = records
+            result['nextRecordsUrl'] = f'/services/data/v{self.sf_version}/query/{locator}'
+        return result
+
+    def query_more(self, next_records_identifier: str, identifier_is_url: bool = False) -> dict:
+        self._api_call('query')
+        locator = next_records_identifier.rstrip('/').split('/')[-1]
+        with self._lock:
+            records = self._cursors.pop(locator)
+        return self._page(records, int(locator.rsplit('-', 1)[1]))
+
+    def query_all_iter(self, soql: str):
+        result = self.query(soql)
+        while True:
+            yield from result['records']
+            if result['done']:
+                return
+            result = self.query_more(result['nextRecordsUrl'], identifier_is_url=True)
+
+    def query_all(self, soql: str) -> dict:
+        records = list(self.query_all_iter(soql))
+        return {'totalSize': len(records), 'done': True, 'records': records}
+
+    # Bulk API 2.0 query jobs: the query runs when the job is created, results are CSV pages
+    def create_query_job(self, body: dict) -> dict:
+        self._api_call('jobs.query')
+        parsed = SoqlQuery(body['query'])
+        missing = [f for f in parsed.fields if (f if '.' in f else f'{parsed.sobject}.{f}') in self.missing_fields]
+        if missing:
+            raise FakeSalesforceError(400, [{'errorCode': 'INVALIDJOB',
+                                             'message': f"No such column '{missing[0]}' on entity '{parsed.sobject}'"}])
+        with self.data_lock:
+            records = [r for r in self.records.get(parsed.sobject, {}).values() if parsed.matches(r)]
+            parsed.sort(records)
+            rows = [[self._csv_cell(parsed.value(r, f)) for f in parsed.fields] for r in records]
+        job = {'id': self.new_id('750'), 'object': parsed.sobject, 'operation': body['operation'],
+               'state': 'JobComplete', 'numberRecordsProcessed': len(rows)}
+        with self._lock:
+            self._jobs[job['id']] = dict(job, columns=parsed.fields, rows=rows)
+        return job
+
+    def query_job(self, job_id: str) -> dict:
+        self._api_call('jobs.get')
+        job = self._jobs[job_id]
+        return {key: value for key, value in job.items() if key not in ('columns', 'rows')}
+
+    def query_results(self, job_id: str, locator: str, max_records: int) -> tuple:
+        """(CSV page, next locator or 'null', rows in the page) - the locator is the offset"""
+        self._api_call('jobs.results')
+        job = self._jobs[job_id]
+        offset = int(locator or 0)
+        rows = job['rows'][offset:offset + max_records]
+        out = io.StringIO()
+        writer = csv.writer(out, lineterminator='\n')
+        writer.writerow(job['columns'])
+        writer.writerows(rows)
+        following = offset + len(rows)
+        return out.getvalue(), str(following) if following < len(job['rows']) else 'null', len(rows)
+
+    @staticmethod
+    def _csv_cell(value) -> str:
+        if value is None:
+            return ''
+        if isinstance(value, bool):
+            return str(value).lower()
+        return str(value)
+
+    # Bulk API 2.0 ingest jobs: rows are applied when the job is closed (UploadComplete)
+    def create_ingest_job(self, body: dict) -> dict:
+        self._api_call('jobs.create')
+        job = {'id': self.new_id('750'), 'object': body['object'], 'operation': body['operation'], 'state': 'Open',
+               'numberRecordsProcessed': 0, 'numberRecordsFailed': 0}
+        with self._lock:
+            self._jobs[job['id']] = dict(job, data='', successful=[], failed=[])
+        return job
+
+    def upload_ingest_data(self, job_id: str, data: str):
+        self._api_call('jobs.upload')
+        self._jobs[job_id]['data'] += data
+
+    def set_ingest_state(self, job_id: str, state: str) -> dict:
+        self._api_call('jobs.state')
+        job = self._jobs[job_id]
+        if state == 'UploadComplete':
+            self._run_ingest(job)
+        else:
+            job['state'] = state
+        return self._job_info(job)
+
+    def ingest_job(self, job_id: str) -> dict:
+        self._api_call('jobs.get')
+        return self._job_info(self._jobs[job_id])
+
+    def ingest_results(self, job_id: str, results_type: str) -> str:
+        """successfulResults / failedResults as CSV, with sf__Id (and sf__Error) columns first"""
+        self._api_call('jobs.results')
+        job = self._jobs[job_id]
+        rows = job['successful'] if results_type == 'successfulResults' else job['failed']
+        extra = ['sf__Id', 'sf__Created'] if results_type == 'successfulResults' else ['sf__Id', 'sf__Error']
+        columns = extra + [c for c in (rows[0] if rows else {}) if c not in extra]
+        out = io.StringIO()
+        writer = csv.DictWriter(out, fieldnames=columns, lineterminator='\n')
+        writer.writeheader()
+        writer.writerows(rows)
+        return out.getvalue()
+
+    @staticmethod
+    def _job_info(job: dict) -> dict:
+        return {key: value for key, value in job.items() if key not in ('data', 'successful', 'failed')}
+
+    @staticmethod
+    def _csv_value(value: str):
+        if value.lower() in ('true', 'false'):
+            return value.lower() == 'true'
+        for cast in (int, float):
+            try:
+                return cast(value)
+            except ValueError:
+                pass
+        return value
+
+    def _run_ingest(self, job: dict):
+        sobject = FakeSObject(self, job['object'], counted=False)
+        for row in csv.DictReader(io.StringIO(job['data'])):
+            fields = {key: self._csv_value(value) for key, value in row.items() if key != 'Id' and value != ''}
+            try:
+                if job['operation'] == 'update':
+                    sobject.update(row['Id'], fields)
+                    record_id, created = row['Id'], 'false'
+                else:
+                    record_id, created = sobject.create(fields)['id'], 'true'
+                job['successful'].append(dict(row, sf__Id=record_id, sf__Created=created))
+            except FakeSalesforceError as e:
+                error = e.errors[0]
+                job['failed'].append(dict(row, sf__Id=row.get('Id', ''), sf__Error=f"{error['errorCode']}:{error['message']}"))
+        job.update(state='JobComplete', numberRecordsProcessed=len(job['successful']) + len(job['failed']),
+                   numberRecordsFailed=len(job['failed']))
+
+    def validate(self, sobject: str, data: dict):
+        rejected = self.reject_fields & set(data)
+        if rejected:
+            raise FakeSalesforceError(400, [{'errorCode': 'FIELD_INTEGRITY_EXCEPTION',
+                                             'message': f'{sobject}: bad value for {sorted(rejected)}'}])
+
+    def restful(self, path: str, params=None, method: str = 'GET', **kwargs) -> dict:
+        if path == 'composite' and method == 'POST':
+            self._api_call('composite')
+            return self.composite(kwargs['json'])
+        raise ValueError(f'Unsupported REST call: {method} {path}')
+
+    def composite(self, body: dict) -> dict:
+        """Apply /composite subrequests, rolling every write back if allOrNone and one fails"""
+        with self.data_lock:
+            return self._composite(body)
+
+    def _composite(self, body: dict) -> dict:
+        snapshot = copy.deepcopy(self.records)
+        responses = []
+        failed = False
+        for sub in body['compositeRequest']:
+            ref = sub['referenceId']
+            if failed and body.get('allOrNone'):
+                responses.append({'referenceId': ref, 'httpStatusCode': 400,
+                                  'body': [{'errorCode': 'PROCESSING_HALTED', 'message': 'halted'}]})
+                continue
+            parts = sub['url'].rstrip('/').split('/')
+            sobject_index = parts.index('sobjects') + 1
+            # Subrequests of a composite call don't count as separate API calls
+            sobject = FakeSObject(self, parts[sobject_index], counted=False)
+            try:
+                if sub['method'] == 'POST':
+                    result = sobject.create(sub['body'])
+                    responses.append({'referenceId': ref, 'httpStatusCode': 201, 'body': result})
+                else:
+                    sobject.update(parts[sobject_index + 1], sub['body'])
+                    responses.append({'referenceId': ref, 'httpStatusCode': 204, 'body': None})
+            except FakeSalesforceError as e:
+                failed = True
+                responses.append({'referenceId': ref, 'httpStatusCode': e.status, 'body': e.errors})
+        if failed and body.get('allOrNone'):
+            self.records = snapshot
+            for response in responses:
+                if response['httpStatusCode'] < 300:
+                    response.update(httpStatusCode=400, body=[{'errorCode': 'PROCESSING_HALTED', 'message': 'rolled back'}])
+        return {'compositeResponse': responses}
+
+
+class FakeMessages:
+    def __init__(self, client):
+        self.client = client
+
+    def create(self, **kwargs):
+        client = self.client
+        with client._lock:
+            client.calls.append(kwargs)
+            failure = client._failures.pop(0) if client._failures else None
+        block, usage = self.reply(kwargs)
+        delay = client.latency(usage) if callable(client.latency) else client.latency
+        if kwargs.get('stream'):
+            return self._stream(block, usage, delay, failure)
+        if delay:
+            time.sleep(delay)
+        if failure:
+            raise failure
+        return SimpleNamespace(content=[block], usage=usage,
+                               stop_reason='tool_use' if block.type == 'tool_use' else 'end_turn')
+
+    def reply(self, kwargs: dict) -> tuple:
+        """(content block, usage) of the responder's reply to a request"""
+        reply = self.client.responder(kwargs)
+        if isinstance(reply, dict):
+            block = SimpleNamespace(type='tool_use', id='toolu_fake', name=kwargs['tools'][0]['name'], input=reply)
+            output_chars = len(json.dumps(reply))
+        else:
+            block = SimpleNamespace(type='text', text=reply)
+            output_chars = len(reply)
+        return block, self._usage(kwargs, output_chars // 4)
+
+    def _usage(self, kwargs: dict, output_tokens: int):
+        """Token usage, with prompt caching: the first request with a given cached prefix
+        writes it to the cache, later ones read it"""
+        total = prompt_tokens(kwargs)
+        prefix = cached_prefix_tokens(kwargs)
+        usage = SimpleNamespace(input_tokens=total, output_tokens=output_tokens,
+                                cache_creation_input_tokens=0, cache_read_input_tokens=0)
+        if prefix >= self.client.min_cache_tokens:
+            key = (kwargs.get('model'), json.dumps(kwargs.get('tools', [])), json.dumps(kwargs.get('system')))
+            with self.client._lock:
+                hit = key in self.client.prompt_cache
+                self.client.prompt_cache.add(key)
+            usage.input_tokens = total - prefix
+            if hit:
+                usage.cache_read_input_tokens = prefix
+            else:
+                usage.cache_creation_input_tokens = prefix
+        return usage
+
+    def _stream(self, block, usage, delay: float, failure):
+        """Replay the reply as server-sent events, chunk_chars characters per delta
+
+        Time to first token is the latency of the request with no output; the rest
+        of the latency is spread evenly across the deltas.
+        """
+        client = self.client
+        if callable(client.latency):
+            first_token = client.latency(SimpleNamespace(**dict(vars(usage), output_tokens=0)))
+        else:
+            first_token = delay / 2
+        if failure:
+            time.sleep(first_token)
+            raise failure
+
+        if block.type == 'tool_use':
+            text = json.dumps(block.input)
+            start = SimpleNamespace(type='tool_use', id=block.id, name=block.name, input={})
+            delta_type, delta_field = 'input_json_delta', 'partial_json'
+        else:
+            text = block.text
+            start = SimpleNamespace(type='text', text='')
+            delta_type, delta_field = 'text_delta', 'text'
+        chunks = [text[i:i + client.chunk_chars] for i in range(0, len(text), client.chunk_chars)] or ['']
+        per_chunk = max(delay - first_token, 0) / len(chunks)
+
+        time.sleep(first_token)
+        yield SimpleNamespace(type='message_start', message=SimpleNamespace(usage=usage))
+        yield SimpleNamespace(type='content_block_start', index=0, content_block=start)
+        for chunk in chunks:
+            if per_chunk:
+                time.sleep(per_chunk)
+            yield SimpleNamespace(type='content_block_delta', index=0,
+                                  delta=SimpleNamespace(type=delta_type, **{delta_field: chunk}))
+        yield SimpleNamespace(type='content_block_stop', index=0)
+        yield SimpleNamespace(type='message_delta', usage=usage,
+                              delta=SimpleNamespace(stop_reason='tool_use' if block.type == 'tool_use' else 'end_turn'))
+        yield SimpleNamespace(type='message_stop')
+
+
+class FakeBatches:
+    """Message Batches (client.beta.messages.batches): every request is answered at
+    submission, and the batch reports ended once batch_latency seconds have passed"""
+
+    def __init__(self, client):
+        self.client = client
+        self.batches = {}
+        self._ids = itertools.count(1)
+
+    def create(self, requests: list):
+        client = self.client
+        results = []
+        for request in requests:
+            with client._lock:
+                failure = client._failures.pop(0) if client._failures else None
+            if failure:
+                error = SimpleNamespace(type='error', error=SimpleNamespace(type='api_error', message=str(failure)))
+                result = SimpleNamespace(type='errored', error=error)
+            else:
+                block, usage = client.messages.reply(request['params'])
+                message = SimpleNamespace(content=[block], usage=usage,
+                                          stop_reason='tool_use' if block.type == 'tool_use' else 'end_turn')
+                result = SimpleNamespace(type='succeeded', message=message)
+            results.append(SimpleNamespace(custom_id=request['custom_id'], result=result))
+        batch_id = f'msgbatch_fake{next(self._ids):06d}'
+        with client._lock:
+            self.batches[batch_id] = {'results': results, 'ready_at': time.monotonic() + client.batch_latency}
+        return self.retrieve(batch_id)
+
+    def retrieve(self, batch_id: str):
+        batch = self.batches[batch_id]
+        ended = time.monotonic() >= batch['ready_at']
+        counts = {kind: sum(1 for r in batch['results'] if r.result.type == kind) if ended else 0
+                  for kind in ('succeeded', 'errored', 'canceled', 'expired')}
+        return SimpleNamespace(id=batch_id, processing_status='ended' if ended else 'in_progress',
+                               request_counts=SimpleNamespace(processing=0 if ended else len(batch['results']), **counts))
+
+    def results(self, batch_id: str):
+        if self.retrieve(batch_id).processing_status != 'ended':
+            raise ValueError(f'Batch {batch_id} has not ended')
+        return iter(self.batches[batch_id]['results'])
+
+
+def _text(content) -> str:
+    """Text of a string or a list of content blocks"""
+    if isinstance(content, str):
+        return content
+    return ''.join(block.get('text', '') for block in content)
+
+
+def prompt_tokens(kwargs: dict) -> int:
+    """Rough token count of a messages.create request (4 chars per token)"""
+    chars = len(_text(kwargs.get('system', ''))) + len(json.dumps(kwargs.get('tools', [])))
+    chars += sum(len(_text(m['content'])) for m in kwargs.get('messages', []))
+    return chars // 4
+
+
+def cached_prefix_tokens(kwargs: dict) -> int:
+    """Tokens up to the last cache_control breakpoint in tools + system, 0 if none"""
+    chars = 0
+    prefix = 0
+    for tool in kwargs.get('tools', []):
+        chars += len(json.dumps(tool))
+        if tool.get('cache_control'):
+            prefix = chars
+    system = kwargs.get('system', '')
+    if isinstance(system, str):
+        chars += len(system)
+    else:
+        for block in system:
+            chars += len(block.get('text', ''))
+            if block.get('cache_control'):
+                prefix = chars
+    return prefix // 4
+
+
+def llm_latency_model(scale: float = 1.0, base: float = 0.6, per_input_token: float = 0.00004,
+                      per_output_token: float = 0.015, per_cached_token: float = 0.000004):
+    """Latency function for FakeAnthropic - fixed overhead plus input and output token cost
+
+    Prompt tokens read from the cache are much cheaper to process than uncached ones.
+    """
+    def latency(usage) -> float:
+        input_cost = (usage.input_tokens + getattr(usage, 'cache_creation_input_tokens', 0)) * per_input_token
+        input_cost += getattr(usage, 'cache_read_input_tokens', 0) * per_cached_token
+        return scale * (base + input_cost + usage.output_tokens * per_output_token)
+    return latency
+
+
+class FakeAnthropic:
+    """Anthropic client double
+
+    responder(kwargs) returns the reply for each call: a string for a text reply or
+    a dict for a tool_use reply. latency is seconds per call or a function of usage.
+    With stream=True the reply is replayed as events of chunk_chars characters.
+    Prompts with a cache_control breakpoint of at least min_cache_tokens are cached.
+    Message batches take batch_latency seconds regardless of size.
+    """
+
+    def __init__(self, responder, latency: float = 0.0, chunk_chars: int = 16, min_cache_tokens: int = 1024,
+                 batch_latency: float = 0.0):
+        self.responder = responder
+        self.latency = latency
+        self.chunk_chars = chunk_chars
+        self.min_cache_tokens = min_cache_tokens
+        self.batch_latency = batch_latency
+        self.prompt_cache = set()
+        self.calls = []
+        self.messages = FakeMessages(self)
+        self.beta = SimpleNamespace(messages=SimpleNamespace(batches=FakeBatches(self)))
+        self._failures = []
+        self._lock = threading.Lock()
+
+    def fail_next(self, count: int, exc: Exception):
+        """Make the next count calls raise exc"""
+        self._failures.extend([exc] * count)
+
+
+class FakeRedis:
+    """The slice of redis.Redis used by RedisIdempotencyStore, with heap-based key expiry"""
+
+    def __init__(self):
+        self.data = {}
+        self.expiry = {}
+        self._heap = []
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float):
+        while self._heap and self._heap[0][0] <= now:
+            expires_at, key = heapq.heappop(self._heap)
+            # Skip heap entries left behind when a key was overwritten or deleted
+            if self.expiry.get(key) == expires_at:
+                del self.data[key]
+                del self.expiry[key]
+
+    def get(self, key: str):
+        with self._lock:
+            self._expire(time.monotonic())
+            value = self.data.get(key)
+        return value.encode() if value is not None else None
+
+    def set(self, key: str, value: str, nx: bool = False, xx: bool = False, ex: int = None):
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            if (nx and key in self.data) or (xx and key not in self.data):
+                return None
+            self.data[key] = value
+            self.expiry.pop(key, None)
+            if ex is not None:
+                self.expiry[key] = now + ex
+                heapq.heappush(self._heap, (now + ex, key))
+            return True
+
+    def delete(self, *keys) -> int:
+        with self._lock:
+            removed = 0
+            for key in keys:
+                if self.data.pop(key, None) is not None:
+                    self.expiry.pop(key, None)
+                    removed += 1
+            return removed
+
+
+SAMPLE_TRANSCRIPT = """Agent: Hey, how'd it go at the appointment?
+User: Good. It was 4116 West Iowa Avenue.
+Agent: ARV?
+User: About 320k. Rehab's probably 45k.
+Agent: Did you make an offer?
+User: Yeah, offered 195k. Lowest they'll take is 210k.
+Agent: Why wasn't this closeable?
+User: Seller needs to talk to her brother first. Mark it warm.
+User: We're meeting again Friday at 2pm. Remind me to get a roofing quote.
+Agent: Got it, I'll add that to your calendar. You're all set. Talk soon."""
+
+SAMPLE_EXTRACTION = {
+    'stage': 'Warm',
+    'appt_status': 'Attended',
+    'appointment_attended': True,
+    'arv': 320000,
+    'rehab_cost': 45000,
+    'last_offer': 195000,
+    'lowest_accept': 210000,
+    'options_presented': True,
+    'obstacle': 'Seller needs to talk to her brother',
+    'next_step': 'Meet with seller on 12/6/2025 at 2pm',
+    'not_closeable_reason': 'Seller needs family sign-off',
+    'tasks': [{'subject': 'Get roofing quote', 'due_date': None}],
+    'events': [{'datetime': '2025-12-06T14:00:00'}],
+}
+
+
+def sample_org(opportunities: int = 50) -> dict:
+    """Fake org records: one AE user and a handful of address-named Opportunities"""
+    streets = ['W Iowa Ave', 'N 12th St', 'Main Street', 'E Oak Dr', 'S Pine Ln']
+    opps = {}
+    for i in range(opportunities):
+        number = 4116 if i == 0 else 1000 + i
+        opp_id = f'006FAKE{i:08d}'
+        opps[opp_id] = {
+            'Id': opp_id,
+            'Name': f'{number} {streets[i % len(streets)]} - Chicago',
+            'StageName': 'Appointment Set',
+            'LastModifiedDate': '2025-01-01T00:00:00.000+0000',
+            'Account': {'Name': f'Seller {i}', 'Phone': '3125550100', 'PersonMobilePhone': None},
+            'Property_Address__c': f'{number} {streets[i % len(streets)]}',
+            'Property_City__c': 'Chicago',
+            'Property_State__c': 'IL',
+            'Property_Zip__c': '60651',
+        }
+    users = {'005FAKE00000001': {'Id': '005FAKE00000001', 'Name': 'Test AE', 'Phone': '3125550199',
+                                 'MobilePhone': None, 'IsActive': True}}
+    return {'Opportunity': opps, 'User': users}
+
+
+STREET_WORDS = ('Oak', 'Pine', 'Maple', 'Cedar', 'Elm', 'Walnut', 'Chestnut', 'Spruce', 'Willow', 'Birch', 'Hickory',
+                'Magnolia', 'Washington', 'Lincoln', 'Jefferson', 'Madison', 'Monroe', 'Jackson', 'Adams', 'Grant',
+                'Franklin', 'Hamilton', 'Harrison', 'Cleveland', 'Wilson', 'Kennedy', 'Park', 'Lake', 'Hill', 'River',
+                'Forest', 'Meadow', 'Spring', 'Ridge', 'Valley', 'Sunset', 'Highland', 'Fairview', 'Prospect',
+                'Church', 'School', 'Mill', 'Market', 'Center', 'Union', 'Railroad', 'Bridge', 'Water', 'Front',
+                'Iowa', 'Ohio', 'Kansas', 'Dakota', 'Nevada', 'Vermont', 'Augusta', 'Division', 'Fullerton',
+                'Belmont', 'Diversey', 'Armitage', 'Cicero', 'Pulaski', 'Kedzie', 'Ashland', 'Halsted', 'Western',
+                'Damen', 'Racine', 'Laramie', 'Central', 'Austin', 'Harlem', 'Cermak', 'Roosevelt', 'Ogden', 'Archer')
+STREET_SUFFIXES = ('Ave', 'St', 'Rd', 'Dr', 'Ln', 'Blvd', 'Ct', 'Pl', 'Way', 'Ter', 'Pkwy', 'Cir')
+CITIES = ('Chicago', 'Cicero', 'Evanston', 'Oak Park', 'Berwyn', 'Skokie', 'Joliet', 'Aurora')
+
+
+def large_org(opportunities: int = 250000, users: int = 200, seed: int = 0) -> dict:
+    """A production-sized org: Opportunities spread over a few thousand streets, each with
+    its seller's Account, plus AE Users (a tenth of them deactivated)"""
+    rng = random.Random(seed)
+    streets = [f'{direction}{word} {suffix}' for word in STREET_WORDS for suffix in STREET_SUFFIXES
+               for direction in ('', 'N ', 'S ', 'E ', 'W ')]
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc).timestamp()
+
+    def modstamp() -> str:
+        moment = datetime.fromtimestamp(start + rng.randint(0, 300 * 86400), timezone.utc)
+        return moment.strftime('%Y-%m-%dT%H:%M:%S.000+0000')
+
+    opps, accounts, seen = {}, {}, set()
+    while len(opps) < opportunities:
+        address = f'{rng.randint(100, 9999)} {rng.choice(streets)}'
+        if address in seen:
+            continue
+        seen.add(address)
+        i = len(opps)
+        account_id, opp_id, stamp, city = f'001BULK{i:08d}', f'006BULK{i:08d}', modstamp(), rng.choice(CITIES)
+        account = {'Id': account_id, 'Name': f'Seller {i}', 'Phone': f'312{rng.randint(0, 9_999_999):07d}',
+                   'PersonMobilePhone': None, 'LastModifiedDate': stamp, 'SystemModstamp': stamp}
+        accounts[account_id] = account
+        opps[opp_id] = {
+            'Id': opp_id,
+            'Name': f'{address} - {city}',
+            'StageName': rng.choice(('Appointment Set', 'Warm', 'Hot', 'Nurture', 'Closed Lost')),
+            'AccountId': account_id,
+            'Account': account,
+            'NextStep': None,
+            'ARV__c': rng.choice((None, rng.randint(100, 600) * 1000)),
+            'Property_Address__c': address,
+            'Property_City__c': city,
+            'Property_State__c': 'IL',
+            'Property_Zip__c': f'60{rng.randint(100, 999)}',
+            'LastModifiedDate': stamp,
+            'SystemModstamp': stamp,
+        }
+    ae_users = {}
+    for i in range(users):
+        user_id, stamp = f'005BULK{i:08d}', modstamp()
+        ae_users[user_id] = {'Id': user_id, 'Name': f'AE {i}', 'Phone': f'773{i:07d}', 'MobilePhone': f'872{i:07d}',
+                             'IsActive': rng.random() >= 0.1, 'LastModifiedDate': stamp, 'SystemModstamp': stamp}
+    return {'Opportunity': opps, 'Account': accounts, 'User': ae_users}
+
+
+def sample_call_payload(call_id: str, transcript: str = SAMPLE_TRANSCRIPT) -> dict:
+    return {
+        'event': 'call_ended',
+        'call': {
+            'call_id': call_id,
+            'transcript': transcript,
+            'from_number': '+13125550100',
+            'to_number': '+13125550199',
+            'call_length': 312,
+            'recording_url': f'https://example.com/{call_id}.wav',
+        },
+    }
+
+
+SPOKEN_STREETS = {'W Iowa Ave': 'West Iowa Avenue', 'N 12th St': 'North 12th Street', 'Main Street': 'Main Street',
+                  'E Oak Dr': 'East Oak Drive', 'S Pine Ln': 'South Pine Lane'}
+
+
+def sample_corpus(calls: int, opportunities: int = 50, unmatched: float = 0.1, empty: float = 0.05,
+                  duplicates: float = 0.05, seed: int = 0) -> list:
+    """call_ended payloads for the sample_org, spread over its addresses as the AE would say them
+
+    A share of calls are about a property that isn't in the org, have no transcript,
+    or are re-sent (Retell retrying a webhook).
+    """
+    rng = random.Random(seed)
+    org = sample_org(opportunities)['Opportunity']
+    payloads = []
+    for i in range(calls):
+        if payloads and rng.random() < duplicates:
+            payloads.append(copy.deepcopy(rng.choice(payloads)))
+            continue
+        call_id = f'replay_{seed}_{i:05d}'
+        roll = rng.random()
+        if roll < empty:
+            payloads.append(sample_call_payload(call_id, transcript=''))
+            continue
+        if roll < empty + unmatched:
+            spoken = f'{rng.randint(20000, 29999)} North Nowhere Road'
+        else:
+            address = rng.choice(list(org.values()))['Property_Address__c']
+            number, street = address.split(' ', 1)
+            spoken = f'{number} {SPOKEN_STREETS[street]}'
+        payloads.append(sample_call_payload(call_id, SAMPLE_TRANSCRIPT.replace('4116 West Iowa Avenue', spoken)))
+    # Spread the calls over the last 90 days, oldest first
+    now_ms = int(time.time() * 1000)
+    for i, payload in enumerate(payloads):
+        payload['call'].setdefault('start_timestamp', now_ms - (calls - i) * 90 * 86400 * 1000 // calls)
+    return payloads
+
+
+def corpus_responder(kwargs: dict):
+    """Like debrief_responder, but with the property address the transcript mentions"""
+    transcript = _text(kwargs['messages'][-1]['content'])
+    match = re.search(r'It was (\d+ [^.\n]+)\.', transcript)
+    address = match.group(1) if match else None
+    if kwargs.get('tools'):
+        return dict(property_address=address, **SAMPLE_EXTRACTION)
+    if kwargs.get('max_tokens', 0) <= 100:
+        return address or 'NONE'
+    return json.dumps(SAMPLE_EXTRACTION)
+
+
+def debrief_responder(kwargs: dict):
+    """Recorded Claude replies for the address, field and single-pass extraction prompts"""
+    if kwargs.get('tools'):
+        # Claude fills tool input in schema order, address first
+        return dict(property_address='4116 W Iowa Ave', **SAMPLE_EXTRACTION)
+    if kwargs.get('max_tokens', 0) <= 100:
+        return '4116 W Iowa Ave'
+    return json.dumps(SAMPLE_EXTRACTION)
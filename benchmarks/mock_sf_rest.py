@@ -0,0 +1,141 @@
+"""
+Local mock of the Salesforce REST API
+A requests transport adapter that answers query, sObject, composite and Bulk API
+2.0 ingest and query calls from a FakeSalesforce record store, so a real simple_salesforce
+client can be pointed at it and every HTTP round-trip counted.
+"""
+import json
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+import requests
+from requests.adapters import BaseAdapter
+from simple_salesforce import Salesforce
+
+from benchmarks.fakes import FakeSalesforce, FakeSalesforceError, FakeSObject
+from sf_session import instrument_session
+
+MOCK_INSTANCE = 'mock.my.salesforce.com'
+
+
+class MockSalesforceAdapter(BaseAdapter):
+    """Serves /services/data/vXX/... requests in-process and counts them
+
+    api_used/api_limit drive the Sforce-Limit-Info header; past the limit every
+    request gets Salesforce's 403 REQUEST_LIMIT_EXCEEDED. While outage is set,
+    requests get a 503 instead.
+    """
+
+    def __init__(self, store: FakeSalesforce, latency: float = 0.0, api_limit: int = 15000):
+        super().__init__()
+        self.store = store
+        self.latency = latency
+        self.requests = []
+        self.api_used = 0
+        self.api_limit = api_limit
+        self.outage = False
+        self._lock = threading.Lock()
+
+    def send(self, request, **kwargs):
+        url = urlparse(request.url)
+        path = url.path.split('/services/data/', 1)[1].split('/', 1)[1]
+        with self._lock:
+            self.requests.append(f'{request.method} {path.split("/")[0]}')
+            self.api_used += 1
+            api_used = self.api_used
+        if self.latency:
+            time.sleep(self.latency)
+        if self.outage:
+            return self._response(request, 503, [{'errorCode': 'SERVER_UNAVAILABLE',
+                                                  'message': 'Service temporarily unavailable'}], api_used)
+        if api_used > self.api_limit:
+            return self._response(request, 403, [{'errorCode': 'REQUEST_LIMIT_EXCEEDED',
+                                                  'message': 'TotalRequests Limit exceeded.'}], api_used)
+        body = request.body
+        if isinstance(body, bytes):
+            body = body.decode()
+        if body and 'json' in request.headers.get('Content-Type', 'application/json'):
+            body = json.loads(body)
+
+        headers = {}
+        try:
+            status, payload, *extra = self._route(request.method, path.rstrip('/'), parse_qs(url.query), body)
+            if extra:
+                headers = extra[0]
+        except FakeSalesforceError as e:
+            status, payload = e.status, e.errors
+        return self._response(request, status, payload, api_used, headers)
+
+    def _response(self, request, status: int, payload, api_used: int, headers: dict = None):
+        response = requests.Response()
+        response.status_code = status
+        response.url = request.url
+        response.request = request
+        response.headers['Sforce-Limit-Info'] = f'api-usage={api_used}/{self.api_limit}'
+        response.headers.update(headers or {})
+        if isinstance(payload, str):
+            response.headers['Content-Type'] = 'text/csv'
+            response._content = payload.encode()
+        else:
+            response.headers['Content-Type'] = 'application/json'
+            response._content = json.dumps(payload).encode() if payload is not None else b''
+        return response
+
+    def _route(self, method: str, path: str, query: dict, body) -> tuple:
+        parts = path.split('/')
+        if parts[0] == 'query' and method == 'GET':
+            if len(parts) > 1:
+                return 200, self.store.query_more(parts[1])
+            return 200, self.store.query(query['q'][0])
+        if parts[0] == 'composite' and method == 'POST':
+            return 200, self.store.composite(body)
+        if parts[0] == 'jobs' and parts[1] == 'query':
+            if len(parts) == 2 and method == 'POST':
+                return 200, self.store.create_query_job(body)
+            if len(parts) == 4 and parts[3] == 'results':
+                page, locator, count = self.store.query_results(parts[2], query.get('locator', [''])[0],
+                                                                int(query.get('maxRecords', [50000])[0]))
+                return 200, page, {'Sforce-Locator': locator, 'Sforce-NumberOfRecords': str(count)}
+            if method == 'GET':
+                return 200, self.store.query_job(parts[2])
+        if parts[0] == 'jobs' and parts[1] == 'ingest':
+            if len(parts) == 2 and method == 'POST':
+                return 200, self.store.create_ingest_job(body)
+            job_id = parts[2]
+            if len(parts) == 4 and parts[3] == 'batches' and method == 'PUT':
+                self.store.upload_ingest_data(job_id, body)
+                return 201, None
+            if len(parts) == 4 and method == 'GET':
+                return 200, self.store.ingest_results(job_id, parts[3])
+            if method == 'PATCH':
+                return 200, self.store.set_ingest_state(job_id, body['state'])
+            if method == 'GET':
+                return 200, self.store.ingest_job(job_id)
+        if parts[0] == 'sobjects':
+            sobject = FakeSObject(self.store, parts[1])
+            if method == 'POST':
+                return 201, sobject.create(body)
+            if method == 'PATCH':
+                sobject.update(parts[2], body)
+                return 204, None
+            if method == 'GET' and parts[2] == 'describe':
+                return 200, sobject.describe()
+            if method == 'GET':
+                return 200, sobject.get(parts[2])
+            if method == 'DELETE':
+                sobject.delete(parts[2])
+                return 204, None
+        return 404, [{'errorCode': 'NOT_FOUND', 'message': f'{method} {path}'}]
+
+    def close(self):
+        pass
+
+
+def mock_salesforce(records: dict = None, latency: float = 0.0, api_limit: int = 15000) -> tuple:
+    """Return (simple_salesforce client, adapter) wired to an in-process mock org"""
+    adapter = MockSalesforceAdapter(FakeSalesforce(records), latency=latency, api_limit=api_limit)
+    session = instrument_session(requests.Session())
+    session.mount(f'https://{MOCK_INSTANCE}', adapter)
+    sf = Salesforce(instance=MOCK_INSTANCE, session_id='MOCK_SESSION', session=session, version='59.0')
+    return sf, adapter
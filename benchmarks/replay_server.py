@@ -0,0 +1,63 @@
+"""
+The app wired to in-process fakes, for replaying webhooks against a real server
+
+Salesforce is the mock REST API (a real simple_salesforce client over an in-process
+transport) and Anthropic is FakeAnthropic, both with latency from REPLAY_* settings:
+
+    REPLAY_SF_LATENCY=0.05 REPLAY_LLM_SCALE=0.3 ASYNC_CALL_PROCESSING=false \
+        gunicorn -w 1 --threads 8 benchmarks.replay_server:app
+
+GET /replay/stats returns the fake API call counts of the worker that answers it
+(and its pid), so run a single worker when the totals need to be exact.
+"""
+import collections
+import os
+import sys
+
+os.environ.setdefault('JOB_QUEUE_PATH', ':memory:')
+os.environ.setdefault('IDEMPOTENCY_PATH', ':memory:')
+os.environ.setdefault('SHARED_STATE_PATH', ':memory:')
+# The recorded calls have no call_analyzed to wait for
+os.environ.setdefault('CALL_ANALYSIS_WAIT_SECONDS', '0')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import jsonify  # noqa: E402
+
+import app as poppy  # noqa: E402
+import extraction  # noqa: E402
+from benchmarks.fakes import FakeAnthropic, corpus_responder, llm_latency_model, sample_org  # noqa: E402
+from benchmarks.mock_sf_rest import mock_salesforce  # noqa: E402
+
+
+def install_fakes(sf_latency: float = 0.05, llm_scale: float = 0.3, opportunities: int = 50) -> tuple:
+    """Point the app at a mock org and a fake Claude. Returns (mock adapter, fake Anthropic client)"""
+    sf, adapter = mock_salesforce(sample_org(opportunities), latency=sf_latency)
+    poppy.get_sf_connection = lambda: sf
+    claude = FakeAnthropic(corpus_responder, latency=llm_latency_model(llm_scale))
+    extraction.claude_client = claude
+    return adapter, claude
+
+
+def stats(adapter, claude) -> dict:
+    """Fake API calls made so far, including background work (index and directory loads)"""
+    return {
+        'salesforce_requests': len(adapter.requests),
+        'salesforce_by_request': dict(collections.Counter(adapter.requests)),
+        'claude_calls': len(claude.calls),
+        'claude_usage': extraction.usage_metrics(),
+        'jobs': poppy.job_queue.counts(),
+        'pid': os.getpid(),
+    }
+
+
+adapter, claude = install_fakes(
+    sf_latency=float(os.environ.get('REPLAY_SF_LATENCY', 0.05)),
+    llm_scale=float(os.environ.get('REPLAY_LLM_SCALE', 0.3)),
+    opportunities=int(os.environ.get('REPLAY_OPPORTUNITIES', 50)),
+)
+app = poppy.app
+
+
+@app.route('/replay/stats', methods=['GET'])
+def replay_stats():
+    return jsonify(stats(adapter, claude))
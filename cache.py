@@ -0,0 +1,167 @@
+"""
+In-process caches for Salesforce reference data
+"""
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after a time-to-live
+
+    None can be stored as a value to remember that something doesn't exist
+    (negative caching); it gets its own, usually shorter, TTL.
+    """
+
+    def __init__(self, ttl: float = 3600, negative_ttl: float = 300, max_size: int = 10000):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key) -> tuple:
+        """Return (found, value). found is False on a miss or an expired entry"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                del self._entries[key]
+            self.misses += 1
+        return False, None
+
+    def put(self, key, value, ttl: float = None):
+        if ttl is None:
+            ttl = self.negative_ttl if value is None else self.ttl
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def metrics(self) -> dict:
+        return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+def normalize_phone(phone: str) -> str:
+    """Last 10 digits of a phone number - drops formatting and the +1 country code"""
+    return re.sub(r'\D', '', phone or '')[-10:]
+
+
+class PhoneUserCache:
+    """Phone number -> Salesforce User, preloaded from every active user
+
+    The directory is reloaded in the background once it is older than the TTL,
+    so AE lookups on the hot path are served from memory. Given shared (a
+    SharedState) and leader (a LeaderElection), only the leader queries
+    Salesforce; it publishes the directory and the other workers load that.
+    """
+
+    SHARED_KEY = 'user_directory'
+    # How soon a worker looks again while the leader is still loading the directory
+    FOLLOWER_RETRY = 5
+
+    def __init__(self, ttl: float = 3600, negative_ttl: float = 300, max_size: int = 10000,
+                 shared=None, leader=None):
+        self.cache = TTLCache(ttl=ttl, negative_ttl=negative_ttl, max_size=max_size)
+        self.shared = shared
+        self.leader = leader
+        self.loaded_at = None
+        self.loads = {'salesforce': 0, 'shared': 0}
+        self._loading = threading.Lock()
+
+    def preload(self, sf) -> int:
+        """Load every active user's phone numbers with one query, and publish them. Returns the number of users"""
+        results = sf.query_all("SELECT Id, Name, Phone, MobilePhone FROM User WHERE IsActive = true")
+        users = [{field: user.get(field) for field in ('Id', 'Name', 'Phone', 'MobilePhone')}
+                 for user in results['records']]
+        self.load(users)
+        self.loads['salesforce'] += 1
+        if self.shared is not None:
+            self.shared.put(self.SHARED_KEY, {'users': users, 'loaded_at': time.time()}, ttl=self.cache.ttl)
+        logger.info(f"Phone user cache loaded {len(users)} active users")
+        return len(users)
+
+    def load(self, users: list, age: float = 0):
+        """Cache users' phone numbers, as loaded age seconds ago"""
+        for user in users:
+            entry = {'Id': user['Id'], 'Name': user['Name']}
+            for field in ('Phone', 'MobilePhone'):
+                phone = normalize_phone(user.get(field))
+                if phone:
+                    self.cache.put(phone, entry, ttl=max(self.cache.ttl - age, 1))
+        self.loaded_at = time.monotonic() - age
+
+    def load_shared(self) -> bool:
+        """Load the directory another worker published, if there is one. Returns whether there was"""
+        found, directory = self.shared.get(self.SHARED_KEY)
+        if not found:
+            return False
+        # It's due for a reload when the copy is, not a full TTL after this worker took it
+        self.load(directory['users'], age=max(0.0, time.time() - directory['loaded_at']))
+        self.loads['shared'] += 1
+        return True
+
+    def refresh_in_background(self, sf_factory):
+        """Reload the directory on a background thread if it's missing or stale"""
+        if self.loaded_at is not None and time.monotonic() - self.loaded_at < self.cache.ttl:
+            return
+        if not self._loading.acquire(blocking=False):
+            return
+
+        def load():
+            try:
+                if self.shared is not None and self.load_shared():
+                    return
+                if self.leader is not None and not self.leader.is_leader():
+                    self.loaded_at = time.monotonic() - self.cache.ttl + self.FOLLOWER_RETRY
+                    return
+                self.preload(sf_factory())
+            except Exception as e:
+                logger.error(f"Phone user cache preload failed: {str(e)}")
+                # Retry on a later lookup rather than hammering a failing org
+                self.loaded_at = time.monotonic() - self.cache.ttl + 60
+            finally:
+                self._loading.release()
+
+        threading.Thread(target=load, name='phone-user-cache', daemon=True).start()
+
+    def get(self, phone: str) -> tuple:
+        return self.cache.get(normalize_phone(phone))
+
+    def put(self, phone: str, user: dict):
+        self.cache.put(normalize_phone(phone), {'Id': user['Id'], 'Name': user['Name']} if user else None)
+
+    def metrics(self) -> dict:
+        metrics = self.cache.metrics()
+        metrics['loaded_age_seconds'] = round(time.monotonic() - self.loaded_at, 1) if self.loaded_at else None
+        metrics['loads'] = dict(self.loads)
+        if self.leader is not None:
+            metrics['leader'] = self.leader.leading
+        return metrics
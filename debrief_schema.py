@@ -0,0 +1,248 @@
+"""
+Validation of the debrief Claude extracts
+The record_debrief tool schema is compiled once into FieldSpecs, and each tool input
+(or the JSON reply of the two-call fallback) is checked and coerced against them in
+a single pass: "$320k" becomes 320000, dates are normalized, picklist values are
+matched to the deployed spelling. A bad value is dropped and reported, so the rest
+of the debrief is still written.
+"""
+import json
+import math
+from dataclasses import dataclass, field
+from datetime import datetime
+
+AMOUNT_SUFFIXES = (('thousand', 1000), ('million', 1000000), ('mm', 1000000), ('k', 1000), ('m', 1000000))
+TRUE_WORDS = frozenset({'true', 'yes', 'y', '1'})
+FALSE_WORDS = frozenset({'false', 'no', 'n', '0'})
+DATE_FORMATS = ('%m/%d/%Y', '%m/%d/%y', '%Y/%m/%d', '%B %d, %Y', '%b %d, %Y')
+DATETIME_FORMATS = ('%m/%d/%Y %I:%M %p', '%m/%d/%Y %I %p', '%m/%d/%Y %H:%M', '%Y-%m-%d %I:%M %p', '%Y-%m-%d %I %p')
+
+
+def parse_amount(value):
+    """Dollar amount as a number: 320000, 320000.0, '$320,000', '320k' and '$1.2M' all work"""
+    if isinstance(value, bool):
+        raise ValueError(f'not an amount: {value!r}')
+    if isinstance(value, (int, float)):
+        number = float(value)
+    else:
+        text = str(value).strip().lower()
+        for char in '$, ':
+            text = text.replace(char, '')
+        multiplier = 1
+        for suffix, factor in AMOUNT_SUFFIXES:
+            if text.endswith(suffix):
+                text, multiplier = text[:-len(suffix)], factor
+                break
+        try:
+            number = float(text) * multiplier
+        except ValueError:
+            raise ValueError(f'not an amount: {value!r}') from None
+    if not math.isfinite(number):
+        raise ValueError(f'not an amount: {value!r}')
+    return int(number) if number.is_integer() else round(number, 2)
+
+
+def parse_bool(value) -> bool:
+    if isinstance(value, bool):
+        return value
+    word = str(value).strip().lower()
+    if word in TRUE_WORDS or word in FALSE_WORDS:
+        return word in TRUE_WORDS
+    raise ValueError(f'not true/false: {value!r}')
+
+
+def parse_choice(value, choices: tuple) -> str:
+    """The picklist value matching value, ignoring case and surrounding space"""
+    text = str(value).strip().lower()
+    for choice in choices:
+        if choice.lower() == text:
+            return choice
+    raise ValueError(f'{value!r} is not one of {", ".join(choices)}')
+
+
+def parse_date(value) -> str:
+    """YYYY-MM-DD from an ISO date or datetime, MM/DD/YYYY, or 'December 6, 2025'"""
+    text = str(value).strip()
+    try:
+        return datetime.fromisoformat(text).date().isoformat()
+    except ValueError:
+        pass
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            continue
+    raise ValueError(f'not a date: {value!r}')
+
+
+def parse_datetime(value) -> str:
+    """YYYY-MM-DDTHH:MM:SS from an ISO datetime or 'MM/DD/YYYY 2:00 PM'. A bare date is rejected"""
+    text = str(value).strip()
+    try:
+        parsed = datetime.fromisoformat(text.removesuffix('Z'))
+    except ValueError:
+        pass
+    else:
+        if len(text) <= len('YYYY-MM-DD'):
+            raise ValueError(f'no time of day in {value!r}')
+        return parsed.isoformat(timespec='seconds')
+    for fmt in DATETIME_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).isoformat(timespec='seconds')
+        except ValueError:
+            continue
+    raise ValueError(f'not a datetime: {value!r}')
+
+
+def parse_text(value) -> str:
+    if isinstance(value, (dict, list)):
+        raise ValueError(f'expected text, got {type(value).__name__}')
+    return str(value).replace('\r\n', '\n').strip() or None
+
+
+@dataclass(slots=True, frozen=True)
+class FieldError:
+    field: str
+    value: object
+    reason: str
+
+    def as_dict(self) -> dict:
+        return {'field': self.field, 'value': self.value, 'reason': self.reason}
+
+
+@dataclass(slots=True, frozen=True)
+class FieldSpec:
+    """One member of the tool schema: kind is string, integer, boolean, date, date-time, or list"""
+    name: str
+    kind: str
+    choices: tuple = ()
+    required: bool = False
+    nullable: bool = False
+    items: tuple = ()  # FieldSpecs of each list item
+
+    @property
+    def needs_value(self) -> bool:
+        return self.required and not self.nullable
+
+    def coerce(self, value):
+        """value in canonical form. Raises ValueError if it can't be made to fit"""
+        if self.kind == 'integer':
+            return parse_amount(value)
+        if self.kind == 'boolean':
+            return parse_bool(value)
+        if self.kind == 'date':
+            return parse_date(value)
+        if self.kind == 'date-time':
+            return parse_datetime(value)
+        if self.choices:
+            return parse_choice(value, self.choices)
+        return parse_text(value)
+
+
+@dataclass(slots=True)
+class Debrief:
+    """A validated debrief: the values that passed, and what was dropped and why"""
+    data: dict = field(default_factory=dict)
+    errors: list = field(default_factory=list)
+
+    def error_dicts(self) -> list:
+        return [e.as_dict() for e in self.errors]
+
+
+def _types(schema: dict) -> list:
+    types = schema.get('type', 'string')
+    return types if isinstance(types, list) else [types]
+
+
+def _kind(schema: dict) -> str:
+    kind = next((t for t in _types(schema) if t != 'null'), 'string')
+    if kind == 'string' and schema.get('format') in ('date', 'date-time'):
+        return schema['format']
+    return 'list' if kind == 'array' else kind
+
+
+def compile_schema(schema: dict) -> tuple:
+    """FieldSpecs for the properties of an object schema (and of the objects in its arrays)"""
+    required = set(schema.get('required', ()))
+    specs = []
+    for name, prop in schema.get('properties', {}).items():
+        kind = _kind(prop)
+        items = compile_schema(prop.get('items', {})) if kind == 'list' else ()
+        choices = tuple(v for v in prop.get('enum', ()) if v is not None)
+        specs.append(FieldSpec(name, kind, choices, name in required, 'null' in _types(prop), items))
+    return tuple(specs)
+
+
+def _validate_object(specs: tuple, raw: dict, path: str, errors: list) -> dict:
+    data = {}
+    for spec in specs:
+        where = f'{path}{spec.name}'
+        value = raw.get(spec.name)
+        if value is None:
+            if spec.needs_value or (spec.required and spec.name not in raw):
+                errors.append(FieldError(where, None, 'required'))
+            if spec.name in raw:
+                data[spec.name] = None
+            continue
+        if spec.kind == 'list':
+            if not isinstance(value, list):
+                errors.append(FieldError(where, value, f'expected a list, got {type(value).__name__}'))
+                continue
+            data[spec.name] = []
+            for i, item in enumerate(value):
+                if not isinstance(item, dict):
+                    errors.append(FieldError(f'{where}[{i}]', item, f'expected an object, got {type(item).__name__}'))
+                    continue
+                clean = _validate_object(spec.items, item, f'{where}[{i}].', errors)
+                # An item without a usable required member (a task with no subject, an event with no time) is dropped
+                if all(clean.get(s.name) is not None for s in spec.items if s.needs_value):
+                    data[spec.name].append(clean)
+            continue
+        try:
+            coerced = spec.coerce(value)
+        except ValueError as e:
+            errors.append(FieldError(where, value, str(e)))
+            continue
+        if coerced is None and spec.needs_value:
+            errors.append(FieldError(where, value, 'required'))
+        data[spec.name] = coerced
+    known = {spec.name for spec in specs}
+    for name in raw:
+        if name not in known:
+            errors.append(FieldError(f'{path}{name}', raw[name], 'not a debrief field'))
+    return data
+
+
+def validate(specs: tuple, raw: dict) -> Debrief:
+    """Check and coerce raw against specs, keeping every value that passes"""
+    if not isinstance(raw, dict):
+        return Debrief(errors=[FieldError('', raw, f'expected an object, got {type(raw).__name__}')])
+    errors = []
+    data = _validate_object(specs, raw, '', errors)
+    return Debrief(data, errors)
+
+
+def parse_json_object(text: str) -> dict:
+    """The first JSON object in a model reply, with or without a ```json fence. None if there isn't one"""
+    text = text.strip()
+    if text.startswith('```'):
+        text = text[3:].removeprefix('json').strip()
+        text = text.removesuffix('```').strip()
+    try:
+        value = json.loads(text)
+        if isinstance(value, dict):
+            return value
+    except json.JSONDecodeError:
+        pass
+    # Prose around the object: decode from each '{' until one parses as a whole object
+    decoder = json.JSONDecoder()
+    start = text.find('{')
+    while start != -1:
+        try:
+            value, _ = decoder.raw_decode(text, start)
+            if isinstance(value, dict):
+                return value
+        except json.JSONDecodeError:
+            pass
+        start = text.find('{', start + 1)
+    return None
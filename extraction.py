@@ -0,0 +1,536 @@
+"""
+Claude extraction of debrief data from call transcripts
+"""
+import contextvars
+import json
+import os
+import logging
+from datetime import datetime, timedelta
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import anthropic
+from debrief_schema import Debrief, compile_schema, parse_json_object, validate
+from json_stream import IncrementalObjectParser
+from metrics import LLM_REQUEST_SECONDS, LLM_TOKENS, record_llm_usage
+from sf_metadata import field_picklist, standard_value_set
+from transcripts import estimate_tokens, transcript_lines, windows
+
+logger = logging.getLogger(__name__)
+
+EXTRACTION_MODEL = "claude-sonnet-4-20250514"
+
+# Address and Opportunity fields come back from a single tool call; the old
+# two-request flow is kept as a fallback if the tool call comes back malformed
+SINGLE_PASS_EXTRACTION = os.environ.get('SINGLE_PASS_EXTRACTION', 'true').lower() != 'false'
+
+# Mark the static tool schema and system prompt cacheable so repeat record_debrief calls
+# only pay full price for the transcript
+PROMPT_CACHING = os.environ.get('PROMPT_CACHING', 'true').lower() != 'false'
+
+# Transcripts longer than this (estimated tokens) are extracted in overlapping windows,
+# side by side, and the results merged - so each request stays a bounded size
+EXTRACTION_WINDOW_TOKENS = int(os.environ.get('EXTRACTION_WINDOW_TOKENS', 30000))
+EXTRACTION_WINDOW_OVERLAP_TOKENS = int(os.environ.get('EXTRACTION_WINDOW_OVERLAP_TOKENS', 1000))
+EXTRACTION_WINDOW_WORKERS = int(os.environ.get('EXTRACTION_WINDOW_WORKERS', 4))
+
+# Anthropic client for extraction
+claude_client = anthropic.Anthropic(api_key=os.environ.get('ANTHROPIC_API_KEY'))
+
+# Picklist values come from the org metadata in force-app where it has them
+STAGE_VALUES = list(standard_value_set('OpportunityStage') or [
+    'Appointment Set', 'Warm', 'Hot', 'Nurture', 'Contract Signed', 'Closed Won', 'Closed Lost'])
+NURTURE_REASONS = list(field_picklist('Opportunity', 'Nurture_Reason__c') or [
+    '3-6 Months', '6-9 Months', '9-24 Months', 'Uncontacted', 'Cold', 'Property Currently List',
+    'Skiptrace Needed', 'SOLD', 'Check Back', 'Below Mortgage'])
+APPT_STATUSES = list(field_picklist('Opportunity', 'Appt_Status__c') or [
+    'Scheduled', 'Attended', 'No-Show', 'Cancelled', 'Rescheduled'])
+SELLER_DECLINED_VALUES = list(field_picklist('Opportunity', 'Did_Seller_Decline_Offer_Price__c') or [
+    'Yes', 'No', 'Counter Offered', 'Considering', 'No Response'])
+
+STAGE_GUIDANCE = {
+    'Appointment Set': 'appointment scheduled but not yet attended',
+    'Warm': 'interested, needs follow-up',
+    'Hot': 'very interested, likely to close soon',
+    'Nurture': 'long-term follow-up needed',
+    'Contract Signed': 'got the contract signed',
+}
+
+def _options(values: list) -> str:
+    return '[' + ', '.join(values) + ']'
+
+# Everything that doesn't change between calls - sent as a cacheable system block
+EXTRACTION_SYSTEM_PROMPT = f"""You extract structured data from sales call transcripts. An AE is debriefing Poppy about an appointment at a property.
+
+Extract the following fields (null if not mentioned):
+- stage: One of {_options(STAGE_VALUES)}
+""" + ''.join(f"  * {stage} = {STAGE_GUIDANCE[stage]}\n" for stage in STAGE_VALUES if stage in STAGE_GUIDANCE) + f"""  * DO NOT use "Appointment Attended" - this is NOT a valid stage
+- nurture_reason: Only if stage is Nurture - one of {_options(NURTURE_REASONS)}
+- appt_status: One of {_options(APPT_STATUSES)} - status of the appointment
+- appointment_attended: true/false - did the AE attend the appointment? (usually true for debrief calls)
+- ae_in_attendance: Name of the AE who attended (if mentioned)
+- arv: After Repair Value as integer (no $ or commas)
+- rehab_cost: Estimated repair costs as integer
+- last_offer: Last offer made to seller as integer
+- lowest_accept: Lowest price seller will accept as integer
+- options_presented: true/false - were purchase options presented to the seller?
+- option_notes: Notes about option presentation - what options were discussed
+- obstacle: What's preventing contract signing right now
+- property_walk_thru: Notes from the property walkthrough - condition, observations, etc.
+- seller_declined_offer: One of {_options(SELLER_DECLINED_VALUES)} - did the seller decline the offer price?
+- next_step: What happens next - ALWAYS use actual dates (e.g., "Meet on 12/6/2025 with seller for options presentation"). NEVER use relative terms like "tomorrow", "today", "next week", "Wednesday" - convert to actual MM/DD/YYYY format
+- post_appt_notes: General notes from the appointment
+- marketing_notes: Marketing-related observations
+- repair_notes: Details about property repairs needed
+- not_closeable_reason: Why did the AE leave without a signed contract? (e.g., price gap, seller needs time, competing offers, title issues, etc.) - ALWAYS populate this if no contract was signed
+- tasks: Array of tasks to create, each with "subject" and optional "due_date" (YYYY-MM-DD)
+- events: Array of calendar events to create (e.g., follow-up appointments, meetings with seller). Each event needs:
+  * "datetime": ISO format datetime (e.g., "2024-12-06T14:00:00") - MUST include specific time
+  * "location": Optional - only if AE specifies a different location than the property
+
+IMPORTANT:
+- Convert dollar amounts to integers (e.g., "320k" = 320000, "$195,000" = 195000)
+- For stage: ONLY extract if the AE explicitly states the stage (e.g., "this is a hot lead", "put them in nurture", "mark it warm"). Do NOT guess or infer the stage - return null if not explicitly mentioned.
+- Extract emotional/motivation details into appropriate notes fields
+- If no contract was signed at the appointment, ALWAYS extract not_closeable_reason - what prevented the close?
+- next_step is REQUIRED - always extract what happens next
+- Convert ALL relative dates to actual dates using the date reference given with the transcript
+"""
+
+def system_prompt():
+    """The static system prompt, marked for prompt caching when enabled"""
+    if not PROMPT_CACHING:
+        return EXTRACTION_SYSTEM_PROMPT
+    return [{'type': 'text', 'text': EXTRACTION_SYSTEM_PROMPT, 'cache_control': {'type': 'ephemeral'}}]
+
+def date_anchors(today: datetime = None) -> str:
+    """Today's date and the coming week, for resolving "tomorrow", "Friday" and so on"""
+    today = today or datetime.now()
+    week = ', '.join(f"{day:%A} = {day:%m/%d/%Y}" for day in (today + timedelta(days=i) for i in range(1, 8)))
+    return f"Today is {today:%A %m/%d/%Y}. Tomorrow = {today + timedelta(days=1):%m/%d/%Y}. Coming days: {week}."
+
+# Running token totals across extraction calls, for /health
+usage_totals = {'calls': 0, 'input_tokens': 0, 'output_tokens': 0,
+                'cache_creation_input_tokens': 0, 'cache_read_input_tokens': 0}
+usage_lock = threading.Lock()
+
+# usage field -> token type label in poppy_llm_tokens_total
+TOKEN_TYPES = {'input_tokens': 'input', 'output_tokens': 'output',
+               'cache_creation_input_tokens': 'cache_write', 'cache_read_input_tokens': 'cache_read'}
+
+def record_usage(kind: str, usage):
+    """Log one call's token usage, including prompt cache reads and writes"""
+    counts = {key: getattr(usage, key, None) or 0 for key in usage_totals if key != 'calls'}
+    with usage_lock:
+        usage_totals['calls'] += 1
+        for key, value in counts.items():
+            usage_totals[key] += value
+    for key, value in counts.items():
+        LLM_TOKENS.inc(value, kind=kind, type=TOKEN_TYPES[key])
+    record_llm_usage(counts)
+    logger.info(f"Claude {kind} extraction: {counts['input_tokens']} input tokens "
+                f"(+{counts['cache_read_input_tokens']} cache read, {counts['cache_creation_input_tokens']} cache write), "
+                f"{counts['output_tokens']} output tokens")
+
+def usage_metrics() -> dict:
+    with usage_lock:
+        totals = dict(usage_totals)
+    prompt = totals['input_tokens'] + totals['cache_read_input_tokens'] + totals['cache_creation_input_tokens']
+    totals['cache_hit_ratio'] = round(totals['cache_read_input_tokens'] / prompt, 3) if prompt else None
+    return totals
+
+def extract_data_from_transcript(transcript: str, property_address: str) -> dict:
+    """Use Claude to extract structured data from conversation transcript"""
+
+    extraction_prompt = f"""{date_anchors()}
+The AE is debriefing about an appointment at {property_address}.
+
+TRANSCRIPT:
+{transcript}
+
+Return valid JSON only, no markdown formatting.
+"""
+
+    with LLM_REQUEST_SECONDS.time(kind='fields'):
+        response = claude_client.messages.create(
+            model=EXTRACTION_MODEL,
+            max_tokens=1024,
+            # No cache breakpoint: without the tool schema in front of it the system prompt
+            # is under the model's minimum cacheable prefix, so it would never be cached
+            system=EXTRACTION_SYSTEM_PROMPT,
+            messages=[
+                {"role": "user", "content": extraction_prompt}
+            ]
+        )
+    record_usage('fields', response.usage)
+
+    data = parse_json_object(response.content[0].text)
+    if data is None:
+        logger.warning("Field extraction reply had no JSON object")
+    return data or {}
+
+def extract_address_from_transcript(transcript: str) -> str:
+    """Use Claude to extract the property address from transcript"""
+    with LLM_REQUEST_SECONDS.time(kind='address'):
+        response = claude_client.messages.create(
+            model=EXTRACTION_MODEL,
+            max_tokens=100,
+            system="Extract the property address from this call transcript. Return ONLY the address (like '2922 N 12th St' or '123 Main Street'), nothing else. If no address found, return 'NONE'.",
+            messages=[
+                {"role": "user", "content": transcript}
+            ]
+        )
+    record_usage('address', response.usage)
+    address = response.content[0].text.strip()
+    return None if address == 'NONE' else address
+
+def _nullable(schema: dict, description: str) -> dict:
+    schema = dict(schema, description=description)
+    if 'enum' in schema:
+        schema['enum'] = schema['enum'] + [None]
+    schema['type'] = [schema['type'], 'null']
+    return schema
+
+# JSON schema for the record_debrief tool - one property per extracted field
+DEBRIEF_TOOL = {
+    'name': 'record_debrief',
+    'description': 'Record the property address and Opportunity fields from an AE debrief call.',
+    'input_schema': {
+        'type': 'object',
+        'properties': {
+            'property_address': _nullable({'type': 'string'}, "Street address of the property discussed (like '2922 N 12th St'). null if no address was given."),
+            'stage': _nullable({'type': 'string', 'enum': STAGE_VALUES}, 'Only if the AE explicitly states the stage ("mark it warm", "put them in nurture"). Never "Appointment Attended".'),
+            'nurture_reason': _nullable({'type': 'string', 'enum': NURTURE_REASONS}, 'Only if stage is Nurture.'),
+            'appt_status': _nullable({'type': 'string', 'enum': APPT_STATUSES}, 'Status of the appointment.'),
+            'appointment_attended': _nullable({'type': 'boolean'}, 'Did the AE attend the appointment? Usually true for debrief calls.'),
+            'ae_in_attendance': _nullable({'type': 'string'}, 'Name of the AE who attended, if mentioned.'),
+            'arv': _nullable({'type': 'integer'}, 'After Repair Value in dollars.'),
+            'rehab_cost': _nullable({'type': 'integer'}, 'Estimated repair costs in dollars.'),
+            'last_offer': _nullable({'type': 'integer'}, 'Last offer made to the seller in dollars.'),
+            'lowest_accept': _nullable({'type': 'integer'}, 'Lowest price the seller will accept in dollars.'),
+            'options_presented': _nullable({'type': 'boolean'}, 'Were purchase options presented to the seller?'),
+            'option_notes': _nullable({'type': 'string'}, 'What options were discussed.'),
+            'obstacle': _nullable({'type': 'string'}, "What's preventing contract signing right now."),
+            'property_walk_thru': _nullable({'type': 'string'}, 'Notes from the property walkthrough - layout, condition, observations.'),
+            'seller_declined_offer': _nullable({'type': 'string', 'enum': SELLER_DECLINED_VALUES}, 'Did the seller decline the offer price?'),
+            'next_step': _nullable({'type': 'string'}, 'What happens next, always with actual MM/DD/YYYY dates.'),
+            'post_appt_notes': _nullable({'type': 'string'}, 'General notes from the appointment, including seller motivation.'),
+            'marketing_notes': _nullable({'type': 'string'}, 'Marketing-related observations.'),
+            'repair_notes': _nullable({'type': 'string'}, 'Details about repairs needed.'),
+            'not_closeable_reason': _nullable({'type': 'string'}, 'Why the AE left without a signed contract. Always populate if no contract was signed.'),
+            'tasks': {
+                'type': 'array',
+                'description': 'Follow-up tasks the AE asked for.',
+                'items': {
+                    'type': 'object',
+                    'properties': {
+                        'subject': {'type': 'string'},
+                        'due_date': {'type': ['string', 'null'], 'format': 'date', 'description': 'YYYY-MM-DD'},
+                    },
+                    'required': ['subject'],
+                },
+            },
+            'events': {
+                'type': 'array',
+                'description': 'Calendar events to create, e.g. follow-up meetings with the seller.',
+                'items': {
+                    'type': 'object',
+                    'properties': {
+                        'datetime': {'type': 'string', 'format': 'date-time',
+                                     'description': 'ISO datetime with a specific time, e.g. 2024-12-06T14:00:00'},
+                        'location': {'type': ['string', 'null'], 'description': 'Only if different from the property.'},
+                    },
+                    'required': ['datetime'],
+                },
+            },
+        },
+        'required': ['property_address'],
+    },
+}
+
+# The tool schema compiled for validating what Claude returns
+DEBRIEF_FIELDS = compile_schema(DEBRIEF_TOOL['input_schema'])
+
+def validate_debrief(raw: dict) -> Debrief:
+    """Coerce a record_debrief tool input to the schema, dropping (and logging) values that don't fit"""
+    debrief = validate(DEBRIEF_FIELDS, raw)
+    if debrief.errors:
+        logger.warning(f"Dropped {len(debrief.errors)} extracted values: {debrief.error_dicts()}")
+    return debrief
+
+def is_long_transcript(transcript: str) -> bool:
+    return estimate_tokens(transcript) > EXTRACTION_WINDOW_TOKENS
+
+def extract_call_data(transcript: str, call_data: dict = None, known: dict = None) -> tuple:
+    """Extract the property address and Opportunity fields in one Claude call
+
+    Returns (property_address, extracted_data, errors) - errors lists the values
+    that failed validation and were left out. Falls back to the two-call flow if
+    single-pass extraction is disabled or the tool call is unusable. A long
+    transcript is extracted in windows (read from call_data's transcript_object
+    when it has one). known holds values already extracted elsewhere (Retell's
+    call analysis); Claude is told to skip them, and they fill what it leaves out.
+    """
+    known = known or {}
+    if is_long_transcript(transcript):
+        return with_known(extract_windowed(dict(call_data or {}, transcript=transcript)), known)
+
+    if SINGLE_PASS_EXTRACTION:
+        result = extract_debrief_single_pass(transcript, known=known)
+        if result is not None:
+            debrief = validate_debrief(result)
+            property_address = debrief.data.pop('property_address', None)
+            return with_known((property_address, debrief.data, debrief.errors), known)
+        logger.warning("Single-pass extraction returned no tool call, falling back to two-call extraction")
+
+    property_address = extract_address_from_transcript(transcript) or known.get('property_address')
+    if not property_address:
+        return None, {}, []
+    debrief = validate_debrief(dict(extract_data_from_transcript(transcript, property_address),
+                                    property_address=property_address))
+    property_address = debrief.data.pop('property_address', None)
+    return with_known((property_address, debrief.data, debrief.errors), known)
+
+def with_known(extracted: tuple, known: dict) -> tuple:
+    """extract_call_data's result with known values filling whatever Claude left empty"""
+    property_address, data, errors = extracted
+    for key, value in known.items():
+        if key == 'property_address':
+            property_address = property_address or value
+        elif data.get(key) in (None, []):
+            data[key] = value
+    return property_address, data, errors
+
+# Retell's post-call analysis: custom_analysis_data fields named like record_debrief's properties
+# are taken as extracted values. When it has all of these, the debrief needs no Claude request
+CALL_ANALYSIS_REQUIRED_FIELDS = tuple(
+    name.strip() for name in
+    os.environ.get('CALL_ANALYSIS_REQUIRED_FIELDS', 'property_address,stage,post_appt_notes,tasks,events').split(',')
+    if name.strip()
+)
+
+def analysis_debrief(call_analysis: dict) -> tuple:
+    """(Debrief, complete) from Retell's call_analysis
+
+    Only debrief fields are kept; tasks and events may be sent as JSON strings, and the
+    call summary stands in for post_appt_notes. complete means the analysis has the
+    address and every CALL_ANALYSIS_REQUIRED_FIELDS member, so Claude can be skipped.
+    """
+    call_analysis = call_analysis or {}
+    names = DEBRIEF_TOOL['input_schema']['properties']
+    raw = {k: v for k, v in (call_analysis.get('custom_analysis_data') or {}).items() if k in names}
+    for key in ('tasks', 'events'):
+        if isinstance(raw.get(key), str):
+            raw[key] = parse_json_list(raw[key])
+            if raw[key] is None:
+                del raw[key]
+    if raw.get('post_appt_notes') is None and call_analysis.get('call_summary'):
+        raw['post_appt_notes'] = call_analysis['call_summary']
+    debrief = validate(DEBRIEF_FIELDS, raw)
+    debrief.errors = [e for e in debrief.errors if e.field.split('[')[0].split('.')[0] in raw]
+    complete = bool(debrief.data.get('property_address')) and all(f in debrief.data for f in CALL_ANALYSIS_REQUIRED_FIELDS)
+    return debrief, complete
+
+def parse_json_list(text: str) -> list:
+    try:
+        value = json.loads(text) if text.strip() else []
+    except ValueError:
+        return None
+    return value if isinstance(value, list) else None
+
+def skipped_request_tokens(transcript: str, data: dict) -> dict:
+    """Estimated tokens of the record_debrief request a complete call analysis made unnecessary"""
+    prompt = EXTRACTION_SYSTEM_PROMPT + json.dumps(DEBRIEF_TOOL) + transcript
+    return {'input': estimate_tokens(prompt), 'output': estimate_tokens(json.dumps(data))}
+
+# Free-text fields where every window's notes are kept, rather than the last window's value
+NOTE_FIELDS = ('option_notes', 'property_walk_thru', 'post_appt_notes', 'marketing_notes', 'repair_notes')
+
+def merge_windows(parts: list) -> dict:
+    """One debrief from the debriefs of consecutive windows of a call
+
+    The first address wins, notes are joined, tasks and events collected without
+    repeats (windows overlap), and for anything else the latest window that
+    mentions it wins - later in the call is the more recent decision.
+    """
+    merged = {}
+    for data in parts:
+        for key, value in data.items():
+            if value is None or value == []:
+                continue
+            if key == 'property_address':
+                merged.setdefault(key, value)
+            elif key in NOTE_FIELDS:
+                notes = merged.get(key)
+                merged[key] = value if not notes else notes if value in notes else f'{notes}\n\n{value}'
+            elif key in ('tasks', 'events'):
+                items = merged.setdefault(key, [])
+                items.extend(item for item in value if item not in items)
+            else:
+                merged[key] = value
+    return merged
+
+def extract_windowed(call_data: dict) -> tuple:
+    """extract_call_data for a long call: one record_debrief call per window, merged"""
+    texts = list(windows(transcript_lines(call_data), EXTRACTION_WINDOW_TOKENS, EXTRACTION_WINDOW_OVERLAP_TOKENS))
+    logger.info(f"Long transcript: extracting {len(texts)} windows of up to {EXTRACTION_WINDOW_TOKENS} tokens")
+
+    def extract(item):
+        i, text = item
+        result = extract_debrief_single_pass(text, part=(i + 1, len(texts)))
+        return validate_debrief(result) if result is not None else None
+
+    with ThreadPoolExecutor(max_workers=max(1, min(len(texts), EXTRACTION_WINDOW_WORKERS))) as executor:
+        # Each window runs in a copy of this context so its usage counts towards the call
+        futures = [executor.submit(contextvars.copy_context().run, extract, item) for item in enumerate(texts)]
+        debriefs = [d for d in (f.result() for f in futures) if d is not None]
+    data = merge_windows([d.data for d in debriefs])
+    property_address = data.pop('property_address', None)
+    return property_address, data, [e for d in debriefs for e in d.errors]
+
+def debrief_request(transcript: str, today: datetime = None, part: tuple = None, known: dict = None) -> dict:
+    """messages.create arguments for the record_debrief tool call
+
+    today anchors relative dates - the day of the call when re-running an old one.
+    part is (n, total) when transcript is one window of a long call. known values
+    are already recorded, so Claude only needs to fill in the rest.
+    """
+    window_note = ''
+    if part:
+        window_note = (f"This is part {part[0]} of {part[1]} of a long call (parts overlap slightly). Record only what "
+                       f"this part says and use null for anything it doesn't mention.\n")
+    if known:
+        window_note += (f"These fields are already recorded - use null (or an empty list) for them unless the "
+                        f"transcript contradicts them: {json.dumps(known)}\n")
+    prompt = f"""{date_anchors(today)}
+Record the debrief from this sales call transcript using the record_debrief tool.
+{window_note}
+TRANSCRIPT:
+{transcript}
+"""
+    return tool_request(prompt)
+
+def tool_request(prompt: str) -> dict:
+    """messages.create arguments that have Claude answer prompt with a record_debrief tool call"""
+    return dict(
+        model=EXTRACTION_MODEL,
+        max_tokens=1536,
+        system=system_prompt(),
+        tools=[DEBRIEF_TOOL],
+        tool_choice={'type': 'tool', 'name': DEBRIEF_TOOL['name']},
+        messages=[
+            {"role": "user", "content": prompt}
+        ]
+    )
+
+def extract_debrief_single_pass(transcript: str, today: datetime = None, part: tuple = None,
+                                known: dict = None) -> dict:
+    """Run the record_debrief tool call. Returns the tool input, or None if Claude didn't call it"""
+    with LLM_REQUEST_SECONDS.time(kind='single_pass'):
+        response = claude_client.messages.create(**debrief_request(transcript, today, part, known))
+    record_usage('single_pass', response.usage)
+    return debrief_tool_input(response)
+
+def increment_request(state: dict, context: str, new_text: str, today: datetime = None) -> dict:
+    """messages.create arguments for folding the next stretch of a call in progress into its debrief"""
+    prompt = f"""{date_anchors(today)}
+This call is still in progress. DEBRIEF SO FAR was recorded from the earlier part of the transcript.
+Record what the NEW TRANSCRIPT adds or changes using the record_debrief tool - use null (or an empty list)
+for anything it doesn't mention, and don't repeat tasks or events already in the debrief so far.
+
+DEBRIEF SO FAR:
+{json.dumps(state)}
+
+EARLIER LINES (already recorded, for context):
+{context}
+
+NEW TRANSCRIPT:
+{new_text}
+"""
+    return tool_request(prompt)
+
+def extract_increment(state: dict, context: str, new_text: str, today: datetime = None) -> Debrief:
+    """The validated debrief of new_text, read against the debrief so far. None if Claude didn't call the tool"""
+    with LLM_REQUEST_SECONDS.time(kind='incremental'):
+        response = claude_client.messages.create(**increment_request(state, context, new_text, today))
+    record_usage('incremental', response.usage)
+    result = debrief_tool_input(response)
+    return validate_debrief(result) if result is not None else None
+
+def debrief_tool_input(message) -> dict:
+    """The record_debrief tool input of a Claude reply, or None if it didn't call the tool"""
+    for block in message.content:
+        if getattr(block, 'type', None) == 'tool_use' and block.name == DEBRIEF_TOOL['name']:
+            if isinstance(block.input, dict):
+                return block.input
+    return None
+
+# Tool input members that map onto Opportunity fields - everything but the address and the lists
+OPPORTUNITY_TOOL_FIELDS = frozenset(DEBRIEF_TOOL['input_schema']['properties']) - {'property_address', 'tasks', 'events'}
+OPPORTUNITY_TOOL_SPECS = tuple(spec for spec in DEBRIEF_FIELDS if spec.name in OPPORTUNITY_TOOL_FIELDS)
+
+def stream_debrief(transcript: str, on_address=None, on_opportunity_fields=None) -> tuple:
+    """Run the record_debrief tool call as a stream, handing out fields as they complete
+
+    on_address(address) fires once property_address is complete. on_opportunity_fields(fields)
+    fires once, as soon as every Opportunity field has arrived or Claude moves on to
+    tasks/events - or at the end of the stream if neither happened. The fields are
+    validated; values that don't fit are left out (validate_debrief on the result reports them).
+
+    Returns (tool_input, timings) - tool_input is None if Claude didn't call the tool.
+    timings has seconds from request to first token, first field, Opportunity fields
+    complete, and end of stream.
+    """
+    parser = IncrementalObjectParser()
+    timings = {}
+    fired = False
+    in_tool = False
+    started = time.perf_counter()
+
+    def elapsed():
+        return round(time.perf_counter() - started, 3)
+
+    def fire_opportunity_fields():
+        nonlocal fired
+        fired = True
+        timings['opportunity_fields_s'] = elapsed()
+        if on_opportunity_fields:
+            fields = {k: v for k, v in parser.fields.items() if k in OPPORTUNITY_TOOL_FIELDS}
+            on_opportunity_fields(validate(OPPORTUNITY_TOOL_SPECS, fields).data)
+
+    usage = None
+    stream = claude_client.messages.create(stream=True, **debrief_request(transcript))
+    for event in stream:
+        if event.type == 'message_start':
+            usage = event.message.usage
+            continue
+        if event.type == 'message_delta' and usage is not None:
+            usage.output_tokens = event.usage.output_tokens
+            continue
+        if event.type == 'content_block_start':
+            in_tool = event.content_block.type == 'tool_use' and event.content_block.name == DEBRIEF_TOOL['name']
+            continue
+        if not (in_tool and event.type == 'content_block_delta' and event.delta.type == 'input_json_delta'):
+            continue
+        timings.setdefault('first_token_s', elapsed())
+        for parsed in parser.feed(event.delta.partial_json):
+            if parsed[0] == 'key':
+                if not fired and parsed[1] in ('tasks', 'events'):
+                    fire_opportunity_fields()
+                continue
+            _, name, value = parsed
+            timings.setdefault('first_field_s', elapsed())
+            if name == 'property_address' and on_address:
+                on_address(value)
+            if not fired and OPPORTUNITY_TOOL_FIELDS <= parser.fields.keys():
+                fire_opportunity_fields()
+    timings['total_s'] = elapsed()
+    LLM_REQUEST_SECONDS.observe(timings['total_s'], kind='stream')
+    if usage is not None:
+        record_usage('stream', usage)
+
+    if not parser.done:
+        return None, timings
+    if not fired:
+        fire_opportunity_fields()
+    return parser.result(), timings
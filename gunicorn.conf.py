@@ -0,0 +1,62 @@
+"""
+Gunicorn settings for Poppy (gunicorn reads this file from the working directory)
+
+Webhooks and function calls spend nearly all their time waiting on Salesforce
+and Claude, so each worker serves several requests at once on threads; both
+clients are thread-safe (the Salesforce session is shared, the Anthropic client
+pools its connections). Workers on a host share the job queue, the idempotency
+store and SHARED_STATE_BACKEND=sqlite; across dynos, set IDEMPOTENCY_BACKEND
+and SHARED_STATE_BACKEND to redis. Background threads start on first use, after
+the fork, so the app must not be preloaded.
+
+    WEB_CONCURRENCY       workers (default: 2 per CPU + 1, as many as fit in MEMORY_AVAILABLE)
+    GUNICORN_THREADS      request threads per worker (default 8)
+    GUNICORN_WORKER_CLASS gthread (default), or gevent with the gevent package installed
+    WORKER_MEMORY_MB      memory budget per worker when sizing from MEMORY_AVAILABLE (default 256)
+
+SF_MAX_RPS applies per worker - divide the org's budget by the workers running.
+LIVE_EXTRACTION keeps each call's running debrief in the worker that got its
+transcript_updated webhooks, so it is turned off with more than one worker;
+run a single worker (WEB_CONCURRENCY=1, more GUNICORN_THREADS) to use it.
+"""
+import multiprocessing
+import os
+import sys
+
+os.environ.setdefault('SHARED_STATE_BACKEND', 'sqlite')
+
+
+def default_workers() -> int:
+    """2 per CPU + 1, but no more than fit in the dyno's memory (MEMORY_AVAILABLE, in MB, is set on Heroku)"""
+    workers = 2 * multiprocessing.cpu_count() + 1
+    memory = os.environ.get('MEMORY_AVAILABLE')
+    if memory:
+        workers = min(workers, int(memory) // int(os.environ.get('WORKER_MEMORY_MB', 256)))
+    return max(1, workers)
+
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY') or default_workers())
+# Tell the app how many workers share the traffic (it's imported after the fork)
+os.environ['WEB_CONCURRENCY'] = str(workers)
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+if worker_class == 'gevent':
+    try:
+        import gevent  # noqa: F401 - optional, only for this worker class
+    except ImportError:
+        raise ImportError("GUNICORN_WORKER_CLASS=gevent needs the gevent package (pip install gevent)") from None
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+# With gevent, concurrency per worker is its greenlets rather than threads
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 100))
+preload_app = False
+# Inline (ASYNC_CALL_PROCESSING=false) webhooks wait on the whole debrief pipeline
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+
+
+def worker_exit(server, worker):
+    # Let another worker take over the index and directory syncs straight away
+    app = sys.modules.get('app')
+    if app is not None:
+        app.resign_leadership()
@@ -0,0 +1,174 @@
+"""
+Idempotency store for Retell webhooks
+Shared across gunicorn workers and restarts so a re-sent webhook is recognized
+no matter which process receives it, and answered with the original result
+"""
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+
+logger = logging.getLogger(__name__)
+
+# Record states
+PROCESSING = 'processing'
+COMPLETED = 'completed'
+
+DEFAULT_TTL = 24 * 3600
+
+
+class IdempotencyStore(ABC):
+    """Interface: atomic check-and-set on a key, then the final result stored against it
+
+    Records are dicts with 'status' (processing/completed), 'result' and 'claimed_at'.
+    """
+
+    @abstractmethod
+    def claim(self, key: str, ttl: float = DEFAULT_TTL) -> tuple:
+        """Claim key if nobody holds it. Returns (claimed, record) - record is the existing one on a duplicate"""
+
+    @abstractmethod
+    def complete(self, key: str, result: dict, ttl: float = DEFAULT_TTL):
+        """Store the final result for a claimed key"""
+
+    @abstractmethod
+    def release(self, key: str):
+        """Drop a claim (processing failed) so the next delivery is processed again"""
+
+    @abstractmethod
+    def get(self, key: str) -> dict:
+        """The record for key, or None if there is none (or it expired)"""
+
+
+class SQLiteIdempotencyStore(IdempotencyStore):
+    """File-backed store - shared by every worker on the same dyno/host
+
+    Expired rows are ignored when read and deleted in a batch every
+    sweep_every claims, so no request pays for a full scan.
+    """
+
+    def __init__(self, path: str = ':memory:', sweep_every: int = 500):
+        self.path = path
+        self.sweep_every = sweep_every
+        self._claims = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        if path != ':memory:':
+            self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS idempotency (
+                key TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                result TEXT,
+                claimed_at REAL NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idempotency_expiry ON idempotency (expires_at)')
+
+    def claim(self, key: str, ttl: float = DEFAULT_TTL) -> tuple:
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._conn.execute('DELETE FROM idempotency WHERE key = ? AND expires_at <= ?', (key, now))
+                cursor = self._conn.execute(
+                    """INSERT OR IGNORE INTO idempotency (key, status, claimed_at, expires_at)
+                       VALUES (?, ?, ?, ?)""",
+                    (key, PROCESSING, now, now + ttl)
+                )
+                claimed = cursor.rowcount == 1
+                row = self._conn.execute('SELECT * FROM idempotency WHERE key = ?', (key,)).fetchone()
+                self._claims += 1
+                if self._claims % self.sweep_every == 0:
+                    self._conn.execute('DELETE FROM idempotency WHERE expires_at <= ?', (now,))
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        return claimed, self._record(row)
+
+    def complete(self, key: str, result: dict, ttl: float = DEFAULT_TTL):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """INSERT INTO idempotency (key, status, result, claimed_at, expires_at) VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT(key) DO UPDATE SET status = excluded.status, result = excluded.result,
+                                                  expires_at = excluded.expires_at""",
+                (key, COMPLETED, json.dumps(result), now, now + ttl)
+            )
+
+    def release(self, key: str):
+        with self._lock:
+            self._conn.execute('DELETE FROM idempotency WHERE key = ?', (key,))
+
+    def get(self, key: str) -> dict:
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT * FROM idempotency WHERE key = ? AND expires_at > ?', (key, time.time())
+            ).fetchone()
+        return self._record(row) if row else None
+
+    @staticmethod
+    def _record(row) -> dict:
+        return {
+            'status': row['status'],
+            'result': json.loads(row['result']) if row['result'] else None,
+            'claimed_at': row['claimed_at'],
+        }
+
+
+class RedisIdempotencyStore(IdempotencyStore):
+    """Store backed by Redis (or anything with its get/set/delete interface) - shared across dynos
+
+    claim is a single SET NX EX, so it is atomic without a lock; expiry is left to Redis.
+    """
+
+    def __init__(self, client, prefix: str = 'poppy:idempotency:'):
+        self.client = client
+        self.prefix = prefix
+
+    def claim(self, key: str, ttl: float = DEFAULT_TTL) -> tuple:
+        record = {'status': PROCESSING, 'result': None, 'claimed_at': time.time()}
+        if self.client.set(self.prefix + key, json.dumps(record), nx=True, ex=math.ceil(ttl)):
+            return True, record
+        existing = self.get(key)
+        if existing is None:
+            # Expired between SET and GET - try once more
+            return self.claim(key, ttl)
+        return False, existing
+
+    def complete(self, key: str, result: dict, ttl: float = DEFAULT_TTL):
+        existing = self.get(key)
+        record = {
+            'status': COMPLETED,
+            'result': result,
+            'claimed_at': existing['claimed_at'] if existing else time.time(),
+        }
+        self.client.set(self.prefix + key, json.dumps(record), ex=math.ceil(ttl))
+
+    def release(self, key: str):
+        self.client.delete(self.prefix + key)
+
+    def get(self, key: str) -> dict:
+        value = self.client.get(self.prefix + key)
+        return json.loads(value) if value else None
+
+
+def store_from_env() -> IdempotencyStore:
+    """Build the store selected by IDEMPOTENCY_BACKEND (sqlite, or redis via REDIS_URL)"""
+    backend = os.environ.get('IDEMPOTENCY_BACKEND', 'sqlite').lower()
+    if backend == 'redis':
+        try:
+            import redis  # only needed for this backend
+        except ImportError:
+            raise ImportError("IDEMPOTENCY_BACKEND=redis needs the redis package (pip install redis)") from None
+        return RedisIdempotencyStore(redis.Redis.from_url(os.environ['REDIS_URL']))
+    if backend != 'sqlite':
+        raise ValueError(f"Unknown IDEMPOTENCY_BACKEND: {backend}")
+    return SQLiteIdempotencyStore(os.environ.get('IDEMPOTENCY_PATH', 'idempotency.sqlite3'))
@@ -0,0 +1,339 @@
+"""
+Durable job queue for Retell webhook processing
+SQLite-backed so queued calls survive a worker restart, drained by a small
+thread pool with retry/backoff for transient Salesforce/Anthropic failures
+"""
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Job states
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+
+class JobQueue:
+    """SQLite-backed queue of call payloads, one job per call_id"""
+
+    def __init__(self, path: str = ':memory:', visibility_timeout: float = 300):
+        self.path = path
+        # Running jobs whose worker hasn't sent a heartbeat for this long are assumed
+        # orphaned (worker died) and re-queued
+        self.visibility_timeout = visibility_timeout
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        if path != ':memory:':
+            self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                call_id TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                next_run_at REAL NOT NULL,
+                locked_at REAL,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                priority INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        columns = {row['name'] for row in self._conn.execute('PRAGMA table_info(jobs)')}
+        if 'priority' not in columns:
+            # Queue files from before job priorities
+            self._conn.execute('ALTER TABLE jobs ADD COLUMN priority INTEGER NOT NULL DEFAULT 0')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, next_run_at)')
+
+    def enqueue(self, call_id: str, payload: dict, max_attempts: int = 5, delay: float = 0,
+                priority: int = 0) -> tuple:
+        """Add a job for call_id, ready after delay seconds. Returns (job, created) - created is False for duplicates
+
+        A job that failed for good is started over with the new payload, so a
+        re-sent call is processed again rather than reported as a duplicate.
+        Ready jobs with a higher priority are claimed first.
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                """INSERT INTO jobs
+                   (call_id, payload, status, max_attempts, next_run_at, created_at, updated_at, priority)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(call_id) DO UPDATE SET payload = excluded.payload, status = excluded.status,
+                       attempts = 0, max_attempts = excluded.max_attempts, next_run_at = excluded.next_run_at,
+                       locked_at = NULL, result = NULL, error = NULL, updated_at = excluded.updated_at,
+                       priority = excluded.priority
+                   WHERE jobs.status = ?""",
+                (call_id, json.dumps(payload), QUEUED, max_attempts, now + delay, now, now, priority, FAILED)
+            )
+            created = cursor.rowcount == 1
+        return self.get(call_id), created
+
+    def claim(self, min_priority: int = None) -> dict:
+        """Atomically take the next ready job and mark it running, or return None
+
+        Higher priorities go first; with min_priority, lower ones are left for other workers.
+        """
+        now = time.time()
+        priority, params = (' AND priority >= ?', (min_priority,)) if min_priority is not None else ('', ())
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._conn.execute(
+                    f"""SELECT call_id FROM jobs
+                        WHERE ((status = ? AND next_run_at <= ?)
+                           OR (status = ? AND locked_at < ?)){priority}
+                        ORDER BY priority DESC, next_run_at LIMIT 1""",
+                    (QUEUED, now, RUNNING, now - self.visibility_timeout, *params)
+                ).fetchone()
+                if not row:
+                    self._conn.execute('COMMIT')
+                    return None
+                self._conn.execute(
+                    """UPDATE jobs SET status = ?, attempts = attempts + 1, locked_at = ?, updated_at = ?
+                       WHERE call_id = ?""",
+                    (RUNNING, now, now, row['call_id'])
+                )
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        return self.get(row['call_id'], include_payload=True)
+
+    def heartbeat(self, call_id: str, attempt: int) -> bool:
+        """Keep a running job from being reclaimed. Returns False if attempt no longer holds it"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                """UPDATE jobs SET locked_at = ?, updated_at = ? WHERE call_id = ? AND status = ? AND attempts = ?""",
+                (now, now, call_id, RUNNING, attempt)
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, call_id: str, result: dict, attempt: int = None) -> bool:
+        """Mark a job as succeeded and store its result
+
+        With attempt (as claimed), only if that attempt still holds the job; the
+        same goes for fail, retry and park. Returns whether the job was updated.
+        """
+        return self._finish(call_id, SUCCEEDED, result=json.dumps(result), attempt=attempt)
+
+    def fail(self, call_id: str, error: str, attempt: int = None) -> bool:
+        """Mark a job as permanently failed"""
+        return self._finish(call_id, FAILED, error=error, attempt=attempt)
+
+    def retry(self, call_id: str, error: str, delay: float, attempt: int = None) -> bool:
+        """Put a job back on the queue to run again after delay seconds"""
+        now = time.time()
+        owned, params = self._owned_by(attempt)
+        with self._lock:
+            cursor = self._conn.execute(
+                f"""UPDATE jobs SET status = ?, next_run_at = ?, locked_at = NULL, error = ?, updated_at = ?
+                    WHERE call_id = ?{owned}""",
+                (QUEUED, now + delay, error, now, call_id, *params)
+            )
+        return cursor.rowcount == 1
+
+    def amend(self, call_id: str, payload: dict) -> bool:
+        """Replace a job's payload and make it ready now, if it is still waiting to run. Returns whether it was"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                """UPDATE jobs SET payload = ?, next_run_at = MIN(next_run_at, ?), updated_at = ?
+                   WHERE call_id = ? AND status = ?""",
+                (json.dumps(payload), now, now, call_id, QUEUED)
+            )
+        return cursor.rowcount == 1
+
+    def park(self, call_id: str, error: str, delay: float, attempt: int = None) -> bool:
+        """Like retry, but the attempt that was just claimed doesn't count towards max_attempts"""
+        now = time.time()
+        owned, params = self._owned_by(attempt)
+        with self._lock:
+            cursor = self._conn.execute(
+                f"""UPDATE jobs SET status = ?, attempts = MAX(attempts - 1, 0), next_run_at = ?, locked_at = NULL,
+                    error = ?, updated_at = ? WHERE call_id = ?{owned}""",
+                (QUEUED, now + delay, error, now, call_id, *params)
+            )
+        return cursor.rowcount == 1
+
+    def _owned_by(self, attempt: int) -> tuple:
+        """WHERE clause (and its parameters) limiting an update to the job as claimed by attempt"""
+        if attempt is None:
+            return '', ()
+        return ' AND status = ? AND attempts = ?', (RUNNING, attempt)
+
+    def _finish(self, call_id: str, status: str, result: str = None, error: str = None, attempt: int = None) -> bool:
+        now = time.time()
+        owned, params = self._owned_by(attempt)
+        with self._lock:
+            cursor = self._conn.execute(
+                f"""UPDATE jobs SET status = ?, result = ?, error = ?, locked_at = NULL, updated_at = ?
+                    WHERE call_id = ?{owned}""",
+                (status, result, error, now, call_id, *params)
+            )
+        return cursor.rowcount == 1
+
+    def get(self, call_id: str, include_payload: bool = False) -> dict:
+        """Return the job record for call_id, or None"""
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM jobs WHERE call_id = ?', (call_id,)).fetchone()
+        if not row:
+            return None
+        job = {
+            'call_id': row['call_id'],
+            'status': row['status'],
+            'attempts': row['attempts'],
+            'max_attempts': row['max_attempts'],
+            'priority': row['priority'],
+            'next_run_at': row['next_run_at'],
+            'result': json.loads(row['result']) if row['result'] else None,
+            'error': row['error'],
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at'],
+        }
+        if include_payload:
+            job['payload'] = json.loads(row['payload'])
+        return job
+
+    def counts(self) -> dict:
+        """Number of jobs in each state"""
+        with self._lock:
+            rows = self._conn.execute('SELECT status, COUNT(*) AS n FROM jobs GROUP BY status').fetchall()
+        return {row['status']: row['n'] for row in rows}
+
+
+class JobWorkerPool:
+    """Bounded pool of threads draining a JobQueue
+
+    handler(payload) returns a JSON-serializable result dict. Exceptions for which
+    is_transient(exc) is true are retried with exponential backoff; anything else
+    fails the job immediately. on_failure(payload, exc) is called once a job has
+    failed for good. retry_after(exc) may return a delay in seconds to park the job
+    for instead, without using up an attempt - for outages that retrying can't fix.
+    With min_priority, the pool only takes jobs of at least that priority, so they
+    never wait behind the rest.
+
+    While a handler runs, its job's lock is renewed every third of the queue's
+    visibility timeout, so only a job whose worker has gone is claimed again.
+    """
+
+    def __init__(self, queue: JobQueue, handler, size: int = 2, is_transient=None, on_failure=None,
+                 retry_after=None, backoff_base: float = 2.0, backoff_max: float = 300.0,
+                 poll_interval: float = 1.0, min_priority: int = None, name: str = 'job-worker'):
+        self.queue = queue
+        self.handler = handler
+        self.size = size
+        self.is_transient = is_transient or (lambda exc: False)
+        self.on_failure = on_failure
+        self.retry_after = retry_after or (lambda exc: None)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.poll_interval = poll_interval
+        self.min_priority = min_priority
+        self.name = name
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+
+    def start(self):
+        if self._threads:
+            return
+        self._stopping.clear()
+        for i in range(self.size):
+            thread = threading.Thread(target=self._run, name=f'{self.name}-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Started {self.size} {self.name}s")
+
+    def stop(self, timeout: float = 10):
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def notify(self):
+        """Wake idle workers after a new job is enqueued"""
+        self._wakeup.set()
+
+    def backoff(self, attempts: int) -> float:
+        """Delay before the next attempt - exponential with jitter"""
+        delay = min(self.backoff_max, self.backoff_base * (2 ** (attempts - 1)))
+        return delay * random.uniform(0.5, 1.0)
+
+    def run_once(self) -> bool:
+        """Process a single ready job. Returns False if the queue had nothing ready"""
+        job = self.queue.claim(self.min_priority)
+        if not job:
+            return False
+
+        call_id = job['call_id']
+        attempt = job['attempts']
+        running = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(call_id, attempt, running),
+                                     name=f'job-heartbeat-{call_id}', daemon=True)
+        heartbeat.start()
+        try:
+            result = self.handler(job['payload'])
+        except Exception as e:
+            running.set()
+            self._handle_failure(job, e)
+        else:
+            running.set()
+            if self.queue.complete(call_id, result, attempt=attempt):
+                logger.info(f"Job {call_id} succeeded on attempt {attempt}")
+            else:
+                logger.warning(f"Job {call_id} attempt {attempt} finished after losing its lock; result not stored")
+        return True
+
+    def _handle_failure(self, job: dict, exc: Exception):
+        call_id = job['call_id']
+        attempt = job['attempts']
+        error = f"{type(exc).__name__}: {exc}"
+        park = self.retry_after(exc)
+        if park is not None:
+            if self.queue.park(call_id, error, park, attempt=attempt):
+                logger.warning(f"Job {call_id} parked for {park:.1f}s ({error})")
+                return
+        elif self.is_transient(exc) and attempt < job['max_attempts']:
+            delay = self.backoff(attempt)
+            if self.queue.retry(call_id, error, delay, attempt=attempt):
+                logger.warning(f"Job {call_id} attempt {attempt} failed ({error}), retrying in {delay:.1f}s")
+                return
+        elif self.queue.fail(call_id, error, attempt=attempt):
+            logger.error(f"Job {call_id} failed after {attempt} attempts: {error}")
+            if self.on_failure:
+                self.on_failure(job['payload'], exc)
+            return
+        # Another worker claimed the job while this one was stuck; it decides how the job ends
+        logger.warning(f"Job {call_id} attempt {attempt} failed after losing its lock: {error}")
+
+    def _heartbeat(self, call_id: str, attempt: int, running: threading.Event):
+        interval = self.queue.visibility_timeout / 3
+        while not running.wait(interval):
+            try:
+                if not self.queue.heartbeat(call_id, attempt):
+                    logger.warning(f"Job {call_id} attempt {attempt} lost its lock")
+                    return
+            except Exception as e:
+                logger.error(f"Job {call_id} heartbeat error: {str(e)}")
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                if self.run_once():
+                    continue
+            except Exception as e:
+                logger.error(f"Job worker error: {str(e)}")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
@@ -0,0 +1,88 @@
+"""
+Incremental parser for a streamed JSON object
+Reports each top-level member as soon as its value is complete, so callers can
+act on early fields while the rest of the object is still arriving
+"""
+import json
+
+
+class IncrementalObjectParser:
+    """Feed chunks of one JSON object; get back ('key', name) and ('field', name, value) events
+
+    A 'key' event fires when a top-level member's name has been read, a 'field'
+    event when its value is complete. Only top-level boundaries are tracked -
+    nested objects and arrays are decoded whole once their member ends.
+    """
+
+    def __init__(self):
+        self.fields = {}
+        self.done = False
+        self._buffer = ''
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._member_start = None
+        self._key = None
+
+    def feed(self, chunk: str) -> list:
+        """Consume the next chunk and return the events it completed"""
+        events = []
+        if self.done:
+            return events
+        self._buffer += chunk
+        buffer = self._buffer
+        pos = self._pos
+        depth = self._depth
+        in_string = self._in_string
+        escaped = self._escaped
+
+        while pos < len(buffer):
+            ch = buffer[pos]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif ch == '\\':
+                    escaped = True
+                elif ch == '"':
+                    in_string = False
+            elif ch == '"':
+                in_string = True
+            elif ch in '{[':
+                depth += 1
+                if depth == 1:
+                    self._member_start = pos + 1
+            elif ch in '}]':
+                depth -= 1
+                if depth == 0:
+                    self._end_member(buffer[self._member_start:pos], events)
+                    self.done = True
+                    break
+            elif depth == 1 and ch == ':':
+                self._key = json.loads(buffer[self._member_start:pos])
+                events.append(('key', self._key))
+            elif depth == 1 and ch == ',':
+                self._end_member(buffer[self._member_start:pos], events)
+                self._member_start = pos + 1
+            pos += 1
+
+        self._pos = pos
+        self._depth = depth
+        self._in_string = in_string
+        self._escaped = escaped
+        return events
+
+    def _end_member(self, text: str, events: list):
+        if not text.strip():
+            return
+        member = json.loads('{' + text + '}')
+        for name, value in member.items():
+            self.fields[name] = value
+            events.append(('field', name, value))
+        self._key = None
+
+    def result(self) -> dict:
+        """The complete object - raises ValueError if the stream ended early"""
+        if not self.done:
+            raise ValueError('JSON object is incomplete')
+        return self.fields
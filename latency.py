@@ -0,0 +1,53 @@
+"""
+Latency percentiles per operation
+Keeps a bounded window of recent samples per name for p50/p99 reporting
+"""
+import math
+import threading
+from collections import deque
+
+
+def percentile(samples: list, pct: float) -> float:
+    """Nearest-rank percentile of a list of numbers (pct in 0-100)"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class LatencyTracker:
+    """Recent latencies per name, with p50/p99 and how often a budget was exceeded"""
+
+    def __init__(self, window: int = 1000, budget: float = None):
+        self.window = window
+        self.budget = budget
+        self._samples = {}
+        self._counts = {}
+        self._over_budget = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float):
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = deque(maxlen=self.window)
+            samples.append(seconds)
+            self._counts[name] = self._counts.get(name, 0) + 1
+            if self.budget is not None and seconds > self.budget:
+                self._over_budget[name] = self._over_budget.get(name, 0) + 1
+
+    def summary(self) -> dict:
+        with self._lock:
+            snapshot = {name: list(samples) for name, samples in self._samples.items()}
+            counts = dict(self._counts)
+            over_budget = dict(self._over_budget)
+        return {
+            name: {
+                'count': counts[name],
+                'p50_ms': round(percentile(samples, 50) * 1000, 1),
+                'p99_ms': round(percentile(samples, 99) * 1000, 1),
+                'over_budget': over_budget.get(name, 0),
+            }
+            for name, samples in snapshot.items()
+        }
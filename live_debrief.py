@@ -0,0 +1,118 @@
+"""
+Debrief extraction while the call is still going
+Retell's transcript_updated webhooks carry the transcript so far. A LiveDebrief
+keeps a running debrief for the call and folds each new stretch of utterances
+into it with a short incremental extraction, and looks up the Opportunity as soon
+as an address is mentioned, so when the call ends only the last few utterances
+are left to reconcile.
+"""
+import threading
+import time
+
+from addresses import normalize_address
+from extraction import merge_windows
+from transcripts import estimate_tokens
+
+
+class LiveDebrief:
+    """Running debrief of one call in progress
+
+    extract(state, context, new_text) returns a validated Debrief of what new_text
+    adds (or None), as extraction.extract_increment does. Mid-call, new lines are
+    folded in once there are at least min_new_tokens of them; context_lines already
+    covered lines are sent along so a reply like "yes, make it Friday" makes sense.
+    """
+
+    def __init__(self, call_id: str, min_new_tokens: int = 200, context_lines: int = 4):
+        self.call_id = call_id
+        self.min_new_tokens = min_new_tokens
+        self.context_lines = context_lines
+        self.lines = []  # the settled transcript lines seen so far
+        self.covered = 0  # how many of them the debrief includes
+        self.covering = 0  # how many it will include once the running extraction finishes
+        self.data = {}
+        self.errors = []
+        self.extractions = 0
+        self.candidates = None  # Opportunity candidates for the address in data
+        self.updated_at = time.monotonic()
+        self._address_key = None
+        self._extracting = threading.Lock()
+        self._lock = threading.Lock()
+
+    def observe(self, lines: list, final: bool = False):
+        """Record the transcript so far. Mid-call the last utterance may still be in progress, so it's held back"""
+        settled = lines if final else lines[:-1]
+        with self._lock:
+            if final or len(settled) > len(self.lines):
+                self.lines = settled
+                self.updated_at = time.monotonic()
+
+    def pending(self) -> list:
+        with self._lock:
+            return self.lines[self.covered:]
+
+    def covered_tokens(self) -> int:
+        """Estimated tokens of transcript the debrief includes, counting an extraction still running"""
+        with self._lock:
+            covered = max(self.covered, self.covering)
+            return estimate_tokens('\n'.join(self.lines[:covered])) if covered else 0
+
+    def ready(self) -> bool:
+        """Whether enough new transcript has come in to be worth an extraction"""
+        pending = self.pending()
+        return bool(pending) and estimate_tokens('\n'.join(pending)) >= self.min_new_tokens
+
+    def advance(self, extract, final: bool = False, timeout: float = None) -> bool:
+        """Fold the pending lines into the debrief. Returns whether an extraction ran
+
+        Mid-call this is skipped while another extraction for the call is running - the
+        next update catches up. The final pass waits for it, then takes whatever is left.
+        """
+        if not self._extracting.acquire(blocking=final, timeout=timeout if final and timeout is not None else -1):
+            return False
+        try:
+            with self._lock:
+                lines, covered = self.lines, self.covered
+            new = lines[covered:]
+            if not new or (not final and estimate_tokens('\n'.join(new)) < self.min_new_tokens):
+                return False
+            with self._lock:
+                self.covering = len(lines)
+            context = '\n'.join(lines[max(0, covered - self.context_lines):covered])
+            try:
+                debrief = extract(dict(self.data), context, '\n'.join(new))
+            except Exception:
+                # Those lines are still pending - don't count them as covered
+                with self._lock:
+                    self.covering = self.covered
+                raise
+            self.extractions += 1
+            if debrief is not None:
+                self.data = merge_windows([self.data, debrief.data])
+                self.errors.extend(debrief.errors)
+            with self._lock:
+                self.covered = len(lines)
+            return True
+        finally:
+            self._extracting.release()
+
+    def resolve(self, search) -> bool:
+        """Look up the Opportunity with search(address) -> candidates once an address is known.
+        Returns whether a lookup ran"""
+        address = self.data.get('property_address')
+        if not address or normalize_address(address) == self._address_key:
+            return False
+        self.candidates = search(address)
+        self._address_key = normalize_address(address)
+        return True
+
+    def candidates_for(self, address: str) -> list:
+        """The candidates found mid-call, if they were for this address, else None"""
+        if address and self._address_key == normalize_address(address):
+            return self.candidates
+        return None
+
+    def result(self) -> tuple:
+        """(property_address, data, errors), as extraction.extract_call_data returns them"""
+        data = dict(self.data)
+        return data.pop('property_address', None), data, list(self.errors)
@@ -0,0 +1,228 @@
+"""
+Prometheus-format metrics
+Counters and histograms for external calls (Salesforce, Claude), pipeline stages
+and webhooks, plus collectors that expose the /health metrics of the caches and
+queues, all rendered by GET /metrics
+"""
+import contextvars
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(labelnames: tuple, values: tuple, extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        return self._values.get(key, 0)
+
+    def render(self) -> list:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f'{self.name}{_labels(self.labelnames, key)} {_number(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['counts'][i] += 1
+                    break
+            series['sum'] += value
+            series['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe how long the block takes - failures included"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> list:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = sorted((key, {'counts': list(s['counts']), 'sum': s['sum'], 'count': s['count']})
+                           for key, s in self._series.items())
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series['counts']):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, key)} {_number(series["sum"])}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, key)} {series["count"]}')
+        return lines
+
+
+class Registry:
+    """Holds metrics and collectors and renders them in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, name: str, documentation: str, kind: str, fn):
+        """A metric read at scrape time: fn() returns [(labels dict, value), ...]"""
+        self._collectors.append((name, documentation, kind, fn))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for name, documentation, kind, fn in self._collectors:
+            lines.extend([f'# HELP {name} {documentation}', f'# TYPE {name} {kind}'])
+            for labels, value in fn():
+                if value is None:
+                    continue
+                names = tuple(labels)
+                lines.append(f'{name}{_labels(names, tuple(labels[n] for n in names))} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+SALESFORCE_REQUEST_SECONDS = REGISTRY.histogram(
+    'poppy_salesforce_request_seconds', 'Salesforce HTTP requests by operation', ('operation', 'status'))
+LLM_REQUEST_SECONDS = REGISTRY.histogram(
+    'poppy_llm_request_seconds', 'Claude requests by kind', ('kind',))
+LLM_TOKENS = REGISTRY.counter(
+    'poppy_llm_tokens_total', 'Claude tokens by kind and type (input, output, cache_read, cache_write)', ('kind', 'type'))
+STAGE_SECONDS = REGISTRY.histogram(
+    'poppy_stage_seconds', 'Debrief pipeline stages', ('stage',))
+OPPORTUNITY_SEARCH_SECONDS = REGISTRY.histogram(
+    'poppy_opportunity_search_seconds', 'Opportunity address search steps', ('step',))
+WEBHOOK_SECONDS = REGISTRY.histogram(
+    'poppy_call_processing_seconds', 'End-to-end call_ended processing by result status', ('status',))
+WEBHOOK_SALESFORCE_REQUESTS = REGISTRY.histogram(
+    'poppy_call_salesforce_requests', 'Salesforce API requests per processed call', (),
+    buckets=(1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 30, 50))
+FUNCTION_SECONDS = REGISTRY.histogram(
+    'poppy_function_call_seconds', 'Mid-call Retell function calls', ('function',))
+OPPORTUNITY_FIELDS = REGISTRY.counter(
+    'poppy_opportunity_fields_total', 'Opportunity field values in debrief writes by outcome (changed, unchanged, rejected)',
+    ('outcome',))
+OPPORTUNITY_WRITES_SKIPPED = REGISTRY.counter(
+    'poppy_opportunity_writes_skipped_total', 'Opportunity updates not sent because no field changed')
+SALESFORCE_THROTTLED = REGISTRY.counter(
+    'poppy_salesforce_throttled_total', 'Salesforce requests held back by the client-side rate limit')
+SALESFORCE_REJECTED = REGISTRY.counter(
+    'poppy_salesforce_rejected_total', 'Salesforce requests not sent, by reason (circuit_open, rate_limited)', ('reason',))
+SALESFORCE_FAILURES = REGISTRY.counter(
+    'poppy_salesforce_failures_total', 'Salesforce responses counted by the circuit breaker, by kind '
+    '(limit_exceeded, server_error, connection)', ('kind',))
+CALL_ANALYZED_EVENTS = REGISTRY.counter(
+    'poppy_call_analyzed_total', 'call_analyzed webhooks by outcome (coalesced into the queued call, queued, late)',
+    ('outcome',))
+LLM_REQUESTS_SAVED = REGISTRY.counter(
+    'poppy_llm_requests_saved_total', "Claude extraction requests skipped because Retell's call analysis covered the debrief")
+LLM_TOKENS_SAVED = REGISTRY.counter(
+    'poppy_llm_tokens_saved_total', "Estimated Claude tokens not spent thanks to Retell's call analysis, by type "
+    '(input, output)', ('type',))
+JOBS_PARKED = REGISTRY.counter(
+    'poppy_jobs_parked_total', 'Calls and writes parked in the job queue until Salesforce accepts requests again')
+
+# Salesforce requests made on behalf of the call being processed. Holds a mutable
+# dict so counts from pipeline stages on other threads (which copy the context)
+# land in the same place
+_call_requests = contextvars.ContextVar('call_salesforce_requests', default=None)
+
+
+@contextmanager
+def count_salesforce_requests():
+    """Count the Salesforce requests made inside the block, including by StageGraph stages"""
+    counts = {'requests': 0}
+    token = _call_requests.set(counts)
+    try:
+        yield counts
+    finally:
+        _call_requests.reset(token)
+
+
+# Claude requests and tokens spent on the call being processed, shared the same way
+_call_llm_usage = contextvars.ContextVar('call_llm_usage', default=None)
+
+
+@contextmanager
+def count_llm_usage():
+    """Tally the Claude requests and tokens used inside the block, including by StageGraph stages"""
+    usage = {'requests': 0, 'input_tokens': 0, 'output_tokens': 0,
+             'cache_creation_input_tokens': 0, 'cache_read_input_tokens': 0}
+    token = _call_llm_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _call_llm_usage.reset(token)
+
+
+def record_llm_usage(counts: dict):
+    usage = _call_llm_usage.get()
+    if usage is not None:
+        usage['requests'] += 1
+        for key, value in counts.items():
+            usage[key] = usage.get(key, 0) + value
+
+
+def record_salesforce_request(operation: str, status: int, seconds: float):
+    SALESFORCE_REQUEST_SECONDS.observe(seconds, operation=operation, status=status)
+    counts = _call_requests.get()
+    if counts is not None:
+        counts['requests'] += 1
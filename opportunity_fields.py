@@ -0,0 +1,180 @@
+"""
+Opportunity fields written from a debrief, and the diff against their current values
+Only fields whose value actually changes are sent, so an unchanged value doesn't
+fire flows and triggers or add field history rows, and picklist values the org
+would reject are dropped instead of failing the whole write. The same read picks
+up the Account and property fields events are built from
+"""
+import logging
+import threading
+
+from debrief_schema import parse_text
+from extraction import DEBRIEF_FIELDS
+
+logger = logging.getLogger(__name__)
+
+# Map extracted data keys to SF field API names
+OPPORTUNITY_FIELD_MAPPING = {
+    'stage': 'StageName',
+    'nurture_reason': 'Nurture_Reason__c',
+    'appt_status': 'Appt_Status__c',
+    'appointment_attended': 'Appointment_Attended__c',
+    'ae_in_attendance': 'AE_in_Attendance__c',
+    'arv': 'ARV__c',
+    'rehab_cost': 'Rehab_Cost__c',
+    'last_offer': 'Last_Offer_Made__c',
+    'lowest_accept': 'Lowest_price_seller_will_accept__c',
+    'options_presented': 'Options_Presented__c',
+    'option_notes': 'Option_Presentation_Notes__c',
+    'obstacle': 'Obstacle_to_Contract__c',
+    'property_walk_thru': 'Property_Walk_Thru__c',
+    'seller_declined_offer': 'Did_Seller_Decline_Offer_Price__c',
+    'next_step': 'NextStep',  # Standard SF field, not custom Next_Step__c
+    'post_appt_notes': 'Post_Appointment_Notes__c',
+    'marketing_notes': 'AE_Marketing_Notes__c',
+    'repair_notes': 'AE_Repair_Notes__c',
+    'not_closeable_reason': 'Why_was_this_not_closable__c',
+}
+
+
+# SF field -> FieldSpec of the tool input member written to it
+FIELD_SPECS = {OPPORTUNITY_FIELD_MAPPING[spec.name]: spec for spec in DEBRIEF_FIELDS if spec.name in OPPORTUNITY_FIELD_MAPPING}
+
+
+def normalize_value(sf_field: str, value):
+    """Value in the form Salesforce stores it. Raises ValueError if the field can't take it"""
+    if value is None:
+        return None
+    spec = FIELD_SPECS.get(sf_field)
+    return spec.coerce(value) if spec else parse_text(value)
+
+
+def build_opportunity_update(data: dict) -> dict:
+    """Map extracted data to Opportunity field values, skipping nulls"""
+    update_fields = {}
+    for key, sf_field in OPPORTUNITY_FIELD_MAPPING.items():
+        if key in data and data[key] is not None:
+            update_fields[sf_field] = data[key]
+    return update_fields
+
+
+def diff_update(current: dict, proposed: dict) -> tuple:
+    """Compare proposed field values with the record's current ones
+
+    Returns (changes, diff): the field values to send, and a report of what
+    changed (old -> new), what was already set, and what was rejected. current
+    None means the record couldn't be read, so every valid value is sent.
+    """
+    changes = {}
+    diff = {'changed': [], 'unchanged': [], 'rejected': []}
+    for field, value in proposed.items():
+        try:
+            new = normalize_value(field, value)
+        except ValueError as e:
+            diff['rejected'].append({'field': field, 'value': value, 'reason': str(e)})
+            continue
+        if new is None:
+            continue
+        if current is not None:
+            try:
+                old = normalize_value(field, current.get(field))
+            except ValueError:
+                old = current.get(field)
+            if old == new:
+                diff['unchanged'].append(field)
+                continue
+        else:
+            old = None
+        changes[field] = new
+        diff['changed'].append({'field': field, 'old': old, 'new': new})
+    if diff['rejected']:
+        logger.warning(f"Dropped invalid Opportunity values: {diff['rejected']}")
+    return changes, diff
+
+
+def merge_diffs(*diffs) -> dict:
+    """One report for an Opportunity written in several steps (later steps win a field)"""
+    merged = {'changed': {}, 'unchanged': {}, 'rejected': {}}
+    for diff in diffs:
+        if not diff:
+            continue
+        for kind in ('changed', 'rejected'):
+            for entry in diff[kind]:
+                merged[kind][entry['field']] = entry
+        for field in diff['unchanged']:
+            merged['unchanged'][field] = field
+    changed = list(merged['changed'].values())
+    unchanged = [f for f in merged['unchanged'] if f not in merged['changed']]
+    return {'changed': changed, 'unchanged': unchanged, 'rejected': list(merged['rejected'].values())}
+
+
+SNAPSHOT_FIELDS = sorted(set(OPPORTUNITY_FIELD_MAPPING.values()))
+
+
+# Event subjects, locations and descriptions. Not every org has them all - PersonMobilePhone
+# needs person accounts and the property fields are custom - so they're checked with describe
+DETAIL_FIELDS = ('Name', 'Account.Name', 'Account.Phone', 'Account.PersonMobilePhone',
+                 'Property_Address__c', 'Property_City__c', 'Property_State__c', 'Property_Zip__c')
+
+
+class FieldCapabilities:
+    """Which fields the org has, from one describe call per sObject for the life of the process"""
+
+    def __init__(self):
+        self._fields = {}
+        self._lock = threading.Lock()
+
+    def fields(self, sf, sobject: str) -> dict:
+        """Field name -> describe entry for sobject. Raises if describe fails (nothing is cached then)"""
+        with self._lock:
+            fields = self._fields.get(sobject)
+        if fields is None:
+            fields = {field['name']: field for field in getattr(sf, sobject).describe()['fields']}
+            with self._lock:
+                self._fields[sobject] = fields
+        return fields
+
+    def available(self, sf, sobject: str, paths: tuple) -> tuple:
+        """The paths (Name, Account.Phone) that can be selected from sobject"""
+        fields = self.fields(sf, sobject)
+        relationships = {field.get('relationshipName'): (field.get('referenceTo') or [None])[0]
+                         for field in fields.values() if field.get('relationshipName')}
+        available = []
+        for path in paths:
+            relationship, _, name = path.rpartition('.')
+            if not relationship:
+                ok = name in fields
+            else:
+                target = relationships.get(relationship)
+                ok = target is not None and name in self.fields(sf, target)
+            if ok:
+                available.append(path)
+            else:
+                logger.info(f"{sobject}.{path} isn't in this org, leaving it out of queries")
+        return tuple(available)
+
+    def clear(self):
+        with self._lock:
+            self._fields.clear()
+
+
+def strip_attributes(record: dict) -> dict:
+    """A query record without the 'attributes' entries, relationship records included"""
+    record.pop('attributes', None)
+    for value in record.values():
+        if isinstance(value, dict):
+            strip_attributes(value)
+    return record
+
+
+def fetch_snapshots(sf, opp_ids: list, chunk_size: int = 200, extra_fields: tuple = ()) -> dict:
+    """Current values of the mapped fields (and extra_fields) for each Opportunity, Id -> record
+    (one query per chunk)"""
+    snapshots = {}
+    fields = ', '.join(['Id'] + SNAPSHOT_FIELDS + [f for f in extra_fields if f not in SNAPSHOT_FIELDS])
+    for i in range(0, len(opp_ids), chunk_size):
+        ids = ', '.join(f"'{opp_id}'" for opp_id in opp_ids[i:i + chunk_size])
+        query = f"SELECT {fields} FROM Opportunity WHERE Id IN ({ids})"
+        for record in sf.query_all(query)['records']:
+            snapshots[record['Id']] = strip_attributes(record)
+    return snapshots
@@ -0,0 +1,100 @@
+"""
+Dependency graph of pipeline stages run on a thread pool
+Each stage is submitted the moment the stages it depends on have finished, so
+independent I/O (Salesforce login, AE lookup, Claude extraction) overlaps
+"""
+import contextvars
+import threading
+import time
+from concurrent.futures import Future
+
+from metrics import STAGE_SECONDS
+
+
+class StageGraph:
+    """Named stages on an executor, each started once its dependencies are done
+
+    fn receives the results of its deps, in order. A stage whose dependency
+    failed fails with the same exception as soon as it does, without running -
+    nothing more is submitted, so the executor may already have been shut down. Stages can be added
+    from inside other stages (e.g. from a streaming callback). Each stage runs in
+    a copy of the context it was added from, so per-call context variables follow it.
+    """
+
+    def __init__(self, executor):
+        self.executor = executor
+        self.futures = {}
+        self.timings = {}
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, name: str, fn, deps: tuple = ()) -> Future:
+        future = Future()
+        with self._lock:
+            dep_futures = [self.futures[dep] for dep in deps]
+            self.futures[name] = future
+        remaining = [len(dep_futures)]
+        failed = [False]
+        context = contextvars.copy_context()
+
+        def run():
+            args = [dep.result() for dep in dep_futures]
+            start = time.perf_counter()
+            try:
+                value = fn(*args)
+            except BaseException as e:
+                self._record(name, start)
+                future.set_exception(e)
+                return
+            self._record(name, start)
+            future.set_result(value)
+
+        def fail(e: BaseException):
+            # Only the first failed dependency settles the stage (set outside the lock: it runs callbacks)
+            with self._lock:
+                if failed[0]:
+                    return
+                failed[0] = True
+            future.set_exception(e)
+
+        def submit():
+            try:
+                self.executor.submit(context.run, run)
+            except RuntimeError as e:
+                # The caller already left the executor (an earlier stage raised) - don't leave this one hanging
+                fail(e)
+
+        def dep_done(dep):
+            if dep.exception() is not None:
+                fail(dep.exception())
+                return
+            with self._lock:
+                remaining[0] -= 1
+                ready = remaining[0] == 0
+            if ready:
+                submit()
+
+        if not dep_futures:
+            submit()
+        for dep in dep_futures:
+            dep.add_done_callback(dep_done)
+        return future
+
+    def has(self, name: str) -> bool:
+        with self._lock:
+            return name in self.futures
+
+    def result(self, name: str):
+        """Wait for a stage and return its result (or raise its exception)"""
+        with self._lock:
+            future = self.futures[name]
+        return future.result()
+
+    def _record(self, name: str, start: float):
+        end = time.perf_counter()
+        STAGE_SECONDS.observe(end - start, stage=name)
+        with self._lock:
+            self.timings[name] = {
+                'start_ms': round((start - self._started) * 1000, 1),
+                'duration_ms': round((end - start) * 1000, 1),
+            }
@@ -0,0 +1,80 @@
+"""
+Client-side rate limiting
+A blocking token bucket, and a requests transport adapter that takes a token
+before every request so all traffic on a session shares one budget
+"""
+import threading
+import time
+
+from requests.adapters import BaseAdapter, HTTPAdapter
+
+
+class TokenBucket:
+    """rate tokens per second, with bursts of up to capacity"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.waited = 0.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def set_rate(self, rate: float):
+        """Change the refill rate, keeping the tokens already earned at the old one"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = rate
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens: float = 1, timeout: float = None) -> bool:
+        """Block until tokens are available. Returns False if that would take longer than timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return True
+                wait = (tokens - self.tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+            with self._lock:
+                self.waited += wait
+
+
+class RateLimitedAdapter(BaseAdapter):
+    """Transport adapter that waits for a token from bucket, then sends through adapter"""
+
+    def __init__(self, bucket: TokenBucket, adapter: BaseAdapter = None):
+        super().__init__()
+        self.bucket = bucket
+        self.adapter = adapter or HTTPAdapter()
+
+    def send(self, request, **kwargs):
+        self.bucket.acquire()
+        return self.adapter.send(request, **kwargs)
+
+    def close(self):
+        self.adapter.close()
+
+
+def rate_limit_session(session, bucket: TokenBucket):
+    """Route every request on session (through whichever adapter it was using) via bucket"""
+    for prefix, adapter in list(session.adapters.items()):
+        if not isinstance(adapter, RateLimitedAdapter):
+            session.mount(prefix, RateLimitedAdapter(bucket, adapter))
+    return session
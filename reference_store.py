@@ -0,0 +1,433 @@
+"""
+Local copy of the Salesforce reference data behind the lookups
+Opportunities (with their sellers' Accounts) and active Users are pulled nightly
+with Bulk API 2.0 CSV query jobs into a SQLite file and kept current between full
+syncs by polling SystemModstamp. Opportunity addresses are searchable with FTS5.
+While the copy is fresh, address searches, Opportunity reads and AE phone lookups
+are answered from it without an API call; once it is older than max_staleness,
+callers go back to Salesforce.
+
+    python reference_store.py [--full]
+"""
+import argparse
+import csv
+import io
+import json
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from addresses import parse_address, pick_match, rank_records, soql_datetime
+from cache import normalize_phone
+from opportunity_fields import DETAIL_FIELDS, SNAPSHOT_FIELDS, FieldCapabilities, strip_attributes
+
+logger = logging.getLogger(__name__)
+
+OPPORTUNITY = 'Opportunity'
+ACCOUNT = 'Account'
+USER = 'User'
+SOBJECTS = (OPPORTUNITY, ACCOUNT, USER)
+
+# Describe types whose Bulk CSV values are turned back into what the REST API returns
+NUMBER_TYPES = ('double', 'currency', 'percent')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS opportunities (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    stage TEXT,
+    account_id TEXT,
+    record TEXT NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS opportunity_search USING fts5(address);
+CREATE TABLE IF NOT EXISTS accounts (
+    id TEXT PRIMARY KEY,
+    record TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    phone TEXT,
+    mobile_phone TEXT
+);
+CREATE INDEX IF NOT EXISTS users_phone ON users (phone);
+CREATE INDEX IF NOT EXISTS users_mobile_phone ON users (mobile_phone);
+CREATE TABLE IF NOT EXISTS sync_state (
+    sobject TEXT PRIMARY KEY,
+    watermark TEXT,
+    full_sync_at REAL,
+    synced_at REAL,
+    rows INTEGER
+);
+"""
+
+
+def csv_value(value: str, field_type: str = None):
+    """A Bulk API CSV cell as the REST API would return it: '' is null, and booleans and numbers are typed"""
+    if value == '':
+        return None
+    if field_type == 'boolean':
+        return value.lower() == 'true'
+    if field_type == 'int':
+        return int(value)
+    if field_type in NUMBER_TYPES:
+        return float(value)
+    return value
+
+
+def search_text(*addresses) -> str:
+    """Normalized street tokens of the addresses (Opportunity name, property address) for the FTS index"""
+    tokens = []
+    for address in addresses:
+        if not address:
+            continue
+        parsed = parse_address(address)
+        for token in (parsed.number, parsed.direction, *parsed.name, parsed.suffix, parsed.unit):
+            if token and token not in tokens:
+                tokens.append(token)
+    return ' '.join(tokens)
+
+
+def fts_phrase(token: str) -> str:
+    return '"' + token.replace('"', '""') + '"'
+
+
+class ReferenceStore:
+    """SQLite copy of Opportunities, Accounts and active Users, shared by every worker on the host
+
+    The first sync of each sObject, and one every night after sync_hour (UTC), is a
+    full Bulk API export that replaces its rows in one transaction; in between,
+    changes since the SystemModstamp watermark are applied every delta_interval.
+    Deletes only show up at the nightly sync. Given leader (a LeaderElection), only
+    the leader syncs; every worker reads the same file.
+    """
+
+    # Rows pulled per FTS query before the address scorer ranks them
+    NUMBER_CANDIDATES = 50
+    STREET_CANDIDATES = 200
+
+    def __init__(self, path: str = 'reference_store.sqlite3', max_staleness: float = 900,
+                 delta_interval: float = 300, sync_hour: int = 9, capabilities: FieldCapabilities = None,
+                 leader=None, bulk_wait: float = 5, page_size: int = 50000):
+        self.path = path
+        self.max_staleness = max_staleness
+        self.delta_interval = delta_interval
+        self.sync_hour = sync_hour
+        self.capabilities = capabilities or FieldCapabilities()
+        self.leader = leader
+        self.bulk_wait = bulk_wait
+        self.page_size = page_size
+        self.lookups = {'hit': 0, 'miss': 0, 'stale': 0}
+        self.syncs = {'full': 0, 'delta': 0}
+        # Reads and the sync's transactions use separate connections, so lookups see the
+        # last committed copy (WAL) rather than a half-replaced one
+        self._reader = None
+        self._writer = None
+        self._read_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript(SCHEMA)
+        return conn
+
+    def _read(self, sql: str, params: tuple = ()) -> list:
+        with self._read_lock:
+            if self._reader is None:
+                self._reader = self._connect()
+            return self._reader.execute(sql, params).fetchall()
+
+    # Freshness
+
+    def state(self, sobject: str) -> dict:
+        rows = self._read('SELECT watermark, full_sync_at, synced_at, rows FROM sync_state WHERE sobject = ?', (sobject,))
+        if not rows:
+            return None
+        watermark, full_sync_at, synced_at, count = rows[0]
+        return {'watermark': watermark, 'full_sync_at': full_sync_at, 'synced_at': synced_at, 'rows': count}
+
+    def age(self, sobject: str) -> float:
+        """Seconds since sobject was last synced, None if it never was"""
+        state = self.state(sobject)
+        return time.time() - state['synced_at'] if state else None
+
+    def fresh(self, *sobjects) -> bool:
+        ages = [self.age(sobject) for sobject in sobjects]
+        fresh = all(age is not None and age <= self.max_staleness for age in ages)
+        if not fresh:
+            self.lookups['stale'] += 1
+        return fresh
+
+    def _counted(self, hit: bool):
+        self.lookups['hit' if hit else 'miss'] += 1
+
+    # Lookups
+
+    def search_opportunities(self, address: str, limit: int = 5) -> list:
+        """Ranked candidates for an address, like find_opportunity_candidates, or None if the copy is too stale"""
+        if not self.fresh(OPPORTUNITY):
+            return None
+        query = parse_address(address)
+        number = fts_phrase(query.number) if query.number else None
+        street = ' AND '.join(fts_phrase(token) for token in query.name)
+        records = []
+        if number and street:
+            words = ' OR '.join(fts_phrase(token) for token in query.name)
+            records += self._search(f'{number} AND ({words})', self.NUMBER_CANDIDATES)
+            candidates = rank_records(address, records, limit)
+            if pick_match(candidates):
+                self._counted(True)
+                return candidates
+        # A misheard number or street name: everything at that number, and on that street
+        if number:
+            records += self._search(number, self.NUMBER_CANDIDATES)
+        if street:
+            records += self._search(street, self.STREET_CANDIDATES)
+        candidates = rank_records(address, records, limit)
+        self._counted(bool(pick_match(candidates)))
+        return candidates
+
+    def _search(self, match: str, limit: int) -> list:
+        rows = self._read(
+            'SELECT o.id, o.name, o.stage FROM opportunity_search s JOIN opportunities o ON o.rowid = s.rowid '
+            'WHERE opportunity_search MATCH ? LIMIT ?', (match, limit))
+        return [{'Id': opp_id, 'Name': name, 'StageName': stage} for opp_id, name, stage in rows]
+
+    def opportunity(self, opp_id: str) -> tuple:
+        """(found, record) with the fields load_opportunity reads - not found when stale, or not synced yet"""
+        if not self.fresh(OPPORTUNITY, ACCOUNT):
+            return False, None
+        rows = self._read('SELECT o.record, o.account_id, a.record FROM opportunities o '
+                          'LEFT JOIN accounts a ON a.id = o.account_id WHERE o.id = ?', (opp_id,))
+        # An Account created since the last sync isn't here yet either
+        if not rows or (rows[0][1] and rows[0][2] is None):
+            self._counted(False)
+            return False, None
+        record, _, account = rows[0]
+        record = json.loads(record)
+        record['Account'] = json.loads(account) if account else None
+        self._counted(True)
+        return True, record
+
+    def user_by_phone(self, phone: str) -> tuple:
+        """(found, {'Id', 'Name'} or None) for an active User with this normalized phone - not found when stale"""
+        if not self.fresh(USER):
+            return False, None
+        rows = self._read('SELECT id, name FROM users WHERE phone = ? OR mobile_phone = ? LIMIT 1', (phone, phone))
+        self._counted(bool(rows))
+        return True, ({'Id': rows[0][0], 'Name': rows[0][1]} if rows else None)
+
+    # Sync
+
+    def fields(self, sf, sobject: str) -> list:
+        """Fields copied for sobject: what the lookups read, limited to those the org has"""
+        detail = self.capabilities.available(sf, OPPORTUNITY, DETAIL_FIELDS)
+        if sobject == OPPORTUNITY:
+            names = ['Id', 'Name', 'StageName', 'AccountId'] + SNAPSHOT_FIELDS + [f for f in detail if '.' not in f]
+        elif sobject == ACCOUNT:
+            names = ['Id'] + [f.split('.', 1)[1] for f in detail if f.startswith(f'{ACCOUNT}.')]
+        else:
+            names = ['Id', 'Name', 'Phone', 'MobilePhone', 'IsActive']
+        return list(dict.fromkeys(names + ['SystemModstamp']))
+
+    def full_sync_due(self, state: dict, now: float = None) -> bool:
+        """Never synced in full, or not since the last sync_hour"""
+        if not state or state['full_sync_at'] is None:
+            return True
+        now = now or time.time()
+        scheduled = datetime.fromtimestamp(now, timezone.utc).replace(hour=self.sync_hour, minute=0, second=0,
+                                                                      microsecond=0)
+        if scheduled.timestamp() > now:
+            scheduled -= timedelta(days=1)
+        return state['full_sync_at'] < scheduled.timestamp()
+
+    def sync(self, sf, full: bool = False) -> dict:
+        """Bring every sObject up to date - in full when due (or full), else by delta. Returns rows applied"""
+        applied = {}
+        for sobject in SOBJECTS:
+            self._keep_lease()
+            try:
+                if full or self.full_sync_due(self.state(sobject)):
+                    applied[sobject] = self.full_sync(sf, sobject)
+                else:
+                    applied[sobject] = self.delta_sync(sf, sobject)
+            except Exception as e:
+                logger.error(f"Reference store sync of {sobject} failed: {str(e)}")
+        return applied
+
+    def full_sync(self, sf, sobject: str) -> int:
+        """Replace sobject's rows with a Bulk API 2.0 export. Returns the rows loaded"""
+        soql = f"SELECT {', '.join(self.fields(sf, sobject))} FROM {sobject}"
+        if sobject == USER:
+            soql += ' WHERE IsActive = true'
+        types = {name: field.get('type') for name, field in self.capabilities.fields(sf, sobject).items()}
+        started = time.time()
+        rows, watermark = 0, None
+
+        def load(conn):
+            nonlocal rows, watermark
+            self._clear(conn, sobject)
+            for page in getattr(sf.bulk2, sobject).query(soql, max_records=self.page_size, wait=self.bulk_wait):
+                for row in csv.DictReader(io.StringIO(page)):
+                    record = {name: csv_value(value, types.get(name)) for name, value in row.items()}
+                    self._upsert(conn, sobject, record, replace=False)
+                    watermark = max(watermark or '', soql_datetime(record['SystemModstamp']))
+                    rows += 1
+                # Hold on to the lease through a long export, and give up if another worker took it
+                self._keep_lease()
+            self._set_state(conn, sobject, watermark, started, full=True)
+
+        self._transaction(load)
+        self.syncs['full'] += 1
+        logger.info(f"Reference store loaded {rows} {sobject} records in {time.time() - started:.1f}s")
+        return rows
+
+    def delta_sync(self, sf, sobject: str) -> int:
+        """Apply sobject's records modified since the watermark (a REST query - deltas are small). Returns the count"""
+        watermark = self.state(sobject)['watermark']
+        soql = f"SELECT {', '.join(self.fields(sf, sobject))} FROM {sobject} WHERE SystemModstamp >= {watermark}"
+        started = time.time()
+        records = [strip_attributes(record) for record in sf.query_all_iter(soql)]
+
+        def apply(conn):
+            latest = watermark
+            for record in records:
+                if sobject == USER and not record.get('IsActive'):
+                    conn.execute('DELETE FROM users WHERE id = ?', (record['Id'],))
+                else:
+                    self._upsert(conn, sobject, record)
+                latest = max(latest, soql_datetime(record['SystemModstamp']))
+            self._set_state(conn, sobject, latest, started)
+
+        self._transaction(apply)
+        self.syncs['delta'] += 1
+        if records:
+            logger.info(f"Reference store applied {len(records)} changed {sobject} records")
+        return len(records)
+
+    def apply_write(self, opp_id: str, changes: dict):
+        """Fold fields just written to Salesforce into the copy, so reads before the next delta see them"""
+        def apply(conn):
+            row = conn.execute('SELECT record FROM opportunities WHERE id = ?', (opp_id,)).fetchone()
+            if row:
+                self._upsert(conn, OPPORTUNITY, {**json.loads(row[0]), **changes})
+
+        self._transaction(apply)
+
+    def _transaction(self, fn):
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = self._connect()
+            conn = self._writer
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                fn(conn)
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+
+    @staticmethod
+    def _clear(conn, sobject: str):
+        if sobject == OPPORTUNITY:
+            conn.execute('DELETE FROM opportunities')
+            conn.execute('DELETE FROM opportunity_search')
+        else:
+            conn.execute(f"DELETE FROM {'accounts' if sobject == ACCOUNT else 'users'}")
+
+    @staticmethod
+    def _upsert(conn, sobject: str, record: dict, replace: bool = True):
+        """Write one record; replace=False skips clearing its old search entry (the table was just emptied)"""
+        if sobject == OPPORTUNITY:
+            rowid = conn.execute(
+                """INSERT INTO opportunities (id, name, stage, account_id, record) VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT(id) DO UPDATE SET name = excluded.name, stage = excluded.stage,
+                       account_id = excluded.account_id, record = excluded.record
+                   RETURNING rowid""",
+                (record['Id'], record.get('Name'), record.get('StageName'), record.get('AccountId'), json.dumps(record))
+            ).fetchone()[0]
+            if replace:
+                conn.execute('DELETE FROM opportunity_search WHERE rowid = ?', (rowid,))
+            name = (record.get('Name') or '').split(' - ')[0]
+            conn.execute('INSERT INTO opportunity_search (rowid, address) VALUES (?, ?)',
+                         (rowid, search_text(name, record.get('Property_Address__c'))))
+        elif sobject == ACCOUNT:
+            account = {k: v for k, v in record.items() if k not in ('Id', 'SystemModstamp')}
+            conn.execute('INSERT OR REPLACE INTO accounts (id, record) VALUES (?, ?)', (record['Id'], json.dumps(account)))
+        else:
+            conn.execute('INSERT OR REPLACE INTO users (id, name, phone, mobile_phone) VALUES (?, ?, ?, ?)',
+                         (record['Id'], record.get('Name'), normalize_phone(record.get('Phone')) or None,
+                          normalize_phone(record.get('MobilePhone')) or None))
+
+    @staticmethod
+    def _set_state(conn, sobject: str, watermark: str, synced_at: float, full: bool = False):
+        table = {OPPORTUNITY: 'opportunities', ACCOUNT: 'accounts', USER: 'users'}[sobject]
+        rows = conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+        # An empty export has no SystemModstamp to go on: carry on from when it started
+        watermark = watermark or datetime.fromtimestamp(synced_at, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        conn.execute(
+            """INSERT INTO sync_state (sobject, watermark, full_sync_at, synced_at, rows) VALUES (?, ?, ?, ?, ?)
+               ON CONFLICT(sobject) DO UPDATE SET watermark = excluded.watermark, synced_at = excluded.synced_at,
+                   rows = excluded.rows, full_sync_at = COALESCE(excluded.full_sync_at, sync_state.full_sync_at)""",
+            (sobject, watermark, synced_at if full else None, synced_at, rows))
+
+    def _keep_lease(self):
+        if self.leader is not None and not self.leader.is_leader():
+            raise RuntimeError('Another worker took over the reference store sync')
+
+    # Background sync
+
+    def start(self, sf_factory):
+        """Sync now and every delta_interval in a background thread"""
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._run, args=(sf_factory,), name='reference-store', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self.leader is not None:
+            self.leader.resign()
+
+    def _run(self, sf_factory):
+        while not self._stopping.is_set():
+            try:
+                if self.leader is None or self.leader.is_leader():
+                    self.sync(sf_factory())
+            except Exception as e:
+                logger.error(f"Reference store sync failed: {str(e)}")
+            self._stopping.wait(self.delta_interval)
+
+    def metrics(self) -> dict:
+        states = {sobject: self.state(sobject) for sobject in SOBJECTS}
+        now = time.time()
+        return {
+            'rows': {sobject: state['rows'] if state else None for sobject, state in states.items()},
+            'age_seconds': {sobject: round(now - state['synced_at'], 1) if state else None
+                            for sobject, state in states.items()},
+            'full_sync_age_seconds': {sobject: round(now - state['full_sync_at'], 1) if state else None
+                                      for sobject, state in states.items()},
+            'lookups': dict(self.lookups),
+            'syncs': dict(self.syncs),
+            'leader': self.leader.leading if self.leader is not None else None,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync the reference store once, as the app's background thread does")
+    parser.add_argument('--full', action='store_true', help='a full Bulk API export of every sObject, due or not')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    import app
+    print(json.dumps(app.reference_store.sync(app.get_sf_connection(), full=args.full)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Salesforce Composite API requests
+Bundles several sObject writes into one REST round-trip with all-or-none semantics
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Salesforce limit on subrequests in a single /composite call
+MAX_SUBREQUESTS = 25
+
+
+class CompositeRequestError(Exception):
+    """Raised when an all-or-none composite request was rolled back"""
+
+    def __init__(self, message: str, results: dict):
+        super().__init__(message)
+        self.results = results
+
+
+class CompositeRequestTooLarge(ValueError):
+    """Raised instead of splitting an all-or-none request over MAX_SUBREQUESTS across several calls"""
+
+
+class CompositeRequest:
+    """Collects sObject creates/updates and sends them as /composite requests
+
+    An all-or-none request must fit in one call (MAX_SUBREQUESTS); otherwise the
+    subrequests are sent in batches of that size.
+    """
+
+    def __init__(self, all_or_none: bool = True):
+        self.all_or_none = all_or_none
+        self.subrequests = []
+
+    def __len__(self):
+        return len(self.subrequests)
+
+    def create(self, sobject: str, data: dict, reference_id: str):
+        self.subrequests.append({
+            'method': 'POST',
+            'url': f'sobjects/{sobject}',
+            'referenceId': reference_id,
+            'body': data,
+        })
+
+    def update(self, sobject: str, record_id: str, data: dict, reference_id: str):
+        self.subrequests.append({
+            'method': 'PATCH',
+            'url': f'sobjects/{sobject}/{record_id}',
+            'referenceId': reference_id,
+            'body': data,
+        })
+
+    def send(self, sf) -> dict:
+        """Send the subrequests and return referenceId -> {'success', 'id', 'status', 'errors'}
+
+        Raises CompositeRequestError if any subrequest failed in all-or-none mode, and
+        CompositeRequestTooLarge - before sending anything - if an all-or-none request
+        wouldn't fit in one call, since batches would commit independently.
+        """
+        results = {}
+        if not self.subrequests:
+            return results
+
+        if self.all_or_none and len(self.subrequests) > MAX_SUBREQUESTS:
+            raise CompositeRequestTooLarge(f"All-or-none composite request has {len(self.subrequests)} subrequests, "
+                                           f"over the limit of {MAX_SUBREQUESTS}")
+        chunks = [self.subrequests[i:i + MAX_SUBREQUESTS] for i in range(0, len(self.subrequests), MAX_SUBREQUESTS)]
+        if len(chunks) > 1:
+            logger.warning(f"Composite request has {len(self.subrequests)} subrequests, sending in {len(chunks)} batches")
+
+        version_prefix = f"/services/data/v{sf.sf_version}/"
+        for chunk in chunks:
+            body = {
+                'allOrNone': self.all_or_none,
+                'compositeRequest': [dict(sub, url=version_prefix + sub['url']) for sub in chunk],
+            }
+            response = sf.restful('composite', method='POST', json=body)
+            for sub in response.get('compositeResponse', []):
+                results[sub['referenceId']] = parse_subresponse(sub)
+
+            failed = [ref for ref, result in results.items() if not result['success']]
+            if failed and self.all_or_none:
+                errors = '; '.join(
+                    f"{ref}: {err.get('errorCode')} {err.get('message', '')}".strip()
+                    for ref in failed for err in results[ref]['errors']
+                    if err.get('errorCode') != 'PROCESSING_HALTED'
+                )
+                raise CompositeRequestError(f"Composite request rolled back: {errors}", results)
+
+        return results
+
+
+def parse_subresponse(sub: dict) -> dict:
+    """Normalize one compositeResponse entry"""
+    status = sub.get('httpStatusCode')
+    body = sub.get('body')
+    success = status is not None and 200 <= status < 300
+    result = {'success': success, 'status': status, 'id': None, 'errors': []}
+    if success and isinstance(body, dict):
+        result['id'] = body.get('id')
+    elif not success:
+        result['errors'] = body if isinstance(body, list) else [{'message': str(body)}]
+    return result
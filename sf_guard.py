@@ -0,0 +1,217 @@
+"""
+Outbound Salesforce traffic control
+Every request on the shared session takes a token from one bucket whose rate
+follows the org's daily API usage (the Sforce-Limit-Info response header), and
+goes through a circuit breaker that stops sending while Salesforce answers
+REQUEST_LIMIT_EXCEEDED or is down. Refused requests raise SalesforceUnavailable
+with a retry_after, so callers can park the work instead of hammering the org.
+"""
+import logging
+import threading
+import time
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+
+from metrics import SALESFORCE_FAILURES, SALESFORCE_REJECTED, SALESFORCE_THROTTLED
+from rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+SERVER_ERRORS = frozenset({500, 502, 503, 504})
+
+
+class SalesforceUnavailable(requests.ConnectionError):
+    """A request that was not sent - the circuit is open or the rate limit wait was too long"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f'Salesforce request not sent ({reason}), retry in {retry_after:.0f}s')
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def parse_limit_info(header: str) -> tuple:
+    """(used, limit) from a Sforce-Limit-Info header like 'api-usage=25/15000', or None"""
+    for part in (header or '').split(','):
+        name, _, value = part.strip().partition('=')
+        if name == 'api-usage':
+            used, _, limit = value.partition('/')
+            try:
+                return int(used), int(limit)
+            except ValueError:
+                return None
+    return None
+
+
+def is_limit_exceeded(response) -> bool:
+    return response.status_code == 403 and b'REQUEST_LIMIT_EXCEEDED' in (response.content or b'')
+
+
+class CircuitBreaker:
+    """Opens after failure_threshold consecutive failures, or at once on an API limit error
+
+    While open every request is refused until the cooldown (reset_timeout, or
+    limit_timeout after a limit error) has passed; then one probe request is let
+    through, and its outcome closes the circuit or opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, limit_timeout: float = 300.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.limit_timeout = limit_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_count = 0
+        self._opened_until = 0.0
+        self._probing = False
+        self._probe_started = 0.0
+        self._lock = threading.Lock()
+
+    def retry_after(self) -> float:
+        """Seconds until the circuit lets a request through again (0 when closed)"""
+        if self.state == CLOSED:
+            return 0.0
+        return max(1.0, self._opened_until - time.monotonic())
+
+    def allow(self):
+        """Raise SalesforceUnavailable unless a request may be sent now"""
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            now = time.monotonic()
+            if self.state == OPEN and now >= self._opened_until:
+                self.state = HALF_OPEN
+                self._probing = False
+            # A probe that never reported back (the caller gave up on it) stops blocking after a cooldown
+            if self.state == HALF_OPEN and (not self._probing or now - self._probe_started > self.reset_timeout):
+                self._probing = True
+                self._probe_started = now
+                return
+        SALESFORCE_REJECTED.inc(reason='circuit_open')
+        raise SalesforceUnavailable('circuit open', self.retry_after())
+
+    def record_success(self):
+        with self._lock:
+            if self.state == OPEN:
+                # A response to a request sent before the circuit opened
+                return
+            if self.state == HALF_OPEN:
+                logger.info("Salesforce is answering again, closing the circuit")
+            self.state = CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self, limit_exceeded: bool = False):
+        with self._lock:
+            self.failures += 1
+            if self.state == CLOSED and not limit_exceeded and self.failures < self.failure_threshold:
+                return
+            cooldown = self.limit_timeout if limit_exceeded else self.reset_timeout
+            if self.state == CLOSED:
+                self.opened_count += 1
+                logger.warning(f"Opening the Salesforce circuit for {cooldown:.0f}s after {self.failures} failures"
+                               f"{' (API limit exceeded)' if limit_exceeded else ''}")
+            self.state = OPEN
+            self._probing = False
+            self._opened_until = time.monotonic() + cooldown
+
+
+class SalesforceGuard:
+    """Rate limit and circuit breaker shared by every request to one Salesforce org
+
+    rate is the requests per second allowed while the org's API usage is below
+    soft_limit (a fraction of its daily limit). Above that the rate falls linearly
+    to min_rate as usage reaches the limit.
+    """
+
+    def __init__(self, rate: float, burst: float = None, soft_limit: float = 0.8, min_rate: float = 0.5,
+                 acquire_timeout: float = 30.0, breaker: CircuitBreaker = None):
+        self.max_rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.soft_limit = soft_limit
+        self.acquire_timeout = acquire_timeout
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = breaker or CircuitBreaker()
+        self.api_usage = None  # (used, limit) from the latest response
+
+    def observe_usage(self, used: int, limit: int):
+        """Scale the request rate to how much of the org's daily API limit is left"""
+        self.api_usage = (used, limit)
+        if limit <= 0:
+            return
+        fraction = used / limit
+        if fraction <= self.soft_limit:
+            rate = self.max_rate
+        else:
+            left = max(0.0, 1.0 - fraction) / (1.0 - self.soft_limit)
+            rate = self.min_rate + (self.max_rate - self.min_rate) * left
+        if rate != self.bucket.rate:
+            self.bucket.set_rate(rate)
+
+    def before_request(self):
+        self.breaker.allow()
+        if self.bucket.try_acquire():
+            return
+        SALESFORCE_THROTTLED.inc()
+        if not self.bucket.acquire(timeout=self.acquire_timeout):
+            SALESFORCE_REJECTED.inc(reason='rate_limited')
+            raise SalesforceUnavailable('rate limited', 1 / self.bucket.rate)
+
+    def after_response(self, response):
+        usage = parse_limit_info(response.headers.get('Sforce-Limit-Info'))
+        if usage:
+            self.observe_usage(*usage)
+        if is_limit_exceeded(response):
+            SALESFORCE_FAILURES.inc(kind='limit_exceeded')
+            self.breaker.record_failure(limit_exceeded=True)
+        elif response.status_code in SERVER_ERRORS:
+            SALESFORCE_FAILURES.inc(kind='server_error')
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    def after_error(self):
+        SALESFORCE_FAILURES.inc(kind='connection')
+        self.breaker.record_failure()
+
+    def metrics(self) -> dict:
+        used, limit = self.api_usage or (None, None)
+        return {
+            'circuit': self.breaker.state,
+            'circuit_opened_count': self.breaker.opened_count,
+            'rate_limit': round(self.bucket.rate, 2),
+            'api_usage': used,
+            'api_limit': limit,
+        }
+
+
+class GuardedAdapter(BaseAdapter):
+    """Transport adapter that sends through adapter only when guard allows it, and reports the outcome"""
+
+    def __init__(self, guard: SalesforceGuard, adapter: BaseAdapter = None):
+        super().__init__()
+        self.guard = guard
+        self.adapter = adapter or HTTPAdapter()
+
+    def send(self, request, **kwargs):
+        self.guard.before_request()
+        try:
+            response = self.adapter.send(request, **kwargs)
+        except requests.RequestException:
+            self.guard.after_error()
+            raise
+        self.guard.after_response(response)
+        return response
+
+    def close(self):
+        self.adapter.close()
+
+
+def guard_session(session, guard: SalesforceGuard):
+    """Route every request on session (through whichever adapter it was using) via guard"""
+    for prefix, adapter in list(session.adapters.items()):
+        if not isinstance(adapter, GuardedAdapter):
+            session.mount(prefix, GuardedAdapter(guard, adapter))
+    return session
@@ -0,0 +1,33 @@
+"""
+Picklist values from the Salesforce metadata in force-app
+Keeps the extraction prompt and tool schema in step with what's deployed to the org
+"""
+import os
+import xml.etree.ElementTree as ET
+from functools import lru_cache
+
+METADATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'force-app', 'main', 'default')
+NS = {'md': 'http://soap.sforce.com/2006/04/metadata'}
+
+
+@lru_cache(maxsize=None)
+def standard_value_set(name: str) -> tuple:
+    """Values of a standard value set (e.g. OpportunityStage), or () if it isn't in force-app"""
+    path = os.path.join(METADATA_DIR, 'standardValueSets', f'{name}.standardValueSet-meta.xml')
+    if not os.path.exists(path):
+        return ()
+    root = ET.parse(path).getroot()
+    return tuple(value.findtext('md:fullName', namespaces=NS)
+                 for value in root.findall('md:standardValue', NS))
+
+
+@lru_cache(maxsize=None)
+def field_picklist(sobject: str, field: str) -> tuple:
+    """Values of a custom picklist field, or () if the field isn't in force-app"""
+    path = os.path.join(METADATA_DIR, 'objects', sobject, 'fields', f'{field}.field-meta.xml')
+    if not os.path.exists(path):
+        return ()
+    root = ET.parse(path).getroot()
+    return tuple(value.findtext('md:fullName', namespaces=NS)
+                 for value in root.findall('md:valueSet/md:valueSetDefinition/md:value', NS))
+
@@ -0,0 +1,172 @@
+"""
+Process-wide Salesforce session
+Logs in once per worker process, reuses a pooled HTTP connection and refreshes
+the session transparently when Salesforce answers INVALID_SESSION_ID
+"""
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from simple_salesforce import Salesforce
+from simple_salesforce.exceptions import SalesforceExpiredSession
+
+from metrics import record_salesforce_request
+from sf_guard import SalesforceGuard, guard_session
+
+logger = logging.getLogger(__name__)
+
+# Logins one request may make for INVALID_SESSION_ID answers before the error is raised
+MAX_SESSION_REFRESHES = 2
+
+
+SOBJECT_OPERATIONS = {'POST': 'create', 'PATCH': 'update', 'GET': 'get', 'DELETE': 'delete'}
+
+
+def salesforce_operation(method: str, url: str) -> str:
+    """Short name for a Salesforce REST request, e.g. 'query', 'composite', 'Task.create', 'login'"""
+    path = urlparse(url).path
+    if '/services/Soap/' in path or '/services/oauth2/' in path:
+        return 'login'
+    if '/services/data/' not in path:
+        return 'other'
+    parts = path.split('/services/data/', 1)[1].strip('/').split('/')[1:]
+    if not parts:
+        return 'other'
+    if parts[0] in ('query', 'queryAll'):
+        return 'query'
+    if parts[0] == 'sobjects' and len(parts) > 1:
+        if len(parts) > 2 and parts[2] == 'describe':
+            return f'{parts[1]}.describe'
+        return f'{parts[1]}.{SOBJECT_OPERATIONS.get(method, method.lower())}'
+    return parts[0]
+
+
+def _record_response(response, *args, **kwargs):
+    request = response.request
+    record_salesforce_request(salesforce_operation(request.method, request.url), response.status_code,
+                              response.elapsed.total_seconds())
+
+
+def instrument_session(session: requests.Session) -> requests.Session:
+    """Time every request made through session in the Salesforce request metrics"""
+    session.hooks['response'].append(_record_response)
+    return session
+
+
+class ManagedSalesforce(Salesforce):
+    """Salesforce connection whose session refreshes are serialized and counted"""
+
+    def __init__(self, manager, **kwargs):
+        self._manager = manager
+        self._connected = False
+        super().__init__(**kwargs)
+        self._connected = True
+
+    def _refresh_session(self):
+        if not self._connected:
+            # simple_salesforce logs in through here; the manager records that login itself
+            super()._refresh_session()
+            return
+        rejected = self._manager.rejected_response()
+        with self._manager._lock:
+            refreshes = getattr(self._manager._auth, 'refreshes', 0)
+            if rejected is not None:
+                if rejected.request.headers.get('Authorization') != self.headers['Authorization']:
+                    # Another thread logged in while we waited on the lock; retry with its session
+                    return
+                if refreshes >= MAX_SESSION_REFRESHES:
+                    # The new session is refused too; give up on this request, the next one may log in again
+                    self._manager._auth.refreshes = 0
+                    raise SalesforceExpiredSession(rejected.url, rejected.status_code,
+                                                   salesforce_operation(rejected.request.method, rejected.url),
+                                                   rejected.content)
+            self._manager._auth.refreshes = refreshes + 1
+            logger.info("Salesforce session expired, logging in again")
+            super()._refresh_session()
+            self._manager._record_login(refresh=True)
+
+
+class SalesforceSessionManager:
+    """Hands out one shared, thread-safe Salesforce connection per process
+
+    With a guard, every request on the connection goes through its rate limit and circuit breaker.
+    """
+
+    def __init__(self, credentials: dict = None, pool_size: int = 10, guard: SalesforceGuard = None):
+        self.credentials = credentials
+        self.pool_size = pool_size
+        self.guard = guard
+        self.login_count = 0
+        self.refresh_count = 0
+        self.logged_in_at = 0.0
+        self._sf = None
+        self._lock = threading.RLock()
+        # Per thread: the last INVALID_SESSION_ID response and the logins made for it since
+        self._auth = threading.local()
+
+    def _default_credentials(self) -> dict:
+        return {
+            'username': os.environ.get('SF_USERNAME'),
+            'password': os.environ.get('SF_PASSWORD'),
+            'security_token': os.environ.get('SF_SECURITY_TOKEN'),
+            'domain': os.environ.get('SF_DOMAIN', 'login'),
+        }
+
+    def _http_session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+        session.mount('https://', adapter)
+        if self.guard is not None:
+            guard_session(session, self.guard)
+        session.hooks['response'].append(self._track_auth)
+        return instrument_session(session)
+
+    def _track_auth(self, response, *args, **kwargs):
+        if salesforce_operation(response.request.method, response.request.url) == 'login':
+            return
+        if response.status_code == 401:
+            self._auth.rejected = response
+        else:
+            self._auth.rejected = None
+            self._auth.refreshes = 0
+
+    def rejected_response(self):
+        """This thread's last request refused with 401, if no request has succeeded since"""
+        return getattr(self._auth, 'rejected', None)
+
+    def _record_login(self, refresh: bool = False):
+        self.login_count += 1
+        if refresh:
+            self.refresh_count += 1
+        self.logged_in_at = time.monotonic()
+
+    def connection(self) -> Salesforce:
+        """Return the shared connection, logging in on first use"""
+        if self._sf is not None:
+            return self._sf
+        with self._lock:
+            if self._sf is None:
+                credentials = self.credentials or self._default_credentials()
+                sf = ManagedSalesforce(self, session=self._http_session(), **credentials)
+                self._record_login()
+                logger.info(f"Salesforce login #{self.login_count} ({sf.sf_instance})")
+                self._sf = sf
+        return self._sf
+
+    def reset(self):
+        """Drop the cached connection so the next call logs in again"""
+        with self._lock:
+            self._sf = None
+
+    def metrics(self) -> dict:
+        age = time.monotonic() - self.logged_in_at if self._sf is not None else None
+        return {
+            'login_count': self.login_count,
+            'refresh_count': self.refresh_count,
+            'session_age_seconds': round(age, 1) if age is not None else None,
+            'guard': self.guard.metrics() if self.guard is not None else None,
+        }
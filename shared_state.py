@@ -0,0 +1,296 @@
+"""
+State shared by every process serving the app
+Small JSON values with a time-to-live, plus leases for leader election, behind
+one interface: in-process (a single worker, and benchmarks), SQLite (every
+gunicorn worker on a dyno/host) or Redis (every dyno). Caches that a call's
+webhooks and function calls hit from different workers live here, and the
+leader's background work - cache warming, index syncs - is published here for
+the other workers to pick up.
+"""
+import json
+import logging
+import math
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class SharedState(ABC):
+    """Interface: JSON values by string key, each with an optional TTL, and named leases
+
+    get returns (found, value) like TTLCache.get. A lease is held by one owner
+    until its TTL runs out; acquire_lease by the holder renews it.
+    """
+
+    backend = None
+
+    @abstractmethod
+    def get(self, key: str) -> tuple:
+        """(found, value) for key - not found once its TTL has run out"""
+
+    @abstractmethod
+    def put(self, key: str, value, ttl: float = None):
+        """Store value (JSON-serializable) - ttl None keeps it until it's replaced or invalidated"""
+
+    @abstractmethod
+    def invalidate(self, key: str):
+        """Drop key, if it's there"""
+
+    @abstractmethod
+    def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        """Take the lease if it's free or expired, or renew it if owner holds it. Returns whether owner holds it"""
+
+    @abstractmethod
+    def release_lease(self, name: str, owner: str):
+        """Give the lease up early, if owner holds it"""
+
+    def metrics(self) -> dict:
+        return {'backend': self.backend}
+
+
+class LocalSharedState(SharedState):
+    """In-process dict - state shared by the threads of one worker only"""
+
+    backend = 'local'
+
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> tuple:
+        with self._lock:
+            value, expires_at = self._values.get(key, (_MISSING, None))
+            if value is _MISSING:
+                return False, None
+            if expires_at is not None and expires_at <= time.time():
+                del self._values[key]
+                return False, None
+        return True, json.loads(value)
+
+    def put(self, key: str, value, ttl: float = None):
+        # Stored serialized, as the other backends do, so callers can't share mutable values by accident
+        with self._lock:
+            self._values[key] = (json.dumps(value), time.time() + ttl if ttl is not None else None)
+
+    def invalidate(self, key: str):
+        with self._lock:
+            self._values.pop(key, None)
+
+    def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        with self._lock:
+            holder, expires_at = self._values.get(f'lease:{name}', (None, 0))
+            if holder is not None and holder != json.dumps(owner) and expires_at > now:
+                return False
+            self._values[f'lease:{name}'] = (json.dumps(owner), now + ttl)
+        return True
+
+    def release_lease(self, name: str, owner: str):
+        with self._lock:
+            holder, _ = self._values.get(f'lease:{name}', (None, 0))
+            if holder == json.dumps(owner):
+                del self._values[f'lease:{name}']
+
+
+class SQLiteSharedState(SharedState):
+    """File-backed state - shared by every worker on the same dyno/host
+
+    Expired rows are ignored when read and deleted in a batch every sweep_every writes.
+    """
+
+    backend = 'sqlite'
+
+    def __init__(self, path: str = ':memory:', sweep_every: int = 500):
+        self.path = path
+        self.sweep_every = sweep_every
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        if path != ':memory:':
+            self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS shared_state (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL
+            )
+        """)
+
+    def get(self, key: str) -> tuple:
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value FROM shared_state WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)',
+                (key, time.time())
+            ).fetchone()
+        return (True, json.loads(row[0])) if row else (False, None)
+
+    def put(self, key: str, value, ttl: float = None):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO shared_state (key, value, expires_at) VALUES (?, ?, ?)',
+                (key, json.dumps(value), now + ttl if ttl is not None else None)
+            )
+            self._writes += 1
+            if self._writes % self.sweep_every == 0:
+                self._conn.execute('DELETE FROM shared_state WHERE expires_at <= ?', (now,))
+
+    def invalidate(self, key: str):
+        with self._lock:
+            self._conn.execute('DELETE FROM shared_state WHERE key = ?', (key,))
+
+    def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                """INSERT INTO shared_state (key, value, expires_at) VALUES (?, ?, ?)
+                   ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at
+                   WHERE shared_state.value = excluded.value OR shared_state.expires_at <= ?""",
+                (f'lease:{name}', json.dumps(owner), now + ttl, now)
+            )
+        return cursor.rowcount == 1
+
+    def release_lease(self, name: str, owner: str):
+        with self._lock:
+            self._conn.execute('DELETE FROM shared_state WHERE key = ? AND value = ?',
+                               (f'lease:{name}', json.dumps(owner)))
+
+
+class RedisSharedState(SharedState):
+    """State in Redis (or anything with its get/set/delete interface) - shared across dynos
+
+    Renewing a lease reads then extends it, so a holder that stalls right at
+    expiry can briefly overlap with the next one - leases keep background work
+    from being repeated, they don't guard anything that must run only once.
+    """
+
+    backend = 'redis'
+
+    def __init__(self, client, prefix: str = 'poppy:state:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key: str) -> tuple:
+        value = self.client.get(self.prefix + key)
+        return (True, json.loads(value)) if value is not None else (False, None)
+
+    def put(self, key: str, value, ttl: float = None):
+        self.client.set(self.prefix + key, json.dumps(value), ex=math.ceil(ttl) if ttl is not None else None)
+
+    def invalidate(self, key: str):
+        self.client.delete(self.prefix + key)
+
+    def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        key = f'{self.prefix}lease:{name}'
+        if self.client.set(key, owner, nx=True, ex=math.ceil(ttl)):
+            return True
+        holder = self.client.get(key)
+        if holder is not None and holder.decode() == owner:
+            return bool(self.client.set(key, owner, xx=True, ex=math.ceil(ttl)))
+        return False
+
+    def release_lease(self, name: str, owner: str):
+        key = f'{self.prefix}lease:{name}'
+        holder = self.client.get(key)
+        if holder is not None and holder.decode() == owner:
+            self.client.delete(key)
+
+
+def state_from_env() -> SharedState:
+    """Build the state selected by SHARED_STATE_BACKEND (local, sqlite, or redis via REDIS_URL)"""
+    backend = os.environ.get('SHARED_STATE_BACKEND', 'local').lower()
+    if backend == 'redis':
+        try:
+            import redis  # only needed for this backend
+        except ImportError:
+            raise ImportError("SHARED_STATE_BACKEND=redis needs the redis package (pip install redis)") from None
+        return RedisSharedState(redis.Redis.from_url(os.environ['REDIS_URL']))
+    if backend == 'sqlite':
+        return SQLiteSharedState(os.environ.get('SHARED_STATE_PATH', 'shared_state.sqlite3'))
+    if backend != 'local':
+        raise ValueError(f"Unknown SHARED_STATE_BACKEND: {backend}")
+    return LocalSharedState()
+
+
+class LeaderElection:
+    """Whether this process leads a background job, by a lease renewed on every check
+
+    Check is_leader() at least once per ttl for as long as the job runs; when the
+    leader stops checking (it exited or hung), another process takes over once
+    the lease runs out.
+    """
+
+    def __init__(self, state: SharedState, name: str, ttl: float = 60):
+        self.state = state
+        self.name = name
+        self.ttl = ttl
+        self.leading = False
+        self._token = uuid.uuid4().hex[:8]
+
+    @property
+    def owner(self) -> str:
+        # The pid is read on each call so a copy inherited by a forked worker is a different owner
+        return f'{socket.gethostname()}:{os.getpid()}:{self._token}'
+
+    def is_leader(self) -> bool:
+        try:
+            leading = self.state.acquire_lease(self.name, self.owner, self.ttl)
+        except Exception as e:
+            logger.error(f"Leader check for {self.name} failed: {str(e)}")
+            leading = False
+        if leading != self.leading:
+            logger.info(f"{'Took over' if leading else 'Lost'} leadership of {self.name} ({self.owner})")
+        self.leading = leading
+        return leading
+
+    def resign(self):
+        if self.leading:
+            self.state.release_lease(self.name, self.owner)
+            self.leading = False
+
+
+class SharedCache:
+    """TTLCache-style get/put/invalidate over SharedState, for values any worker may need
+
+    Keys may be tuples (joined with ':'). None can be stored, with its own TTL,
+    to remember that something doesn't exist.
+    """
+
+    def __init__(self, state: SharedState, namespace: str, ttl: float = 3600, negative_ttl: float = 300):
+        self.state = state
+        self.namespace = namespace
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, key) -> str:
+        parts = key if isinstance(key, tuple) else (key,)
+        return ':'.join([self.namespace] + [str(part) for part in parts])
+
+    def get(self, key) -> tuple:
+        found, value = self.state.get(self._key(key))
+        if found:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return found, value
+
+    def put(self, key, value, ttl: float = None):
+        if ttl is None:
+            ttl = self.negative_ttl if value is None else self.ttl
+        self.state.put(self._key(key), value, ttl)
+
+    def invalidate(self, key):
+        self.state.invalidate(self._key(key))
+
+    def metrics(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,93 @@
+"""
+Call transcripts as a stream of utterances
+Retell sends each call's transcript both as one string and as transcript_object,
+a list of {role, content, words} utterances. Reading it an utterance at a time
+lets long calls be extracted in token-bounded windows and stored in chunks that
+fit Salesforce's field limits, without building more copies of the whole text.
+"""
+import io
+from dataclasses import dataclass
+
+SPEAKERS = {'agent': 'Agent', 'user': 'User'}
+
+# Rough tokens per character for English speech; errs high so windows stay under budget
+CHARS_PER_TOKEN = 3.5
+
+
+@dataclass(slots=True, frozen=True)
+class Utterance:
+    speaker: str
+    content: str
+
+    def line(self) -> str:
+        return f'{self.speaker}: {self.content}'
+
+
+def utterances(call_data: dict):
+    """The call's utterances in order, from transcript_object when Retell sent it, else the transcript text"""
+    turns = call_data.get('transcript_object')
+    if turns:
+        for turn in turns:
+            content = (turn.get('content') or '').strip()
+            if content:
+                yield Utterance(SPEAKERS.get(turn.get('role'), str(turn.get('role')).title()), content)
+        return
+    for line in io.StringIO(call_data.get('transcript') or ''):
+        speaker, sep, content = line.partition(':')
+        if sep and speaker.strip() and ' ' not in speaker.strip():
+            yield Utterance(speaker.strip(), content.strip())
+        elif line.strip():
+            yield Utterance('', line.strip())
+
+
+def transcript_lines(call_data: dict):
+    for utterance in utterances(call_data):
+        yield utterance.line() if utterance.speaker else utterance.content
+
+
+def estimate_tokens(text: str) -> int:
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+
+def windows(lines, max_tokens: int, overlap_tokens: int = 0):
+    """Group lines into windows of at most max_tokens (estimated), each starting with up to
+    overlap_tokens of the previous window's last lines for context. Yields window texts"""
+    window, size = [], 0
+    for line in lines:
+        tokens = estimate_tokens(line) + 1
+        if window and size + tokens > max_tokens:
+            yield '\n'.join(window)
+            carried, carried_size = [], 0
+            for previous in reversed(window):
+                previous_tokens = estimate_tokens(previous) + 1
+                if carried_size + previous_tokens > overlap_tokens:
+                    break
+                carried.insert(0, previous)
+                carried_size += previous_tokens
+            window, size = carried, carried_size
+        window.append(line)
+        size += tokens
+    if window:
+        yield '\n'.join(window)
+
+
+def chunks(lines, max_chars: int):
+    """Join lines into chunks of at most max_chars, breaking between lines where possible"""
+    chunk, size = [], 0
+    for line in lines:
+        while len(line) > max_chars:
+            # One utterance longer than a whole chunk: split it, at a space if there is one
+            if chunk:
+                yield '\n'.join(chunk)
+                chunk, size = [], 0
+            cut = line.rfind(' ', 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            yield line[:cut]
+            line = line[cut:].lstrip()
+        if chunk and size + 1 + len(line) > max_chars:
+            yield '\n'.join(chunk)
+            chunk, size = [], 0
+        size += len(line) + (1 if chunk else 0)
+        chunk.append(line)
+    if chunk:
+        yield '\n'.join(chunk)